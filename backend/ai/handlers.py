@@ -1,4 +1,4 @@
-from typing import List, Dict, Optional, Union
+from typing import Any, AsyncIterator, List, Dict, Optional, Union
 from openai import AsyncOpenAI
 from functools import lru_cache
 import os
@@ -9,6 +9,16 @@ from backend.models.email import Email, StressLevel, Priority
 import json
 from backend.utils.logger import logger
 from backend.config import settings
+from backend.services.analysis_cache import analysis_cache
+from backend.services.model_router import model_router, heuristic_summary
+from backend.services.single_flight import create_chat_completion
+from backend.services.openai_scheduler import estimate_chat_tokens, openai_scheduler
+from backend.services.prompt_preprocessing import preprocess_text
+from backend.services.structured_output import (
+    StructuredOutputError,
+    function_tool_params,
+    parse_function_call,
+)
 
 
 class EmailAnalysis(BaseModel):
@@ -52,12 +62,43 @@ SYSTEM_PROMPT = """You are an AI assistant that always responds with valid JSON.
 Your responses must be parseable JSON objects with no additional text or explanations.
 Use lowercase for all field values and ensure they match the expected formats."""
 
+# Bump when ANALYZE_EMAIL_PROMPT changes so cached analyses are not reused
+ANALYZE_EMAIL_PROMPT_VERSION = "2"
+# Streamed replies are plain text followed by this marker and a JSON metadata line,
+# so tokens can be shown as they arrive and structured fields parsed at the end
+REPLY_METADATA_MARKER = "---META---"
+STREAM_REPLY_PROMPT = (
+    "Generate a {tone} reply as plain text, without JSON or a subject line. "
+    f"After the reply, write a line containing only {REPLY_METADATA_MARKER} followed by "
+    "JSON with fields: tone (str), formality_level (int 1-5)"
+)
+
+ANALYZE_EMAIL_PROMPT = "Analyze this email and record the result with record_email_analysis: summary, stress_level (LOW/MEDIUM/HIGH), priority (LOW/MEDIUM/HIGH), action_items (list), sentiment_score (float between -1 and 1)"
+
+
+def _partial_marker_length(text: str) -> int:
+    """Length of the longest suffix of text that could be the start of the metadata marker"""
+    for length in range(min(len(REPLY_METADATA_MARKER) - 1, len(text)), 0, -1):
+        if text.endswith(REPLY_METADATA_MARKER[:length]):
+            return length
+    return 0
+
 
 class AIHandler:
     def __init__(self, testing: bool = False):
         self.testing = testing
         if not testing:
-            self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+            self.client = AsyncOpenAI(
+                api_key=settings.OPENAI_API_KEY,
+                base_url=settings.OPENAI_BASE_URL,
+                max_retries=0,
+                http_client=openai_scheduler.http_client(),
+            )
+
+    async def close(self) -> None:
+        """Close the client's connection pool; needed for handlers created per task"""
+        if not self.testing:
+            await self.client.close()
 
     @retry(
         stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10)
@@ -98,9 +139,6 @@ class AIHandler:
         response_text = self._create_chat_completion([prompt, user_message])
         return self._parse_json_response(response_text, AIResponse)
 
-    @retry(
-        stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10)
-    )
     async def generate_reply(
         self, content: str, tone: Optional[str] = "professional"
     ) -> ReplyResponse:
@@ -113,7 +151,9 @@ class AIHandler:
                     formality_level=2
                 )
 
-            response = await self.client.chat.completions.create(
+            content = preprocess_text(content, "generate_reply").text
+            response = await create_chat_completion(
+                self.client,
                 model="gpt-4",
                 messages=[
                     {
@@ -131,8 +171,87 @@ class AIHandler:
             logger.error(f"Reply generation failed: {str(e)}")
             raise HTTPException(status_code=500, detail="Failed to generate reply")
 
-    async def analyze_email(self, content: str) -> EmailAnalysis:
-        """Analyze email content and return structured analysis."""
+    async def stream_reply(
+        self,
+        content: str,
+        tone: Optional[str] = "professional",
+        instructions: Optional[str] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Stream a reply as "token" events, then a "done" event with the full ReplyResponse."""
+        if self.testing:
+            for word in ["Test ", "reply ", "content"]:
+                yield {"event": "token", "data": {"content": word}}
+            reply = ReplyResponse(content="Test reply content", tone="professional", formality_level=2)
+            yield {"event": "done", "data": reply.dict()}
+            return
+
+        content = preprocess_text(content, "stream_reply").text
+        system_prompt = STREAM_REPLY_PROMPT.format(tone=tone)
+        if instructions:
+            system_prompt = f"{system_prompt}\n{instructions}"
+
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": content},
+        ]
+        stream = await openai_scheduler.run(
+            "gpt-4",
+            estimate_chat_tokens(messages, 500),
+            lambda: self.client.chat.completions.create(
+                model="gpt-4",
+                messages=messages,
+                temperature=0.7,
+                max_tokens=500,
+                stream=True,
+            ),
+        )
+
+        buffer = ""
+        sent = 0
+        marker_at = -1
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            buffer += chunk.choices[0].delta.content or ""
+            if marker_at < 0:
+                marker_at = buffer.find(REPLY_METADATA_MARKER)
+            end = marker_at if marker_at >= 0 else len(buffer) - _partial_marker_length(buffer)
+            if end > sent:
+                yield {"event": "token", "data": {"content": buffer[sent:end]}}
+                sent = end
+
+        metadata: Dict[str, Any] = {}
+        if marker_at >= 0:
+            try:
+                metadata = json.loads(buffer[marker_at + len(REPLY_METADATA_MARKER):].strip())
+            except json.JSONDecodeError:
+                logger.warning("Streamed reply metadata was not valid JSON")
+            reply_text = buffer[:marker_at]
+        else:
+            if len(buffer) > sent:
+                yield {"event": "token", "data": {"content": buffer[sent:]}}
+            reply_text = buffer
+
+        reply = ReplyResponse(
+            content=reply_text.strip(),
+            tone=metadata.get("tone") or tone,
+            formality_level=metadata.get("formality_level") or 3,
+        )
+        yield {"event": "done", "data": reply.dict()}
+
+    async def analyze_email(
+        self,
+        content: str,
+        sender: Optional[Any] = None,
+        sender_history: Optional[Dict[str, int]] = None,
+        user_preferences: Optional[Any] = None,
+        email_id: Optional[int] = None,
+    ) -> EmailAnalysis:
+        """Analyze email content and return structured analysis.
+
+        The model is chosen by the model router from local signals; automated mail
+        without stress triggers is summarised locally without an LLM call.
+        """
         try:
             if self.testing:
                 return EmailAnalysis(
@@ -143,38 +262,60 @@ class AIHandler:
                     sentiment_score=0.5
                 )
 
-            response = await self.client.chat.completions.create(
-                model="gpt-4",
+            # Route and cache on the cleaned text so quoted history and
+            # boilerplate neither inflate the model choice nor split cache keys
+            content = preprocess_text(content, "analyze_email").text
+            decision = model_router.route(
+                "analyze_email",
+                content,
+                sender=sender,
+                sender_history=sender_history,
+                anxiety_triggers=getattr(user_preferences, "anxiety_triggers", None),
+                stress_sensitivity=getattr(user_preferences, "stress_sensitivity", None) or "MEDIUM",
+                email_id=email_id,
+            )
+            if decision.skip:
+                return EmailAnalysis(
+                    summary=heuristic_summary(content),
+                    stress_level=StressLevel.LOW,
+                    priority=Priority.LOW,
+                    action_items=[],
+                    sentiment_score=0.0,
+                )
+
+            cache_key = analysis_cache.make_key(
+                content, decision.model, ANALYZE_EMAIL_PROMPT_VERSION
+            )
+            cached = analysis_cache.get("analyze_email", cache_key)
+            if cached is not None:
+                return EmailAnalysis(**cached)
+
+            response = await create_chat_completion(
+                self.client,
+                model=decision.model,
                 messages=[
-                    {
-                        "role": "system",
-                        "content": "Analyze this email and return JSON with fields: summary, stress_level (LOW/MEDIUM/HIGH), priority (LOW/MEDIUM/HIGH), action_items (list), sentiment_score (float between -1 and 1)"
-                    },
+                    {"role": "system", "content": ANALYZE_EMAIL_PROMPT},
                     {"role": "user", "content": content},
                 ],
+                **function_tool_params(
+                    "record_email_analysis", "Record the email analysis", EmailAnalysis
+                ),
             )
-            result = json.loads(response.choices[0].message.content)
-            # Convert enum fields to uppercase to match the expectation
-            if "stress_level" in result and isinstance(result["stress_level"], str):
-                result["stress_level"] = result["stress_level"].upper()
-            if "priority" in result and isinstance(result["priority"], str):
-                result["priority"] = result["priority"].upper()
-            # Filter only the fields needed by EmailAnalysis
-            keys = {
-                "summary",
-                "stress_level",
-                "priority",
-                "action_items",
-                "sentiment_score",
-            }
-            filtered = {k: v for k, v in result.items() if k in keys}
-            return EmailAnalysis(**filtered)
-        except ValidationError as e:
-            logger.error(f"Email analysis validation failed: {str(e)}")
-            raise HTTPException(status_code=422, detail=str(e))
-        except json.JSONDecodeError as e:
-            logger.error(f"Email analysis JSON parsing failed: {str(e)}")
-            raise HTTPException(status_code=500, detail=str(e))
+            try:
+                analysis = parse_function_call(response, "record_email_analysis", EmailAnalysis)
+            except StructuredOutputError as e:
+                # Malformed model output is not a server error; degrade to the
+                # local summary instead of asking the model again
+                logger.error(f"Email analysis output was invalid: {str(e)}")
+                return EmailAnalysis(
+                    summary=heuristic_summary(content),
+                    stress_level=StressLevel.MEDIUM,
+                    priority=Priority.MEDIUM,
+                    action_items=[],
+                    sentiment_score=0.0,
+                )
+            analysis_cache.set("analyze_email", cache_key, analysis.dict())
+            return analysis
         except Exception as e:
             logger.error(f"Email analysis failed: {str(e)}")
             raise HTTPException(status_code=500, detail=str(e))
@@ -187,6 +328,8 @@ class AIHandler:
             if self.testing:
                 return "Test response suggestion"
 
+            email_content = preprocess_text(email_content, "generate_response_suggestion").text
+
             assistance_level = user_preferences.get("ai_assistance", {}).get(
                 "level", "balanced"
             )
@@ -208,7 +351,8 @@ Response should be:
 4. Address all key points
 """
 
-            response = await self.client.chat.completions.create(
+            response = await create_chat_completion(
+                self.client,
                 model="gpt-4",
                 messages=[
                     {
@@ -234,7 +378,9 @@ Response should be:
             if self.testing:
                 return "Simplified test content"
 
-            response = await self.client.chat.completions.create(
+            content = preprocess_text(content, "simplify_content").text
+            response = await create_chat_completion(
+                self.client,
                 model="gpt-4",
                 messages=[
                     {"role": "system", "content": "Simplify this email"},
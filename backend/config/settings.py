@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings
 from pydantic import Field
-from typing import Optional, List
+from typing import Optional, List, Dict
 import os
 from pathlib import Path
 
@@ -95,7 +95,11 @@ class Settings(BaseSettings):
         default="your-openai-key",
         description="OpenAI API key"
     )
-    
+    OPENAI_BASE_URL: Optional[str] = Field(
+        default=None,
+        description="Override the OpenAI API base URL (e.g. the offline fake server)"
+    )
+
     # Logging settings
     LOG_LEVEL: str = Field(
         default="INFO",
@@ -130,6 +134,360 @@ class Settings(BaseSettings):
         description="Celery result backend"
     )
     
+    # Analysis cache settings
+    ANALYSIS_CACHE_ENABLED: bool = Field(
+        default=True,
+        description="Cache LLM email analysis results by content hash"
+    )
+    ANALYSIS_CACHE_TTL: int = Field(
+        default=604800,
+        description="Redis TTL in seconds for cached analysis results"
+    )
+    ANALYSIS_CACHE_MAX_ENTRIES: int = Field(
+        default=1024,
+        description="Maximum entries held in the in-process analysis LRU"
+    )
+
+    # Embedding batching settings
+    EMBEDDING_BATCH_MAX_WAIT_MS: float = Field(
+        default=5,
+        description="How long to collect concurrent embedding calls before sending a batch"
+    )
+    EMBEDDING_BATCH_MAX_SIZE: int = Field(
+        default=256,
+        description="Maximum number of texts per embeddings request"
+    )
+    EMBEDDING_BATCH_TOKEN_BUDGET: int = Field(
+        default=100000,
+        description="Approximate token budget per embeddings request"
+    )
+
+    # Embedding provider settings
+    EMBEDDING_PROVIDER: str = Field(
+        default="auto",
+        description="Embedding provider for vector memory: openai, local, or auto (openai when an API key is set)"
+    )
+    EMBEDDING_MODEL: str = Field(
+        default="text-embedding-3-small",
+        description="OpenAI embedding model used by the openai provider"
+    )
+    EMBEDDING_DIMENSIONS: Optional[int] = Field(
+        default=None,
+        description="Shorten OpenAI embeddings to this many dimensions (text-embedding-3 models); unset keeps full size"
+    )
+    EMBEDDING_LOCAL_DIMENSIONS: int = Field(
+        default=384,
+        description="Vector size of the local hashing embedding provider"
+    )
+    EMBEDDING_CACHE_ENABLED: bool = Field(
+        default=True,
+        description="Persist embeddings on disk keyed by content hash and model"
+    )
+    EMBEDDING_CACHE_PATH: str = Field(
+        default="./data/embedding_cache.sqlite3",
+        description="SQLite file holding the persistent embedding cache"
+    )
+    EMBEDDING_QUANTIZATION: str = Field(
+        default="none",
+        description="Precision of persisted embeddings: none (float32), float16 or int8"
+    )
+
+    # Model routing settings
+    MODEL_ROUTER_ENABLED: bool = Field(
+        default=True,
+        description="Route email analysis by local signals instead of always using the premium model"
+    )
+    MODEL_ROUTER_STANDARD_MODEL: str = Field(
+        default="gpt-3.5-turbo",
+        description="Model used for routine email analysis"
+    )
+    MODEL_ROUTER_PREMIUM_MODEL: str = Field(
+        default="gpt-4-turbo",
+        description="Model used when local signals suggest a stressful or complex email"
+    )
+    MODEL_ROUTER_SKIP_AUTOMATED: bool = Field(
+        default=True,
+        description="Skip the LLM for newsletters and automated mail without stress triggers"
+    )
+    MODEL_ROUTER_LONG_EMAIL_CHARS: int = Field(
+        default=6000,
+        description="Emails longer than this are escalated to the premium model"
+    )
+    MODEL_ROUTER_URGENT_WORD_THRESHOLD: int = Field(
+        default=1,
+        description="Number of urgent words that escalates to the premium model"
+    )
+    MODEL_ROUTER_SENDER_STRESS_RATIO: float = Field(
+        default=0.5,
+        description="Share of high-stress past emails from a sender that escalates to the premium model"
+    )
+    MODEL_ROUTER_SENDER_MIN_HISTORY: int = Field(
+        default=3,
+        description="Past emails from a sender required before its stress ratio is used"
+    )
+
+    # Single-flight settings
+    SINGLE_FLIGHT_ENABLED: bool = Field(
+        default=True,
+        description="Share one OpenAI request between concurrent identical callers"
+    )
+    SINGLE_FLIGHT_DISTRIBUTED: bool = Field(
+        default=True,
+        description="Also de-duplicate across workers using a Redis lock"
+    )
+    SINGLE_FLIGHT_LOCK_TTL_MS: int = Field(
+        default=60000,
+        description="How long a worker may hold the single-flight lock for one request"
+    )
+    SINGLE_FLIGHT_POLL_INTERVAL_MS: int = Field(
+        default=100,
+        description="How often waiting workers poll Redis for the leader's result"
+    )
+    SINGLE_FLIGHT_RESULT_TTL: int = Field(
+        default=30,
+        description="Seconds a published single-flight result stays readable by waiting workers"
+    )
+
+    # Prompt preprocessing settings
+    PREPROCESS_ENABLED: bool = Field(
+        default=True,
+        description="Strip quoted history, signatures, disclaimers and links before LLM calls"
+    )
+    PREPROCESS_LLM_TOKEN_BUDGET: int = Field(
+        default=3000,
+        description="Maximum input tokens of email text per chat completion"
+    )
+    PREPROCESS_EMBEDDING_TOKEN_BUDGET: int = Field(
+        default=8000,
+        description="Maximum input tokens per text sent to the embeddings API"
+    )
+
+    # OpenAI scheduler settings
+    OPENAI_SCHEDULER_ENABLED: bool = Field(
+        default=True,
+        description="Queue OpenAI calls per model within requests- and tokens-per-minute budgets"
+    )
+    OPENAI_RATE_LIMITS: Dict[str, Dict[str, int]] = Field(
+        default={
+            "gpt-4": {"rpm": 500, "tpm": 30000},
+            "gpt-4-turbo": {"rpm": 500, "tpm": 30000},
+            "gpt-4-turbo-preview": {"rpm": 500, "tpm": 30000},
+            "gpt-3.5-turbo": {"rpm": 3500, "tpm": 200000},
+            "text-embedding-3-small": {"rpm": 3000, "tpm": 1000000},
+            "default": {"rpm": 500, "tpm": 30000},
+        },
+        description="Starting rpm/tpm budget per model; narrowed by the limits OpenAI reports"
+    )
+    OPENAI_SCHEDULER_MAX_RETRIES: int = Field(
+        default=5,
+        description="Times a rate-limited or failed OpenAI call is re-queued before giving up"
+    )
+
+    # Vector memory settings
+    VECTOR_MEMORY_MAX_WORKERS: int = Field(
+        default=4,
+        description="Threads running ChromaDB calls concurrently"
+    )
+    VECTOR_MEMORY_MAX_PENDING: int = Field(
+        default=64,
+        description="ChromaDB calls admitted (running or queued) before callers wait"
+    )
+    VECTOR_MEMORY_BULK_MAX_ITEMS: int = Field(
+        default=5000,
+        description="Maximum memories accepted by one bulk store request"
+    )
+    VECTOR_MEMORY_SHARDING: str = Field(
+        default="none",
+        description=(
+            "How memories are split across collections: none, user or bucket. "
+            "Run scripts/migrate_vector_shards.py before switching away from none"
+        )
+    )
+    VECTOR_MEMORY_USER_BUCKETS: int = Field(
+        default=64,
+        description="Number of shared collections users are hashed into when sharding by bucket"
+    )
+    VECTOR_MEMORY_COLLECTION_CACHE_SIZE: int = Field(
+        default=1024,
+        description="Open shard collection handles kept in memory"
+    )
+    VECTOR_MEMORY_PAGE_SIZE: int = Field(
+        default=100,
+        description="Memories returned per page when listing memories"
+    )
+    VECTOR_MEMORY_MAX_PAGE_SIZE: int = Field(
+        default=1000,
+        description="Largest page a memory listing may request"
+    )
+    VECTOR_MEMORY_SCAN_BATCH: int = Field(
+        default=1000,
+        description="Metadata records read per ChromaDB call while ordering a listing"
+    )
+    VECTOR_MEMORY_HYBRID_SEARCH: bool = Field(
+        default=True,
+        description="Fuse BM25 keyword matches with vector results when recalling context"
+    )
+    VECTOR_MEMORY_HYBRID_CANDIDATES: int = Field(
+        default=4,
+        description="Candidates each retriever returns, as a multiple of the requested limit"
+    )
+    VECTOR_MEMORY_RRF_K: int = Field(
+        default=60,
+        description="Reciprocal-rank fusion constant; larger values flatten rank differences"
+    )
+
+    # Passage chunking settings
+    PASSAGE_CHUNKING_ENABLED: bool = Field(
+        default=True,
+        description="Split long memories into separately embedded passages"
+    )
+    PASSAGE_MIN_DOCUMENT_TOKENS: int = Field(
+        default=384,
+        description="Memories longer than this many tokens are chunked into passages"
+    )
+    PASSAGE_MAX_TOKENS: int = Field(
+        default=256,
+        description="Maximum tokens per passage"
+    )
+    PASSAGE_OVERLAP_TOKENS: int = Field(
+        default=48,
+        description="Tokens of trailing context repeated at the start of the next passage"
+    )
+    PASSAGE_QUERY_OVERSAMPLE: int = Field(
+        default=3,
+        description="Vector results fetched per requested memory, before passages collapse to their parents"
+    )
+
+    # Recall cache settings
+    RECALL_CACHE_ENABLED: bool = Field(
+        default=True,
+        description="Cache query embeddings and memory recall results in process"
+    )
+    RECALL_CACHE_TTL: int = Field(
+        default=300,
+        description="Seconds a cached recall result is served; bounds staleness from other processes' writes"
+    )
+    RECALL_CACHE_MAX_ENTRIES: int = Field(
+        default=2048,
+        description="Maximum recall result sets held in the in-process LRU"
+    )
+    RECALL_CACHE_EMBEDDING_ENTRIES: int = Field(
+        default=4096,
+        description="Maximum query embeddings held in the in-process LRU"
+    )
+
+    # Memory consolidation settings
+    MEMORY_DEDUP_SIMILARITY: float = Field(
+        default=0.97,
+        description="Cosine similarity above which two memories of the same type are merged"
+    )
+    MEMORY_ROLLUP_AGE_DAYS: int = Field(
+        default=30,
+        description="Age after which low-importance memories are rolled up into summaries"
+    )
+    MEMORY_ROLLUP_MAX_IMPORTANCE: float = Field(
+        default=0.3,
+        description="Highest importance a memory can have and still be rolled up"
+    )
+    MEMORY_ROLLUP_PERIOD: str = Field(
+        default="month",
+        description="Period each summary memory covers: week or month"
+    )
+    MEMORY_ROLLUP_MIN_GROUP: int = Field(
+        default=3,
+        description="Fewest memories in a period worth replacing with a summary"
+    )
+    MEMORY_USER_BUDGET: int = Field(
+        default=5000,
+        description="Memories kept per user; the lowest-retention ones beyond this are evicted"
+    )
+    MEMORY_EVICTION_HALF_LIFE_DAYS: float = Field(
+        default=90,
+        description="Age at which a memory's retention score halves"
+    )
+
+    # Neo4j settings
+    NEO4J_URI: str = Field(
+        default="bolt://localhost:7687",
+        description="Neo4j connection URI"
+    )
+    NEO4J_USER: str = Field(
+        default="neo4j",
+        description="Neo4j user"
+    )
+    NEO4J_PASSWORD: str = Field(
+        default="password",
+        description="Neo4j password"
+    )
+    NEO4J_DATABASE: Optional[str] = Field(
+        default=None,
+        description="Neo4j database name; unset uses the server default"
+    )
+    NEO4J_MAX_POOL_SIZE: int = Field(
+        default=50,
+        description="Maximum connections in the shared Neo4j driver pool"
+    )
+    NEO4J_CONNECTION_ACQUISITION_TIMEOUT: float = Field(
+        default=10,
+        description="Seconds to wait for a free pooled connection before failing"
+    )
+    NEO4J_CONNECTION_TIMEOUT: float = Field(
+        default=5,
+        description="Seconds to wait when opening a new connection to Neo4j"
+    )
+    NEO4J_QUERY_TIMEOUT: float = Field(
+        default=10,
+        description="Server-side timeout in seconds for each Cypher transaction"
+    )
+    NEO4J_SENDER_CACHE_SIZE: int = Field(
+        default=10000,
+        description="Sender-to-relationship-node ids kept in process; 0 disables the cache"
+    )
+    KNOWLEDGE_GRAPH_BACKEND: str = Field(
+        default="neo4j",
+        description="Knowledge graph backend: neo4j (falls back to memory when unreachable) or memory"
+    )
+    KNOWLEDGE_GRAPH_SNAPSHOT_PATH: Optional[str] = Field(
+        default=None,
+        description="File the in-memory knowledge graph is persisted to; unset keeps it in memory only"
+    )
+    KNOWLEDGE_GRAPH_SNAPSHOT_INTERVAL: float = Field(
+        default=30,
+        description="Minimum seconds between in-memory knowledge graph snapshots"
+    )
+    KNOWLEDGE_GRAPH_SEARCH_BUDGET: int = Field(
+        default=1000,
+        description="Maximum expansions per reasoning or relevance search before it returns its best result so far"
+    )
+    KNOWLEDGE_GRAPH_NEO4J_SEARCH_BUDGET: int = Field(
+        default=100,
+        description="KNOWLEDGE_GRAPH_SEARCH_BUDGET for searches against Neo4j, where neighbors cost a round trip"
+    )
+    KNOWLEDGE_GRAPH_NEO4J_EXPAND_BATCH: int = Field(
+        default=25,
+        description="Frontier nodes whose neighbors one Neo4j search query fetches"
+    )
+    KNOWLEDGE_GRAPH_SEARCH_FANOUT: int = Field(
+        default=50,
+        description="Strongest outgoing relationships followed from each node during a search"
+    )
+    KNOWLEDGE_GRAPH_MIN_PATH_STRENGTH: float = Field(
+        default=0.001,
+        description="Relevance paths whose strength product falls below this are pruned"
+    )
+    KNOWLEDGE_GRAPH_RELEVANCE_TOP_K: int = Field(
+        default=10,
+        description="Most relevant target nodes kept with each relevance score"
+    )
+    KNOWLEDGE_GRAPH_RELEVANCE_CACHE_SIZE: int = Field(
+        default=1000,
+        description="Relevance results cached per (entity, target type); 0 disables the cache"
+    )
+    KNOWLEDGE_GRAPH_RELEVANCE_CACHE_TTL: int = Field(
+        default=300,
+        description="Seconds a cached relevance result is served, bounding staleness from other processes' writes"
+    )
+
     # Monitoring settings
     SENTRY_DSN: Optional[str] = Field(
         default=None,
@@ -18,6 +18,9 @@ from backend.routes.knowledge_graph_routes import router as graph_router
 from backend.config import settings
 from backend.utils.error_handlers import setup_error_handlers
 from backend.utils.cache import cache_service
+from backend.services.neo4j_driver import close_driver
+from backend.services.neo4j_service import neo4j_service
+from backend.services.knowledge_graph import knowledge_graph_service
 from backend.tasks.worker import celery as celery_app
 from backend.database import Base, engine
 from backend.utils.logger import setup_logger
@@ -211,6 +214,13 @@ async def startup_event():
             worker_max_tasks_per_child=50,
             broker_connection_retry_on_startup=True
         )
+        
+        # Create Neo4j constraints and indexes; the graph stays optional.
+        # Older nodes get the shared label via scripts/migrate_graph_labels.py
+        try:
+            await neo4j_service.ensure_schema()
+        except Exception as e:
+            logger.warning(f"Neo4j schema bootstrap skipped: {str(e)}")
 
     except Exception as e:
         logger.error(f"Error during startup: {str(e)}")
@@ -224,6 +234,9 @@ async def shutdown_event():
     # Close Redis connection
     if cache_service.redis:
         cache_service.redis.close()
+    # Persist the in-memory knowledge graph, if used, and close the shared Neo4j connection pool
+    await knowledge_graph_service.close()
+    await close_driver()
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
@@ -27,6 +27,7 @@ class EdgeType(str, Enum):
     SCHEDULED_FOR = "scheduled_for"
     CREATED_BY = "created_by"
     SENT_TO = "sent_to"
+    SENT_BY = "sent_by"
     RESPONDED_TO = "responded_to"
     IMPROVES = "improves"
     WORSENS = "worsens"
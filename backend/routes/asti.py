@@ -232,7 +232,8 @@ async def analyze_email(
             "stress_sensitivity": user_preferences.get("stress_sensitivity", "MEDIUM"),
             "communication_preferences": user_preferences.get("communication_preferences", "CLEAR"),
             "action_item_detail": user_preferences.get("action_item_detail", "HIGH"),
-            "use_advanced_model": True  # Use GPT-4 for email analysis
+            "anxiety_triggers": user_preferences.get("anxiety_triggers"),
+            "sender": email.sender,
         }
         
         # Get AI analysis using the enhanced email summary feature
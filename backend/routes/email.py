@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from typing import List, Optional, Dict
 from datetime import datetime, timedelta
 from enum import Enum
+import asyncio
 import os
 import uuid
 
@@ -17,7 +18,9 @@ from backend.schemas.email import (
     EmailAnalysisResponse,
     EmailReplyResponse,
     EmailReplyRequest,
-    EmailReplyConfirmation
+    EmailReplyConfirmation,
+    EmailIngestResponse,
+    AnalysisJobResponse,
 )
 from backend.auth.security import get_current_user, get_current_active_user
 from backend.database import get_db
@@ -26,7 +29,9 @@ from backend.utils.logger import logger, log_error, log_accessibility_event
 from backend.config import settings
 from backend.services.stress_analysis import analyze_email_stress, StressAnalyzer
 from backend.services.openai_service import analyze_content
+from backend.services.analysis_jobs import enqueue_email_analysis, get_job_status
 from backend.utils.email_parsing import parse_email_file
+from backend.utils.sse import sse_response
 
 router = APIRouter(tags=["emails"])
 testing_mode = os.getenv("TESTING") == "1"
@@ -40,19 +45,14 @@ class EmailTone(str, Enum):
     FORMAL = "formal"
 
 
-@router.post("", response_model=EmailResponse)
+@router.post("", response_model=EmailIngestResponse, status_code=202)
 async def create_email(
     email_data: EmailCreate,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
-) -> Email:
-    """Create a new email with AI analysis."""
+) -> Dict:
+    """Store a new email and queue its AI analysis on the worker."""
     try:
-        # Get AI analysis of the email
-        analysis = await ai_handler.analyze_email(email_data.content)
-
-        # Create new email with AI analysis results
         new_email = Email(
             user_id=current_user.id,
             subject=email_data.subject,
@@ -61,26 +61,12 @@ async def create_email(
             recipient=email_data.recipient,
             timestamp=datetime.utcnow(),
             category_id=None,  # We'll set this based on rules later
-            stress_level=analysis.stress_level,
-            priority=analysis.priority,
-            summary=analysis.summary,
-            action_items=analysis.action_items,
-            sentiment_score=analysis.sentiment_score,
-            is_processed=True,
+            is_processed=False,
         )
 
         db.add(new_email)
         db.commit()
         db.refresh(new_email)
-
-        # Schedule background processing if needed
-        background_tasks.add_task(process_email_background, new_email.id, db)
-
-        return new_email
-
-    except HTTPException:
-        # Let HTTP exceptions pass through
-        raise
     except Exception as e:
         logger.error(
             f"Error creating email: {str(e)}",
@@ -88,6 +74,22 @@ async def create_email(
         )
         raise HTTPException(status_code=500, detail="Failed to process email")
 
+    # The email is stored either way; clients can fall back to POST /{id}/analyze
+    job_id = None
+    job_status = "queued"
+    try:
+        job_id = enqueue_email_analysis(new_email.id, current_user.id)
+    except Exception as e:
+        logger.error(
+            f"Error queueing email analysis: {str(e)}",
+            extra={"user_id": current_user.id, "email_id": new_email.id},
+        )
+        job_status = "unavailable"
+
+    response = EmailResponse.from_orm(new_email).dict()
+    response.update({"job_id": job_id, "job_status": job_status})
+    return response
+
 
 @router.get("", response_model=List[EmailResponse])
 async def get_emails(
@@ -274,6 +276,43 @@ async def get_stress_report(
         raise HTTPException(status_code=500, detail="Failed to retrieve stress report")
 
 
+@router.get("/jobs/{job_id}", response_model=AnalysisJobResponse)
+async def get_analysis_job(
+    job_id: str,
+    current_user: User = Depends(get_current_active_user),
+):
+    """Poll the status of an email analysis job."""
+    job = get_job_status(job_id, current_user.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Analysis job not found")
+    return job
+
+
+@router.get("/jobs/{job_id}/result", response_model=EmailAnalysisResponse)
+async def get_analysis_job_result(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    """Get the analysis produced by a completed job."""
+    job = get_job_status(job_id, current_user.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Analysis job not found")
+    if job["status"] != "completed":
+        raise HTTPException(
+            status_code=409, detail=f"Analysis job is {job['status']}"
+        )
+
+    email = await get_email(job["email_id"], current_user.id, db)
+    return EmailAnalysisResponse(
+        stress_level=email.stress_level,
+        priority=email.priority,
+        summary=email.summary,
+        action_items=email.action_items or [],
+        sentiment_score=email.sentiment_score,
+    )
+
+
 @router.get("/{email_id}", response_model=EmailResponse)
 async def get_email(
     email_id: int,
@@ -421,28 +460,20 @@ async def generate_email_reply(
         raise HTTPException(status_code=500, detail="Failed to generate reply")
 
 
-async def process_email_background(email_id: int, db: Session):
-    """Background task to process email with additional AI analysis."""
-    try:
-        email = db.query(Email).filter(Email.id == email_id).first()
-        if not email:
-            return
-
-        # Get priority analysis
-        priority_analysis = await analyze_priority(email.content)
-
-        # Update email with additional analysis
-        email.priority = priority_analysis["priority"]
-        email.stress_level = priority_analysis["stress_level"]
-        email.is_processed = True
-
-        db.commit()
+@router.post("/{email_id}/reply/stream")
+async def stream_email_reply(
+    email_id: int = Path(..., gt=0),
+    tone: EmailTone = EmailTone.PROFESSIONAL,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    """Stream an AI reply over Server-Sent Events.
 
-    except Exception as e:
-        logger.error(
-            f"Background processing failed: {str(e)}", extra={"email_id": email_id}
-        )
-        # Don't raise HTTP exception in background task
+    Emits "token" events as the reply is generated, then a "done" event with
+    content, tone and formality_level.
+    """
+    email = await get_email(email_id, current_user.id, db)
+    return sse_response(ai_handler.stream_reply(email.content, tone=tone.value))
 
 
 @router.post("/{email_id}/analyze", response_model=EmailAnalysisResponse)
@@ -506,11 +537,6 @@ async def generate_reply(
         raise
 
 
-async def analyze_priority(content: str):
-    analysis = await ai_handler.analyze_email(content)
-    return {"priority": analysis.priority, "stress_level": analysis.stress_level}
-
-
 async def get_email(email_id: int, user_id: int, db: Session) -> Email:
     """Helper function to get email by ID and user ID"""
     email = (
@@ -559,15 +585,9 @@ async def get_reply_suggestions(
         preferences = current_user.preferences or User.get_default_preferences()
         
         # Enhance context with neurodiversity accommodations
-        accessibility_context = {
-            "tone": tone,
-            "preferences": preferences,
-            "simplify_language": simplified or preferences.get("cognitiveLoadReduction", False),
-            "stress_sensitive": preferences.get("stressSensitivity", "MEDIUM"),
-            "neurodiverse_focus": True,
-            "breakdown_tasks": breakdown_tasks or preferences.get("taskBreakdownAssistance", False),
-            "anxiety_triggers": preferences.get("anxietyTriggers", ["urgent", "ASAP", "deadline"])
-        }
+        accessibility_context = _reply_accessibility_context(
+            preferences, tone, simplified, breakdown_tasks
+        )
         
         # Generate reply suggestions
         response = await analyze_content(
@@ -575,29 +595,14 @@ async def get_reply_suggestions(
             context=accessibility_context
         )
         
-        # Get available tones
-        available_tones = ["Professional", "Friendly", "Direct", "Simple"]
-        if preferences.get("preferredTones"):
-            available_tones = preferences.get("preferredTones")
-        
-        # Prepare response with neurodiversity considerations
-        reply_options = {
-            "suggestions": [
-                response.get("suggestion_formal", "I'm sorry, I couldn't generate a formal suggestion."),
-                response.get("suggestion_friendly", "I'm sorry, I couldn't generate a friendly suggestion.")
-            ],
-            "tone_analysis": response.get("tone_analysis", ""),
-            "stress_level": response.get("stress_level", "MEDIUM"),
-            "available_tones": available_tones
-        }
-        
-        # Include simplified version if requested
-        if simplified or preferences.get("cognitiveLoadReduction", False):
-            reply_options["simplified_version"] = response.get("simplified_version", "")
-            
-        # Include task breakdown if requested
-        if breakdown_tasks or preferences.get("taskBreakdownAssistance", False):
-            reply_options["task_breakdown"] = response.get("action_items", [])
+        # Replies in each requested tone come back with the analysis in one call
+        suggestions = [option["content"] for option in response.get("reply_options") or []]
+        reply_options = _reply_options(
+            response,
+            suggestions or ["I'm sorry, I couldn't generate a reply suggestion."],
+            accessibility_context,
+            preferences,
+        )
         
         # Log accessibility event
         log_accessibility_event(
@@ -618,6 +623,115 @@ async def get_reply_suggestions(
             detail="Failed to generate reply suggestions"
         )
 
+@router.post("/{email_id}/reply-suggestions/stream")
+async def stream_reply_suggestions(
+    email_id: int = Path(..., gt=0),
+    tone: Optional[str] = Query("professional", description="Desired tone of reply"),
+    simplified: Optional[bool] = Query(False, description="Include simplified version for cognitive accessibility"),
+    breakdown_tasks: Optional[bool] = Query(False, description="Break down complex tasks into steps"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    """Stream a reply suggestion over Server-Sent Events.
+
+    Emits "token" events as the draft is generated, then a "done" event with the
+    same structured fields as /reply-suggestions (tone analysis runs alongside).
+    """
+    email = await get_email(email_id, current_user.id, db)
+    preferences = current_user.preferences or User.get_default_preferences()
+    accessibility_context = _reply_accessibility_context(
+        preferences, tone, simplified, breakdown_tasks
+    )
+
+    async def events():
+        # The reply itself is streamed, so the analysis does not draft reply options
+        analysis_task = asyncio.create_task(
+            analyze_content(email.content, context={**accessibility_context, "tone_options": []})
+        )
+        try:
+            instructions = []
+            if accessibility_context["simplify_language"]:
+                instructions.append("Use short sentences and plain, literal language.")
+            if accessibility_context["breakdown_tasks"]:
+                instructions.append("Address each request in the email in its own short paragraph.")
+
+            async for event in ai_handler.stream_reply(
+                email.content, tone=tone, instructions=" ".join(instructions) or None
+            ):
+                if event["event"] != "done":
+                    yield event
+                    continue
+
+                reply = event["data"]
+                try:
+                    analysis = await analysis_task
+                except Exception as e:
+                    log_error(e, {"action": "stream_reply_suggestions", "email_id": email_id})
+                    analysis = {}
+
+                reply_options = _reply_options(
+                    analysis, [reply["content"]], accessibility_context, preferences
+                )
+                reply_options.update(reply)
+                log_accessibility_event(
+                    "neurodiverse_reply_suggestions_streamed",
+                    {
+                        "email_id": email_id,
+                        "tone": tone,
+                        "simplified": simplified,
+                        "breakdown_tasks": breakdown_tasks
+                    }
+                )
+                yield {"event": "done", "data": reply_options}
+        finally:
+            analysis_task.cancel()
+
+    return sse_response(events())
+
+
+def _reply_accessibility_context(
+    preferences: Dict, tone: str, simplified: bool, breakdown_tasks: bool
+) -> Dict:
+    """Build the accessibility context used to generate reply suggestions"""
+    return {
+        "tone": tone,
+        "preferences": preferences,
+        "simplify_language": simplified or preferences.get("cognitiveLoadReduction", False),
+        "stress_sensitive": preferences.get("stressSensitivity", "MEDIUM"),
+        "neurodiverse_focus": True,
+        "breakdown_tasks": breakdown_tasks or preferences.get("taskBreakdownAssistance", False),
+        "anxiety_triggers": preferences.get("anxietyTriggers", ["urgent", "ASAP", "deadline"]),
+        "tone_options": [tone] if tone == "friendly" else [tone, "friendly"]
+    }
+
+
+def _reply_options(
+    analysis: Dict, suggestions: List[str], accessibility_context: Dict, preferences: Dict
+) -> Dict:
+    """Assemble reply suggestions with the requested accessibility extras"""
+    # Get available tones
+    available_tones = ["Professional", "Friendly", "Direct", "Simple"]
+    if preferences.get("preferredTones"):
+        available_tones = preferences.get("preferredTones")
+
+    reply_options = {
+        "suggestions": suggestions,
+        "tone_analysis": analysis.get("tone_analysis", ""),
+        "stress_level": analysis.get("stress_level", "MEDIUM"),
+        "available_tones": available_tones
+    }
+
+    # Include simplified version if requested
+    if accessibility_context["simplify_language"]:
+        reply_options["simplified_version"] = analysis.get("simplified_version", "")
+
+    # Include task breakdown if requested
+    if accessibility_context["breakdown_tasks"]:
+        reply_options["task_breakdown"] = analysis.get("action_items", [])
+
+    return reply_options
+
+
 @router.post("/{email_id}/reply/preview", response_model=EmailReplyResponse)
 async def preview_reply(
     email_id: int,
@@ -657,7 +771,6 @@ async def preview_reply(
 async def send_reply(
     email_id: int,
     confirmation: EmailReplyConfirmation,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
 ):
@@ -687,12 +800,15 @@ async def send_reply(
         db.commit()
         db.refresh(reply)
         
-        # Process reply in background
-        background_tasks.add_task(
-            process_email_background,
-            reply.id,
-            db
-        )
+        # Analyze reply on the worker; the reply is already sent, so a queue
+        # outage must not turn into an error the client would retry
+        try:
+            enqueue_email_analysis(reply.id, current_user.id)
+        except Exception as e:
+            logger.warning(
+                f"Error queueing reply analysis: {str(e)}",
+                extra={"user_id": current_user.id, "email_id": reply.id},
+            )
         
         # Log accessibility event
         log_accessibility_event(
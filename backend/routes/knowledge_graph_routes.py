@@ -11,14 +11,14 @@ import os
 from enum import Enum
 
 # Import services
-from backend.services.knowledge_graph import Neo4jService
+from backend.services.knowledge_graph import knowledge_graph_service
 from backend.services.auth_service import get_current_user
 
 # Create router
 router = APIRouter(prefix="/api/graph", tags=["graph"])
 
-# Initialize knowledge graph service
-graph_service = Neo4jService()
+# Share the service instance, so an in-memory graph is the same one everywhere
+graph_service = knowledge_graph_service
 
 # Models
 class MemoryType(str, Enum):
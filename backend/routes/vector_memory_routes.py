@@ -3,16 +3,23 @@ Vector Memory API Routes
 Handles requests for ChromaDB vector operations
 """
 
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List, Dict, Any, Optional
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, List, Dict, Any, Optional
+from pydantic import BaseModel, Field
 from datetime import datetime
+import json
 import os
 from enum import Enum
 
+from backend.config import settings
+
 # Import services
-from backend.services.vector_memory import VectorMemoryService
+from backend.services.vector_memory import VectorMemoryService, BulkStoreResult, MemoryPage, MEMORY_PROJECTIONS
+from backend.services.vector_memory import Memory as StoredMemory
+from backend.services.memory_consolidation import ConsolidationReport, MemoryConsolidator
 from backend.services.auth_service import get_current_user
+from backend.services.embedding_codec import pack_base64
 
 # Create router
 router = APIRouter(prefix="/api/vector", tags=["vector"])
@@ -35,6 +42,19 @@ class Memory(BaseModel):
     metadata: Optional[Dict[str, Any]] = None
     embedding: Optional[List[float]] = None
 
+class EmbeddingFormat(str, Enum):
+    NONE = "none"
+    BASE64 = "base64"
+
+class MemoryResponse(BaseModel):
+    id: str
+    type: MemoryType
+    content: str
+    timestamp: int
+    metadata: Optional[Dict[str, Any]] = None
+    # Base64 of little-endian float32 values, only when requested with embedding_format=base64
+    embedding: Optional[str] = None
+
 class MemoryCreate(BaseModel):
     type: MemoryType
     content: str
@@ -42,7 +62,7 @@ class MemoryCreate(BaseModel):
     embedding: Optional[List[float]] = None
 
 class MemoryQueryResult(BaseModel):
-    memory: Memory
+    memory: MemoryResponse
     score: float
 
 class QueryOptions(BaseModel):
@@ -50,14 +70,28 @@ class QueryOptions(BaseModel):
     limit: Optional[int] = 5
     threshold: Optional[float] = 0.1
 
+class BulkMemoryRequest(BaseModel):
+    memories: List[Memory] = Field(..., max_length=settings.VECTOR_MEMORY_BULK_MAX_ITEMS)
+
 class VectorQuery(BaseModel):
     query: str
     embedding: Optional[List[float]] = None
     options: Optional[QueryOptions] = None
 
+def _memory_response(memory: Any, embedding_format: EmbeddingFormat = EmbeddingFormat.NONE) -> Dict[str, Any]:
+    """A memory as returned by the API: embeddings are omitted unless asked for, then base64-packed"""
+    data = memory.dict(exclude={"embedding"})
+    if embedding_format == EmbeddingFormat.BASE64 and memory.embedding is not None:
+        data["embedding"] = pack_base64(memory.embedding)
+    return data
+
 # Routes
-@router.post("/memory", response_model=Memory)
-async def store_memory(memory: Memory, user = Depends(get_current_user)):
+@router.post("/memory", response_model=MemoryResponse)
+async def store_memory(
+    memory: Memory,
+    embedding_format: EmbeddingFormat = EmbeddingFormat.NONE,
+    user = Depends(get_current_user)
+):
     """Store a memory with its vector embedding"""
     try:
         # Add user_id to metadata to support multi-tenant isolation
@@ -67,10 +101,25 @@ async def store_memory(memory: Memory, user = Depends(get_current_user)):
         
         # Store memory in vector database
         result = await vector_service.store_memory(memory)
-        return result
+        return _memory_response(result, embedding_format)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to store memory: {str(e)}")
 
+@router.post("/memories/bulk", response_model=BulkStoreResult)
+async def store_memories_bulk(request: BulkMemoryRequest, user = Depends(get_current_user)):
+    """Store many memories in batched embedding and write calls, reporting each item's outcome"""
+    try:
+        memories = []
+        for memory in request.memories:
+            # Add user_id to metadata to support multi-tenant isolation
+            metadata = dict(memory.metadata or {})
+            metadata["user_id"] = user.id
+            memories.append(StoredMemory(**{**memory.dict(), "metadata": metadata}))
+        
+        return await vector_service.store_memories(memories)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to store memories: {str(e)}")
+
 @router.post("/query", response_model=List[MemoryQueryResult])
 async def query_memories(query: VectorQuery, user = Depends(get_current_user)):
     """Find memories related to a query using vector similarity"""
@@ -95,13 +144,36 @@ async def query_memories(query: VectorQuery, user = Depends(get_current_user)):
             limit=limit,
             threshold=threshold
         )
-        return results
+        return [{"memory": _memory_response(result.memory), "score": result.score} for result in results]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to query memories: {str(e)}")
 
-@router.get("/memories/{type}", response_model=List[Memory])
-async def get_memories_by_type(type: MemoryType, user = Depends(get_current_user)):
-    """Get all memories of a specific type"""
+async def _stream_page(page: MemoryPage, include: List[str]) -> AsyncIterator[str]:
+    """Serialize a page as a JSON array one memory at a time, with embeddings base64-packed"""
+    exclude = set(MEMORY_PROJECTIONS) - set(include)
+    embedding_format = EmbeddingFormat.BASE64 if "embedding" in include else EmbeddingFormat.NONE
+    yield "["
+    for i, memory in enumerate(page.memories):
+        data = _memory_response(memory, embedding_format)
+        for field in exclude:
+            data.pop(field, None)
+        yield ("," if i else "") + json.dumps(data)
+    yield "]"
+
+@router.get("/memories/{type}", response_model=List[MemoryResponse])
+async def get_memories_by_type(
+    type: MemoryType,
+    limit: int = Query(settings.VECTOR_MEMORY_PAGE_SIZE, ge=1, le=settings.VECTOR_MEMORY_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    include: List[str] = Query(default=[], description="Optional fields to return: content, embedding (base64 float32)"),
+    user = Depends(get_current_user)
+):
+    """
+    Get memories of a specific type, newest first, one page at a time.
+    
+    The X-Next-Cursor response header holds the cursor for the next page and is
+    absent on the last page.
+    """
     try:
         # Set user_id filter to ensure tenant isolation
         where_filter = {
@@ -110,22 +182,39 @@ async def get_memories_by_type(type: MemoryType, user = Depends(get_current_user
         }
         
         # Query vector database
-        results = await vector_service.get_memories(where=where_filter)
-        return results
+        page = await vector_service.list_memories(
+            where=where_filter,
+            limit=limit,
+            cursor=cursor,
+            include=include
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get memories: {str(e)}")
+    
+    headers = {"X-Next-Cursor": page.next_cursor} if page.next_cursor else {}
+    return StreamingResponse(_stream_page(page, include), media_type="application/json", headers=headers)
+
+@router.post("/memories/consolidate", response_model=ConsolidationReport)
+async def consolidate_memories(dry_run: bool = True, user = Depends(get_current_user)):
+    """Merge duplicates, roll up old memories and enforce the memory budget; dry-run by default"""
+    try:
+        return await MemoryConsolidator(vector_service).consolidate_user(user.id, dry_run=dry_run)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to consolidate memories: {str(e)}")
 
 @router.delete("/memory/{memory_id}", response_model=bool)
 async def delete_memory(memory_id: str, user = Depends(get_current_user)):
     """Delete a memory by ID"""
     try:
         # Get memory to check ownership
-        memory = await vector_service.get_memory_by_id(memory_id)
+        memory = await vector_service.get_memory_by_id(memory_id, user_id=user.id)
         if not memory or memory.metadata.get("user_id") != user.id:
             raise HTTPException(status_code=404, detail="Memory not found")
         
         # Delete memory
-        result = await vector_service.delete_memory(memory_id)
+        result = await vector_service.delete_memory(memory_id, user_id=user.id)
         return result
     except HTTPException:
         raise
@@ -108,3 +108,15 @@ class EmailResponse(EmailBase):
 
     class Config:
         orm_mode = True
+
+
+class EmailIngestResponse(EmailResponse):
+    job_id: Optional[str] = None
+    job_status: str = "queued"
+
+
+class AnalysisJobResponse(BaseModel):
+    job_id: str
+    email_id: int
+    status: str
+    error: Optional[str] = None
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Benchmark recall against memory for reduced-dimension and quantized embeddings.
+
+Embeds a corpus once at full size, then for each dimension count and
+quantization mode reports bytes per vector, the memory needed for the whole
+corpus, and recall@k of exact cosine search compared with full-size float32
+vectors. Reduced dimensions are produced by truncating and re-normalizing, which
+is what the text-embedding-3 models return when asked for fewer dimensions.
+
+The local provider is not truncation-aware, so with --provider local each
+dimension count is embedded separately instead.
+
+Usage:
+    python backend/scripts/benchmark_embedding_storage.py --provider local --documents 5000
+    python backend/scripts/benchmark_embedding_storage.py --provider openai --corpus emails.txt --dimensions 1536 512 256
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+# Add the parent directory to sys.path to allow importing from the backend
+backend_dir = str(Path(__file__).resolve().parent.parent.parent)
+sys.path.append(backend_dir)
+
+from backend.services.embedding_codec import QUANTIZATION_MODES, bytes_per_vector, dequantize, quantize, truncate
+from backend.services.embedding_provider import LocalEmbeddingProvider, OpenAIEmbeddingProvider
+
+SUBJECTS = ["invoice", "meeting", "flight", "contract", "newsletter", "deadline", "report", "payment", "offsite", "review"]
+VERBS = ["moved to", "is due", "was approved for", "needs input before", "got cancelled for", "is confirmed for"]
+WHEN = ["Monday", "Tuesday", "next week", "the end of the month", "Q3", "tomorrow morning", "Friday afternoon"]
+
+
+def synthetic_corpus(count: int, seed: int) -> List[str]:
+    """Short email-like sentences with overlapping vocabulary"""
+    rng = random.Random(seed)
+    return [
+        f"The {rng.choice(SUBJECTS)} {rng.randint(1, 500)} {rng.choice(VERBS)} {rng.choice(WHEN)}. "
+        f"Please check the {rng.choice(SUBJECTS)} with {rng.choice(['Ana', 'Ben', 'Chen', 'Dara', 'Eli'])}."
+        for _ in range(count)
+    ]
+
+
+def perturb(text: str, rng: random.Random) -> str:
+    """A query resembling a document: drop a few of its words"""
+    words = text.split()
+    keep = [word for word in words if rng.random() > 0.25]
+    return " ".join(keep or words)
+
+
+def embed(provider, texts: List[str], batch_size: int) -> np.ndarray:
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        vectors.extend(provider.embed(texts[start:start + batch_size]))
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def top_k(queries: np.ndarray, documents: np.ndarray, k: int) -> np.ndarray:
+    scores = queries @ documents.T
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return top
+
+
+def recall(found: np.ndarray, truth: np.ndarray) -> float:
+    return float(np.mean([len(set(a) & set(b)) / len(b) for a, b in zip(found, truth)]))
+
+
+def round_trip(vectors: np.ndarray, mode: str) -> np.ndarray:
+    """Vectors as they would be read back from storage"""
+    if mode == "none":
+        return vectors
+    return np.asarray([dequantize(quantize(vector, mode)) for vector in vectors], dtype=np.float32)
+
+
+def main(args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    if args.corpus:
+        documents = [line.strip() for line in Path(args.corpus).read_text().splitlines() if line.strip()]
+    else:
+        documents = synthetic_corpus(args.documents, args.seed)
+    queries = [perturb(rng.choice(documents), rng) for _ in range(args.queries)]
+
+    full_dimensions = max(args.dimensions)
+    if args.provider == "openai":
+        provider = OpenAIEmbeddingProvider(dimensions=None)
+    else:
+        provider = LocalEmbeddingProvider(dimensions=full_dimensions)
+
+    started = time.perf_counter()
+    full_documents = embed(provider, documents, args.batch_size)
+    full_queries = embed(provider, queries, args.batch_size)
+    elapsed = time.perf_counter() - started
+    full_dimensions = full_documents.shape[1]
+    truth = top_k(full_queries, full_documents, args.k)
+
+    print(f"Provider: {provider.model_name}  documents={len(documents)}  queries={len(queries)}  k={args.k}")
+    print(f"Embedded {len(documents) + len(queries)} texts in {elapsed:.2f}s")
+    print(f"{'dims':>6}{'quant':>9}{'bytes/vec':>11}{'corpus MB':>11}{'vs full':>9}{'recall@k':>10}")
+    for dimensions in sorted(args.dimensions, reverse=True):
+        dimensions = min(dimensions, full_dimensions)
+        if args.provider == "openai" or dimensions == full_dimensions:
+            document_vectors = truncate(full_documents, dimensions)
+            query_vectors = truncate(full_queries, dimensions)
+        else:
+            reduced = LocalEmbeddingProvider(dimensions=dimensions)
+            document_vectors = embed(reduced, documents, args.batch_size)
+            query_vectors = embed(reduced, queries, args.batch_size)
+
+        for mode in QUANTIZATION_MODES:
+            size = bytes_per_vector(dimensions, mode)
+            found = top_k(query_vectors, round_trip(document_vectors, mode), args.k)
+            print(
+                f"{dimensions:>6}{mode:>9}{size:>11}"
+                f"{size * len(documents) / 2 ** 20:>11.2f}"
+                f"{bytes_per_vector(full_dimensions, 'none') / size:>8.1f}x"
+                f"{recall(found, truth):>10.3f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark recall against memory for compact embeddings")
+    parser.add_argument("--provider", choices=["local", "openai"], default="local")
+    parser.add_argument("--corpus", help="Text file with one document per line (default: synthetic emails)")
+    parser.add_argument("--documents", type=int, default=5000, help="Synthetic corpus size")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dimensions", type=int, nargs="+", default=[1536, 768, 512, 256])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
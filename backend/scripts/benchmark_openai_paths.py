@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Benchmark the LLM and embedding paths against the offline fake OpenAI server.
+
+Runs concurrent calls through analyze_content, get_email_summary_and_suggestion,
+generate_daily_brief, AIHandler.analyze_email and generate_embedding and reports
+throughput and p50/p95/p99 latency for each path.
+
+Usage:
+    python backend/scripts/benchmark_openai_paths.py --profile gpt35 --requests 200 --concurrency 20
+    python backend/scripts/benchmark_openai_paths.py --base-url http://localhost:8100/v1
+"""
+import argparse
+import asyncio
+import socket
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List
+
+# Add the parent directory to sys.path to allow importing from the backend
+backend_dir = str(Path(__file__).resolve().parent.parent.parent)
+sys.path.append(backend_dir)
+
+from backend.config import settings
+
+
+def start_fake_server(profile: str, rpm: int, tpm: int, error_rate: float) -> str:
+    """Start the fake OpenAI server on a free port in a background thread"""
+    import uvicorn
+    from backend.scripts.fake_openai_server import create_app
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    config = uvicorn.Config(
+        create_app(profile, rpm, tpm, error_rate, seed=0),
+        host="127.0.0.1",
+        port=port,
+        log_level="warning",
+    )
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}/v1"
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_path(
+    name: str,
+    call: Callable[[int], Awaitable[object]],
+    requests: int,
+    concurrency: int,
+) -> Dict[str, float]:
+    """Run `requests` calls with bounded concurrency and collect latencies"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(i: int) -> None:
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await call(i)
+                latencies.append(time.perf_counter() - start)
+            except Exception:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+
+    if not latencies:
+        return {"name": name, "ok": 0, "errors": errors, "rps": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0}
+    return {
+        "name": name,
+        "ok": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50": percentile(latencies, 50) * 1000,
+        "p95": percentile(latencies, 95) * 1000,
+        "p99": percentile(latencies, 99) * 1000,
+        "mean": statistics.mean(latencies) * 1000,
+    }
+
+
+def email_text(i: int) -> str:
+    # Distinct content per request so the analysis cache does not hide the API cost
+    return (
+        f"Subject: Quarterly report #{i}\n\n"
+        f"Hi team, please send your section of report {i} by Friday. "
+        "Let me know if anything is blocking you.\n\nThanks,\nAlex"
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    settings.OPENAI_BASE_URL = args.base_url or start_fake_server(
+        args.profile, args.rpm, args.tpm, args.error_rate
+    )
+    settings.OPENAI_API_KEY = settings.OPENAI_API_KEY or "sk-fake"
+
+    # Import after the base URL is set so the shared clients point at it
+    from backend.ai.handlers import AIHandler
+    from backend.services import openai_service
+    from backend.services.analysis_cache import analysis_cache
+
+    analysis_cache.enabled = args.with_cache
+    handler = AIHandler()
+
+    paths = {
+        "analyze_content": lambda i: openai_service.analyze_content(email_text(i)),
+        "email_summary": lambda i: openai_service.get_email_summary_and_suggestion(email_text(i), {}),
+        "daily_brief": lambda i: openai_service.generate_daily_brief(
+            {"name": f"User {i}"}, [{"subject": f"Report {i}", "summary": "Send report"}], []
+        ),
+        "aihandler_analyze": lambda i: handler.analyze_email(email_text(i)),
+        "embedding": lambda i: openai_service.generate_embedding(email_text(i)),
+    }
+    selected = args.paths or list(paths)
+
+    print(f"Target: {settings.OPENAI_BASE_URL}  requests={args.requests} concurrency={args.concurrency}")
+    print(f"{'path':<20}{'ok':>6}{'err':>6}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name in selected:
+        result = await run_path(name, paths[name], args.requests, args.concurrency)
+        print(
+            f"{result['name']:<20}{result['ok']:>6}{result['errors']:>6}{result['rps']:>10.1f}"
+            f"{result['p50']:>10.1f}{result['p95']:>10.1f}{result['p99']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark OpenAI-backed paths against the fake server")
+    parser.add_argument("--base-url", help="Use an already running server instead of starting one")
+    parser.add_argument("--profile", default="gpt35", help="Latency profile for the embedded fake server")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--rpm", type=int, default=0)
+    parser.add_argument("--tpm", type=int, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--with-cache", action="store_true", help="Leave the analysis cache enabled")
+    parser.add_argument("--paths", nargs="*", choices=[
+        "analyze_content", "email_summary", "daily_brief", "aihandler_analyze", "embedding",
+    ])
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+Offline stand-in for the OpenAI API, for benchmarks and network-free testing.
+
+Serves /v1/chat/completions, /v1/embeddings and /v1/models with deterministic,
+schema-valid responses for each prompt family the backend uses. Latency is
+drawn from a configurable profile, and token-per-minute / request-per-minute
+limits return 429s with OpenAI-style rate-limit headers.
+
+Usage:
+    python backend/scripts/fake_openai_server.py --profile gpt4 --port 8100
+    OPENAI_BASE_URL=http://localhost:8100/v1 uvicorn backend.main:app
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Add the parent directory to sys.path to allow importing from the backend
+backend_dir = str(Path(__file__).resolve().parent.parent.parent)
+sys.path.append(backend_dir)
+
+
+@dataclass
+class LatencyProfile:
+    """Latency model: lognormal time-to-first-token plus per-token generation time"""
+    ttft_median_ms: float
+    ttft_sigma: float
+    tokens_per_second: float
+    embedding_median_ms: float
+
+
+LATENCY_PROFILES: Dict[str, LatencyProfile] = {
+    "instant": LatencyProfile(0, 0, float("inf"), 0),
+    "fast": LatencyProfile(80, 0.3, 400, 20),
+    "gpt35": LatencyProfile(350, 0.5, 90, 120),
+    "gpt4": LatencyProfile(700, 0.6, 25, 120),
+    "degraded": LatencyProfile(2500, 0.9, 8, 600),
+}
+
+EMBEDDING_DIMENSIONS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
+
+LEVELS = ["LOW", "MEDIUM", "HIGH"]
+
+
+def count_tokens(text: str) -> int:
+    """Approximate token count (about 4 characters per token)"""
+    return max(1, len(text) // 4)
+
+
+def seeded_rng(*parts: Any) -> random.Random:
+    """Deterministic RNG seeded from the request content"""
+    digest = hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).digest()
+    return random.Random(int.from_bytes(digest[:8], "big"))
+
+
+class RateLimiter:
+    """Sliding one-minute window over requests and tokens"""
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.events: Deque[Tuple[float, int]] = deque()
+
+    def _trim(self, now: float) -> None:
+        while self.events and now - self.events[0][0] >= 60:
+            self.events.popleft()
+
+    def check(self, tokens: int) -> Tuple[bool, Dict[str, str]]:
+        """Record a request if it fits the budget and return rate-limit headers"""
+        now = time.monotonic()
+        self._trim(now)
+        used_tokens = sum(t for _, t in self.events)
+        allowed = (
+            (not self.rpm or len(self.events) < self.rpm)
+            and (not self.tpm or used_tokens + tokens <= self.tpm)
+        )
+        if allowed:
+            self.events.append((now, tokens))
+            used_tokens += tokens
+        reset = 60 - (now - self.events[0][0]) if self.events else 0
+        # Like OpenAI, only report the limits that apply
+        headers = {}
+        if self.rpm:
+            headers.update({
+                "x-ratelimit-limit-requests": str(self.rpm),
+                "x-ratelimit-remaining-requests": str(max(0, self.rpm - len(self.events))),
+                "x-ratelimit-reset-requests": f"{reset:.3f}s",
+            })
+        if self.tpm:
+            headers.update({
+                "x-ratelimit-limit-tokens": str(self.tpm),
+                "x-ratelimit-remaining-tokens": str(max(0, self.tpm - used_tokens)),
+                "x-ratelimit-reset-tokens": f"{reset:.3f}s",
+            })
+        if not allowed:
+            headers["retry-after"] = str(max(1, int(reset)))
+        return allowed, headers
+
+
+def _system_prompt(messages: List[Dict[str, Any]]) -> str:
+    return " ".join(m.get("content") or "" for m in messages if m.get("role") == "system")
+
+
+def _user_text(messages: List[Dict[str, Any]]) -> str:
+    return " ".join(m.get("content") or "" for m in messages if m.get("role") == "user")
+
+
+def fake_completion_content(messages: List[Dict[str, Any]]) -> str:
+    """Build a deterministic, schema-valid reply for the prompt family in messages"""
+    system = _system_prompt(messages)
+    user = _user_text(messages)
+    rng = seeded_rng(system, user)
+    level = rng.choice(LEVELS)
+    priority = rng.choice(LEVELS)
+    first_line = user.strip().splitlines()[0][:80] if user.strip() else "the message"
+
+    if "accessibility specialist" in system:
+        return (
+            f"**Summary:** {first_line}\n"
+            "- Read the main request.\n"
+            "- Note any **deadline**.\n"
+            "- Reply when you are ready."
+        )
+
+    if "daily brief" in system:
+        return json.dumps({
+            "greeting": "Good morning!",
+            "summary": "You have a few emails and events today.",
+            "email_highlights": [
+                {"subject": first_line, "summary": "Needs a quick look", "priority": priority}
+            ],
+            "upcoming_events": [
+                {"title": "Team Meeting", "time": "10:00", "preparation_needed": "Review agenda"}
+            ],
+            "suggested_priorities": [
+                {"task": "Reply to urgent emails", "reason": "Unblocks others"}
+            ],
+            "wellbeing_suggestion": "Take a short break every hour.",
+            "focus_tip": "Work on one task at a time.",
+        })
+
+    if "ASTI" in system and ("suggested_actions" in system or "record_email_summary" in system):
+        return json.dumps({
+            "summary": f"Email about: {first_line}",
+            "emotional_tone": rng.choice(["formal", "friendly", "urgent", "neutral"]),
+            "stress_level": level,
+            "explicit_expectations": ["Respond to the sender"],
+            "implicit_expectations": ["Respond within a working day"],
+            "suggested_actions": [{
+                "action": "Reply to the email",
+                "steps": ["Read the email", "Draft a reply", "Send it"],
+                "deadline": "Today" if level == "HIGH" else "This week",
+                "effort_level": rng.choice(LEVELS),
+            }],
+            "suggested_response": "Thanks for your email. I will get back to you soon.",
+            "needs_immediate_attention": level == "HIGH",
+        })
+
+    if "---META---" in system:
+        # Streamed reply: plain text, then the metadata marker and a JSON line
+        metadata = {
+            "tone": rng.choice(["professional", "friendly", "formal"]),
+            "formality_level": rng.randint(1, 5),
+        }
+        return (
+            "Hi,\n\nThank you for your message. I have read it and will follow up "
+            "with the details shortly.\n\nBest regards"
+            f"\n---META---\n{json.dumps(metadata)}"
+        )
+
+    if "formality_level" in system:
+        return json.dumps({
+            "content": "Thank you for your message. I will follow up shortly.",
+            "tone": rng.choice(["professional", "friendly", "formal"]),
+            "formality_level": rng.randint(1, 5),
+        })
+
+    if "stress_level" in system or "Stress level" in system:
+        analysis = {
+            "summary": f"Summary of: {first_line}",
+            "stress_level": level,
+            "priority": priority,
+            "action_items": [f"Follow up on {first_line[:40]}"],
+            "sentiment_score": round(rng.uniform(-1, 1), 2),
+        }
+        if "tone_analysis" in system or "Tone analysis" in system:
+            analysis["tone_analysis"] = "Neutral, professional tone"
+            analysis["suggestions"] = ["Reply briefly", "Confirm any deadline"]
+        return json.dumps(analysis)
+
+    return f"Response to: {first_line}"
+
+
+def _resolve_ref(schema: Dict[str, Any], root: Dict[str, Any]) -> Dict[str, Any]:
+    ref = schema.get("$ref")
+    if not ref:
+        return schema
+    node = root
+    for part in ref.lstrip("#/").split("/"):
+        node = node[part]
+    return node
+
+
+def conform_to_schema(value: Any, schema: Dict[str, Any], root: Dict[str, Any], rng: random.Random) -> Any:
+    """Coerce value into something valid for a (strict) JSON schema, filling gaps"""
+    schema = _resolve_ref(schema, root)
+    if "anyOf" in schema:
+        # Nullable fields are always filled in
+        options = [_resolve_ref(option, root) for option in schema["anyOf"]]
+        option = next((o for o in options if o.get("type") != "null"), options[0])
+        return conform_to_schema(value, option, root, rng)
+    if "enum" in schema:
+        return value if value in schema["enum"] else rng.choice(schema["enum"])
+
+    kind = schema.get("type")
+    if kind == "object":
+        value = value if isinstance(value, dict) else {}
+        return {
+            name: conform_to_schema(value.get(name), prop, root, rng)
+            for name, prop in schema.get("properties", {}).items()
+        }
+    if kind == "array":
+        items = value if isinstance(value, list) else [None]
+        return [conform_to_schema(item, schema.get("items", {}), root, rng) for item in items]
+    if kind == "string":
+        return value if isinstance(value, str) else "Generated text"
+    if kind == "number":
+        return value if isinstance(value, (int, float)) and not isinstance(value, bool) else round(rng.uniform(-1, 1), 2)
+    if kind == "integer":
+        return value if isinstance(value, int) and not isinstance(value, bool) else rng.randint(1, 5)
+    if kind == "boolean":
+        return value if isinstance(value, bool) else False
+    return value
+
+
+def fake_tool_arguments(messages: List[Dict[str, Any]], schema: Dict[str, Any]) -> str:
+    """Arguments for a forced function call: the prompt family's reply, fitted to the schema"""
+    rng = seeded_rng(_system_prompt(messages), _user_text(messages), "tool")
+    try:
+        base = json.loads(fake_completion_content(messages))
+    except ValueError:
+        base = {}
+    return json.dumps(conform_to_schema(base, schema, schema, rng))
+
+
+def fake_embedding(text: str, dimensions: int) -> List[float]:
+    """Deterministic unit vector derived from the text"""
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    rng = np.random.default_rng(int.from_bytes(digest[:8], "big"))
+    vector = rng.standard_normal(dimensions)
+    vector /= np.linalg.norm(vector)
+    return vector.astype(float).tolist()
+
+
+def create_app(
+    profile: str = "instant",
+    rpm: int = 0,
+    tpm: int = 0,
+    error_rate: float = 0.0,
+    seed: Optional[int] = None,
+) -> FastAPI:
+    """Create the fake OpenAI application"""
+    latency = LATENCY_PROFILES[profile]
+    limiter = RateLimiter(rpm=rpm, tpm=tpm)
+    # Latency and injected errors come from their own RNG so responses stay deterministic
+    jitter = random.Random(seed)
+    app = FastAPI(title="Fake OpenAI API")
+
+    def rate_limited(headers: Dict[str, str], message: str) -> JSONResponse:
+        return JSONResponse(
+            status_code=429,
+            headers=headers,
+            content={"error": {"message": message, "type": "rate_limit_exceeded", "code": "rate_limit_exceeded"}},
+        )
+
+    async def simulate_latency(median_ms: float, output_tokens: int = 0) -> None:
+        if median_ms <= 0:
+            return
+        delay = jitter.lognormvariate(np.log(median_ms / 1000), latency.ttft_sigma)
+        delay += output_tokens / latency.tokens_per_second
+        await asyncio.sleep(delay)
+
+    async def stream_chunks(completion_id: str, model: str, content: str):
+        """Yield chat.completion.chunk events, one word at a time"""
+        await simulate_latency(latency.ttft_median_ms)
+        pieces = re.findall(r"\S+\s*|\s+", content)
+        for i, piece in enumerate(pieces):
+            delta = {"content": piece}
+            if i == 0:
+                delta["role"] = "assistant"
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+            if latency.ttft_median_ms > 0:
+                await asyncio.sleep(count_tokens(piece) / latency.tokens_per_second)
+        final = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        }
+        yield f"data: {json.dumps(final)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    @app.get("/v1/models")
+    async def list_models():
+        models = ["gpt-4", "gpt-4-turbo", "gpt-3.5-turbo", *EMBEDDING_DIMENSIONS]
+        return {"object": "list", "data": [{"id": m, "object": "model", "owned_by": "fake"} for m in models]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        prompt_tokens = sum(count_tokens(m.get("content") or "") for m in messages)
+
+        # A forced function call (structured output) answers with tool_calls
+        tool = next(iter(body.get("tools") or []), None)
+        if tool and body.get("tool_choice") not in (None, "none", "auto"):
+            function = tool["function"]
+            content = fake_tool_arguments(messages, function.get("parameters", {}))
+        else:
+            function = None
+            content = fake_completion_content(messages)
+        completion_tokens = min(count_tokens(content), body.get("max_tokens") or 4096)
+
+        allowed, headers = limiter.check(prompt_tokens + completion_tokens)
+        if not allowed:
+            return rate_limited(headers, "Rate limit reached for tokens per min")
+        if error_rate and jitter.random() < error_rate:
+            return rate_limited(headers, "The server is overloaded, please retry")
+
+        completion_id = f"chatcmpl-{hashlib.sha1(content.encode()).hexdigest()[:24]}"
+        if function:
+            message = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{
+                    "id": f"call_{completion_id[-12:]}",
+                    "type": "function",
+                    "function": {"name": function["name"], "arguments": content},
+                }],
+            }
+        else:
+            message = {"role": "assistant", "content": content}
+        if body.get("stream"):
+            return StreamingResponse(
+                stream_chunks(completion_id, body.get("model", "gpt-4"), content),
+                media_type="text/event-stream",
+                headers=headers,
+            )
+
+        await simulate_latency(latency.ttft_median_ms, completion_tokens)
+
+        return JSONResponse(headers=headers, content={
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4"),
+            "choices": [{
+                "index": 0,
+                "message": message,
+                "finish_reason": "tool_calls" if function else "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        model = body.get("model", "text-embedding-3-small")
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dimensions = body.get("dimensions") or EMBEDDING_DIMENSIONS.get(model, 1536)
+        prompt_tokens = sum(count_tokens(text) for text in inputs)
+
+        allowed, headers = limiter.check(prompt_tokens)
+        if not allowed:
+            return rate_limited(headers, "Rate limit reached for tokens per min")
+        if error_rate and jitter.random() < error_rate:
+            return rate_limited(headers, "The server is overloaded, please retry")
+
+        await simulate_latency(latency.embedding_median_ms)
+
+        return JSONResponse(headers=headers, content={
+            "object": "list",
+            "model": model,
+            "data": [
+                {"object": "embedding", "index": i, "embedding": fake_embedding(text, dimensions)}
+                for i, text in enumerate(inputs)
+            ],
+            "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+        })
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run an offline OpenAI-compatible server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--profile", choices=sorted(LATENCY_PROFILES), default=os.environ.get("FAKE_OPENAI_PROFILE", "gpt4"))
+    parser.add_argument("--rpm", type=int, default=0, help="Requests per minute limit (0 = unlimited)")
+    parser.add_argument("--tpm", type=int, default=0, help="Tokens per minute limit (0 = unlimited)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with a 429")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for latency and error injection")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    print(f"Fake OpenAI API on http://{args.host}:{args.port}/v1 (profile={args.profile})")
+    uvicorn.run(
+        create_app(args.profile, args.rpm, args.tpm, args.error_rate, args.seed),
+        host=args.host,
+        port=args.port,
+        log_level="warning",
+    )
+
+
+if __name__ == "__main__":
+    main()
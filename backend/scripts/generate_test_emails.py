@@ -17,7 +17,7 @@ import random
 backend_dir = str(Path(__file__).resolve().parent.parent.parent)
 sys.path.append(backend_dir)
 
-from backend.services.openai_service import get_email_summary_and_suggestion, generate_embedding
+from backend.services.openai_service import get_email_summary_and_suggestion, generate_embeddings
 from backend.services.vector_memory import add_memory
 from backend.utils.logger import logger
 from backend.models.email import Email, EmailAnalysis
@@ -263,6 +263,13 @@ async def generate_and_analyze_test_emails(db: Session):
     """Generate and analyze test emails, storing results in the database."""
     print(f"Generating and analyzing {len(TEST_EMAILS)} test emails...")
     
+    # Embed every email in one request instead of one round trip per email
+    print(f"Generating embeddings for {len(TEST_EMAILS)} emails...")
+    embeddings = await generate_embeddings([
+        f"Subject: {email_data['subject']}\n\n{email_data['content']}"
+        for email_data in TEST_EMAILS
+    ])
+    
     for i, email_data in enumerate(TEST_EMAILS):
         print(f"\nProcessing email {i+1}/{len(TEST_EMAILS)}: {email_data['subject']}")
         
@@ -289,9 +296,7 @@ async def generate_and_analyze_test_emails(db: Session):
             print(f"  Analyzing with OpenAI...")
             ai_analysis = await get_email_summary_and_suggestion(full_email_text)
             
-            # Generate embedding
-            print(f"  Generating embedding...")
-            embedding = await generate_embedding(full_email_text)
+            embedding = embeddings[i]
             
             # Create memory ID for vector storage
             memory_id = str(uuid.uuid4())
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Add the shared GraphNode label to knowledge graph nodes written before it existed.
+
+Application startup only creates the GraphNode constraints and indexes; run
+this once after upgrading so older EMAIL, TASK, RELATIONSHIP and other typed
+nodes are covered by them. It labels nodes in batches and is safe to re-run.
+"""
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+# Add the parent directory to sys.path to allow importing from the backend
+backend_dir = str(Path(__file__).resolve().parent.parent.parent)
+sys.path.append(backend_dir)
+
+from backend.services.neo4j_driver import close_driver
+from backend.services.neo4j_service import Neo4jService
+
+
+async def main(args):
+    service = Neo4jService()
+    try:
+        await service.ensure_schema()
+        labelled = await service.label_existing_nodes(batch_size=args.batch_size)
+        print(json.dumps(labelled, indent=2))
+    finally:
+        await close_driver()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=10000, help="Nodes labelled per query")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Split the shared vector memory collection into per-user shards.
+
+Copies every memory tagged with a user_id from the shared asti_memory
+collection into that user's shard collection, reusing the stored embeddings.
+Run with --dry-run first to see how memories would be distributed.
+
+Run it while the application still uses VECTOR_MEMORY_SHARDING=none, passing
+the target mode with --sharding, then set VECTOR_MEMORY_SHARDING to that mode:
+memories not yet migrated are invisible to a sharded deployment.
+"""
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+# Add the parent directory to sys.path to allow importing from the backend
+backend_dir = str(Path(__file__).resolve().parent.parent.parent)
+sys.path.append(backend_dir)
+
+from backend.config import settings
+from backend.services.vector_memory import vector_memory
+
+
+async def main(args):
+    if args.sharding:
+        settings.VECTOR_MEMORY_SHARDING = args.sharding
+    if settings.VECTOR_MEMORY_SHARDING == "none":
+        print("VECTOR_MEMORY_SHARDING is 'none'; pass --sharding user or --sharding bucket to migrate")
+        return
+
+    report = await vector_memory.migrate_to_shards(
+        batch_size=args.batch_size,
+        delete_source=args.delete_source,
+        dry_run=args.dry_run,
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--sharding",
+        choices=["user", "bucket"],
+        help="Sharding mode to migrate to (default: VECTOR_MEMORY_SHARDING)",
+    )
+    parser.add_argument("--batch-size", type=int, default=500, help="Memories read per page")
+    parser.add_argument(
+        "--delete-source",
+        action="store_true",
+        help="Remove migrated memories from the shared collection",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Report the distribution without writing")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,128 @@
+"""
+Analysis Cache
+Content-addressed two-tier cache (in-process LRU + Redis) for LLM analysis results
+"""
+
+from typing import Any, Dict, Optional
+import copy
+import hashlib
+import json
+import re
+import unicodedata
+
+from backend.config import settings
+from backend.utils.cache import CacheService, LRUCache, cache_service
+from backend.utils.logger import logger
+from backend.utils.metrics import ANALYSIS_CACHE_REQUESTS, ANALYSIS_CACHE_INVALIDATIONS
+
+NAMESPACE = "analysis"
+
+_whitespace = re.compile(r"\s+")
+
+
+def normalize_content(content: str) -> str:
+    """Normalize content so trivially different copies of a text share a key"""
+    content = unicodedata.normalize("NFC", content or "")
+    return _whitespace.sub(" ", content).strip()
+
+
+class AnalysisCache:
+    """
+    Caches analysis results keyed by a hash of the normalized content, the model,
+    the prompt version and the user context that shapes the prompt.
+
+    Bumping a prompt's version changes every key for that prompt; call
+    invalidate_prompt() to also drop the stale entries straight away.
+    """
+
+    def __init__(
+        self,
+        remote: Optional[CacheService] = None,
+        max_entries: int = settings.ANALYSIS_CACHE_MAX_ENTRIES,
+        ttl: int = settings.ANALYSIS_CACHE_TTL,
+        enabled: bool = settings.ANALYSIS_CACHE_ENABLED,
+    ):
+        self.remote = remote or cache_service
+        self.local = LRUCache(max_size=max_entries)
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(
+        self,
+        content: str,
+        model: str,
+        prompt_version: str,
+        user_context: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """Build the content-addressed key for an analysis request"""
+        payload = json.dumps(
+            {
+                "content": normalize_content(content),
+                "model": model,
+                "prompt_version": prompt_version,
+                "context": user_context or {},
+            },
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _namespace(self, prompt: str) -> str:
+        return f"{NAMESPACE}:{prompt}"
+
+    def get(self, prompt: str, key: str) -> Optional[Dict[str, Any]]:
+        """Look up a cached result, checking the local LRU before Redis"""
+        if not self.enabled:
+            return None
+
+        local_key = f"{prompt}:{key}"
+        value = self.local.get(local_key)
+        if value is not None:
+            self.hits += 1
+            ANALYSIS_CACHE_REQUESTS.labels(prompt=prompt, result="memory_hit").inc()
+            # Callers may mutate the result, so never hand out the cached object
+            return copy.deepcopy(value)
+
+        value = self.remote.get(self._namespace(prompt), key)
+        if value is not None:
+            self.hits += 1
+            ANALYSIS_CACHE_REQUESTS.labels(prompt=prompt, result="redis_hit").inc()
+            self.local.set(local_key, copy.deepcopy(value))
+            return value
+
+        self.misses += 1
+        ANALYSIS_CACHE_REQUESTS.labels(prompt=prompt, result="miss").inc()
+        return None
+
+    def set(self, prompt: str, key: str, value: Dict[str, Any]) -> None:
+        """Store a result in both tiers"""
+        if not self.enabled:
+            return
+
+        self.local.set(f"{prompt}:{key}", copy.deepcopy(value))
+        if not self.remote.set(self._namespace(prompt), key, value, expire=self.ttl):
+            logger.debug(f"Failed to write analysis result for {prompt} to Redis")
+
+    def invalidate_prompt(self, prompt: str) -> int:
+        """Drop every cached result for a prompt, e.g. after its template changes"""
+        removed = self.local.clear_prefix(f"{prompt}:")
+        self.remote.clear_namespace(self._namespace(prompt))
+        ANALYSIS_CACHE_INVALIDATIONS.labels(prompt=prompt).inc()
+        logger.info(f"Invalidated analysis cache for prompt {prompt}")
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters for this process"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "local_entries": len(self.local),
+        }
+
+
+# Create a global instance of the analysis cache
+analysis_cache = AnalysisCache()
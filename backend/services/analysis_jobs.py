@@ -0,0 +1,53 @@
+"""
+Analysis Jobs
+Queues email analysis on the Celery worker and tracks job status for polling
+"""
+
+from typing import Any, Dict, Optional
+
+from backend.tasks.worker import celery, analyze_email_task
+from backend.utils.cache import cache_service
+from backend.utils.logger import logger
+
+JOB_NAMESPACE = "analysis_jobs"
+JOB_TTL = 86400
+
+# Celery task states mapped to the statuses exposed by the API
+_STATUS_BY_STATE = {
+    "PENDING": "queued",
+    "RECEIVED": "queued",
+    "STARTED": "processing",
+    "RETRY": "retrying",
+    "SUCCESS": "completed",
+    "FAILURE": "failed",
+    "REVOKED": "failed",
+}
+
+
+def enqueue_email_analysis(email_id: int, user_id: int) -> str:
+    """Queue analysis for a stored email and return the job id"""
+    result = analyze_email_task.delay(email_id)
+    if not cache_service.set(
+        JOB_NAMESPACE,
+        result.id,
+        {"email_id": email_id, "user_id": user_id},
+        expire=JOB_TTL,
+    ):
+        logger.warning(f"Failed to record analysis job {result.id} for email {email_id}")
+    return result.id
+
+
+def get_job_status(job_id: str, user_id: int) -> Optional[Dict[str, Any]]:
+    """Return the status of a job owned by the user, or None if it is unknown"""
+    job = cache_service.get(JOB_NAMESPACE, job_id)
+    if not job or job.get("user_id") != user_id:
+        return None
+
+    result = celery.AsyncResult(job_id)
+    status = _STATUS_BY_STATE.get(result.state, "processing")
+    return {
+        "job_id": job_id,
+        "email_id": job["email_id"],
+        "status": status,
+        "error": str(result.result) if status == "failed" else None,
+    }
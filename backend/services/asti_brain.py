@@ -1,4 +1,4 @@
-from typing import Dict, List, Optional, Any, Union
+from typing import Dict, List, Optional, Any, Tuple, Union
 import json
 import uuid
 from datetime import datetime, timedelta
@@ -16,7 +16,8 @@ from backend.models.knowledge_graph import (
     RelationshipNode
 )
 from backend.services.vector_memory import vector_memory, recall_relevant_context, add_memory
-from backend.services.knowledge_graph import knowledge_graph_service
+# ASTIBrain works with typed Node/Edge models, which the Neo4jService in neo4j_service stores
+from backend.services.neo4j_service import neo4j_service as knowledge_graph_service
 from backend.utils.logger import logger
 from backend.services.openai_service import analyze_content
 
@@ -53,14 +54,12 @@ class ASTIBrain:
                 }
             )
             
-            # 3. Store in knowledge graph
-            await knowledge_graph_service.create_node(email_node)
-            
-            # 4. Connect to related entities
+            # 3. Store the email and its related entities in the knowledge graph
             await self._connect_email_to_entities(email_node, analysis)
             
-            # 5. Store in vector memory
+            # 4. Store in vector memory
             await add_memory(
+                user_id=self.user_id,
                 content=email_content,
                 metadata={
                     "type": "email",
@@ -83,24 +82,31 @@ class ASTIBrain:
             raise
     
     async def _connect_email_to_entities(self, email_node: EmailNode, analysis: Dict[str, Any]) -> None:
-        """Connect email to relevant entities in the knowledge graph"""
+        """
+        Store an email together with its related entities in the knowledge graph.
+        
+        The email's whole subgraph (sender, tasks, emotion state and the edges
+        between them) is collected first and then written in one transaction.
+        """
         try:
+            nodes: List[Node] = [email_node]
+            edges: List[Edge] = []
+            
             # 1. Connect to sender
             sender_email = email_node.properties.get("sender", {}).get("email", "")
             if sender_email:
                 # Find or create relationship node for sender
-                sender_node = await self._get_or_create_relationship_node(sender_email)
-                if sender_node:
-                    edge = Edge(
+                sender_id = await self._get_or_create_relationship_node(sender_email)
+                if sender_id:
+                    edges.append(Edge(
                         id=f"edge-{str(uuid.uuid4())}",
                         type=EdgeType.SENT_BY,
                         source_id=email_node.id,
-                        target_id=sender_node.id,
+                        target_id=sender_id,
                         properties={
                             "timestamp": email_node.properties.get("timestamp", datetime.utcnow().isoformat())
                         }
-                    )
-                    await knowledge_graph_service.create_edge(edge)
+                    ))
             
             # 2. Create and connect task nodes for action items
             action_items = analysis.get("action_items", [])
@@ -116,10 +122,10 @@ class ASTIBrain:
                         "source_id": email_node.id
                     }
                 )
-                await knowledge_graph_service.create_node(task_node)
+                nodes.append(task_node)
                 
                 # Connect task to email
-                edge = Edge(
+                edges.append(Edge(
                     id=f"edge-{str(uuid.uuid4())}",
                     type=EdgeType.PART_OF,
                     source_id=task_node.id,
@@ -127,66 +133,39 @@ class ASTIBrain:
                     properties={
                         "created_at": datetime.utcnow().isoformat()
                     }
-                )
-                await knowledge_graph_service.create_edge(edge)
+                ))
             
             # 3. Update emotion state based on email
-            await self._update_emotion_state([email_node])
+            emotion_nodes, emotion_edges = await self._update_emotion_state([email_node])
+            nodes.extend(emotion_nodes)
+            edges.extend(emotion_edges)
+            
+            await knowledge_graph_service.write_batch(nodes, edges, user_id=self.user_id)
             
         except Exception as e:
             logger.error(f"Failed to connect email to entities: {str(e)}")
             raise
     
-    async def _get_or_create_relationship_node(self, email: str) -> Optional[Node]:
-        """Find or create a relationship node for an email address"""
+    async def _get_or_create_relationship_node(self, email: str) -> Optional[str]:
+        """Get the id of the relationship node for an email address, creating it if needed"""
         try:
-            # Try to find existing relationship node
-            query = """
-            MATCH (n:RELATIONSHIP)
-            WHERE n.properties.email = $email
-            RETURN n
-            """
-            
-            result = await knowledge_graph_service.get_related_nodes(
-                node_id="",  # Empty to search all nodes
-                relationship_types=["RELATIONSHIP"]
-            )
-            
-            for node in result:
-                if node.properties.get("email") == email:
-                    return node
-            
-            # Create new relationship node if not found
-            relationship_node = RelationshipNode(
-                id=f"rel-{str(uuid.uuid4())}",
-                properties={
-                    "email": email,
-                    "type": "email_contact",
-                    "created_at": datetime.utcnow().isoformat()
-                }
-            )
-            
-            await knowledge_graph_service.create_node(relationship_node)
-            return relationship_node
+            return await knowledge_graph_service.get_or_create_relationship(self.user_id, email)
             
         except Exception as e:
             logger.error(f"Failed to get/create relationship node: {str(e)}")
             return None
     
-    async def _update_emotion_state(self, new_nodes: List[Node]) -> None:
-        """Update the user's emotional state based on new information"""
+    async def _update_emotion_state(self, new_nodes: List[Node]) -> Tuple[List[Node], List[Edge]]:
+        """
+        Update the user's emotional state based on new information.
+        
+        Returns the emotion state node and the edges to write; the caller
+        stores them with the rest of its batch.
+        """
         try:
-            # Get or create emotion state node
-            emotion_states = await knowledge_graph_service.get_related_nodes(
-                node_id="",  # Empty to search all nodes
-                relationship_types=["EMOTION_STATE"]
-            )
-            
-            emotion_node = None
-            if emotion_states:
-                # Use the most recent emotion state
-                emotion_node = max(emotion_states, key=lambda n: n.updated_at)
-            else:
+            # Get the most recent emotion state, or create one
+            emotion_node = await knowledge_graph_service.get_latest_node(self.user_id, NodeType.EMOTION_STATE)
+            if emotion_node is None:
                 # Create a new emotion state
                 emotion_node = EmotionStateNode(
                     id=f"emotion-{str(uuid.uuid4())}",
@@ -194,16 +173,16 @@ class ASTIBrain:
                         "timestamp": datetime.utcnow().isoformat()
                     }
                 )
-                await knowledge_graph_service.create_node(emotion_node)
             
             # Update emotion state based on new nodes
+            edges = []
             stress_count = 0
             for node in new_nodes:
                 if node.type == NodeType.EMAIL and node.properties.get("stress_level") == "HIGH":
                     stress_count += 1
                     
                     # Connect stress-inducing email to emotion
-                    edge = Edge(
+                    edges.append(Edge(
                         id=f"edge-{str(uuid.uuid4())}",
                         type=EdgeType.CAUSES,
                         source_id=node.id,
@@ -212,8 +191,7 @@ class ASTIBrain:
                             "factor": "email_stress",
                             "weight": 0.8 if node.properties.get("priority") == "HIGH" else 0.5
                         }
-                    )
-                    await knowledge_graph_service.create_edge(edge)
+                    ))
             
             # Update overall stress level
             if stress_count > 2:
@@ -222,7 +200,7 @@ class ASTIBrain:
             elif stress_count > 0:
                 emotion_node.properties["overall_stress"] = "MEDIUM"
             
-            await knowledge_graph_service.update_node(emotion_node)
+            return [emotion_node], edges
             
         except Exception as e:
             logger.error(f"Failed to update emotion state: {str(e)}")
@@ -240,14 +218,12 @@ class ASTIBrain:
             related_nodes = await knowledge_graph_service.get_related_nodes(email_id)
             
             # 3. Get current emotion state
-            emotion_states = await knowledge_graph_service.get_related_nodes(
-                node_id="",  # Empty to search all nodes
-                relationship_types=["EMOTION_STATE"]
-            )
-            current_emotion = max(emotion_states, key=lambda n: n.updated_at) if emotion_states else None
+            current_emotion = await knowledge_graph_service.get_latest_node(self.user_id, NodeType.EMOTION_STATE)
             
             # 4. Get vector memory context
-            vector_context = await recall_relevant_context(email_node.properties.get("content", ""))
+            vector_context = await recall_relevant_context(
+                email_node.properties.get("content", ""), user_id=self.user_id
+            )
             
             return {
                 "email": email_node.properties,
@@ -0,0 +1,111 @@
+"""
+Embedding Batcher
+Coalesces concurrent single-text embedding requests into batched API calls
+"""
+
+from typing import Awaitable, Callable, List, Optional, Tuple
+import asyncio
+import weakref
+
+from backend.utils.logger import logger
+from backend.utils.metrics import EMBEDDING_BATCH_SIZE
+
+EmbedFn = Callable[[List[str]], Awaitable[List[List[float]]]]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (about 4 characters per token)"""
+    return max(1, len(text) // 4)
+
+
+class _PendingBatch:
+    """Texts waiting to be embedded on one event loop, with their callers' futures"""
+
+    def __init__(self):
+        self.items: List[Tuple[str, asyncio.Future]] = []
+        self.tokens = 0
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class EmbeddingBatcher:
+    """
+    Collects embed() calls for up to max_wait_ms, or until the batch reaches
+    max_batch_size texts or token_budget tokens, then sends them as a single
+    request and routes each vector back to its caller.
+
+    Batches never span event loops: futures and timers belong to the loop that
+    created them, and Celery tasks each run their own.
+    """
+
+    def __init__(
+        self,
+        embed_fn: EmbedFn,
+        max_wait_ms: float = 5,
+        max_batch_size: int = 256,
+        token_budget: int = 100000,
+    ):
+        self.embed_fn = embed_fn
+        self.max_wait_ms = max_wait_ms
+        self.max_batch_size = max_batch_size
+        self.token_budget = token_budget
+        self._pending: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _PendingBatch]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def _batch(self, loop: asyncio.AbstractEventLoop) -> _PendingBatch:
+        pending = self._pending.get(loop)
+        if pending is None:
+            pending = self._pending[loop] = _PendingBatch()
+        return pending
+
+    async def embed(self, text: str) -> List[float]:
+        """Embed a single text as part of the next batch"""
+        loop = asyncio.get_running_loop()
+        pending = self._batch(loop)
+        tokens = estimate_tokens(text)
+
+        # Flush first if this text would push the batch over its token budget
+        if pending.items and pending.tokens + tokens > self.token_budget:
+            self._flush(loop)
+
+        future = loop.create_future()
+        pending.items.append((text, future))
+        pending.tokens += tokens
+
+        if len(pending.items) >= self.max_batch_size or pending.tokens >= self.token_budget:
+            self._flush(loop)
+        elif pending.timer is None:
+            pending.timer = loop.call_later(self.max_wait_ms / 1000, self._flush, loop)
+
+        return await future
+
+    def _flush(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Hand the loop's pending batch to a background task on that loop"""
+        pending = self._batch(loop)
+        if pending.timer is not None:
+            pending.timer.cancel()
+            pending.timer = None
+
+        batch = pending.items
+        pending.items = []
+        pending.tokens = 0
+        if batch:
+            loop.create_task(self._run_batch(batch))
+
+    async def _run_batch(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        """Send one embedding request and resolve every caller's future"""
+        EMBEDDING_BATCH_SIZE.observe(len(batch))
+        try:
+            vectors = await self.embed_fn([text for text, _ in batch])
+            if len(vectors) != len(batch):
+                raise ValueError(
+                    f"Embedding batch returned {len(vectors)} vectors for {len(batch)} texts"
+                )
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+        except Exception as e:
+            logger.error(f"Embedding batch of {len(batch)} texts failed: {str(e)}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
@@ -0,0 +1,85 @@
+"""
+Embedding Codec
+Compact representations of embedding vectors: truncation to fewer dimensions,
+float16/int8 quantization for persisted vectors, and base64 packing for API
+responses
+"""
+
+from typing import List, Sequence, Union
+import base64
+import struct
+
+import numpy as np
+
+QUANTIZATION_MODES = ("none", "float16", "int8")
+
+Vector = Union[Sequence[float], np.ndarray]
+
+# First byte of a quantized blob, so stored vectors decode whatever the current setting
+_MODE_CODES = {"none": 0, "float16": 1, "int8": 2}
+_CODE_MODES = {code: mode for mode, code in _MODE_CODES.items()}
+_INT8_SCALE = struct.Struct("<f")
+
+
+def truncate(vectors: Union[Sequence[Vector], np.ndarray], dimensions: int) -> np.ndarray:
+    """
+    Keep the first dimensions of each vector and re-normalize.
+
+    text-embedding-3 models are trained so that this matches requesting fewer
+    dimensions from the API; other models lose more recall when truncated.
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)[:, :dimensions]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def bytes_per_vector(dimensions: int, mode: str) -> int:
+    """Size of one quantized vector, excluding the mode byte"""
+    if mode == "float16":
+        return 2 * dimensions
+    if mode == "int8":
+        return dimensions + _INT8_SCALE.size
+    return 4 * dimensions
+
+
+def quantize(vector: Vector, mode: str = "none") -> bytes:
+    """
+    Encode a vector at the given precision.
+
+    int8 uses one symmetric scale per vector (its largest magnitude maps to
+    127), which keeps cosine similarity within about 1% for embeddings.
+    """
+    if mode not in _MODE_CODES:
+        raise ValueError(f"Unknown quantization mode: {mode}")
+    array = np.asarray(vector, dtype=np.float32)
+    header = bytes([_MODE_CODES[mode]])
+    if mode == "float16":
+        return header + array.astype("<f2").tobytes()
+    if mode == "int8":
+        peak = float(np.abs(array).max()) if array.size else 0.0
+        scale = peak / 127 if peak else 1.0
+        codes = np.clip(np.rint(array / scale), -127, 127).astype(np.int8)
+        return header + _INT8_SCALE.pack(scale) + codes.tobytes()
+    return header + array.astype("<f4").tobytes()
+
+
+def dequantize(blob: bytes) -> np.ndarray:
+    """Decode a blob written by quantize() back to float32"""
+    mode = _CODE_MODES.get(blob[0]) if blob else None
+    if mode == "float16":
+        return np.frombuffer(blob, dtype="<f2", offset=1).astype(np.float32)
+    if mode == "int8":
+        (scale,) = _INT8_SCALE.unpack_from(blob, 1)
+        return np.frombuffer(blob, dtype=np.int8, offset=1 + _INT8_SCALE.size).astype(np.float32) * scale
+    if mode == "none":
+        return np.frombuffer(blob, dtype="<f4", offset=1).copy()
+    raise ValueError("Not a quantized embedding")
+
+
+def pack_base64(vector: Vector) -> str:
+    """A vector as base64 of little-endian float32, like OpenAI's encoding_format=base64"""
+    return base64.b64encode(np.asarray(vector, dtype="<f4").tobytes()).decode("ascii")
+
+
+def unpack_base64(packed: str) -> List[float]:
+    return np.frombuffer(base64.b64decode(packed), dtype="<f4").tolist()
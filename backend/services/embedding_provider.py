@@ -0,0 +1,237 @@
+"""
+Embedding Provider
+Pluggable embedding backends for vector memory: the OpenAI API, or a local
+NumPy feature-hashing model that needs no network access, both behind an
+on-disk cache keyed by content hash and model
+"""
+
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+import numpy as np
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+from chromadb.utils import embedding_functions
+
+from backend.config import settings
+from backend.services.embedding_codec import dequantize, quantize
+from backend.services.lexical_index import tokenize
+from backend.utils.logger import logger
+from backend.utils.metrics import EMBEDDING_CACHE_LOOKUPS, EMBEDDING_PROVIDER_LATENCY
+
+# OPENAI_API_KEY's default in settings, i.e. no key configured
+_PLACEHOLDER_API_KEY = "your-openai-key"
+# SQLite limits the number of bound parameters per statement
+_CACHE_LOOKUP_BATCH = 500
+
+
+class EmbeddingProvider(EmbeddingFunction, ABC):
+    """
+    An embedding backend usable directly or as a Chroma embedding function.
+
+    Subclasses implement embed() for a batch of texts and set model_name, which
+    identifies the vector space: caches key on it, and vectors from different
+    models must never be mixed in one collection.
+    """
+
+    model_name: str = "unknown"
+
+    def __init__(self):
+        pass
+
+    @abstractmethod
+    def embed(self, texts: List[str]) -> List[np.ndarray]:
+        pass
+
+    def __call__(self, input: Documents) -> Embeddings:
+        started = time.perf_counter()
+        try:
+            return self.embed(list(input))
+        finally:
+            EMBEDDING_PROVIDER_LATENCY.labels(provider=type(self).__name__).observe(time.perf_counter() - started)
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """Embeddings from the OpenAI API, optionally shortened to fewer dimensions by the API"""
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        model_name: str = settings.EMBEDDING_MODEL,
+        dimensions: Optional[int] = settings.EMBEDDING_DIMENSIONS,
+    ):
+        super().__init__()
+        self.dimensions = dimensions
+        # Shortened vectors live in a different space from full-size ones
+        self.model_name = f"{model_name}-{dimensions}" if dimensions else model_name
+        self._function = embedding_functions.OpenAIEmbeddingFunction(
+            api_key=api_key or settings.OPENAI_API_KEY,
+            api_base=settings.OPENAI_BASE_URL,
+            model_name=model_name,
+            dimensions=dimensions
+        )
+
+    def embed(self, texts: List[str]) -> List[np.ndarray]:
+        return [np.asarray(vector, dtype=np.float32) for vector in self._function(texts)]
+
+
+@lru_cache(maxsize=65536)
+def _feature_hash(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class LocalEmbeddingProvider(EmbeddingProvider):
+    """
+    Feature-hashing embeddings computed on the CPU with NumPy.
+
+    Each text's word tokens and character trigrams are hashed into a fixed
+    number of signed buckets, log-scaled and L2-normalized, so texts sharing
+    words and word fragments land close together. There is no model to load,
+    a batch is a handful of vectorized NumPy operations, and the same text
+    always maps to the same vector on every machine. It trades the semantic
+    recall of a neural model for zero latency and no network dependency.
+    """
+
+    # Weight of a character trigram relative to a whole word
+    TRIGRAM_WEIGHT = 0.5
+
+    def __init__(self, dimensions: int = settings.EMBEDDING_LOCAL_DIMENSIONS):
+        super().__init__()
+        self.dimensions = dimensions
+        self.model_name = f"local-hashing-{dimensions}"
+
+    def _features(self, text: str):
+        for token in tokenize(text):
+            yield token, 1.0
+            padded = f"<{token}>"
+            for i in range(len(padded) - 2):
+                yield padded[i:i + 3], self.TRIGRAM_WEIGHT
+
+    def embed(self, texts: List[str]) -> List[np.ndarray]:
+        rows: List[int] = []
+        hashes: List[int] = []
+        weights: List[float] = []
+        for row, text in enumerate(texts):
+            for feature, weight in self._features(text):
+                rows.append(row)
+                hashes.append(_feature_hash(feature))
+                weights.append(weight)
+
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        if hashes:
+            hashed = np.asarray(hashes, dtype=np.uint64)
+            columns = (hashed % np.uint64(self.dimensions)).astype(np.intp)
+            # The top bit picks the sign, so colliding features tend to cancel out
+            signs = np.where(hashed >> np.uint64(63), -1.0, 1.0).astype(np.float32)
+            np.add.at(matrix, (np.asarray(rows, dtype=np.intp), columns), signs * np.asarray(weights, dtype=np.float32))
+        # Dampen repeated terms while keeping each bucket's sign
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1, norms)
+        return list(matrix)
+
+
+class CachedEmbeddingProvider(EmbeddingProvider):
+    """
+    Wraps a provider with a persistent SQLite cache of its embeddings.
+
+    Entries are keyed by the sha256 of model name and text, so a model change
+    never serves stale vectors and identical texts are embedded once across
+    restarts and processes. Only the cache misses of a batch are sent to the
+    wrapped provider, in one call. Vectors are stored at the quantization
+    precision; entries written under another setting still decode.
+    """
+
+    def __init__(
+        self,
+        provider: EmbeddingProvider,
+        path: str = settings.EMBEDDING_CACHE_PATH,
+        quantization: str = settings.EMBEDDING_QUANTIZATION,
+    ):
+        super().__init__()
+        self.provider = provider
+        self.model_name = provider.model_name
+        self.path = path
+        self.quantization = quantization
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            # WAL lets several workers read while one writes
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            self._connection = connection
+        return self._connection
+
+    def cache_key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def embed(self, texts: List[str]) -> List[np.ndarray]:
+        keys = [self.cache_key(text) for text in texts]
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            connection = self._connect()
+            unique = list(dict.fromkeys(keys))
+            for start in range(0, len(unique), _CACHE_LOOKUP_BATCH):
+                batch = unique[start:start + _CACHE_LOOKUP_BATCH]
+                rows = connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = dequantize(blob)
+
+        missing = {key: text for key, text in zip(keys, texts) if key not in found}
+        EMBEDDING_CACHE_LOOKUPS.labels(result="hit").inc(len(texts) - len(missing))
+        EMBEDDING_CACHE_LOOKUPS.labels(result="miss").inc(len(missing))
+        if missing:
+            blobs = [quantize(vector, self.quantization) for vector in self.provider.embed(list(missing.values()))]
+            # Serve what later lookups will read, so a text embeds the same whether cached or not
+            found.update((key, dequantize(blob)) for key, blob in zip(missing, blobs))
+            with self._lock:
+                connection = self._connect()
+                connection.executemany(
+                    "INSERT OR IGNORE INTO embeddings (key, vector) VALUES (?, ?)",
+                    list(zip(missing, blobs))
+                )
+                connection.commit()
+        return [found[key] for key in keys]
+
+
+def has_openai_key() -> bool:
+    return bool(settings.OPENAI_API_KEY) and settings.OPENAI_API_KEY != _PLACEHOLDER_API_KEY
+
+
+def create_embedding_provider(provider: Optional[str] = None, **kwargs: Any) -> EmbeddingProvider:
+    """
+    The configured embedding provider, behind the persistent cache when enabled.
+
+    With EMBEDDING_PROVIDER=auto the OpenAI provider is used when an API key is
+    configured and the local provider otherwise, so offline and self-hosted
+    deployments work without configuration. Switching providers changes the
+    vector space: existing collections must be re-embedded.
+    """
+    provider = (provider or settings.EMBEDDING_PROVIDER).lower()
+    if provider == "auto":
+        provider = "openai" if has_openai_key() else "local"
+
+    if provider == "openai":
+        embedder: EmbeddingProvider = OpenAIEmbeddingProvider(**kwargs)
+    elif provider == "local":
+        embedder = LocalEmbeddingProvider(**kwargs)
+    else:
+        raise ValueError(f"Unknown embedding provider: {provider}")
+
+    logger.info(f"Using {embedder.model_name} embeddings")
+    if settings.EMBEDDING_CACHE_ENABLED:
+        return CachedEmbeddingProvider(embedder)
+    return embedder
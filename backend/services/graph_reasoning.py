@@ -0,0 +1,221 @@
+"""
+Graph Reasoning
+Budgeted best-first search over the knowledge graph for strongest paths and
+relevance scores, independent of whether the graph lives in Neo4j or in memory
+"""
+
+import heapq
+import itertools
+import math
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from backend.config import settings
+from backend.services.memory_graph import EdgeKey, edge_strength
+from backend.utils.metrics import GRAPH_SEARCH_EXPANSIONS, GRAPH_SEARCH_TRUNCATED
+
+# (relationship type, target id, target node type, relationship properties)
+Neighbor = Tuple[str, str, Optional[str], Dict[str, Any]]
+# Neighbors of several nodes at once, by node id
+Expand = Callable[[List[str]], Awaitable[Dict[str, List[Neighbor]]]]
+
+
+@dataclass
+class SearchPath:
+    """The strongest path found, with its edges and their properties"""
+    edges: List[EdgeKey]
+    properties: List[Dict[str, Any]]
+    strength: float
+    truncated: bool = False
+
+    @property
+    def node_ids(self) -> List[str]:
+        return [self.edges[0][0]] + [target_id for _, _, target_id in self.edges]
+
+
+@dataclass
+class RelevanceResult:
+    """A relevance score and the target nodes contributing most to it"""
+    score: float
+    top: List[Tuple[str, float]] = field(default_factory=list)
+    truncated: bool = False
+
+
+class Neighbors:
+    """
+    Expands each node at most once per search; paths revisit nodes, the backend need not.
+
+    When a node is not fetched yet, up to batch_size - 1 of the nodes the search
+    will expand next are fetched with it, so a backend with a round trip per
+    call (Neo4j) answers a frontier of nodes per query rather than one.
+    """
+
+    def __init__(self, expand: Expand, batch_size: int = 1):
+        self.expand = expand
+        self.batch_size = max(batch_size, 1)
+        self.fetched: Dict[str, List[Neighbor]] = {}
+
+    async def of(self, node_id: str, upcoming: Callable[[int], Iterable[str]]) -> List[Neighbor]:
+        """A node's neighbors; upcoming(n) lists about n node ids the search expands next"""
+        if node_id not in self.fetched:
+            batch = [node_id]
+            for next_id in upcoming(self.batch_size * 2) if self.batch_size > 1 else ():
+                if len(batch) >= self.batch_size:
+                    break
+                if next_id not in self.fetched and next_id not in batch:
+                    batch.append(next_id)
+            neighbors = await self.expand(batch)
+            for fetched_id in batch:
+                self.fetched[fetched_id] = neighbors.get(fetched_id, [])
+        return self.fetched[node_id]
+
+
+def _cost(strength: float) -> float:
+    # Strengths above 1 would make costs negative; Dijkstra needs them >= 0
+    return -math.log(min(strength, 1.0))
+
+
+async def strongest_path(
+    expand: Expand,
+    source_id: str,
+    target_id: str,
+    max_length: int = 5,
+    min_strength: float = 0.0,
+    budget: int = settings.KNOWLEDGE_GRAPH_SEARCH_BUDGET,
+    batch_size: int = 1
+) -> Optional[SearchPath]:
+    """
+    The path with the largest product of edge strengths, every edge at least min_strength.
+
+    Dijkstra's algorithm over -log(strength): maximizing a product of strengths
+    in (0, 1] is minimizing the sum of their negative logs, so the first time
+    the target is popped its path is the strongest. A label is dropped when
+    its node was already reached by a path at least as strong with no more
+    hops. At most budget nodes are expanded; if the budget runs out first,
+    the strongest path to the target seen so far is returned, marked truncated.
+    Neighbors are fetched batch_size frontier nodes at a time (see Neighbors).
+    """
+    neighbors = Neighbors(expand, batch_size)
+    counter = itertools.count()
+    heap: List[Tuple[float, int, int, str, Tuple[Tuple[EdgeKey, Dict[str, Any]], ...]]] = [
+        (0.0, 0, next(counter), source_id, ())
+    ]
+    settled: Dict[str, int] = {}
+    found = None
+    fallback: Optional[Tuple[float, Tuple[Tuple[EdgeKey, Dict[str, Any]], ...]]] = None
+    expansions = 0
+    truncated = False
+
+    def upcoming(count: int) -> Iterable[str]:
+        # Labels the search will still expand, strongest first
+        return (
+            entry[3] for entry in heapq.nsmallest(count, heap)
+            if entry[1] < max_length and settled.get(entry[3], max_length + 1) > entry[1]
+        )
+
+    while heap:
+        cost, hops, _, node_id, path = heapq.heappop(heap)
+        if node_id == target_id and path:
+            found = path
+            break
+        if settled.get(node_id, max_length + 1) <= hops:
+            continue
+        settled[node_id] = hops
+        if hops == max_length:
+            continue
+        if expansions >= budget:
+            truncated = True
+            break
+        expansions += 1
+
+        on_path = {source_id} | {edge[2] for edge, _ in path}
+        for relationship_type, next_id, _, properties in await neighbors.of(node_id, upcoming):
+            strength = edge_strength(properties)
+            if strength <= 0 or strength < min_strength:
+                continue
+            if next_id in on_path and next_id != target_id:
+                continue
+            next_cost = cost + _cost(strength)
+            next_path = path + (((node_id, relationship_type, next_id), properties),)
+            if next_id == target_id and (fallback is None or next_cost < fallback[0]):
+                fallback = (next_cost, next_path)
+            heapq.heappush(heap, (next_cost, hops + 1, next(counter), next_id, next_path))
+
+    GRAPH_SEARCH_EXPANSIONS.labels(operation="strongest_path").observe(expansions)
+    if truncated:
+        GRAPH_SEARCH_TRUNCATED.labels(operation="strongest_path").inc()
+    if found is None and fallback is not None:
+        found = fallback[1]
+    if found is None:
+        return None
+    return _search_path(found, truncated)
+
+
+def _search_path(path: Tuple[Tuple[EdgeKey, Dict[str, Any]], ...], truncated: bool) -> SearchPath:
+    strength = 1.0
+    for _, properties in path:
+        strength *= edge_strength(properties)
+    return SearchPath(
+        edges=[edge for edge, _ in path],
+        properties=[properties for _, properties in path],
+        strength=strength,
+        truncated=truncated
+    )
+
+
+async def relevance(
+    expand: Expand,
+    entity_id: str,
+    target_type: str,
+    max_depth: int = 3,
+    top_k: int = settings.KNOWLEDGE_GRAPH_RELEVANCE_TOP_K,
+    budget: int = settings.KNOWLEDGE_GRAPH_SEARCH_BUDGET,
+    min_path_strength: float = settings.KNOWLEDGE_GRAPH_MIN_PATH_STRENGTH,
+    batch_size: int = 1
+) -> RelevanceResult:
+    """
+    Sum of strength product / length² over the paths from the entity to nodes of target_type.
+
+    Paths never use an edge twice, as in Cypher. They are extended strongest
+    first, and extending a path can only weaken it, so a path weaker than
+    min_path_strength is pruned together with all of its extensions, and when
+    the budget of extended paths runs out the strongest contributions are
+    already counted. With no pruning and an unspent budget the score is exact.
+    Neighbors are fetched batch_size frontier nodes at a time (see Neighbors).
+    """
+    neighbors = Neighbors(expand, batch_size)
+    counter = itertools.count()
+    heap: List[Tuple[float, int, str, Tuple[EdgeKey, ...]]] = [(-1.0, next(counter), entity_id, ())]
+    contributions: Dict[str, float] = defaultdict(float)
+    expansions = 0
+    truncated = False
+
+    def upcoming(count: int) -> Iterable[str]:
+        return (entry[2] for entry in heapq.nsmallest(count, heap))
+
+    while heap:
+        negative_strength, _, node_id, path = heapq.heappop(heap)
+        if expansions >= budget:
+            truncated = True
+            break
+        expansions += 1
+
+        length = len(path) + 1
+        for relationship_type, next_id, next_type, properties in await neighbors.of(node_id, upcoming):
+            edge = (node_id, relationship_type, next_id)
+            if edge in path:
+                continue
+            strength = -negative_strength * edge_strength(properties)
+            if strength <= 0 or strength < min_path_strength:
+                continue
+            if next_type == target_type:
+                contributions[next_id] += strength / length ** 2
+            if length < max_depth:
+                heapq.heappush(heap, (-strength, next(counter), next_id, path + (edge,)))
+
+    GRAPH_SEARCH_EXPANSIONS.labels(operation="relevance").observe(expansions)
+    if truncated:
+        GRAPH_SEARCH_TRUNCATED.labels(operation="relevance").inc()
+    top = heapq.nlargest(top_k, contributions.items(), key=lambda item: item[1])
+    return RelevanceResult(score=sum(contributions.values()), top=top, truncated=truncated)
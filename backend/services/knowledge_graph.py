@@ -1,23 +1,35 @@
 """
 Knowledge Graph Service
-Handles interaction with Neo4j for graph operations
+Handles interaction with Neo4j for graph operations through the shared async driver,
+or with an embedded in-memory graph when Neo4j is not available
 """
 
 from typing import List, Dict, Any, Optional, Union
 from pydantic import BaseModel
-import neo4j
-from neo4j import GraphDatabase
 import os
 import json
 import logging
 from datetime import datetime
 import asyncio
+import heapq
+import time
 from enum import Enum
 
+from backend.config import settings
+from backend.services.graph_reasoning import Expand, Neighbor, RelevanceResult, relevance, strongest_path
+from backend.services.memory_graph import EdgeKey, InMemoryGraph, edge_strength
+from backend.services.neo4j_driver import get_driver, graph_session, run_query
+from backend.utils.cache import LRUCache
+from backend.utils.executor import BoundedExecutor
+from backend.utils.metrics import GRAPH_RELEVANCE_CACHE_REQUESTS
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Snapshots serialize the whole graph to disk; one at a time, off the event loop
+snapshot_executor = BoundedExecutor("knowledge_graph_snapshot", max_workers=1, max_pending=1)
+
 class MemoryType(str, Enum):
     EMAIL = "email"
     TASK = "task"
@@ -58,81 +70,154 @@ class ReasoningPath(BaseModel):
     score: float
     explanation: str
 
+def _to_graph_node(props: Dict[str, Any], relationships: Optional[List[Dict[str, Any]]] = None) -> GraphNode:
+    """A GraphNode from a node's stored properties"""
+    return GraphNode(
+        id=props["id"],
+        type=props.get("type", MemoryType.KNOWLEDGE),
+        content=props.get("content", ""),
+        timestamp=props.get("timestamp", int(datetime.now().timestamp() * 1000)),
+        metadata=props.get("metadata", {}),
+        relationships=relationships
+    )
+
 class Neo4jService:
-    """Service for handling knowledge graph operations with Neo4j"""
+    """
+    Service for handling knowledge graph operations with Neo4j.
+    
+    In mock mode (KNOWLEDGE_GRAPH_BACKEND=memory, or Neo4j unreachable) the same
+    operations run against an in-process InMemoryGraph instead.
+    """
     
     def __init__(self):
         """Initialize the Neo4j service"""
         self.driver = None
         self.initialized = False
         self.mock_mode = False
+        self.graph: Optional[InMemoryGraph] = None
+        self._snapshot_dirty = False
+        self._snapshot_saved_at = 0.0
+        self._snapshot_task: Optional[asyncio.Task] = None
+        # Relevance results by (generation, query); writes bump the generation
+        self._relevance_cache = LRUCache(max_size=settings.KNOWLEDGE_GRAPH_RELEVANCE_CACHE_SIZE)
+        self._generation = 0
         self._initialize()
     
     def _initialize(self):
-        """Initialize the Neo4j driver"""
+        """Attach to the shared Neo4j driver; connectivity is verified on first use"""
+        if settings.KNOWLEDGE_GRAPH_BACKEND == "memory":
+            self._use_memory_graph()
+            return
         try:
-            uri = os.environ.get("NEO4J_URI", "bolt://neo4j:7687")
-            user = os.environ.get("NEO4J_USER", "neo4j")
-            password = os.environ.get("NEO4J_PASSWORD", "password")
-            
-            logger.info(f"Connecting to Neo4j at {uri}")
-            
-            try:
-                self.driver = neo4j.GraphDatabase.driver(uri, auth=(user, password))
-                self.driver.verify_connectivity()
-                self.initialized = True
-                logger.info("Neo4j service initialized successfully")
-            except Exception as e:
-                logger.error(f"Error initializing Neo4j service: {e}")
-                logger.warning("Falling back to mock mode for knowledge graph")
-                self.mock_mode = True
-                self.initialized = True
+            self.driver = get_driver()
         except Exception as e:
             logger.error(f"Error initializing Neo4j service: {e}")
             logger.warning("Falling back to mock mode for knowledge graph")
-            self.mock_mode = True
+            self._use_memory_graph()
+    
+    def _use_memory_graph(self):
+        """Serve the graph from process memory, restored from the last snapshot if there is one"""
+        self.mock_mode = True
+        self.initialized = True
+        path = settings.KNOWLEDGE_GRAPH_SNAPSHOT_PATH
+        try:
+            self.graph = InMemoryGraph.load(path) if path else InMemoryGraph()
+        except Exception as e:
+            logger.error(f"Error loading knowledge graph snapshot {path}: {e}")
+            self.graph = InMemoryGraph()
+        logger.info(f"Using in-memory knowledge graph with {len(self.graph)} nodes")
+    
+    def _graph_changed(self):
+        """Schedule a snapshot of the in-memory graph, at most once per KNOWLEDGE_GRAPH_SNAPSHOT_INTERVAL"""
+        if not settings.KNOWLEDGE_GRAPH_SNAPSHOT_PATH or self.graph is None:
+            return
+        self._snapshot_dirty = True
+        task = self._snapshot_task
+        # A task left behind by another (finished) event loop will never complete
+        if task is not None and not task.done() and task.get_loop() is asyncio.get_running_loop():
+            return
+        if time.monotonic() - self._snapshot_saved_at >= settings.KNOWLEDGE_GRAPH_SNAPSHOT_INTERVAL:
+            self._snapshot_task = asyncio.create_task(self._save_snapshot())
+    
+    async def _save_snapshot(self):
+        """Copy the graph on the event loop, then serialize and write it on the snapshot thread"""
+        path = settings.KNOWLEDGE_GRAPH_SNAPSHOT_PATH
+        snapshot = self.graph.to_snapshot()
+        self._snapshot_dirty = False
+        self._snapshot_saved_at = time.monotonic()
+        try:
+            await snapshot_executor.run("save_snapshot", InMemoryGraph.write_snapshot, path, snapshot)
+        except Exception as e:
+            self._snapshot_dirty = True
+            logger.error(f"Error saving knowledge graph snapshot {path}: {e}")
+    
+    async def _ensure_initialized(self):
+        """Verify connectivity once, falling back to mock mode when Neo4j is unreachable"""
+        if self.initialized:
+            return
+        try:
+            await self.driver.verify_connectivity()
+            await self._ensure_indexes()
+            logger.info("Neo4j service initialized successfully")
             self.initialized = True
+        except Exception as e:
+            logger.error(f"Error initializing Neo4j service: {e}")
+            logger.warning("Falling back to mock mode for knowledge graph")
+            self._use_memory_graph()
+    
+    async def _ensure_indexes(self):
+        """Index Memory ids, so searches expand nodes by id without a label scan"""
+        try:
+            await run_query("ensure_indexes", "CREATE INDEX memory_id IF NOT EXISTS FOR (n:Memory) ON (n.id)")
+        except Exception as e:
+            logger.warning(f"Could not create the Memory id index: {e}")
     
     async def create_node(self, memory: Memory) -> str:
         """Create or update a node in the knowledge graph"""
-        if self.mock_mode:
-            # In mock mode, just return the node ID
-            logger.info(f"MOCK: Created node {memory.id} of type {memory.type}")
-            return memory.id
-            
         await self._ensure_initialized()
+        self._invalidate_relevance()
         
         try:
-            with self.driver.session() as session:
-                # Convert metadata to JSON serializable format
-                metadata = {}
-                if memory.metadata:
-                    metadata = {k: v for k, v in memory.metadata.items() if v is not None}
-                    # Convert non-serializable values to strings
-                    for k, v in metadata.items():
-                        if not isinstance(v, (str, int, float, bool, list, dict, type(None))):
-                            metadata[k] = str(v)
-                
-                # Merge node (create if not exists, update if exists)
-                query = """
-                MERGE (n:Memory {id: $id})
-                SET n.type = $type,
-                    n.content = $content,
-                    n.timestamp = $timestamp,
-                    n.metadata = $metadata
-                RETURN n.id
-                """
-                
-                result = session.run(
-                    query,
-                    id=memory.id,
-                    type=memory.type,
-                    content=memory.content,
-                    timestamp=memory.timestamp,
-                    metadata=metadata
-                )
-                
-                return result.single()[0]
+            # Convert metadata to JSON serializable format
+            metadata = {}
+            if memory.metadata:
+                metadata = {k: v for k, v in memory.metadata.items() if v is not None}
+                # Convert non-serializable values to strings
+                for k, v in metadata.items():
+                    if not isinstance(v, (str, int, float, bool, list, dict, type(None))):
+                        metadata[k] = str(v)
+            
+            if self.mock_mode:
+                self.graph.upsert_node(memory.id, "Memory", {
+                    "type": memory.type.value,
+                    "content": memory.content,
+                    "timestamp": memory.timestamp,
+                    "metadata": metadata
+                })
+                self._graph_changed()
+                return memory.id
+            
+            # Merge node (create if not exists, update if exists)
+            query = """
+            MERGE (n:Memory {id: $id})
+            SET n.type = $type,
+                n.content = $content,
+                n.timestamp = $timestamp,
+                n.metadata = $metadata
+            RETURN n.id
+            """
+            
+            records = await run_query(
+                "create_node",
+                query,
+                id=memory.id,
+                type=memory.type,
+                content=memory.content,
+                timestamp=memory.timestamp,
+                metadata=metadata
+            )
+            
+            return records[0][0]
         except Exception as e:
             logger.error(f"Error creating node: {e}")
             raise
@@ -140,9 +225,28 @@ class Neo4jService:
     async def create_temporal_event(self, event: TemporalEvent, user_id: str) -> str:
         """Create a temporal reasoning node in the knowledge graph"""
         await self._ensure_initialized()
+        self._invalidate_relevance()
+        
+        if self.mock_mode:
+            self.graph.upsert_node(event.id, "TemporalEvent", {
+                "event_type": event.event_type,
+                "timestamp": event.timestamp,
+                "description": event.description,
+                "intensity": event.intensity,
+                "duration": event.duration or 0,
+                "user_id": user_id
+            })
+            for entity_id in event.related_entities:
+                if self.graph.get_node(entity_id, "Memory"):
+                    self.graph.set_edge(event.id, "RELATES_TO", entity_id, {
+                        "strength": event.intensity / 10,
+                        "timestamp": event.timestamp
+                    })
+            self._graph_changed()
+            return event.id
         
         try:
-            with self.driver.session() as session:
+            async with graph_session() as session:
                 # Create temporal event node
                 query = """
                 CREATE (e:TemporalEvent {
@@ -157,8 +261,10 @@ class Neo4jService:
                 RETURN e.id
                 """
                 
-                result = session.run(
+                records = await run_query(
+                    "create_temporal_event",
                     query,
+                    session=session,
                     id=event.id,
                     event_type=event.event_type,
                     timestamp=event.timestamp,
@@ -168,7 +274,7 @@ class Neo4jService:
                     user_id=user_id
                 )
                 
-                event_id = result.single()[0]
+                event_id = records[0][0]
                 
                 # Connect temporal event to related entities
                 for entity_id in event.related_entities:
@@ -182,8 +288,10 @@ class Neo4jService:
                     RETURN r
                     """
                     
-                    session.run(
+                    await run_query(
+                        "create_temporal_event",
                         query,
+                        session=session,
                         event_id=event.id,
                         entity_id=entity_id,
                         strength=event.intensity / 10,  # Normalize to 0-1 range
@@ -203,59 +311,37 @@ class Neo4jService:
         properties: Optional[Dict[str, Any]] = None
     ) -> bool:
         """Create a relationship between two nodes in the knowledge graph"""
+        await self._ensure_initialized()
+        self._invalidate_relevance()
+        
         if self.mock_mode:
-            # In mock mode, just return True
-            logger.info(f"MOCK: Created edge between {source_id} and {target_id} of type {relationship_type}")
+            # Like MATCH in Cypher, an edge to a missing node is silently not created
+            if self.graph.get_node(source_id, "Memory") and self.graph.get_node(target_id, "Memory"):
+                existing = self.graph.get_edge(source_id, relationship_type, target_id)
+                self.graph.set_edge(
+                    source_id, relationship_type, target_id, self._edge_properties(existing, properties)
+                )
+                self._graph_changed()
             return True
-            
-        await self._ensure_initialized()
         
         try:
-            with self.driver.session() as session:
+            async with graph_session() as session:
                 # Check if relationship already exists
                 check_query = f"""
                 MATCH (source:Memory {{id: $source_id}})-[r:{relationship_type}]->(target:Memory {{id: $target_id}})
                 RETURN r
                 """
                 
-                check_result = session.run(
+                existing = await run_query(
+                    "create_edge",
                     check_query,
+                    session=session,
                     source_id=source_id,
                     target_id=target_id
                 )
                 
-                # Default properties
-                now = int(datetime.now().timestamp() * 1000)
-                default_props = {
-                    "timestamp": now,
-                    "strength": 0.5,
-                    "frequency": 1,
-                    "recency": 1.0
-                }
-                
-                # If relationship exists, increment frequency
-                record = check_result.single() if check_result.peek() else None
-                if record:
-                    rel = record["r"]
-                    # Get current frequency or default to 0
-                    frequency = rel.get("frequency", 0) + 1
-                    default_props["frequency"] = frequency
-                
-                # Merge with provided properties
-                if not properties:
-                    properties = {}
-                props = {**default_props, **properties}
-                
-                # Calculate overall relationship strength if not explicitly provided
-                if "strength" not in properties:
-                    # Normalize frequency (logarithmic scale to avoid extreme values)
-                    freq = props["frequency"]
-                    normalized_freq = min(1, (1 if freq <= 1 else (1 + 0.1 * (freq - 1))))
-                    
-                    # Combine frequency (30%), recency (50%), and base strength (20%)
-                    recency = props.get("recency", 1.0)
-                    base_strength = default_props["strength"]
-                    props["strength"] = 0.3 * normalized_freq + 0.5 * recency + 0.2 * base_strength
+                record = existing[0] if existing else None
+                props = self._edge_properties(record["r"] if record else None, properties)
                 
                 # Create or update relationship
                 query = f"""
@@ -266,8 +352,10 @@ class Neo4jService:
                 RETURN r
                 """
                 
-                session.run(
+                await run_query(
+                    "create_edge",
                     query,
+                    session=session,
                     source_id=source_id,
                     target_id=target_id,
                     properties=props
@@ -278,41 +366,74 @@ class Neo4jService:
             logger.error(f"Error creating edge: {e}")
             raise
     
+    @staticmethod
+    def _edge_properties(existing: Optional[Any], properties: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Properties for a new or repeated relationship, given the existing one if any"""
+        # Default properties
+        now = int(datetime.now().timestamp() * 1000)
+        default_props = {
+            "timestamp": now,
+            "strength": 0.5,
+            "frequency": 1,
+            "recency": 1.0
+        }
+        
+        # If relationship exists, increment frequency
+        if existing:
+            # Get current frequency or default to 0
+            frequency = existing.get("frequency", 0) + 1
+            default_props["frequency"] = frequency
+        
+        # Merge with provided properties
+        if not properties:
+            properties = {}
+        props = {**default_props, **properties}
+        
+        # Calculate overall relationship strength if not explicitly provided
+        if "strength" not in properties:
+            # Normalize frequency (logarithmic scale to avoid extreme values)
+            freq = props["frequency"]
+            normalized_freq = min(1, (1 if freq <= 1 else (1 + 0.1 * (freq - 1))))
+            
+            # Combine frequency (30%), recency (50%), and base strength (20%)
+            recency = props.get("recency", 1.0)
+            base_strength = default_props["strength"]
+            props["strength"] = 0.3 * normalized_freq + 0.5 * recency + 0.2 * base_strength
+        
+        return props
+    
     async def get_node(self, node_id: str) -> Optional[GraphNode]:
         """Get a node by ID"""
-        if self.mock_mode:
-            # In mock mode, return None
-            logger.info(f"MOCK: Node {node_id} not found (mock mode)")
-            return None
-            
         await self._ensure_initialized()
         
+        if self.mock_mode:
+            node = self.graph.get_node(node_id)
+            return _to_graph_node(node) if node else None
+        
         try:
-            with self.driver.session() as session:
-                query = """
-                MATCH (n {id: $id})
-                RETURN n
-                """
-                
-                result = session.run(query, id=node_id)
-                
-                record = result.single() if result.peek() else None
-                if not record:
-                    return None
-                
-                node = record["n"]
-                
-                # Extract properties
-                props = dict(node.items())
-                
-                # Create GraphNode
-                return GraphNode(
-                    id=props["id"],
-                    type=props.get("type", MemoryType.KNOWLEDGE),
-                    content=props.get("content", ""),
-                    timestamp=props.get("timestamp", int(datetime.now().timestamp() * 1000)),
-                    metadata=props.get("metadata", {})
-                )
+            query = """
+            MATCH (n {id: $id})
+            RETURN n
+            """
+            
+            records = await run_query("get_node", query, id=node_id)
+            
+            if not records:
+                return None
+            
+            node = records[0]["n"]
+            
+            # Extract properties
+            props = dict(node.items())
+            
+            # Create GraphNode
+            return GraphNode(
+                id=props["id"],
+                type=props.get("type", MemoryType.KNOWLEDGE),
+                content=props.get("content", ""),
+                timestamp=props.get("timestamp", int(datetime.now().timestamp() * 1000)),
+                metadata=props.get("metadata", {})
+            )
         except Exception as e:
             logger.error(f"Error getting node: {e}")
             raise
@@ -325,63 +446,76 @@ class Neo4jService:
         min_strength: float = 0.0
     ) -> List[GraphNode]:
         """Find related nodes for a given node"""
-        if self.mock_mode:
-            # In mock mode, return empty list or mock data
-            logger.info(f"MOCK: Returning empty list for get_related_nodes({node_id})")
-            return []
-            
         await self._ensure_initialized()
         
+        if self.mock_mode:
+            edges = [
+                (relationship_type, target_id, props)
+                for relationship_type, target_id, props in self.graph.edges_from(node_id, relationship_types)
+                if edge_strength(props) >= min_strength
+            ]
+            edges.sort(key=lambda edge: (edge_strength(edge[2]), edge[2].get("timestamp", 0)), reverse=True)
+            return [
+                _to_graph_node(self.graph.nodes[target_id], [{
+                    "targetId": node_id,
+                    "relationship": {
+                        "type": relationship_type,
+                        "properties": props
+                    }
+                }])
+                for relationship_type, target_id, props in edges[:limit]
+            ]
+        
         try:
-            with self.driver.session() as session:
-                rel_types = relationship_types if relationship_types else ["*"]
-                rel_type_str = "|".join(f"`{t}`" for t in rel_types)
+            rel_types = relationship_types if relationship_types else ["*"]
+            rel_type_str = "|".join(f"`{t}`" for t in rel_types)
+            
+            query = f"""
+            MATCH (source {{id: $node_id}})
+            MATCH (source)-[r:{rel_type_str}]->(target)
+            WHERE r.strength >= $min_strength
+            RETURN target, r
+            ORDER BY r.strength DESC, r.timestamp DESC
+            LIMIT $limit
+            """
+            
+            records = await run_query(
+                "get_related_nodes",
+                query,
+                node_id=node_id,
+                min_strength=min_strength,
+                limit=limit
+            )
+            
+            nodes = []
+            
+            for record in records:
+                target = record["target"]
+                relationship = record["r"]
                 
-                query = f"""
-                MATCH (source {{id: $node_id}})
-                MATCH (source)-[r:{rel_type_str}]->(target)
-                WHERE r.strength >= $min_strength
-                RETURN target, r
-                ORDER BY r.strength DESC, r.timestamp DESC
-                LIMIT $limit
-                """
+                # Extract properties
+                target_props = dict(target.items())
+                rel_props = dict(relationship.items())
                 
-                result = session.run(
-                    query,
-                    node_id=node_id,
-                    min_strength=min_strength,
-                    limit=limit
+                # Create GraphNode
+                node = GraphNode(
+                    id=target_props["id"],
+                    type=target_props.get("type", MemoryType.KNOWLEDGE),
+                    content=target_props.get("content", ""),
+                    timestamp=target_props.get("timestamp", int(datetime.now().timestamp() * 1000)),
+                    metadata=target_props.get("metadata", {}),
+                    relationships=[{
+                        "targetId": node_id,
+                        "relationship": {
+                            "type": relationship.type,
+                            "properties": rel_props
+                        }
+                    }]
                 )
                 
-                nodes = []
-                
-                for record in result:
-                    target = record["target"]
-                    relationship = record["r"]
-                    
-                    # Extract properties
-                    target_props = dict(target.items())
-                    rel_props = dict(relationship.items())
-                    
-                    # Create GraphNode
-                    node = GraphNode(
-                        id=target_props["id"],
-                        type=target_props.get("type", MemoryType.KNOWLEDGE),
-                        content=target_props.get("content", ""),
-                        timestamp=target_props.get("timestamp", int(datetime.now().timestamp() * 1000)),
-                        metadata=target_props.get("metadata", {}),
-                        relationships=[{
-                            "targetId": node_id,
-                            "relationship": {
-                                "type": relationship.type,
-                                "properties": rel_props
-                            }
-                        }]
-                    )
-                    
-                    nodes.append(node)
-                
-                return nodes
+                nodes.append(node)
+            
+            return nodes
         except Exception as e:
             logger.error(f"Error getting related nodes: {e}")
             raise
@@ -396,69 +530,187 @@ class Neo4jService:
         """Find the shortest path between two nodes"""
         await self._ensure_initialized()
         
+        if self.mock_mode:
+            edges = self.graph.shortest_path(source_id, target_id, relationship_types, max_length)
+            return self._memory_path_nodes(edges) if edges else []
+        
         try:
-            with self.driver.session() as session:
-                rel_types = relationship_types if relationship_types else ["*"]
-                rel_type_str = "|".join(f"`{t}`" for t in rel_types)
+            rel_types = relationship_types if relationship_types else ["*"]
+            rel_type_str = "|".join(f"`{t}`" for t in rel_types)
+            
+            query = f"""
+            MATCH path = shortestPath(
+                (source {{id: $source_id}})-[r:{rel_type_str}*1..{max_length}]->(target {{id: $target_id}})
+            )
+            RETURN nodes(path) as nodes, relationships(path) as relationships
+            """
+            
+            records = await run_query(
+                "get_path",
+                query,
+                source_id=source_id,
+                target_id=target_id
+            )
+            
+            if not records:
+                return []
+            
+            nodes = records[0]["nodes"]
+            relationships = records[0]["relationships"]
+            
+            # Format nodes and relationships
+            formatted_nodes = []
+            
+            for i, node in enumerate(nodes):
+                # Extract properties
+                props = dict(node.items())
                 
-                query = f"""
-                MATCH path = shortestPath(
-                    (source {{id: $source_id}})-[r:{rel_type_str}*1..{max_length}]->(target {{id: $target_id}})
-                )
-                RETURN nodes(path) as nodes, relationships(path) as relationships
-                """
+                # Create relationship info for this node to the next node
+                node_relationships = None
+                if i < len(relationships):
+                    rel = relationships[i]
+                    rel_props = dict(rel.items())
+                    
+                    node_relationships = [{
+                        "targetId": nodes[i + 1]["id"],
+                        "relationship": {
+                            "type": rel.type,
+                            "properties": rel_props
+                        }
+                    }]
                 
-                result = session.run(
-                    query,
-                    source_id=source_id,
-                    target_id=target_id
+                # Create GraphNode
+                formatted_node = GraphNode(
+                    id=props["id"],
+                    type=props.get("type", MemoryType.KNOWLEDGE),
+                    content=props.get("content", ""),
+                    timestamp=props.get("timestamp", int(datetime.now().timestamp() * 1000)),
+                    metadata=props.get("metadata", {}),
+                    relationships=node_relationships
                 )
                 
-                record = result.single() if result.peek() else None
-                if not record:
-                    return []
-                
-                nodes = record["nodes"]
-                relationships = record["relationships"]
-                
-                # Format nodes and relationships
-                formatted_nodes = []
-                
-                for i, node in enumerate(nodes):
-                    # Extract properties
-                    props = dict(node.items())
-                    
-                    # Create relationship info for this node to the next node
-                    node_relationships = None
-                    if i < len(relationships):
-                        rel = relationships[i]
-                        rel_props = dict(rel.items())
-                        
-                        node_relationships = [{
-                            "targetId": nodes[i + 1]["id"],
-                            "relationship": {
-                                "type": rel.type,
-                                "properties": rel_props
-                            }
-                        }]
-                    
-                    # Create GraphNode
-                    formatted_node = GraphNode(
-                        id=props["id"],
-                        type=props.get("type", MemoryType.KNOWLEDGE),
-                        content=props.get("content", ""),
-                        timestamp=props.get("timestamp", int(datetime.now().timestamp() * 1000)),
-                        metadata=props.get("metadata", {}),
-                        relationships=node_relationships
-                    )
-                    
-                    formatted_nodes.append(formatted_node)
-                
-                return formatted_nodes
+                formatted_nodes.append(formatted_node)
+            
+            return formatted_nodes
         except Exception as e:
             logger.error(f"Error getting path: {e}")
             raise
     
+    def _memory_path_nodes(self, edges: List[EdgeKey]) -> List[GraphNode]:
+        """GraphNodes along an in-memory path, each carrying its edge to the next node"""
+        node_ids = [edges[0][0]] + [target_id for _, _, target_id in edges]
+        formatted_nodes = []
+        for i, node_id in enumerate(node_ids):
+            node_relationships = None
+            if i < len(edges):
+                source_id, relationship_type, next_id = edges[i]
+                node_relationships = [{
+                    "targetId": next_id,
+                    "relationship": {
+                        "type": relationship_type,
+                        "properties": self.graph.get_edge(source_id, relationship_type, next_id)
+                    }
+                }]
+            formatted_nodes.append(_to_graph_node(self.graph.nodes[node_id], node_relationships))
+        return formatted_nodes
+    
+    def _memory_expander(self, relationship_types: Optional[List[str]], min_strength: float) -> Expand:
+        """Search expansion over the in-memory graph: each node's strongest outgoing edges"""
+        def strongest(node_id: str) -> List[Neighbor]:
+            neighbors = [
+                (relationship_type, target_id, self.graph.nodes[target_id].get("type"), props)
+                for relationship_type, target_id, props in self.graph.edges_from(node_id, relationship_types)
+                if edge_strength(props) >= min_strength
+            ]
+            return heapq.nlargest(
+                settings.KNOWLEDGE_GRAPH_SEARCH_FANOUT, neighbors, key=lambda neighbor: edge_strength(neighbor[3])
+            )
+        
+        async def expand(node_ids: List[str]) -> Dict[str, List[Neighbor]]:
+            return {node_id: strongest(node_id) for node_id in node_ids}
+        return expand
+    
+    def _neo4j_expander(self, session, relationship_types: Optional[List[str]], min_strength: float) -> Expand:
+        """Search expansion over Neo4j: one query per batch of nodes for each one's strongest outgoing edges"""
+        type_filter = "AND type(r) IN $relationship_types" if relationship_types else ""
+        query = f"""
+        UNWIND $node_ids AS node_id
+        MATCH (source:Memory {{id: node_id}})
+        CALL {{
+            WITH source
+            MATCH (source)-[r]->(target)
+            WHERE r.strength >= $min_strength {type_filter}
+            RETURN r, target
+            ORDER BY r.strength DESC
+            LIMIT $fanout
+        }}
+        RETURN source.id AS source_id, type(r) AS type, target.id AS id,
+               target.type AS target_type, properties(r) AS properties
+        """
+        
+        async def expand(node_ids: List[str]) -> Dict[str, List[Neighbor]]:
+            records = await run_query(
+                "graph_search_expand",
+                query,
+                session=session,
+                node_ids=node_ids,
+                min_strength=min_strength,
+                relationship_types=relationship_types or [],
+                fanout=settings.KNOWLEDGE_GRAPH_SEARCH_FANOUT
+            )
+            neighbors: Dict[str, List[Neighbor]] = {node_id: [] for node_id in node_ids}
+            for record in records:
+                neighbors[record["source_id"]].append(
+                    (record["type"], record["id"], record["target_type"], dict(record["properties"]))
+                )
+            return neighbors
+        return expand
+    
+    def _invalidate_relevance(self):
+        """Make every cached relevance result unreachable after a graph write"""
+        self._generation += 1
+    
+    async def get_relevance(
+        self,
+        entity_id: str,
+        target_type: str,
+        relationship_types: Optional[List[str]] = None,
+        max_depth: int = 3
+    ) -> RelevanceResult:
+        """
+        Relevance of an entity to nodes of a type, with the top contributing nodes.
+        
+        Computed by a budgeted best-first search (see graph_reasoning.relevance)
+        and cached per (entity, target type) until the next write through this
+        service, or for KNOWLEDGE_GRAPH_RELEVANCE_CACHE_TTL seconds.
+        """
+        await self._ensure_initialized()
+        
+        # Take the key before searching, so a concurrent write invalidates the result
+        cache_key = json.dumps(
+            [self._generation, entity_id, target_type, sorted(relationship_types or []), max_depth]
+        )
+        cached = self._relevance_cache.get(cache_key)
+        if cached is not None and time.monotonic() - cached[0] < settings.KNOWLEDGE_GRAPH_RELEVANCE_CACHE_TTL:
+            GRAPH_RELEVANCE_CACHE_REQUESTS.labels(result="hit").inc()
+            return cached[1]
+        GRAPH_RELEVANCE_CACHE_REQUESTS.labels(result="miss").inc()
+        
+        if self.mock_mode:
+            result = await relevance(
+                self._memory_expander(relationship_types, 0.0), entity_id, target_type, max_depth
+            )
+        else:
+            async with graph_session() as session:
+                result = await relevance(
+                    self._neo4j_expander(session, relationship_types, 0.0), entity_id, target_type, max_depth,
+                    budget=settings.KNOWLEDGE_GRAPH_NEO4J_SEARCH_BUDGET,
+                    batch_size=settings.KNOWLEDGE_GRAPH_NEO4J_EXPAND_BATCH
+                )
+        
+        self._relevance_cache.set(cache_key, (time.monotonic(), result))
+        return result
+    
     async def calculate_relevance_score(
         self,
         entity_id: str,
@@ -467,37 +719,9 @@ class Neo4jService:
         max_depth: int = 3
     ) -> float:
         """Calculate relevance score for an entity based on its connections"""
-        await self._ensure_initialized()
-        
         try:
-            with self.driver.session() as session:
-                rel_types = relationship_types if relationship_types else ["*"]
-                rel_type_str = "|".join(f"`{t}`" for t in rel_types)
-                
-                query = f"""
-                MATCH path = (source {{id: $entity_id}})-[r:{rel_type_str}*1..{max_depth}]->(target)
-                WHERE target.type = $target_type
-                WITH path,
-                     relationships(path) as rels,
-                     length(path) as pathLength
-                WITH path,
-                     rels,
-                     pathLength,
-                     reduce(s = 1.0, rel in rels | s * rel.strength) as pathStrength
-                RETURN sum(pathStrength / (pathLength ^ 2)) as relevanceScore
-                """
-                
-                result = session.run(
-                    query,
-                    entity_id=entity_id,
-                    target_type=target_type
-                )
-                
-                record = result.single() if result.peek() else None
-                if not record or record["relevanceScore"] is None:
-                    return 0.0
-                
-                return float(record["relevanceScore"])
+            result = await self.get_relevance(entity_id, target_type, relationship_types, max_depth)
+            return result.score
         except Exception as e:
             logger.error(f"Error calculating relevance score: {e}")
             return 0.0
@@ -509,91 +733,56 @@ class Neo4jService:
         max_length: int = 5,
         min_strength: float = 0.2
     ) -> ReasoningPath:
-        """Perform reasoning by finding paths between entities and explaining the connections"""
+        """
+        Perform reasoning by finding paths between entities and explaining the connections.
+        
+        The strongest path (largest product of relationship strengths) is found
+        by a budgeted best-first search, see graph_reasoning.strongest_path.
+        """
         await self._ensure_initialized()
         
         try:
-            with self.driver.session() as session:
-                # Find the most relevant path based on relationship strength
-                query = f"""
-                MATCH path = (source {{id: $source_id}})-[rels*1..{max_length}]->(target {{id: $target_id}})
-                WHERE all(r in rels WHERE r.strength >= $min_strength)
-                WITH path,
-                     relationships(path) as rels,
-                     nodes(path) as nodes,
-                     reduce(s = 1.0, rel in relationships(path) | s * rel.strength) as pathStrength
-                RETURN path, nodes, rels, pathStrength
-                ORDER BY pathStrength DESC
-                LIMIT 1
-                """
-                
-                result = session.run(
-                    query,
-                    source_id=source_id,
-                    target_id=target_id,
-                    min_strength=min_strength
+            if self.mock_mode:
+                result = await strongest_path(
+                    self._memory_expander(None, min_strength), source_id, target_id, max_length, min_strength
                 )
-                
-                record = result.single() if result.peek() else None
-                if not record:
-                    return ReasoningPath(
-                        path=[],
-                        relationships=[],
-                        score=0,
-                        explanation=f"No connection found between {source_id} and {target_id}"
+                nodes = {node_id: self.graph.nodes[node_id] for node_id in result.node_ids} if result else {}
+            else:
+                async with graph_session() as session:
+                    result = await strongest_path(
+                        self._neo4j_expander(session, None, min_strength),
+                        source_id, target_id, max_length, min_strength,
+                        budget=settings.KNOWLEDGE_GRAPH_NEO4J_SEARCH_BUDGET,
+                        batch_size=settings.KNOWLEDGE_GRAPH_NEO4J_EXPAND_BATCH
                     )
-                
-                nodes = record["nodes"]
-                relationships = record["rels"]
-                path_strength = record["pathStrength"]
-                
-                # Format nodes
-                formatted_nodes = []
-                for node in nodes:
-                    props = dict(node.items())
-                    
-                    formatted_node = GraphNode(
-                        id=props["id"],
-                        type=props.get("type", MemoryType.KNOWLEDGE),
-                        content=props.get("content", ""),
-                        timestamp=props.get("timestamp", int(datetime.now().timestamp() * 1000)),
-                        metadata=props.get("metadata", {})
+                    records = await run_query(
+                        "perform_reasoning",
+                        """
+                        MATCH (n:Memory)
+                        WHERE n.id IN $ids
+                        RETURN n
+                        """,
+                        session=session,
+                        ids=result.node_ids if result else []
                     )
-                    
-                    formatted_nodes.append(formatted_node)
-                
-                # Format relationships
-                formatted_rels = []
-                for rel in relationships:
-                    rel_props = dict(rel.items())
-                    
-                    formatted_rel = Relationship(
-                        type=rel.type,
-                        properties=rel_props
-                    )
-                    
-                    formatted_rels.append(formatted_rel)
-                
-                # Generate explanation
-                explanation = f"Connection found between {formatted_nodes[0].id} and {formatted_nodes[-1].id} with strength {path_strength:.2f}: "
-                
-                # Add path details to explanation
-                for i in range(len(formatted_nodes) - 1):
-                    current_node = formatted_nodes[i]
-                    next_node = formatted_nodes[i + 1]
-                    rel = formatted_rels[i]
-                    
-                    explanation += f"{current_node.type}({current_node.id}) -[{rel.type}]-> "
-                    
-                    if i == len(formatted_nodes) - 2:
-                        explanation += f"{next_node.type}({next_node.id})"
-                
-                return ReasoningPath(
-                    path=formatted_nodes,
-                    relationships=formatted_rels,
-                    score=float(path_strength),
-                    explanation=explanation
-                )
+                nodes = {record["n"]["id"]: dict(record["n"].items()) for record in records}
+            
+            if result is None:
+                return self._no_connection(source_id, target_id)
+            
+            # Format nodes
+            formatted_nodes = [_to_graph_node(nodes[node_id]) for node_id in result.node_ids]
+            
+            # Format relationships
+            formatted_rels = [
+                Relationship(type=relationship_type, properties=properties)
+                for (_, relationship_type, _), properties in zip(result.edges, result.properties)
+            ]
+            
+            reasoning = self._explain_path(formatted_nodes, formatted_rels, result.strength)
+            if result.truncated:
+                reasoning.explanation += " (strongest path found within the search budget)"
+            return reasoning
         except Exception as e:
             logger.error(f"Error performing reasoning: {e}")
             return ReasoningPath(
@@ -603,32 +792,72 @@ class Neo4jService:
                 explanation=f"Error: Failed to perform reasoning between {source_id} and {target_id}"
             )
     
+    @staticmethod
+    def _no_connection(source_id: str, target_id: str) -> ReasoningPath:
+        return ReasoningPath(
+            path=[],
+            relationships=[],
+            score=0,
+            explanation=f"No connection found between {source_id} and {target_id}"
+        )
+    
+    @staticmethod
+    def _explain_path(
+        formatted_nodes: List[GraphNode],
+        formatted_rels: List[Relationship],
+        path_strength: float
+    ) -> ReasoningPath:
+        """A ReasoningPath with a readable explanation of each hop"""
+        # Generate explanation
+        explanation = f"Connection found between {formatted_nodes[0].id} and {formatted_nodes[-1].id} with strength {path_strength:.2f}: "
+        
+        # Add path details to explanation
+        for i in range(len(formatted_nodes) - 1):
+            current_node = formatted_nodes[i]
+            next_node = formatted_nodes[i + 1]
+            rel = formatted_rels[i]
+            
+            explanation += f"{current_node.type}({current_node.id}) -[{rel.type}]-> "
+            
+            if i == len(formatted_nodes) - 2:
+                explanation += f"{next_node.type}({next_node.id})"
+        
+        return ReasoningPath(
+            path=formatted_nodes,
+            relationships=formatted_rels,
+            score=float(path_strength),
+            explanation=explanation
+        )
+    
     async def delete_node(self, node_id: str) -> bool:
         """Delete a node and its relationships"""
+        await self._ensure_initialized()
+        self._invalidate_relevance()
+        
         if self.mock_mode:
-            # In mock mode, return success
-            logger.info(f"MOCK: Deleted node {node_id}")
+            self.graph.delete_node(node_id)
+            self._graph_changed()
             return True
-            
-        await self._ensure_initialized()
         
         try:
-            with self.driver.session() as session:
-                query = """
-                MATCH (n {id: $node_id})
-                DETACH DELETE n
-                """
-                
-                session.run(query, node_id=node_id)
-                return True
+            query = """
+            MATCH (n {id: $node_id})
+            DETACH DELETE n
+            """
+            
+            await run_query("delete_node", query, node_id=node_id)
+            return True
         except Exception as e:
             logger.error(f"Error deleting node: {e}")
             raise
     
     async def close(self):
-        """Close the Neo4j driver"""
-        if self.driver:
-            self.driver.close()
+        """Flush the in-memory graph's snapshot; the shared driver is closed on application shutdown"""
+        task = self._snapshot_task
+        if task is not None and not task.done() and task.get_loop() is asyncio.get_running_loop():
+            await task
+        if self._snapshot_dirty and settings.KNOWLEDGE_GRAPH_SNAPSHOT_PATH and self.graph is not None:
+            await self._save_snapshot()
 
 # Create singleton instance
-knowledge_graph_service = Neo4jService() 
\ No newline at end of file
+knowledge_graph_service = Neo4jService()
\ No newline at end of file
@@ -0,0 +1,129 @@
+"""
+Lexical Index
+In-memory BM25 inverted index kept alongside a vector memory collection, so
+exact names, ticket numbers and phrases can be found even when their
+embeddings are not close to the query's
+"""
+
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Words, plus compound tokens such as ticket numbers ("ops-1234") and versions ("v2.1")
+_TOKEN = re.compile(r"\w+(?:[-./#]\w+)*")
+_PART = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms of a text; compound tokens also contribute their parts"""
+    terms = []
+    for token in _TOKEN.findall(text.lower()):
+        terms.append(token)
+        parts = _PART.findall(token)
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[str]], k: int = 60) -> Dict[str, float]:
+    """Fuse ranked id lists: each list contributes 1 / (k + rank) to an id's score"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return scores
+
+
+class BM25Index:
+    """
+    Okapi BM25 over an inverted index of term -> {doc_id: term frequency}.
+
+    Documents carry an optional owner so a collection shared by several users
+    (bucket or unsharded modes) can be searched for one user only. All methods
+    are thread-safe; the index is filled lazily from the vector store by load().
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.loaded = False
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._doc_terms: Dict[str, Counter] = {}
+        self._doc_length: Dict[str, int] = {}
+        self._doc_owner: Dict[str, Optional[str]] = {}
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    def add(self, doc_id: str, text: str, owner: Optional[Any] = None) -> None:
+        """Index a document, replacing any previous version with the same id"""
+        terms = Counter(tokenize(text))
+        with self._lock:
+            self._remove(doc_id)
+            self._doc_terms[doc_id] = terms
+            self._doc_length[doc_id] = sum(terms.values())
+            self._doc_owner[doc_id] = str(owner) if owner is not None else None
+            self._total_length += self._doc_length[doc_id]
+            for term, count in terms.items():
+                self._postings.setdefault(term, {})[doc_id] = count
+
+    def remove(self, doc_ids: Iterable[str]) -> None:
+        with self._lock:
+            for doc_id in doc_ids:
+                self._remove(doc_id)
+
+    def _remove(self, doc_id: str) -> None:
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        self._doc_owner.pop(doc_id, None)
+        self._total_length -= self._doc_length.pop(doc_id)
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._postings.clear()
+            self._doc_terms.clear()
+            self._doc_length.clear()
+            self._doc_owner.clear()
+            self._total_length = 0
+            self.loaded = False
+
+    def load(self, loader: Callable[["BM25Index"], None]) -> None:
+        """Fill the index once with loader(self); concurrent callers wait for the first"""
+        with self._lock:
+            if not self.loaded:
+                loader(self)
+                self.loaded = True
+
+    def search(self, query: str, k: int, owner: Optional[Any] = None) -> List[Tuple[str, float]]:
+        """Top k (doc_id, score) pairs for the query, optionally limited to one owner"""
+        terms = set(tokenize(query))
+        owner = str(owner) if owner is not None else None
+        with self._lock:
+            count = len(self._doc_terms)
+            if not count or not terms:
+                return []
+            average_length = self._total_length / count
+            scores: Dict[str, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    if owner is not None and self._doc_owner.get(doc_id) != owner:
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_length[doc_id] / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
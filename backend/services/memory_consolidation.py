@@ -0,0 +1,244 @@
+"""
+Memory Consolidation
+Keeps each user's vector memory small: merges near-duplicate memories, rolls
+old low-importance memories up into periodic summaries, and evicts the least
+valuable memories once a user exceeds their budget
+"""
+
+import re
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List
+
+import numpy as np
+from pydantic import BaseModel
+
+from backend.config import settings
+from backend.services.vector_memory import Memory, VectorMemoryService, vector_memory
+from backend.utils.logger import logger
+from backend.utils.metrics import MEMORY_CONSOLIDATION_ACTIONS
+
+DAY_MS = 24 * 60 * 60 * 1000
+# Importance assumed for memories stored without one
+DEFAULT_IMPORTANCE = 0.5
+# Source lines quoted in an extractive summary
+SUMMARY_MAX_LINES = 20
+
+Summarizer = Callable[[List[Memory], str], Awaitable[str]]
+
+_FIRST_SENTENCE = re.compile(r"(.+?[.!?])(?:\s|$)")
+
+
+class MergedGroup(BaseModel):
+    kept: str
+    removed: List[str]
+    similarity: float
+
+
+class RollupSummary(BaseModel):
+    id: str
+    type: str
+    period: str
+    source_ids: List[str]
+
+
+class ConsolidationReport(BaseModel):
+    user_id: str
+    dry_run: bool
+    scanned: int
+    merged: List[MergedGroup] = []
+    summaries: List[RollupSummary] = []
+    evicted: List[str] = []
+    remaining: int = 0
+
+
+def importance(memory: Memory) -> float:
+    value = (memory.metadata or {}).get("importance")
+    return float(value) if isinstance(value, (int, float)) else DEFAULT_IMPORTANCE
+
+
+def retention_score(memory: Memory, now_ms: int) -> float:
+    """Importance decayed by age; the lowest scores are evicted first"""
+    age_days = max(0, now_ms - memory.timestamp) / DAY_MS
+    return importance(memory) * 0.5 ** (age_days / settings.MEMORY_EVICTION_HALF_LIFE_DAYS)
+
+
+def period_of(timestamp_ms: int) -> str:
+    moment = datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc)
+    if settings.MEMORY_ROLLUP_PERIOD == "week":
+        year, week, _ = moment.isocalendar()
+        return f"{year}-W{week:02d}"
+    return moment.strftime("%Y-%m")
+
+
+async def extractive_summary(memories: List[Memory], period: str) -> str:
+    """Summary built from the first sentence of the most important memories, without an LLM call"""
+    ranked = sorted(memories, key=lambda m: (importance(m), m.timestamp), reverse=True)
+    lines = []
+    for memory in ranked[:SUMMARY_MAX_LINES]:
+        text = " ".join(memory.content.split())
+        match = _FIRST_SENTENCE.match(text)
+        lines.append(f"- {(match.group(1) if match else text)[:200]}")
+    more = len(memories) - len(lines)
+    if more > 0:
+        lines.append(f"- ... and {more} more")
+    return f"Summary of {len(memories)} {memories[0].type.value} memories from {period}:\n" + "\n".join(lines)
+
+
+class MemoryConsolidator:
+    """Runs de-duplication, roll-up and eviction over one user's memories"""
+
+    def __init__(self, service: VectorMemoryService = vector_memory, summarize: Summarizer = extractive_summary):
+        self.service = service
+        self.summarize = summarize
+
+    async def consolidate_user(self, user_id: Any, dry_run: bool = False) -> ConsolidationReport:
+        """
+        Consolidate one user's memories and report what changed.
+
+        With dry_run the same decisions are made and reported but nothing is
+        written, so the report shows exactly what a real run would do.
+        """
+        now_ms = int(time.time() * 1000)
+        memories = await self.service.scan_memories(user_id=user_id, include_embeddings=True)
+        report = ConsolidationReport(user_id=str(user_id), dry_run=dry_run, scanned=len(memories))
+
+        memories = await self._merge_duplicates(user_id, memories, report, dry_run)
+        memories = await self._roll_up(user_id, memories, report, dry_run, now_ms)
+        memories = await self._evict(user_id, memories, report, dry_run, now_ms)
+        report.remaining = len(memories)
+
+        if not dry_run:
+            MEMORY_CONSOLIDATION_ACTIONS.labels(action="merged").inc(sum(len(g.removed) for g in report.merged))
+            MEMORY_CONSOLIDATION_ACTIONS.labels(action="rolled_up").inc(
+                sum(len(s.source_ids) for s in report.summaries)
+            )
+            MEMORY_CONSOLIDATION_ACTIONS.labels(action="evicted").inc(len(report.evicted))
+        logger.info(
+            f"Memory consolidation{' (dry run)' if dry_run else ''} for user {user_id}: "
+            f"{report.scanned} scanned, {sum(len(g.removed) for g in report.merged)} merged, "
+            f"{sum(len(s.source_ids) for s in report.summaries)} rolled up into {len(report.summaries)} summaries, "
+            f"{len(report.evicted)} evicted, {report.remaining} remaining"
+        )
+        return report
+
+    async def _merge_duplicates(
+        self, user_id: Any, memories: List[Memory], report: ConsolidationReport, dry_run: bool
+    ) -> List[Memory]:
+        """Keep the most important, newest memory of each near-duplicate group"""
+        candidates = [m for m in memories if m.embedding]
+        if len(candidates) < 2:
+            return memories
+
+        # Representatives are chosen first, so each group keeps its best member
+        candidates.sort(key=lambda m: (importance(m), m.timestamp), reverse=True)
+        vectors = np.asarray([m.embedding for m in candidates], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        types = np.asarray([m.type.value for m in candidates])
+
+        absorbed = np.zeros(len(candidates), dtype=bool)
+        kept_updates = []
+        removed_ids = set()
+        for i, keeper in enumerate(candidates):
+            if absorbed[i]:
+                continue
+            # One row at a time keeps memory linear in the number of memories
+            similarity = vectors[i + 1:] @ vectors[i]
+            matches = np.nonzero(
+                (similarity >= settings.MEMORY_DEDUP_SIMILARITY)
+                & ~absorbed[i + 1:]
+                & (types[i + 1:] == types[i])
+            )[0] + i + 1
+            if not len(matches):
+                continue
+            absorbed[matches] = True
+            duplicates = [candidates[j] for j in matches]
+            removed_ids.update(d.id for d in duplicates)
+            report.merged.append(MergedGroup(
+                kept=keeper.id,
+                removed=[d.id for d in duplicates],
+                similarity=round(float(similarity[matches - i - 1].min()), 4),
+            ))
+
+            metadata = dict(keeper.metadata or {})
+            metadata["importance"] = max(importance(m) for m in [keeper] + duplicates)
+            metadata["merged_count"] = int(metadata.get("merged_count", 1)) + sum(
+                int((d.metadata or {}).get("merged_count", 1)) for d in duplicates
+            )
+            metadata["last_seen"] = max(m.timestamp for m in [keeper] + duplicates)
+            keeper.metadata = metadata
+            kept_updates.append(keeper)
+
+        if removed_ids and not dry_run:
+            await self.service.update_metadata(kept_updates, user_id=user_id)
+            await self.service.delete_memory_ids(sorted(removed_ids), user_id=user_id)
+        return [m for m in memories if m.id not in removed_ids]
+
+    async def _roll_up(
+        self, user_id: Any, memories: List[Memory], report: ConsolidationReport, dry_run: bool, now_ms: int
+    ) -> List[Memory]:
+        """Replace old low-importance memories with one summary per type and period"""
+        cutoff = now_ms - settings.MEMORY_ROLLUP_AGE_DAYS * DAY_MS
+        groups: Dict[tuple, List[Memory]] = defaultdict(list)
+        for memory in memories:
+            if (
+                memory.timestamp < cutoff
+                and importance(memory) <= settings.MEMORY_ROLLUP_MAX_IMPORTANCE
+                and not (memory.metadata or {}).get("rollup")
+            ):
+                groups[(memory.type, period_of(memory.timestamp))].append(memory)
+
+        summaries = []
+        rolled_up = set()
+        for (memory_type, period), sources in sorted(groups.items(), key=lambda item: item[0][1]):
+            if len(sources) < settings.MEMORY_ROLLUP_MIN_GROUP:
+                continue
+            summary = Memory(
+                id=f"summary-{uuid.uuid4()}",
+                type=memory_type,
+                content=await self.summarize(sources, period),
+                timestamp=max(m.timestamp for m in sources),
+                metadata={
+                    "user_id": user_id,
+                    "rollup": True,
+                    "period": period,
+                    "source_count": len(sources),
+                    "importance": max(importance(m) for m in sources),
+                },
+            )
+            summaries.append(summary)
+            rolled_up.update(m.id for m in sources)
+            report.summaries.append(RollupSummary(
+                id=summary.id, type=memory_type.value, period=period, source_ids=[m.id for m in sources]
+            ))
+
+        if summaries and not dry_run:
+            result = await self.service.store_memories(summaries)
+            stored = {item.id for item in result.results if item.stored}
+            # Sources of a summary that failed to store are kept
+            report.summaries = [entry for entry in report.summaries if entry.id in stored]
+            rolled_up = {source_id for entry in report.summaries for source_id in entry.source_ids}
+            summaries = [s for s in summaries if s.id in stored]
+            await self.service.delete_memory_ids(sorted(rolled_up), user_id=user_id)
+        return [m for m in memories if m.id not in rolled_up] + summaries
+
+    async def _evict(
+        self, user_id: Any, memories: List[Memory], report: ConsolidationReport, dry_run: bool, now_ms: int
+    ) -> List[Memory]:
+        """Drop the lowest-retention memories until the user is within budget"""
+        excess = len(memories) - settings.MEMORY_USER_BUDGET
+        if excess <= 0:
+            return memories
+
+        ranked = sorted(memories, key=lambda m: (retention_score(m, now_ms), m.timestamp))
+        evicted = {m.id for m in ranked[:excess]}
+        report.evicted = [m.id for m in ranked[:excess]]
+        if not dry_run:
+            await self.service.delete_memory_ids(report.evicted, user_id=user_id)
+        return [m for m in memories if m.id not in evicted]
+
+
+memory_consolidator = MemoryConsolidator()
@@ -0,0 +1,190 @@
+"""
+In-Memory Graph
+An embedded property graph that backs the knowledge graph service when Neo4j
+is not used: typed adjacency lists, id and type indexes, path search and
+optional JSON snapshots on disk
+"""
+
+from collections import defaultdict, deque
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+import json
+import os
+
+# (source id, relationship type, target id)
+EdgeKey = Tuple[str, str, str]
+
+
+def edge_strength(properties: Dict[str, Any]) -> float:
+    """An edge's strength; edges without one never pass a strength filter, as in Cypher"""
+    strength = properties.get("strength")
+    return float(strength) if strength is not None else 0.0
+
+
+class InMemoryGraph:
+    """
+    A directed property graph held in process.
+
+    Nodes are property dicts indexed by id and by their "type" property, each
+    with one label. Edges are stored as adjacency lists keyed by source, then
+    relationship type, then target, so expanding a node by relationship type
+    never touches unrelated edges. There is at most one edge per (source,
+    type, target), matching how the service MERGEs relationships.
+    """
+
+    def __init__(self):
+        self.nodes: Dict[str, Dict[str, Any]] = {}
+        self.labels: Dict[str, str] = {}
+        self._by_type: Dict[str, Set[str]] = defaultdict(set)
+        # source id -> relationship type -> target id -> properties
+        self._out: Dict[str, Dict[str, Dict[str, Dict[str, Any]]]] = defaultdict(lambda: defaultdict(dict))
+        # target id -> ids of nodes with an edge to it, so deletes avoid a scan
+        self._in: Dict[str, Set[str]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def upsert_node(self, node_id: str, label: str, properties: Dict[str, Any]) -> Dict[str, Any]:
+        """Create a node or set the given properties on an existing one"""
+        node = self.nodes.get(node_id)
+        if node is None:
+            node = {"id": node_id}
+            self.nodes[node_id] = node
+            self.labels[node_id] = label
+        previous_type = node.get("type")
+        node.update(properties)
+        if node.get("type") != previous_type:
+            self._by_type[str(previous_type)].discard(node_id)
+        if node.get("type") is not None:
+            self._by_type[str(node["type"])].add(node_id)
+        return node
+
+    def get_node(self, node_id: str, label: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        node = self.nodes.get(node_id)
+        if node is None or (label is not None and self.labels[node_id] != label):
+            return None
+        return node
+
+    def nodes_of_type(self, node_type: str) -> List[Dict[str, Any]]:
+        return [self.nodes[node_id] for node_id in self._by_type.get(node_type, ())]
+
+    def delete_node(self, node_id: str) -> bool:
+        """Delete a node and every edge touching it"""
+        node = self.nodes.pop(node_id, None)
+        if node is None:
+            return False
+        self.labels.pop(node_id, None)
+        self._by_type[str(node.get("type"))].discard(node_id)
+        for targets in self._out.pop(node_id, {}).values():
+            for target_id in targets:
+                self._in[target_id].discard(node_id)
+        for source_id in self._in.pop(node_id, set()):
+            for targets in self._out.get(source_id, {}).values():
+                targets.pop(node_id, None)
+        return True
+
+    def get_edge(self, source_id: str, relationship_type: str, target_id: str) -> Optional[Dict[str, Any]]:
+        types = self._out.get(source_id)
+        if not types or relationship_type not in types:
+            return None
+        return types[relationship_type].get(target_id)
+
+    def set_edge(self, source_id: str, relationship_type: str, target_id: str, properties: Dict[str, Any]) -> None:
+        """Create an edge or replace its properties"""
+        self._out[source_id][relationship_type][target_id] = dict(properties)
+        self._in[target_id].add(source_id)
+
+    def edges_from(
+        self,
+        source_id: str,
+        relationship_types: Optional[List[str]] = None
+    ) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+        """(relationship type, target id, properties) of a node's outgoing edges"""
+        types = self._out.get(source_id)
+        if not types:
+            return
+        for relationship_type in relationship_types or list(types):
+            for target_id, properties in types.get(relationship_type, {}).items():
+                yield relationship_type, target_id, properties
+
+    def shortest_path(
+        self,
+        source_id: str,
+        target_id: str,
+        relationship_types: Optional[List[str]] = None,
+        max_length: int = 5
+    ) -> Optional[List[EdgeKey]]:
+        """The edges of a path with the fewest hops (at least one), by breadth-first search"""
+        if source_id not in self.nodes or target_id not in self.nodes:
+            return None
+        parents: Dict[str, EdgeKey] = {}
+        frontier = deque([(source_id, 0)])
+        while frontier:
+            node_id, depth = frontier.popleft()
+            if depth == max_length:
+                continue
+            for relationship_type, next_id, _ in self.edges_from(node_id, relationship_types):
+                if next_id in parents or (next_id == source_id and next_id != target_id):
+                    continue
+                parents[next_id] = (node_id, relationship_type, next_id)
+                if next_id == target_id:
+                    return self._unwind(parents, source_id, target_id)
+                frontier.append((next_id, depth + 1))
+        return None
+
+    @staticmethod
+    def _unwind(parents: Dict[str, EdgeKey], source_id: str, target_id: str) -> List[EdgeKey]:
+        path = [parents[target_id]]
+        while path[-1][0] != source_id:
+            path.append(parents[path[-1][0]])
+        return path[::-1]
+
+    def to_snapshot(self) -> Dict[str, Any]:
+        """
+        A point-in-time copy of the graph, safe to serialize while it keeps changing.
+
+        Node and edge property dicts are copied; their values are only ever
+        replaced, never mutated in place, so a shallow copy is enough.
+        """
+        return {
+            "nodes": [
+                {"label": self.labels[node_id], "properties": dict(node)}
+                for node_id, node in self.nodes.items()
+            ],
+            "edges": [
+                {"source": source_id, "type": relationship_type, "target": target_id, "properties": dict(properties)}
+                for source_id, types in self._out.items()
+                for relationship_type, targets in types.items()
+                for target_id, properties in targets.items()
+            ]
+        }
+
+    @classmethod
+    def from_snapshot(cls, snapshot: Dict[str, Any]) -> "InMemoryGraph":
+        graph = cls()
+        for node in snapshot.get("nodes", []):
+            graph.upsert_node(node["properties"]["id"], node["label"], node["properties"])
+        for edge in snapshot.get("edges", []):
+            graph.set_edge(edge["source"], edge["type"], edge["target"], edge["properties"])
+        return graph
+
+    def save(self, path: str) -> None:
+        self.write_snapshot(path, self.to_snapshot())
+
+    @staticmethod
+    def write_snapshot(path: str, snapshot: Dict[str, Any]) -> None:
+        """Write a snapshot atomically, so a crash mid-write keeps the previous one"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(snapshot, f, default=str)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path: str) -> "InMemoryGraph":
+        """The graph saved at path, or an empty graph if there is no snapshot yet"""
+        if not os.path.exists(path):
+            return cls()
+        with open(path) as f:
+            return cls.from_snapshot(json.load(f))
@@ -0,0 +1,217 @@
+"""
+Model Router
+Chooses between skipping the LLM, a standard model and a premium model for email
+analysis using cheap local signals, and records every decision for audit
+"""
+
+import hashlib
+import re
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from backend.config import settings
+from backend.models.email import Email, StressLevel
+from backend.models.user import UserPreferences
+from backend.utils.logger import log_routing_decision
+from backend.utils.metrics import MODEL_ROUTING_DECISIONS
+
+TIER_SKIP = "skip"
+TIER_STANDARD = "standard"
+TIER_PREMIUM = "premium"
+
+AUTOMATED_SENDER_PATTERN = re.compile(
+    r"(no-?reply|do-?not-?reply|notifications?|newsletter|mailer-daemon|bounce|digest|updates?)@",
+    re.IGNORECASE,
+)
+AUTOMATED_CONTENT_MARKERS = [
+    "unsubscribe",
+    "view this email in your browser",
+    "view in browser",
+    "manage your preferences",
+    "this is an automated message",
+    "do not reply to this email",
+    "you are receiving this email because",
+]
+
+
+@dataclass
+class RoutingDecision:
+    """Outcome of routing one LLM call"""
+    call_site: str
+    tier: str
+    model: Optional[str]
+    reasons: List[str] = field(default_factory=list)
+    signals: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def skip(self) -> bool:
+        return self.tier == TIER_SKIP
+
+
+def sender_address(sender: Any) -> Optional[str]:
+    """Extract an address from the sender JSON column or a plain string"""
+    if isinstance(sender, dict):
+        return sender.get("email")
+    return sender or None
+
+
+def get_sender_history(
+    db: Session, user_id: int, sender: Any, exclude_email_id: Optional[int] = None
+) -> Dict[str, int]:
+    """Count the user's previous emails from a sender and how many were high stress"""
+    address = sender_address(sender)
+    if not address:
+        return {"email_count": 0, "high_stress_count": 0}
+
+    query = db.query(Email).filter(
+        Email.user_id == user_id,
+        Email.sender["email"].as_string() == address,
+    )
+    if exclude_email_id is not None:
+        query = query.filter(Email.id != exclude_email_id)
+
+    email_count = query.with_entities(func.count(Email.id)).scalar() or 0
+    high_stress_count = (
+        query.filter(Email.stress_level == StressLevel.HIGH)
+        .with_entities(func.count(Email.id))
+        .scalar()
+        or 0
+    )
+    return {"email_count": email_count, "high_stress_count": high_stress_count}
+
+
+class ModelRouter:
+    """Routes email analysis to no model, the standard model or the premium model"""
+
+    def __init__(
+        self,
+        enabled: bool = settings.MODEL_ROUTER_ENABLED,
+        standard_model: str = settings.MODEL_ROUTER_STANDARD_MODEL,
+        premium_model: str = settings.MODEL_ROUTER_PREMIUM_MODEL,
+        skip_automated: bool = settings.MODEL_ROUTER_SKIP_AUTOMATED,
+        long_email_chars: int = settings.MODEL_ROUTER_LONG_EMAIL_CHARS,
+        urgent_word_threshold: int = settings.MODEL_ROUTER_URGENT_WORD_THRESHOLD,
+        sender_stress_ratio: float = settings.MODEL_ROUTER_SENDER_STRESS_RATIO,
+        sender_min_history: int = settings.MODEL_ROUTER_SENDER_MIN_HISTORY,
+    ):
+        self.enabled = enabled
+        self.standard_model = standard_model
+        self.premium_model = premium_model
+        self.skip_automated = skip_automated
+        self.long_email_chars = long_email_chars
+        self.urgent_word_threshold = urgent_word_threshold
+        self.sender_stress_ratio = sender_stress_ratio
+        self.sender_min_history = sender_min_history
+
+    def collect_signals(
+        self,
+        content: str,
+        sender: Any = None,
+        sender_history: Optional[Dict[str, int]] = None,
+        anxiety_triggers: Optional[List[str]] = None,
+        stress_sensitivity: str = "MEDIUM",
+    ) -> Dict[str, Any]:
+        """Gather the local signals routing is based on"""
+        # Imported here because stress_analysis imports openai_service, which uses the router
+        from backend.services.stress_analysis import StressAnalyzer
+
+        analyzer = StressAnalyzer(
+            UserPreferences(
+                stress_sensitivity=stress_sensitivity,
+                anxiety_triggers=anxiety_triggers if anxiety_triggers is not None else ["deadline", "urgent"],
+            )
+        )
+        triggers = analyzer._check_content_triggers(content)
+        base_stress = analyzer._calculate_base_stress_level(triggers)
+
+        address = sender_address(sender) or ""
+        lowered = content.lower()
+        automated_markers = [m for m in AUTOMATED_CONTENT_MARKERS if m in lowered]
+
+        history = sender_history or {}
+        email_count = history.get("email_count", 0)
+        high_stress_count = history.get("high_stress_count", 0)
+
+        return {
+            "length": len(content),
+            "urgent_words": triggers["urgent_words"],
+            "anxiety_triggers": triggers["anxiety_triggers"],
+            "has_deadlines": triggers["has_deadlines"],
+            "stress_level": analyzer._adjust_for_user_sensitivity(base_stress).value,
+            "automated_sender": bool(AUTOMATED_SENDER_PATTERN.search(address)),
+            "automated_markers": automated_markers,
+            "sender_email_count": email_count,
+            "sender_high_stress_ratio": (
+                round(high_stress_count / email_count, 3) if email_count else 0.0
+            ),
+        }
+
+    def route(
+        self,
+        call_site: str,
+        content: str,
+        sender: Any = None,
+        sender_history: Optional[Dict[str, int]] = None,
+        anxiety_triggers: Optional[List[str]] = None,
+        stress_sensitivity: str = "MEDIUM",
+        email_id: Optional[int] = None,
+    ) -> RoutingDecision:
+        """Decide which model, if any, should handle this content"""
+        premium = self.premium_model
+        if not self.enabled:
+            decision = RoutingDecision(call_site, TIER_PREMIUM, premium, ["router_disabled"])
+            self._record(decision, content, email_id)
+            return decision
+
+        signals = self.collect_signals(
+            content, sender, sender_history, anxiety_triggers, stress_sensitivity
+        )
+        stressful = bool(signals["urgent_words"] or signals["anxiety_triggers"] or signals["has_deadlines"])
+        automated = signals["automated_sender"] or bool(signals["automated_markers"])
+
+        reasons = []
+        if len(signals["urgent_words"]) >= self.urgent_word_threshold:
+            reasons.append("urgent_words")
+        if signals["stress_level"] == StressLevel.HIGH.value:
+            reasons.append("high_local_stress")
+        if signals["length"] > self.long_email_chars:
+            reasons.append("long_email")
+        if (
+            signals["sender_email_count"] >= self.sender_min_history
+            and signals["sender_high_stress_ratio"] >= self.sender_stress_ratio
+        ):
+            reasons.append("stressful_sender")
+
+        if reasons:
+            decision = RoutingDecision(call_site, TIER_PREMIUM, premium, reasons, signals)
+        elif automated and not stressful and self.skip_automated:
+            decision = RoutingDecision(call_site, TIER_SKIP, None, ["automated_mail"], signals)
+        else:
+            decision = RoutingDecision(call_site, TIER_STANDARD, self.standard_model, ["default"], signals)
+
+        self._record(decision, content, email_id)
+        return decision
+
+    def _record(self, decision: RoutingDecision, content: str, email_id: Optional[int]) -> None:
+        """Count the decision and write it to the routing audit log"""
+        MODEL_ROUTING_DECISIONS.labels(call_site=decision.call_site, tier=decision.tier).inc()
+        record = asdict(decision)
+        record["email_id"] = email_id
+        # Hash rather than content so the audit log holds no email text
+        record["content_sha256"] = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        log_routing_decision(record)
+
+
+def heuristic_summary(content: str, max_chars: int = 200) -> str:
+    """First non-empty line of the content, trimmed, for analyses that skip the LLM"""
+    for line in content.splitlines():
+        line = line.strip()
+        if line:
+            return line if len(line) <= max_chars else line[: max_chars - 3].rstrip() + "..."
+    return ""
+
+
+model_router = ModelRouter()
@@ -0,0 +1,127 @@
+"""
+Neo4j Driver
+One pooled AsyncGraphDatabase driver shared by every knowledge graph service,
+with a server-side timeout on each query and pool utilization metrics
+"""
+
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import time
+
+from neo4j import AsyncDriver, AsyncGraphDatabase, AsyncSession, Query, Record, unit_of_work
+
+from backend.config import settings
+from backend.utils.logger import logger
+from backend.utils.metrics import NEO4J_POOL_MAX_SIZE, NEO4J_QUERY_DURATION, NEO4J_SESSIONS_IN_USE
+
+_driver: Optional[AsyncDriver] = None
+
+
+def get_driver() -> AsyncDriver:
+    """
+    The application-wide driver, created on first use.
+
+    The driver owns the connection pool: sessions borrow a connection for each
+    transaction and return it, so every service and request shares at most
+    NEO4J_MAX_POOL_SIZE connections. Waiting longer than
+    NEO4J_CONNECTION_ACQUISITION_TIMEOUT for one fails the query instead of
+    queueing it indefinitely.
+    """
+    global _driver
+    if _driver is None:
+        logger.info(f"Creating Neo4j driver for {settings.NEO4J_URI} (pool size {settings.NEO4J_MAX_POOL_SIZE})")
+        _driver = AsyncGraphDatabase.driver(
+            settings.NEO4J_URI,
+            auth=(settings.NEO4J_USER, settings.NEO4J_PASSWORD),
+            max_connection_pool_size=settings.NEO4J_MAX_POOL_SIZE,
+            connection_acquisition_timeout=settings.NEO4J_CONNECTION_ACQUISITION_TIMEOUT,
+            connection_timeout=settings.NEO4J_CONNECTION_TIMEOUT,
+        )
+        NEO4J_POOL_MAX_SIZE.set(settings.NEO4J_MAX_POOL_SIZE)
+    return _driver
+
+
+async def close_driver() -> None:
+    """Close the shared driver and its pooled connections"""
+    global _driver
+    if _driver is not None:
+        driver, _driver = _driver, None
+        await driver.close()
+        logger.info("Closed Neo4j driver")
+
+
+def cypher(text: str, timeout: Optional[float] = None) -> Query:
+    """A query the server aborts after timeout seconds (NEO4J_QUERY_TIMEOUT by default)"""
+    return Query(text, timeout=timeout if timeout is not None else settings.NEO4J_QUERY_TIMEOUT)
+
+
+@asynccontextmanager
+async def graph_session() -> AsyncIterator[AsyncSession]:
+    """A session on the shared driver, counted in neo4j_sessions_in_use while open"""
+    session = get_driver().session(database=settings.NEO4J_DATABASE)
+    NEO4J_SESSIONS_IN_USE.inc()
+    try:
+        yield session
+    finally:
+        NEO4J_SESSIONS_IN_USE.dec()
+        await session.close()
+
+
+async def run_query(
+    operation: str,
+    text: str,
+    session: Optional[AsyncSession] = None,
+    timeout: Optional[float] = None,
+    **parameters: Any
+) -> List[Record]:
+    """
+    Run one query and fetch all of its records.
+
+    Without a session the query gets its own pooled session. The records are
+    fully read before returning, so the connection goes back to the pool at
+    once. Durations are recorded in neo4j_query_seconds by operation.
+    """
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        if session is None:
+            async with graph_session() as own_session:
+                records = await _fetch(own_session, text, timeout, parameters)
+        else:
+            records = await _fetch(session, text, timeout, parameters)
+        outcome = "ok"
+        return records
+    finally:
+        NEO4J_QUERY_DURATION.labels(operation=operation, outcome=outcome).observe(time.perf_counter() - started)
+
+
+async def _fetch(session: AsyncSession, text: str, timeout: Optional[float], parameters: dict) -> List[Record]:
+    result = await session.run(cypher(text, timeout), parameters)
+    return [record async for record in result]
+
+
+async def run_transaction(
+    operation: str,
+    statements: List[Tuple[str, Dict[str, Any]]],
+    timeout: Optional[float] = None
+) -> None:
+    """
+    Run several write statements in one managed transaction.
+
+    Either every statement is committed or none is; the driver retries the
+    whole transaction on transient errors such as deadlocks or leader changes.
+    """
+    @unit_of_work(timeout=timeout if timeout is not None else settings.NEO4J_QUERY_TIMEOUT)
+    async def work(tx) -> None:
+        for text, parameters in statements:
+            result = await tx.run(text, parameters)
+            await result.consume()
+
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        async with graph_session() as session:
+            await session.execute_write(work)
+        outcome = "ok"
+    finally:
+        NEO4J_QUERY_DURATION.labels(operation=operation, outcome=outcome).observe(time.perf_counter() - started)
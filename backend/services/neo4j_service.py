@@ -1,11 +1,26 @@
 from typing import List, Dict, Any, Optional
+from collections import defaultdict
 from datetime import datetime
+import json
 import uuid
-from neo4j import GraphDatabase, Driver
+from neo4j import AsyncDriver
 from backend.models.knowledge_graph import Node, Edge, NodeType, EdgeType
+from backend.services.neo4j_driver import get_driver, run_query, run_transaction
+from backend.utils.cache import LRUCache
 from backend.utils.logger import logger
 from backend.config import settings
 
+# Label shared by every node, so lookups by id use one uniqueness index whatever the type
+NODE_LABEL = "GraphNode"
+
+SCHEMA_STATEMENTS = [
+    f"CREATE CONSTRAINT graph_node_id IF NOT EXISTS FOR (n:{NODE_LABEL}) REQUIRE n.id IS UNIQUE",
+    f"CREATE INDEX graph_node_type IF NOT EXISTS FOR (n:{NODE_LABEL}) ON (n.type)",
+    f"CREATE INDEX graph_node_user_type IF NOT EXISTS FOR (n:{NODE_LABEL}) ON (n.user_id, n.type)",
+    "CREATE CONSTRAINT relationship_user_email IF NOT EXISTS "
+    "FOR (n:RELATIONSHIP) REQUIRE (n.user_id, n.email) IS UNIQUE",
+]
+
 
 class Neo4jService:
     """
@@ -15,51 +30,94 @@ class Neo4jService:
     
     def __init__(self):
         """Initialize Neo4j connection"""
-        self.driver: Optional[Driver] = None
+        self.driver: Optional[AsyncDriver] = None
+        # (user_id, email) -> relationship node id; ids never change once created
+        self._sender_ids = LRUCache(max_size=settings.NEO4J_SENDER_CACHE_SIZE)
         self._connect()
     
     def _connect(self):
-        """Establish connection to Neo4j database"""
+        """Attach to the shared, pooled Neo4j driver"""
         try:
-            self.driver = GraphDatabase.driver(
-                settings.NEO4J_URI,
-                auth=(settings.NEO4J_USER, settings.NEO4J_PASSWORD)
-            )
-            logger.info("Successfully connected to Neo4j database")
+            self.driver = get_driver()
         except Exception as e:
             logger.error(f"Failed to connect to Neo4j: {str(e)}")
             raise
     
-    async def create_node(self, node: Node) -> Node:
-        """Create a new node in the knowledge graph"""
+    async def ensure_schema(self) -> None:
+        """
+        Create the graph's constraints and indexes if they do not exist yet.
+        
+        Only schema statements run here, so it is cheap and safe on every
+        startup; nodes written before the shared label existed are labelled
+        once by label_existing_nodes (backend/scripts/migrate_graph_labels.py).
+        """
         try:
-            with self.driver.session() as session:
-                # Create node with properties
-                result = session.run(
-                    """
-                    CREATE (n:%s {
-                        id: $id,
-                        type: $type,
-                        properties: $properties,
-                        created_at: $created_at,
-                        updated_at: $updated_at
-                    })
-                    RETURN n
+            for statement in SCHEMA_STATEMENTS:
+                await run_query("ensure_schema", statement)
+            logger.info("Neo4j schema is up to date")
+        except Exception as e:
+            logger.error(f"Failed to create Neo4j schema: {str(e)}")
+            raise
+    
+    async def label_existing_nodes(self, batch_size: int = 10000) -> Dict[str, int]:
+        """
+        Add the shared label to nodes written before it existed.
+        
+        Only nodes carrying one of the NodeType labels are touched, never other
+        services' nodes, and each batch is its own query so none runs into the
+        query timeout. Returns the number of nodes labelled per node type.
+        """
+        labelled: Dict[str, int] = {}
+        for node_type in NodeType:
+            label = node_type.value.upper()
+            labelled[label] = 0
+            while True:
+                records = await run_query(
+                    "label_existing_nodes",
+                    f"""
+                    MATCH (n:{label})
+                    WHERE NOT n:{NODE_LABEL}
+                    WITH n LIMIT $batch_size
+                    SET n:{NODE_LABEL}
+                    RETURN count(n) AS labelled
                     """,
-                    labels=node.type.value,
-                    id=node.id,
-                    type=node.type.value,
-                    properties=node.properties,
-                    created_at=datetime.utcnow().isoformat(),
-                    updated_at=datetime.utcnow().isoformat()
+                    batch_size=batch_size
                 )
-                
-                record = result.single()
-                if not record:
-                    raise ValueError("Failed to create node")
-                
-                return self._create_node_from_record(record["n"])
-                
+                count = records[0]["labelled"] if records else 0
+                labelled[label] += count
+                if count < batch_size:
+                    break
+        logger.info(f"Labelled {sum(labelled.values())} existing graph nodes", extra={"labelled": labelled})
+        return labelled
+    
+    async def create_node(self, node: Node) -> Node:
+        """Create a new node in the knowledge graph"""
+        try:
+            # Labels cannot be parameters; the node type is a closed enum
+            records = await run_query(
+                "create_node",
+                f"""
+                CREATE (n:{NODE_LABEL}:{node.type.value.upper()} {{
+                    id: $id,
+                    type: $type,
+                    properties: $properties,
+                    created_at: $created_at,
+                    updated_at: $updated_at
+                }})
+                RETURN n
+                """,
+                id=node.id,
+                type=node.type.value,
+                properties=self._encode_properties(node.properties),
+                created_at=datetime.utcnow().isoformat(),
+                updated_at=datetime.utcnow().isoformat()
+            )
+            
+            if not records:
+                raise ValueError("Failed to create node")
+            
+            return self._create_node_from_record(records[0]["n"])
+            
         except Exception as e:
             logger.error(f"Failed to create node: {str(e)}")
             raise
@@ -67,58 +125,125 @@ class Neo4jService:
     async def create_edge(self, edge: Edge) -> Edge:
         """Create a new edge between nodes"""
         try:
-            with self.driver.session() as session:
-                # Create edge with properties
-                result = session.run(
-                    """
-                    MATCH (source {id: $source_id})
-                    MATCH (target {id: $target_id})
-                    CREATE (source)-[r:%s {
-                        id: $id,
-                        type: $type,
-                        properties: $properties,
-                        created_at: $created_at
-                    }]->(target)
-                    RETURN r
-                    """,
-                    relationship_type=edge.type.value,
-                    source_id=edge.source_id,
-                    target_id=edge.target_id,
-                    id=edge.id,
-                    type=edge.type.value,
-                    properties=edge.properties,
-                    created_at=datetime.utcnow().isoformat()
-                )
-                
-                record = result.single()
-                if not record:
-                    raise ValueError("Failed to create edge")
-                
-                return self._create_edge_from_record(record["r"])
-                
+            # Relationship types cannot be parameters; the edge type is a closed enum
+            records = await run_query(
+                "create_edge",
+                f"""
+                MATCH (source:{NODE_LABEL} {{id: $source_id}})
+                MATCH (target:{NODE_LABEL} {{id: $target_id}})
+                CREATE (source)-[r:{edge.type.value.upper()} {{
+                    id: $id,
+                    type: $type,
+                    source_id: $source_id,
+                    target_id: $target_id,
+                    properties: $properties,
+                    created_at: $created_at
+                }}]->(target)
+                RETURN r
+                """,
+                source_id=edge.source_id,
+                target_id=edge.target_id,
+                id=edge.id,
+                type=edge.type.value,
+                properties=self._encode_properties(edge.properties),
+                created_at=datetime.utcnow().isoformat()
+            )
+            
+            if not records:
+                raise ValueError("Failed to create edge")
+            
+            return self._create_edge_from_record(records[0]["r"])
+            
         except Exception as e:
             logger.error(f"Failed to create edge: {str(e)}")
             raise
     
+    async def write_batch(self, nodes: List[Node], edges: List[Edge], user_id: Optional[str] = None) -> None:
+        """
+        Upsert nodes and edges in a single transaction.
+        
+        Labels and relationship types cannot be parameters, so rows are grouped
+        by type and each group is written by one UNWIND statement. Nodes are
+        written before edges, so edges may connect nodes of the same batch.
+        """
+        now = datetime.utcnow().isoformat()
+        statements = []
+        
+        nodes_by_type: Dict[NodeType, List[Dict[str, Any]]] = defaultdict(list)
+        for node in nodes:
+            nodes_by_type[node.type].append({
+                "id": node.id,
+                "type": node.type.value,
+                "properties": self._encode_properties(node.properties),
+                "created_at": node.created_at.isoformat(),
+                "updated_at": now
+            })
+        for node_type, rows in nodes_by_type.items():
+            statements.append((
+                f"""
+                UNWIND $rows AS row
+                MERGE (n:{NODE_LABEL} {{id: row.id}})
+                ON CREATE SET n.created_at = row.created_at
+                SET n:{node_type.value.upper()},
+                    n.type = row.type,
+                    n.properties = row.properties,
+                    n.updated_at = row.updated_at,
+                    n.user_id = $user_id
+                """,
+                {"rows": rows, "user_id": user_id}
+            ))
+        
+        edges_by_type: Dict[EdgeType, List[Dict[str, Any]]] = defaultdict(list)
+        for edge in edges:
+            edges_by_type[edge.type].append({
+                "id": edge.id,
+                "type": edge.type.value,
+                "source_id": edge.source_id,
+                "target_id": edge.target_id,
+                "properties": self._encode_properties(edge.properties),
+                "created_at": edge.created_at.isoformat()
+            })
+        for edge_type, rows in edges_by_type.items():
+            statements.append((
+                f"""
+                UNWIND $rows AS row
+                MATCH (source:{NODE_LABEL} {{id: row.source_id}})
+                MATCH (target:{NODE_LABEL} {{id: row.target_id}})
+                MERGE (source)-[r:{edge_type.value.upper()} {{id: row.id}}]->(target)
+                ON CREATE SET r.created_at = row.created_at
+                SET r.type = row.type,
+                    r.source_id = row.source_id,
+                    r.target_id = row.target_id,
+                    r.properties = row.properties
+                """,
+                {"rows": rows}
+            ))
+        
+        if not statements:
+            return
+        try:
+            await run_transaction("write_batch", statements)
+        except Exception as e:
+            logger.error(f"Failed to write graph batch: {str(e)}")
+            raise
+    
     async def get_node(self, node_id: str) -> Optional[Node]:
         """Get a node by ID"""
         try:
-            with self.driver.session() as session:
-                result = session.run(
-                    """
-                    MATCH (n)
-                    WHERE n.id = $id
-                    RETURN n
-                    """,
-                    id=node_id
-                )
-                
-                record = result.single()
-                if not record:
-                    return None
-                
-                return self._create_node_from_record(record["n"])
-                
+            records = await run_query(
+                "get_node",
+                f"""
+                MATCH (n:{NODE_LABEL} {{id: $id}})
+                RETURN n
+                """,
+                id=node_id
+            )
+            
+            if not records:
+                return None
+            
+            return self._create_node_from_record(records[0]["n"])
+            
         except Exception as e:
             logger.error(f"Failed to get node: {str(e)}")
             raise
@@ -126,22 +251,22 @@ class Neo4jService:
     async def get_related_nodes(self, node_id: str, relationship_types: Optional[List[str]] = None) -> List[Node]:
         """Get nodes related to a given node"""
         try:
-            with self.driver.session() as session:
-                # Build relationship type filter
-                rel_filter = ""
-                if relationship_types:
-                    rel_filter = f":{':|'.join(relationship_types)}"
-                
-                result = session.run(
-                    f"""
-                    MATCH (source {{id: $id}})-[r{rel_filter}]->(target)
-                    RETURN target
-                    """,
-                    id=node_id
-                )
-                
-                return [self._create_node_from_record(record["target"]) for record in result]
-                
+            # Build relationship type filter
+            rel_filter = ""
+            if relationship_types:
+                rel_filter = f":{':|'.join(relationship_types)}"
+            
+            records = await run_query(
+                "get_related_nodes",
+                f"""
+                MATCH (source:{NODE_LABEL} {{id: $id}})-[r{rel_filter}]->(target)
+                RETURN target
+                """,
+                id=node_id
+            )
+            
+            return [self._create_node_from_record(record["target"]) for record in records]
+            
         except Exception as e:
             logger.error(f"Failed to get related nodes: {str(e)}")
             raise
@@ -149,51 +274,121 @@ class Neo4jService:
     async def get_path(self, source_id: str, target_id: str) -> List[Dict[str, Any]]:
         """Find the shortest path between two nodes"""
         try:
-            with self.driver.session() as session:
-                result = session.run(
-                    """
-                    MATCH path = shortestPath(
-                        (source {id: $source_id})-[*]-(target {id: $target_id})
-                    )
-                    RETURN path
-                    """,
-                    source_id=source_id,
-                    target_id=target_id
-                )
-                
-                record = result.single()
-                if not record:
-                    return []
-                
-                path = record["path"]
-                return self._format_path(path)
-                
+            records = await run_query(
+                "get_path",
+                f"""
+                MATCH (source:{NODE_LABEL} {{id: $source_id}})
+                MATCH (target:{NODE_LABEL} {{id: $target_id}})
+                MATCH path = shortestPath((source)-[*]-(target))
+                RETURN path
+                """,
+                source_id=source_id,
+                target_id=target_id
+            )
+            
+            if not records:
+                return []
+            
+            path = records[0]["path"]
+            return self._format_path(path)
+            
         except Exception as e:
             logger.error(f"Failed to get path: {str(e)}")
             raise
     
+    async def get_or_create_relationship(self, user_id: str, email: str) -> str:
+        """
+        The id of the user's relationship node for an email address, created if missing.
+        
+        A single MERGE on the (user_id, email) uniqueness constraint, so concurrent
+        emails from a new sender still create one node. Resolved ids are cached
+        in process, making repeat senders free.
+        """
+        email = email.strip().lower()
+        cache_key = f"{user_id}\0{email}"
+        node_id = self._sender_ids.get(cache_key)
+        if node_id is not None:
+            return node_id
+        
+        try:
+            now = datetime.utcnow().isoformat()
+            records = await run_query(
+                "get_or_create_relationship",
+                f"""
+                MERGE (n:RELATIONSHIP {{user_id: $user_id, email: $email}})
+                ON CREATE SET n:{NODE_LABEL},
+                    n.id = $id,
+                    n.type = $type,
+                    n.properties = $properties,
+                    n.created_at = $now,
+                    n.updated_at = $now
+                RETURN n.id AS id
+                """,
+                user_id=user_id,
+                email=email,
+                id=f"rel-{str(uuid.uuid4())}",
+                type=NodeType.RELATIONSHIP.value,
+                properties=self._encode_properties({
+                    "email": email,
+                    "type": "email_contact",
+                    "created_at": now
+                }),
+                now=now
+            )
+            
+            node_id = records[0]["id"]
+            self._sender_ids.set(cache_key, node_id)
+            return node_id
+            
+        except Exception as e:
+            logger.error(f"Failed to get or create relationship: {str(e)}")
+            raise
+    
+    async def get_latest_node(self, user_id: str, node_type: NodeType) -> Optional[Node]:
+        """The user's most recently updated node of a type, using the (user_id, type) index"""
+        try:
+            records = await run_query(
+                "get_latest_node",
+                f"""
+                MATCH (n:{NODE_LABEL} {{user_id: $user_id, type: $type}})
+                RETURN n
+                ORDER BY n.updated_at DESC
+                LIMIT 1
+                """,
+                user_id=user_id,
+                type=node_type.value
+            )
+            
+            if not records:
+                return None
+            
+            return self._create_node_from_record(records[0]["n"])
+            
+        except Exception as e:
+            logger.error(f"Failed to get latest node: {str(e)}")
+            raise
+    
     async def update_node(self, node: Node) -> Node:
         """Update an existing node"""
         try:
-            with self.driver.session() as session:
-                result = session.run(
-                    """
-                    MATCH (n {id: $id})
-                    SET n.properties = $properties,
-                        n.updated_at = $updated_at
-                    RETURN n
-                    """,
-                    id=node.id,
-                    properties=node.properties,
-                    updated_at=datetime.utcnow().isoformat()
-                )
-                
-                record = result.single()
-                if not record:
-                    raise ValueError("Failed to update node")
-                
-                return self._create_node_from_record(record["n"])
-                
+            records = await run_query(
+                "update_node",
+                f"""
+                MATCH (n:{NODE_LABEL} {{id: $id}})
+                SET n.properties = $properties,
+                    n.updated_at = $updated_at
+                RETURN n
+                """,
+                id=node.id,
+                properties=self._encode_properties(node.properties),
+                updated_at=datetime.utcnow().isoformat()
+            )
+            
+            if not records:
+                raise ValueError("Failed to update node")
+            
+            return self._create_node_from_record(records[0]["n"])
+            
         except Exception as e:
             logger.error(f"Failed to update node: {str(e)}")
             raise
@@ -201,30 +396,40 @@ class Neo4jService:
     async def delete_node(self, node_id: str) -> bool:
         """Delete a node and its relationships"""
         try:
-            with self.driver.session() as session:
-                result = session.run(
-                    """
-                    MATCH (n {id: $id})
-                    DETACH DELETE n
-                    RETURN count(n) as deleted
-                    """,
-                    id=node_id
-                )
-                
-                record = result.single()
-                return record["deleted"] > 0
-                
+            records = await run_query(
+                "delete_node",
+                f"""
+                MATCH (n:{NODE_LABEL} {{id: $id}})
+                DETACH DELETE n
+                RETURN count(n) as deleted
+                """,
+                id=node_id
+            )
+            
+            # The node may have been a cached sender
+            self._sender_ids.clear()
+            return records[0]["deleted"] > 0
+            
         except Exception as e:
             logger.error(f"Failed to delete node: {str(e)}")
             raise
     
+    @staticmethod
+    def _encode_properties(properties: Dict[str, Any]) -> str:
+        """Neo4j properties cannot hold maps, so property dicts are stored as JSON"""
+        return json.dumps(properties or {}, default=str)
+    
+    @staticmethod
+    def _decode_properties(properties: Any) -> Dict[str, Any]:
+        return json.loads(properties) if isinstance(properties, str) else (properties or {})
+    
     def _create_node_from_record(self, record: Any) -> Node:
         """Convert a Neo4j record to a Node object"""
         node_type = NodeType(record["type"])
         return Node(
             id=record["id"],
             type=node_type,
-            properties=record["properties"]
+            properties=self._decode_properties(record["properties"])
         )
     
     def _create_edge_from_record(self, record: Any) -> Edge:
@@ -235,7 +440,7 @@ class Neo4jService:
             type=edge_type,
             source_id=record["source_id"],
             target_id=record["target_id"],
-            properties=record["properties"]
+            properties=self._decode_properties(record["properties"])
         )
     
     def _format_path(self, path: Any) -> List[Dict[str, Any]]:
@@ -258,14 +463,8 @@ class Neo4jService:
         return formatted_path
     
     async def close(self):
-        """Close the Neo4j connection"""
-        try:
-            if self.driver:
-                self.driver.close()
-                logger.info("Closed Neo4j connection")
-        except Exception as e:
-            logger.error(f"Failed to close Neo4j connection: {str(e)}")
-            raise
+        """Nothing to release: the shared driver is closed on application shutdown"""
+        return None
 
 
 # Create singleton instance
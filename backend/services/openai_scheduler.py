@@ -0,0 +1,295 @@
+"""
+OpenAI Scheduler
+Process-wide admission control for OpenAI calls. Tracks requests-per-minute and
+tokens-per-minute budgets per model, learns from the rate-limit headers on every
+response, and releases queued work in priority order (interactive before
+background) so throughput stays near quota instead of bursting into 429s.
+"""
+
+import asyncio
+import heapq
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+import httpx
+import openai
+
+from backend.config import settings
+from backend.services.prompt_preprocessing import count_tokens
+from backend.utils.logger import logger
+from backend.utils.metrics import (
+    OPENAI_QUEUE_DEPTH,
+    OPENAI_QUEUE_WAIT,
+    OPENAI_RATE_LIMITED,
+)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BACKGROUND: "background"}
+
+# Priority of OpenAI calls made from the current task; request handlers are interactive
+request_priority: ContextVar[int] = ContextVar("openai_request_priority", default=PRIORITY_INTERACTIVE)
+
+WINDOW_SECONDS = 60
+DEFAULT_BUDGET_KEY = "default"
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+RETRYABLE_ERRORS = (openai.APIConnectionError, openai.InternalServerError)
+# Completion size assumed for requests that do not set max_tokens
+DEFAULT_COMPLETION_TOKENS = 500
+# Per-message framing tokens added by the chat format
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+async def run_with_priority(coro: Awaitable[Any], priority: int) -> Any:
+    """Await coro with every OpenAI call inside it scheduled at the given priority"""
+    token = request_priority.set(priority)
+    try:
+        return await coro
+    finally:
+        request_priority.reset(token)
+
+
+def estimate_chat_tokens(messages: List[Dict[str, Any]], max_tokens: Optional[int] = None) -> int:
+    """Estimate the tokens a chat completion counts against the TPM budget"""
+    prompt_tokens = sum(
+        count_tokens(str(message.get("content") or "")) + MESSAGE_OVERHEAD_TOKENS
+        for message in messages
+    )
+    return prompt_tokens + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """Parse OpenAI reset durations such as "20ms", "1.5s" or "6m0s" into seconds"""
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def _int_header(headers: httpx.Headers, name: str) -> Optional[int]:
+    try:
+        return int(headers[name])
+    except (KeyError, ValueError):
+        return None
+
+
+class ModelBudget:
+    """Sliding one-minute window of requests and tokens for one model"""
+
+    def __init__(self, rpm: Optional[int], tpm: Optional[int]):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.events: Deque[List[float]] = deque()
+        self.blocked_until = 0.0
+
+    def _trim(self, now: float) -> None:
+        while self.events and now - self.events[0][0] >= WINDOW_SECONDS:
+            self.events.popleft()
+
+    def wait_time(self, tokens: int, now: float) -> float:
+        """Seconds until a request of this size fits the budget (0 if it fits now)"""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._trim(now)
+
+        wait = 0.0
+        if self.rpm and len(self.events) >= self.rpm:
+            wait = self.events[len(self.events) - self.rpm][0] + WINDOW_SECONDS - now
+
+        if self.tpm and self.events:
+            # A request larger than the whole budget runs alone in an empty window
+            needed = min(tokens, self.tpm)
+            used = sum(event[1] for event in self.events)
+            for event in self.events:
+                if used + needed <= self.tpm:
+                    break
+                used -= event[1]
+                wait = max(wait, event[0] + WINDOW_SECONDS - now)
+        return max(0.0, wait)
+
+    def record(self, tokens: int, now: float) -> List[float]:
+        event = [now, tokens]
+        self.events.append(event)
+        return event
+
+    def block(self, seconds: float, now: float) -> None:
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+    def update_from_headers(self, headers: httpx.Headers, status_code: int, now: float) -> None:
+        """Adopt the server's view of our limits and remaining quota"""
+        limit_requests = _int_header(headers, "x-ratelimit-limit-requests")
+        limit_tokens = _int_header(headers, "x-ratelimit-limit-tokens")
+        if limit_requests:
+            self.rpm = min(self.rpm, limit_requests) if self.rpm else limit_requests
+        if limit_tokens:
+            self.tpm = min(self.tpm, limit_tokens) if self.tpm else limit_tokens
+
+        # A reported limit of 0 means the dimension is not limited
+        if limit_requests != 0 and _int_header(headers, "x-ratelimit-remaining-requests") == 0:
+            self.block(parse_reset_duration(headers.get("x-ratelimit-reset-requests")) or 1.0, now)
+        if limit_tokens != 0 and _int_header(headers, "x-ratelimit-remaining-tokens") == 0:
+            self.block(parse_reset_duration(headers.get("x-ratelimit-reset-tokens")) or 1.0, now)
+
+        if status_code == 429:
+            retry_after_ms = _int_header(headers, "retry-after-ms")
+            if retry_after_ms is not None:
+                retry_after = retry_after_ms / 1000
+            else:
+                retry_after = parse_reset_duration(headers.get("retry-after"))
+            self.block(retry_after or 1.0, now)
+
+
+class OpenAIScheduler:
+    """Queues OpenAI calls per model and admits them within RPM/TPM budgets"""
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, Dict[str, int]]] = None,
+        enabled: bool = settings.OPENAI_SCHEDULER_ENABLED,
+        max_retries: int = settings.OPENAI_SCHEDULER_MAX_RETRIES,
+        poll_interval: float = 0.05,
+    ):
+        self.limits = limits if limits is not None else settings.OPENAI_RATE_LIMITS
+        self.enabled = enabled
+        self.max_retries = max_retries
+        self.poll_interval = poll_interval
+        # Plain locks and polling rather than asyncio primitives: Celery tasks run
+        # their own event loops in the same process and share this scheduler
+        self._lock = threading.Lock()
+        self._budgets: Dict[str, ModelBudget] = {}
+        self._queues: Dict[str, List[Tuple[int, int]]] = {}
+        self._sequence = itertools.count()
+
+    def budget(self, model: str) -> ModelBudget:
+        with self._lock:
+            return self._get_budget(model)
+
+    def _get_budget(self, model: str) -> ModelBudget:
+        if model not in self._budgets:
+            limit = self.limits.get(model) or self.limits.get(DEFAULT_BUDGET_KEY) or {}
+            self._budgets[model] = ModelBudget(limit.get("rpm"), limit.get("tpm"))
+        return self._budgets[model]
+
+    def queue_depth(self, model: str) -> int:
+        with self._lock:
+            return len(self._queues.get(model, []))
+
+    async def acquire(self, model: str, tokens: int, priority: Optional[int] = None) -> List[float]:
+        """Wait for this request's turn and budget, then record it against the window"""
+        priority = request_priority.get() if priority is None else priority
+        ticket = (priority, next(self._sequence))
+        depth = OPENAI_QUEUE_DEPTH.labels(model=model, priority=PRIORITY_NAMES.get(priority, str(priority)))
+        start = time.monotonic()
+
+        with self._lock:
+            heapq.heappush(self._queues.setdefault(model, []), ticket)
+        depth.inc()
+        try:
+            while True:
+                with self._lock:
+                    queue = self._queues[model]
+                    budget = self._get_budget(model)
+                    now = time.monotonic()
+                    wait = budget.wait_time(tokens, now) if queue[0] == ticket else self.poll_interval
+                    if wait <= 0:
+                        heapq.heappop(queue)
+                        event = budget.record(tokens, now)
+                        break
+                await asyncio.sleep(min(max(wait, 0.001), self.poll_interval * 10))
+        except BaseException:
+            with self._lock:
+                queue = self._queues[model]
+                if ticket in queue:
+                    queue.remove(ticket)
+                    heapq.heapify(queue)
+            raise
+        finally:
+            depth.dec()
+
+        OPENAI_QUEUE_WAIT.labels(model=model).observe(time.monotonic() - start)
+        return event
+
+    async def run(
+        self,
+        model: str,
+        tokens: int,
+        request: Callable[[], Awaitable[Any]],
+        priority: Optional[int] = None,
+    ) -> Any:
+        """
+        Run one OpenAI request within the model's budget.
+
+        429s block the whole model until the server's reset time and the request
+        is re-queued; connection errors and 5xx responses back off and retry.
+        """
+        if not self.enabled:
+            return await request()
+
+        for attempt in range(self.max_retries + 1):
+            event = await self.acquire(model, tokens, priority)
+            try:
+                result = await request()
+            except openai.RateLimitError:
+                OPENAI_RATE_LIMITED.labels(model=model).inc()
+                if attempt == self.max_retries:
+                    raise
+                # The response hook has applied retry-after; this covers responses without it
+                self.budget(model).block(self._backoff(attempt), time.monotonic())
+                logger.warning(f"OpenAI rate limit for {model}, re-queued (attempt {attempt + 1})")
+                continue
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                logger.warning(f"OpenAI request to {model} failed, retrying: {str(e)}")
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+
+            self._reconcile(event, result)
+            return result
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        return min(30.0, 2 ** attempt) * (0.5 + random.random() / 2)
+
+    def _reconcile(self, event: List[float], result: Any) -> None:
+        """Replace the estimated token count with the reported usage"""
+        usage = getattr(result, "usage", None)
+        total = getattr(usage, "total_tokens", None)
+        if isinstance(total, int):
+            with self._lock:
+                event[1] = total
+
+    async def _on_response(self, response: httpx.Response) -> None:
+        """httpx response hook: learn limits from every OpenAI response"""
+        try:
+            model = json.loads(response.request.content or b"{}").get("model")
+        except (ValueError, AttributeError, httpx.RequestNotRead):
+            model = None
+        if not model:
+            return
+        with self._lock:
+            self._get_budget(model).update_from_headers(
+                response.headers, response.status_code, time.monotonic()
+            )
+
+    def http_client(self) -> httpx.AsyncClient:
+        """HTTP client for AsyncOpenAI that feeds response headers to the scheduler"""
+        return openai.DefaultAsyncHttpxClient(event_hooks={"response": [self._on_response]})
+
+
+openai_scheduler = OpenAIScheduler()
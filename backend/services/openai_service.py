@@ -4,7 +4,19 @@ from openai import AsyncOpenAI
 from backend.config import settings
 from backend.utils.logger import logger, log_error
 from backend.models.email import StressLevel, Priority
-from tenacity import retry, stop_after_attempt, wait_exponential
+from backend.services.analysis_cache import analysis_cache
+from backend.services.embedding_batcher import EmbeddingBatcher
+from backend.services.model_router import model_router, heuristic_summary
+from backend.services.single_flight import create_chat_completion
+from backend.services.openai_scheduler import openai_scheduler
+from backend.services.prompt_preprocessing import preprocess_text
+from backend.services.structured_output import (
+    ContentAnalysis,
+    EmailSummary,
+    StructuredOutputError,
+    function_tool_params,
+    parse_function_call,
+)
 import json
 import time
 
@@ -14,7 +26,13 @@ def get_client() -> AsyncOpenAI:
     """Get or create OpenAI client instance."""
     global _client
     if _client is None:
-        _client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+        # Retries are handled by the scheduler, which re-queues within the rate budget
+        _client = AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL,
+            max_retries=0,
+            http_client=openai_scheduler.http_client(),
+        )
     return _client
 
 # Define the OpenAI models to use
@@ -22,11 +40,20 @@ GPT_4_MODEL = "gpt-4-turbo"  # Latest GPT-4 model
 GPT_3_5_MODEL = "gpt-3.5-turbo"  # Faster and cheaper model for simpler tasks
 EMBEDDING_MODEL = "text-embedding-3-small"  # For vector embeddings
 
-@retry(stop_after_attempt(3), wait_exponential(multiplier=1, min=1, max=10))
+# Bump when the analyze_content prompt changes so cached analyses are not reused
+ANALYZE_CONTENT_PROMPT_VERSION = "2"
+# Completion budget for analyze_content, grown for each optional section requested
+ANALYSIS_MAX_TOKENS = 700
+SIMPLIFIED_VERSION_MAX_TOKENS = 500
+REPLY_OPTION_MAX_TOKENS = 250
+
 async def analyze_content(content: str, context: Optional[Dict] = None) -> Dict:
     """
     Analyze content using OpenAI API with accessibility considerations for
     neurodiverse users with various cognitive needs.
+    
+    Every field, including the simplified version and reply options when the
+    context asks for them, comes back from a single strict function call.
     """
     try:
         # Track start time for performance monitoring
@@ -34,6 +61,9 @@ async def analyze_content(content: str, context: Optional[Dict] = None) -> Dict:
         
         client = get_client()
         
+        # Strip quoted history, signatures and boilerplate, and cap the prompt size
+        content = preprocess_text(content, "analyze_content").text
+        
         content_length = len(content)
         has_context = context is not None
         
@@ -45,6 +75,7 @@ async def analyze_content(content: str, context: Optional[Dict] = None) -> Dict:
         simplify_language = context.get("simplify_language", False) if context else False
         stress_sensitivity = context.get("stress_sensitive", "MEDIUM") if context else "MEDIUM"
         neurodiverse_focus = context.get("neurodiverse_focus", True) if context else True
+        reply_tones = list(context.get("tone_options") or []) if context else []
         
         system_prompt = """
         Analyze the following content and provide a detailed analysis including:
@@ -53,17 +84,10 @@ async def analyze_content(content: str, context: Optional[Dict] = None) -> Dict:
         3. Summary: Provide a clear and concise summary of the content (3-5 sentences)
         4. Action items: Extract any clear action items or tasks
         5. Sentiment score: Rate sentiment from -5 (very negative) to 5 (very positive)
+        6. Tone analysis: Briefly describe the tone of the content
+        7. Suggestions: Suggest how the reader could respond or proceed
         
-        Return your analysis as a structured JSON with the following fields:
-        {
-            "stress_level": "LOW|MEDIUM|HIGH",
-            "priority": "LOW|MEDIUM|HIGH",
-            "summary": "Concise summary here",
-            "action_items": ["Item 1", "Item 2"],
-            "sentiment_score": -5 to 5,
-            "tone_analysis": "Brief analysis of tone",
-            "suggestions": ["Suggestion 1", "Suggestion 2"]
-        }
+        Record your analysis by calling the record_analysis function.
         """
         
         # Add special instructions for neurodiverse users
@@ -82,15 +106,21 @@ async def analyze_content(content: str, context: Optional[Dict] = None) -> Dict:
             5. Identify social cues or implicit expectations that might be unclear
             """
             
-        # Add simplification instructions for cognitive load reduction
+        # Cognitive load reduction: the simplified rewrite comes back in the same call
         if simplify_language:
             system_prompt += """
-            Additionally, provide a simplified version of any response that:
-            1. Uses shorter sentences and simpler vocabulary
-            2. Eliminates unnecessary jargon and idioms
-            3. Uses bullet points for key information
-            4. Clearly marks deadlines, requests, and expectations
-            5. Provides a readability score for the original content
+            Also provide simplified_version: a rewrite of the content for people with ADHD,
+            autism, dyslexia or cognitive processing difficulties that:
+            1. Uses shorter sentences (15 words or less when possible) and simpler vocabulary
+            2. Eliminates unnecessary jargon, idioms and metaphors
+            3. Uses bullet points for key information and steps
+            4. Clearly marks deadlines, requests, and expectations with **bold text**
+            """
+        
+        if reply_tones:
+            system_prompt += f"""
+            Also provide reply_options: one complete reply to the content for each of these
+            tones, in this order: {", ".join(reply_tones)}.
             """
             
         # Adjust stress detection based on user sensitivity
@@ -114,12 +144,48 @@ async def analyze_content(content: str, context: Optional[Dict] = None) -> Dict:
         model = GPT_3_5_MODEL
         if context and context.get("use_advanced_model", False):
             model = GPT_4_MODEL
+        
+        # Only the context that shapes the prompt takes part in the cache key
+        cache_key = analysis_cache.make_key(
+            content,
+            model,
+            ANALYZE_CONTENT_PROMPT_VERSION,
+            {
+                "simplify_language": simplify_language,
+                "stress_sensitivity": stress_sensitivity,
+                "neurodiverse_focus": neurodiverse_focus,
+                "reply_tones": reply_tones,
+            },
+        )
+        cached = analysis_cache.get("analyze_content", cache_key)
+        if cached is not None:
+            logger.info("Content analysis served from cache")
+            return cached
+        
+        # Optional sections are left out of the schema unless requested
+        excluded = []
+        max_tokens = ANALYSIS_MAX_TOKENS
+        if simplify_language:
+            max_tokens += SIMPLIFIED_VERSION_MAX_TOKENS
+        else:
+            excluded.append("simplified_version")
+        if reply_tones:
+            max_tokens += REPLY_OPTION_MAX_TOKENS * len(reply_tones)
+        else:
+            excluded.append("reply_options")
             
-        response = await client.chat.completions.create(
+        response = await create_chat_completion(
+            client,
             model=model, 
             messages=messages,
-            max_tokens=700,
+            max_tokens=max_tokens,
             temperature=0.5,
+            **function_tool_params(
+                "record_analysis",
+                "Record the structured analysis of the content",
+                ContentAnalysis,
+                exclude=excluded,
+            ),
         )
         
         # Calculate elapsed time for performance monitoring
@@ -129,26 +195,11 @@ async def analyze_content(content: str, context: Optional[Dict] = None) -> Dict:
         # Log token usage
         log_token_usage(response, "analyze_content")
         
-        analysis = response.choices[0].message.content
-
         try:
-            # Try to parse the analysis as valid JSON
-            analysis_dict = json.loads(analysis)
-            
-            # Ensure all required fields are present
-            required_fields = ["stress_level", "priority", "summary", "action_items", "sentiment_score"]
-            for field in required_fields:
-                if field not in analysis_dict:
-                    analysis_dict[field] = "Not provided" if field in ["stress_level", "priority", "summary"] else []
-            
-            # Add simplified version if requested
-            if simplify_language and "simplified_version" not in analysis_dict:
-                analysis_dict["simplified_version"] = await generate_simplified_version(content)
-                
-            return analysis_dict
-        except Exception as e:
-            log_error(f"Error parsing analysis JSON: {str(e)}")
-            # Return a structured response even if JSON parsing fails
+            analysis = parse_function_call(response, "record_analysis", ContentAnalysis)
+        except StructuredOutputError as e:
+            log_error(f"Error parsing analysis: {str(e)}")
+            # Return a structured response rather than asking the model again
             return {
                 "stress_level": "MEDIUM",
                 "priority": "MEDIUM",
@@ -157,6 +208,10 @@ async def analyze_content(content: str, context: Optional[Dict] = None) -> Dict:
                 "sentiment_score": 0,
                 "error": "Failed to parse analysis response"
             }
+        
+        analysis_dict = analysis.model_dump(mode="json", exclude=set(excluded))
+        analysis_cache.set("analyze_content", cache_key, analysis_dict)
+        return analysis_dict
             
     except Exception as e:
         log_error(f"Error analyzing content: {str(e)}")
@@ -183,6 +238,7 @@ async def generate_simplified_version(content: str) -> str:
     """Generate a simplified version of content for cognitive accessibility."""
     try:
         client = get_client()
+        content = preprocess_text(content, "generate_simplified_version").text
         
         system_prompt = """
         You are an accessibility specialist focused on cognitive accessibility.
@@ -209,7 +265,8 @@ async def generate_simplified_version(content: str) -> str:
             {"role": "user", "content": content}
         ]
         
-        response = await client.chat.completions.create(
+        response = await create_chat_completion(
+            client,
             model="gpt-3.5-turbo", 
             messages=messages,
             max_tokens=500,
@@ -224,7 +281,6 @@ async def generate_simplified_version(content: str) -> str:
         log_error(f"Error generating simplified version: {str(e)}")
         return "Could not generate simplified version."
 
-@retry(stop_after_attempt(3), wait_exponential(multiplier=1, min=1, max=10))
 async def get_email_summary_and_suggestion(email_text: str, user_context: Optional[Dict] = None) -> Dict[str, Any]:
     """
     Analyze an email for ASTI to provide a summary, emotional context, and suggested actions.
@@ -240,6 +296,7 @@ async def get_email_summary_and_suggestion(email_text: str, user_context: Option
     try:
         start_time = time.time()
         client = get_client()
+        email_text = preprocess_text(email_text, "get_email_summary_and_suggestion").text
         
         # Default user preferences if not provided
         if user_context is None:
@@ -261,24 +318,9 @@ async def get_email_summary_and_suggestion(email_text: str, user_context: Option
         4. Specific action items the user should take, broken into simple steps
         5. A suggested response template if a reply is needed
         
-        Format your response as structured JSON with these keys:
-        {
-            "summary": "Brief summary of the email content",
-            "emotional_tone": "The emotional tone of the email",
-            "stress_level": "LOW", "MEDIUM", or "HIGH",
-            "explicit_expectations": ["List of clear expectations"],
-            "implicit_expectations": ["List of unstated but implied expectations"],
-            "suggested_actions": [{
-                "action": "What to do",
-                "steps": ["Step 1", "Step 2"],
-                "deadline": "When it needs to be done by (if applicable)",
-                "effort_level": "LOW", "MEDIUM", or "HIGH"
-            }],
-            "suggested_response": "Template for a response if needed",
-            "needs_immediate_attention": true/false
-        }
-        
-        If the email doesn't require any action, include "no_action_needed": true in your response.
+        Record your analysis by calling the record_email_summary function. Set deadline to
+        null when an action has none, and set no_action_needed to true if the email doesn't
+        require any action.
         
         Always be supportive, reduce cognitive load, and provide clarity for neurodivergent users.
         """
@@ -314,16 +356,42 @@ async def get_email_summary_and_suggestion(email_text: str, user_context: Option
             {"role": "user", "content": f"Email:\n\n{email_text}"}
         ]
         
-        # Choose model based on complexity and importance
-        # For most emails, use GPT-4 for its more nuanced understanding of social context
-        model = GPT_4_MODEL
+        # Let the router pick the model from local signals; routine mail goes to
+        # GPT-3.5, stressful or complex mail to GPT-4, automated mail skips the LLM
+        decision = model_router.route(
+            "get_email_summary_and_suggestion",
+            email_text,
+            sender=user_context.get("sender"),
+            sender_history=user_context.get("sender_history"),
+            anxiety_triggers=user_context.get("anxiety_triggers"),
+            stress_sensitivity=stress_sensitivity,
+        )
+        if decision.skip:
+            return {
+                "summary": heuristic_summary(email_text),
+                "emotional_tone": "neutral",
+                "stress_level": "LOW",
+                "explicit_expectations": [],
+                "implicit_expectations": [],
+                "suggested_actions": [],
+                "suggested_response": "",
+                "needs_immediate_attention": False,
+                "no_action_needed": True,
+            }
+        model = decision.model
         
         try:
-            response = await client.chat.completions.create(
+            response = await create_chat_completion(
+                client,
                 model=model,
                 messages=messages,
                 max_tokens=800,
                 temperature=0.4,
+                **function_tool_params(
+                    "record_email_summary",
+                    "Record the summary and suggested actions for the email",
+                    EmailSummary,
+                ),
             )
             
             # Log token usage and performance
@@ -331,49 +399,27 @@ async def get_email_summary_and_suggestion(email_text: str, user_context: Option
             elapsed_time = time.time() - start_time
             logger.info(f"Email analysis completed in {elapsed_time:.2f} seconds using {model}")
             
-            # Parse the response
-            result = response.choices[0].message.content
-            
             try:
-                # Try to parse as JSON
-                analysis = json.loads(result)
-                return analysis
-            except json.JSONDecodeError:
-                logger.error("Error: Could not parse response as JSON")
-                logger.debug(f"Raw response: {result}")
-                
-                # Fallback - try again with explicit structure request
-                fallback_response = await client.chat.completions.create(
-                    model=model,
-                    messages=messages + [
-                        {"role": "assistant", "content": result},
-                        {"role": "user", "content": "Please reformat your response as valid JSON only."}
+                return parse_function_call(
+                    response, "record_email_summary", EmailSummary
+                ).model_dump(mode="json")
+            except StructuredOutputError as e:
+                # Return a structured error rather than asking the model again
+                logger.error(f"Error: could not parse email summary: {str(e)}")
+                return {
+                    "error": "Failed to parse JSON response",
+                    "summary": "The email content could not be automatically analyzed.",
+                    "emotional_tone": "unknown",
+                    "stress_level": "MEDIUM",
+                    "suggested_actions": [
+                        {
+                            "action": "Review email manually",
+                            "steps": ["Check email content", "Determine if action is needed"],
+                            "effort_level": "MEDIUM"
+                        }
                     ],
-                    max_tokens=800,
-                    temperature=0.2,
-                )
-                
-                fallback_result = fallback_response.choices[0].message.content
-                
-                try:
-                    return json.loads(fallback_result)
-                except json.JSONDecodeError:
-                    # If still failing, return structured error with partial information
-                    logger.error("Fallback parsing also failed")
-                    return {
-                        "error": "Failed to parse JSON response",
-                        "summary": "The email content could not be automatically analyzed.",
-                        "emotional_tone": "unknown",
-                        "stress_level": "MEDIUM",
-                        "suggested_actions": [
-                            {
-                                "action": "Review email manually",
-                                "steps": ["Check email content", "Determine if action is needed"],
-                                "effort_level": "MEDIUM"
-                            }
-                        ],
-                        "needs_immediate_attention": False
-                    }
+                    "needs_immediate_attention": False
+                }
         except Exception as e:
             logger.error(f"OpenAI API error: {str(e)}")
             raise
@@ -382,42 +428,81 @@ async def get_email_summary_and_suggestion(email_text: str, user_context: Option
         logger.error(f"Error analyzing email: {str(e)}")
         return {"error": str(e)}
 
-@retry(stop_after_attempt(3), wait_exponential(multiplier=1, min=1, max=10))
+async def _create_embeddings(texts: List[str]) -> List[List[float]]:
+    """Send one embeddings request and return vectors in input order."""
+    client = get_client()
+    prepared = [
+        preprocess_text(
+            text,
+            "embedding",
+            max_tokens=settings.PREPROCESS_EMBEDDING_TOKEN_BUDGET,
+            model=EMBEDDING_MODEL,
+        )
+        for text in texts
+    ]
+    
+    response = await openai_scheduler.run(
+        EMBEDDING_MODEL,
+        sum(result.tokens for result in prepared),
+        lambda: client.embeddings.create(
+            model=EMBEDDING_MODEL,
+            input=[result.text for result in prepared],
+            encoding_format="float"
+        ),
+    )
+    
+    # Log token usage
+    if hasattr(response, 'usage'):
+        logger.info(f"Embedding token usage: {response.usage.prompt_tokens} tokens for {len(texts)} texts")
+    
+    # The API may return items out of order, so place them by index
+    embeddings = [None] * len(texts)
+    for item in response.data:
+        embeddings[item.index] = item.embedding
+    return embeddings
+
+async def generate_embeddings(texts: List[str]) -> List[List[float]]:
+    """
+    Generate vector embeddings for several texts with as few API requests as possible.
+    
+    Args:
+        texts: Texts to create embeddings for
+        
+    Returns:
+        List of embedding vectors in the same order as texts
+    """
+    try:
+        batch_size = settings.EMBEDDING_BATCH_MAX_SIZE
+        embeddings = []
+        for start in range(0, len(texts), batch_size):
+            embeddings.extend(await _create_embeddings(texts[start:start + batch_size]))
+        return embeddings
+    except Exception as e:
+        logger.error(f"Error generating embeddings: {str(e)}")
+        raise
+
+# Concurrent generate_embedding calls share batched requests
+embedding_batcher = EmbeddingBatcher(
+    generate_embeddings,
+    max_wait_ms=settings.EMBEDDING_BATCH_MAX_WAIT_MS,
+    max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE,
+    token_budget=settings.EMBEDDING_BATCH_TOKEN_BUDGET,
+)
+
 async def generate_embedding(text: str) -> List[float]:
     """
     Generate vector embedding for text using OpenAI's embedding model.
     
+    Calls made within a few milliseconds of each other are sent together
+    as one request by the embedding batcher.
+    
     Args:
         text: Text to create embedding for
         
     Returns:
         List of float values representing the embedding vector
     """
-    try:
-        client = get_client()
-        
-        # Trim text if longer than token limit (roughly ~8000 tokens for embedding-3)
-        # This is a rough approximation - around 4 characters per token
-        max_chars = 32000
-        if len(text) > max_chars:
-            logger.warning(f"Text too long for embedding ({len(text)} chars), truncating to {max_chars} chars")
-            text = text[:max_chars]
-        
-        response = await client.embeddings.create(
-            model=EMBEDDING_MODEL,
-            input=text,
-            encoding_format="float"
-        )
-        
-        # Log token usage
-        if hasattr(response, 'usage'):
-            logger.info(f"Embedding token usage: {response.usage.prompt_tokens} tokens")
-            
-        embedding = response.data[0].embedding
-        return embedding
-    except Exception as e:
-        logger.error(f"Error generating embedding: {str(e)}")
-        raise
+    return await embedding_batcher.embed(text)
 
 async def generate_daily_brief(user_context: Dict, emails: List[Dict], events: List[Dict]) -> Dict:
     """
@@ -501,12 +586,16 @@ async def generate_daily_brief(user_context: Dict, emails: List[Dict], events: L
         Current time: {time.strftime("%A, %B %d, %Y %H:%M")}
         """
         
+        # The brief is built from our own summaries, so it is only capped, not cleaned
+        content = preprocess_text(content.strip(), "generate_daily_brief", clean=False).text
+        
         messages = [
             {"role": "system", "content": system_prompt.strip()},
-            {"role": "user", "content": content.strip()}
+            {"role": "user", "content": content}
         ]
         
-        response = await client.chat.completions.create(
+        response = await create_chat_completion(
+            client,
             model=GPT_4_MODEL,  # Always use GPT-4 for daily brief for highest quality
             messages=messages,
             max_tokens=1000,
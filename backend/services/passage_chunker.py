@@ -0,0 +1,121 @@
+"""
+Passage Chunker
+Splits long memory content into overlapping token-sized passages along sentence
+boundaries, so each passage gets its own embedding instead of one truncated
+embedding for the whole document
+"""
+
+import hashlib
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from backend.config import settings
+from backend.services.prompt_preprocessing import count_tokens
+
+# Passage records are stored as "<parent id><separator><index>"
+PASSAGE_ID_SEPARATOR = "::passage-"
+
+_PARAGRAPH = re.compile(r"\n\s*\n")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+@dataclass
+class Passage:
+    """One chunk of a parent memory"""
+    index: int
+    text: str
+    tokens: int
+
+    @property
+    def digest(self) -> str:
+        """Content hash; an unchanged digest means the stored embedding can be reused"""
+        return hashlib.sha1(self.text.encode("utf-8")).hexdigest()
+
+
+def passage_id(parent_id: str, index: int) -> str:
+    return f"{parent_id}{PASSAGE_ID_SEPARATOR}{index}"
+
+
+def parent_of(memory_id: str) -> str:
+    """The parent memory id of a passage id (or the id itself for a whole memory)"""
+    parent, separator, _ = memory_id.rpartition(PASSAGE_ID_SEPARATOR)
+    return parent if separator else memory_id
+
+
+def needs_chunking(text: str, model: Optional[str] = None) -> bool:
+    return settings.PASSAGE_CHUNKING_ENABLED and count_tokens(text, model) > settings.PASSAGE_MIN_DOCUMENT_TOKENS
+
+
+def _split_long(unit: str, max_tokens: int, model: Optional[str]) -> List[Tuple[str, int]]:
+    """Split a sentence longer than a passage into word windows"""
+    windows = []
+    words: List[str] = []
+    tokens = 0
+    for word in unit.split():
+        word_tokens = count_tokens(word + " ", model)
+        if words and tokens + word_tokens > max_tokens:
+            windows.append((" ".join(words), tokens))
+            words, tokens = [], 0
+        words.append(word)
+        tokens += word_tokens
+    if words:
+        windows.append((" ".join(words), tokens))
+    return windows
+
+
+def _units(text: str, max_tokens: int, model: Optional[str]) -> List[Tuple[str, int]]:
+    """Sentences with their token counts, in order"""
+    units = []
+    for paragraph in _PARAGRAPH.split(text):
+        for sentence in _SENTENCE_END.split(paragraph.strip()):
+            sentence = " ".join(sentence.split())
+            if not sentence:
+                continue
+            tokens = count_tokens(sentence, model)
+            if tokens > max_tokens:
+                units.extend(_split_long(sentence, max_tokens, model))
+            else:
+                units.append((sentence, tokens))
+    return units
+
+
+def chunk_text(
+    text: str,
+    max_tokens: int = settings.PASSAGE_MAX_TOKENS,
+    overlap_tokens: int = settings.PASSAGE_OVERLAP_TOKENS,
+    model: Optional[str] = None,
+) -> List[Passage]:
+    """
+    Pack sentences into passages of at most max_tokens tokens.
+
+    Each passage starts with the trailing sentences of the previous one, up to
+    overlap_tokens, so context spanning a boundary appears in both. Passages
+    follow sentence boundaries, so an edit only changes the passages around it
+    and appended text only changes the last ones.
+    """
+    passages: List[Passage] = []
+    current: List[Tuple[str, int]] = []
+    current_tokens = 0
+
+    def emit():
+        passages.append(Passage(len(passages), " ".join(unit for unit, _ in current), current_tokens))
+
+    for unit, tokens in _units(text, max_tokens, model):
+        if current and current_tokens + tokens > max_tokens:
+            emit()
+            carry: List[Tuple[str, int]] = []
+            carry_tokens = 0
+            for previous, previous_tokens in reversed(current):
+                if carry_tokens + previous_tokens > overlap_tokens:
+                    break
+                carry.insert(0, (previous, previous_tokens))
+                carry_tokens += previous_tokens
+            if carry_tokens + tokens > max_tokens:
+                carry, carry_tokens = [], 0
+            current, current_tokens = carry, carry_tokens
+        current.append((unit, tokens))
+        current_tokens += tokens
+    if current:
+        emit()
+    return passages
@@ -0,0 +1,201 @@
+"""
+Prompt Preprocessing
+Shrinks email text before it is sent to an LLM or embedding model: strips quoted
+history, signatures, disclaimers and HTML boilerplate, collapses whitespace and
+links, and truncates to a per-call token budget using the model's tokenizer
+"""
+
+import html
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Optional
+from urllib.parse import urlsplit
+
+from backend.config import settings
+from backend.utils.logger import logger
+from backend.utils.metrics import PROMPT_TOKENS_SAVED, PROMPT_TOKENS_SENT
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - optional dependency
+    tiktoken = None
+
+DEFAULT_ENCODING = "cl100k_base"
+
+# A line that introduces quoted history; everything from it on is dropped.
+# Forwarded-message headers are kept since the forwarded text is the content.
+QUOTE_HEADER_PATTERNS = [
+    re.compile(r"^\s*On .{0,200}wrote:\s*$", re.IGNORECASE),
+    re.compile(r"^\s*-{2,}\s*Original Message\s*-{2,}\s*$", re.IGNORECASE),
+    re.compile(r"^\s*_{10,}\s*$"),
+]
+# Outlook-style reply header ("From: ..." followed by "Sent:" or "Date:")
+OUTLOOK_HEADER_PATTERN = re.compile(r"^\s*From:\s.+\n\s*(Sent|Date):\s", re.IGNORECASE | re.MULTILINE)
+# Signature delimiter ("-- ") and mobile client footers
+SIGNATURE_PATTERNS = [
+    re.compile(r"^--\s*$"),
+    re.compile(r"^\s*Sent from my \w+", re.IGNORECASE),
+    re.compile(r"^\s*Get Outlook for \w+", re.IGNORECASE),
+]
+DISCLAIMER_PATTERN = re.compile(
+    r"(confidential|privileged).{0,300}(intended (solely )?(for|recipient)|"
+    r"if you (have )?received this)",
+    re.IGNORECASE | re.DOTALL,
+)
+HTML_HINT_PATTERN = re.compile(r"<\s*(html|body|div|p|table|br|span)\b", re.IGNORECASE)
+URL_PATTERN = re.compile(r"https?://[^\s<>\"')\]]+", re.IGNORECASE)
+
+
+@dataclass
+class PreprocessResult:
+    """Preprocessed text and its token accounting"""
+    text: str
+    original_tokens: int
+    tokens: int
+    truncated: bool
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.original_tokens - self.tokens)
+
+
+@lru_cache(maxsize=8)
+def _get_encoding(model: Optional[str]) -> Optional[Any]:
+    """Load the tokenizer for a model, or None if tiktoken is unavailable"""
+    if tiktoken is None:
+        logger.warning("tiktoken is not installed; estimating token counts")
+        return None
+    try:
+        return tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding(DEFAULT_ENCODING)
+    except KeyError:
+        return _get_encoding(None)
+    except Exception as e:
+        # Encodings are downloaded on first use and may be unavailable offline
+        logger.warning(f"Could not load tokenizer for {model}, estimating token counts: {str(e)}")
+        return None
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Count tokens with the model's tokenizer, falling back to ~4 characters per token"""
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: Optional[str] = None) -> str:
+    """Cut text to at most max_tokens tokens"""
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return text[: max_tokens * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
+
+
+def strip_html(text: str) -> str:
+    """Reduce HTML mail to its visible text"""
+    if not HTML_HINT_PATTERN.search(text):
+        return text
+    text = re.sub(r"<(script|style|head)\b.*?</\1\s*>", " ", text, flags=re.IGNORECASE | re.DOTALL)
+    text = re.sub(r"<!--.*?-->", " ", text, flags=re.DOTALL)
+    text = re.sub(r"<\s*(br|/p|/div|/tr|/li|/h\d)\s*/?>", "\n", text, flags=re.IGNORECASE)
+    text = re.sub(r"<[^>]+>", " ", text)
+    return html.unescape(text)
+
+
+def strip_quoted_history(text: str) -> str:
+    """Drop quoted reply chains: "> " lines and everything after a reply header"""
+    match = OUTLOOK_HEADER_PATTERN.search(text)
+    if match and match.start() > 0:
+        text = text[: match.start()]
+
+    kept = []
+    for line in text.splitlines():
+        if kept and any(p.match(line) for p in QUOTE_HEADER_PATTERNS):
+            break
+        if line.lstrip().startswith(">"):
+            continue
+        kept.append(line)
+    return "\n".join(kept)
+
+
+def strip_signature(text: str) -> str:
+    """Drop the signature block after a "-- " delimiter and mobile client footers"""
+    lines = text.splitlines()
+    for i, line in enumerate(lines):
+        if i > 0 and any(p.match(line) for p in SIGNATURE_PATTERNS):
+            return "\n".join(lines[:i])
+    return text
+
+
+def strip_disclaimers(text: str) -> str:
+    """Drop paragraphs that read like legal confidentiality disclaimers"""
+    paragraphs = re.split(r"\n\s*\n", text)
+    return "\n\n".join(p for p in paragraphs if not DISCLAIMER_PATTERN.search(p))
+
+
+def collapse_links(text: str) -> str:
+    """Replace URLs (and their tracking parameters) with a short [link: host] marker"""
+    def shorten(match: re.Match) -> str:
+        host = urlsplit(match.group(0)).netloc.lower()
+        if host.startswith("www."):
+            host = host[4:]
+        return f"[link: {host}]" if host else "[link]"
+
+    return URL_PATTERN.sub(shorten, text)
+
+
+def collapse_whitespace(text: str) -> str:
+    """Collapse runs of spaces and blank lines"""
+    text = re.sub(r"[ \t\u00a0]+", " ", text)
+    text = re.sub(r" *\n *", "\n", text)
+    text = re.sub(r"\n{3,}", "\n\n", text)
+    return text.strip()
+
+
+def clean_email_text(text: str) -> str:
+    """Apply every cleaning step, keeping the original if cleaning would empty it"""
+    cleaned = strip_html(text)
+    cleaned = strip_quoted_history(cleaned)
+    cleaned = strip_signature(cleaned)
+    cleaned = strip_disclaimers(cleaned)
+    cleaned = collapse_links(cleaned)
+    cleaned = collapse_whitespace(cleaned)
+    # An email that is nothing but a forward or a quote still needs its content
+    return cleaned or collapse_whitespace(collapse_links(strip_html(text)))
+
+
+def preprocess_text(
+    text: str,
+    call_site: str,
+    max_tokens: int = settings.PREPROCESS_LLM_TOKEN_BUDGET,
+    model: Optional[str] = None,
+    clean: bool = True,
+) -> PreprocessResult:
+    """
+    Clean text and truncate it to max_tokens for one LLM or embedding call.
+
+    Token savings are logged and counted per call site. With preprocessing
+    disabled the text is only truncated to the budget.
+    """
+    original_tokens = count_tokens(text, model)
+    processed = clean_email_text(text) if clean and settings.PREPROCESS_ENABLED else text
+
+    tokens = count_tokens(processed, model) if processed is not text else original_tokens
+    truncated = tokens > max_tokens
+    if truncated:
+        processed = truncate_to_tokens(processed, max_tokens, model)
+        tokens = count_tokens(processed, model)
+
+    result = PreprocessResult(processed, original_tokens, tokens, truncated)
+    PROMPT_TOKENS_SENT.labels(call_site=call_site).inc(result.tokens)
+    PROMPT_TOKENS_SAVED.labels(call_site=call_site).inc(result.tokens_saved)
+    if result.tokens_saved:
+        logger.info(
+            f"Preprocessing for {call_site}: {original_tokens} -> {tokens} tokens "
+            f"(saved {result.tokens_saved}{', truncated' if truncated else ''})"
+        )
+    return result
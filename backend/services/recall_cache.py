@@ -0,0 +1,128 @@
+"""
+Recall Cache
+In-process cache of query embeddings and memory recall results, invalidated by
+per-user generation counters that every store and delete increments
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+import copy
+import hashlib
+import json
+import threading
+import time
+
+from backend.config import settings
+from backend.services.analysis_cache import normalize_content
+from backend.utils.cache import LRUCache
+from backend.utils.metrics import RECALL_CACHE_REQUESTS
+
+
+def normalize_query(query: str) -> str:
+    """Queries differing only in case or spacing share cached results"""
+    return normalize_content(query).casefold()
+
+
+class RecallCache:
+    """
+    Two caches in front of memory recall.
+
+    Query embeddings are keyed by model and text and never go stale. Result
+    sets are keyed by collection, user, generation, normalized query, filter,
+    k and threshold. A write bumps the generation of the user it touched, so
+    only that user's old entries become unreachable, and they age out of the
+    LRU. A write whose users are unknown bumps the whole collection, and
+    recalls not scoped to a user follow every write. Writes made by other
+    processes are not seen, so results also expire after ttl seconds.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = settings.RECALL_CACHE_MAX_ENTRIES,
+        embedding_entries: int = settings.RECALL_CACHE_EMBEDDING_ENTRIES,
+        ttl: int = settings.RECALL_CACHE_TTL,
+        enabled: bool = settings.RECALL_CACHE_ENABLED,
+    ):
+        self.results = LRUCache(max_size=max_entries)
+        self.embeddings = LRUCache(max_size=embedding_entries)
+        self.ttl = ttl
+        self.enabled = enabled
+        # (collection, user) -> generation; user None counts writes to the whole
+        # collection, user "*" counts every write to it
+        self._generations: Dict[Tuple[str, Optional[str]], int] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _user(user_id: Optional[Any]) -> Optional[str]:
+        # Users are stored under their int id or its string; both share a generation
+        return str(user_id) if user_id is not None else None
+
+    def generation(self, scope: str, user_id: Optional[Any] = None) -> Tuple[int, int]:
+        """(collection generation, generation of the user or, without one, of every write)"""
+        user = self._user(user_id)
+        with self._lock:
+            return (
+                self._generations.get((scope, None), 0),
+                self._generations.get((scope, user if user is not None else "*"), 0),
+            )
+
+    def bump(self, scope: str, user_id: Optional[Any] = None) -> None:
+        """Invalidate a user's cached results in a collection, or everyone's without a user"""
+        user = self._user(user_id)
+        with self._lock:
+            for key in {(scope, user), (scope, "*")}:
+                self._generations[key] = self._generations.get(key, 0) + 1
+
+    def make_key(
+        self,
+        scope: str,
+        query: str,
+        where: Optional[Dict[str, Any]],
+        limit: int,
+        threshold: float,
+        user_id: Optional[Any] = None,
+    ) -> str:
+        """Key for a result set; take it before searching so a concurrent write invalidates it"""
+        payload = json.dumps(
+            {
+                "scope": scope,
+                "user": self._user(user_id),
+                "generation": self.generation(scope, user_id),
+                "query": normalize_query(query),
+                "where": where or {},
+                "limit": limit,
+                "threshold": threshold,
+            },
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get_results(self, key: str) -> Optional[List[Any]]:
+        if not self.enabled:
+            return None
+        entry = self.results.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            RECALL_CACHE_REQUESTS.labels(cache="results", result="miss").inc()
+            return None
+        RECALL_CACHE_REQUESTS.labels(cache="results", result="hit").inc()
+        # Callers may mutate the results, so never hand out the cached objects
+        return copy.deepcopy(entry[1])
+
+    def set_results(self, key: str, results: List[Any]) -> None:
+        if self.enabled:
+            self.results.set(key, (time.monotonic() + self.ttl, copy.deepcopy(results)))
+
+    def get_embedding(self, model: str, query: str) -> Optional[List[float]]:
+        if not self.enabled:
+            return None
+        embedding = self.embeddings.get(f"{model}:{normalize_content(query)}")
+        RECALL_CACHE_REQUESTS.labels(cache="embeddings", result="hit" if embedding is not None else "miss").inc()
+        return embedding
+
+    def set_embedding(self, model: str, query: str, embedding: List[float]) -> None:
+        if self.enabled:
+            self.embeddings.set(f"{model}:{normalize_content(query)}", embedding)
+
+
+# Create a global instance of the recall cache
+recall_cache = RecallCache()
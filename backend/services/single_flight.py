@@ -0,0 +1,212 @@
+"""
+Single Flight
+Collapses concurrent identical LLM requests so only one reaches OpenAI. Callers in
+the same process await the in-flight request; other workers coordinate through a
+Redis lock and read the leader's published result.
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+import weakref
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from openai.types.chat import ChatCompletion
+
+from backend.config import settings
+from backend.services.openai_scheduler import estimate_chat_tokens, openai_scheduler
+from backend.utils.cache import CacheService, cache_service
+from backend.utils.logger import logger
+from backend.utils.metrics import SINGLE_FLIGHT_REQUESTS
+
+LOCK_NAMESPACE = "singleflight:lock"
+RESULT_NAMESPACE = "singleflight:result"
+# After a Redis failure, stay process-local for this long instead of paying
+# connection timeouts on every request
+REMOTE_RETRY_SECONDS = 30
+
+# Delete the lock only if this worker still holds it
+_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    """
+    Runs at most one instance of an identical request at a time.
+
+    Within a process, later callers share the first caller's future. Across
+    processes, the first worker to take the Redis lock makes the request and
+    publishes the serialized result; the others poll for it and fall back to
+    making the request themselves if the leader fails or the lock expires.
+    """
+
+    def __init__(
+        self,
+        remote: Optional[CacheService] = None,
+        enabled: bool = settings.SINGLE_FLIGHT_ENABLED,
+        distributed: bool = settings.SINGLE_FLIGHT_DISTRIBUTED,
+        lock_ttl_ms: int = settings.SINGLE_FLIGHT_LOCK_TTL_MS,
+        poll_interval_ms: int = settings.SINGLE_FLIGHT_POLL_INTERVAL_MS,
+        result_ttl: int = settings.SINGLE_FLIGHT_RESULT_TTL,
+    ):
+        self.remote = remote or cache_service
+        self.enabled = enabled
+        self.distributed = distributed
+        self.lock_ttl_ms = lock_ttl_ms
+        self.poll_interval_ms = poll_interval_ms
+        self.result_ttl = result_ttl
+        self._remote_down_until = 0.0
+        # Futures belong to an event loop, and Celery tasks each run their own loop
+        self._inflight: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Future]]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    @staticmethod
+    def make_key(kind: str, params: Dict[str, Any]) -> str:
+        """Hash the request parameters into a single-flight key"""
+        payload = json.dumps({"kind": kind, "params": params}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        serialize: Optional[Callable[[Any], Any]] = None,
+        deserialize: Optional[Callable[[Any], Any]] = None,
+    ) -> Any:
+        """Run fn once for all concurrent callers with the same key"""
+        if not self.enabled:
+            return await fn()
+
+        inflight = self._inflight.setdefault(asyncio.get_running_loop(), {})
+        while True:
+            existing = inflight.get(key)
+            if existing is None:
+                break
+            SINGLE_FLIGHT_REQUESTS.labels(result="shared").inc()
+            try:
+                return await asyncio.shield(existing)
+            except asyncio.CancelledError:
+                # A cancelled leader (e.g. its client disconnected) is no reason to
+                # fail unrelated callers; follow a new leader or become one
+                if not existing.cancelled():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        # Mark the exception as retrieved when no follower is waiting for it
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        inflight[key] = future
+        try:
+            result = await self._run(key, fn, serialize, deserialize)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            if inflight.get(key) is future:
+                del inflight[key]
+
+    async def _run(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        serialize: Optional[Callable[[Any], Any]],
+        deserialize: Optional[Callable[[Any], Any]],
+    ) -> Any:
+        if not self.distributed or serialize is None or deserialize is None:
+            SINGLE_FLIGHT_REQUESTS.labels(result="leader").inc()
+            return await fn()
+
+        token = uuid.uuid4().hex
+        acquired = self._acquire(key, token) if time.monotonic() >= self._remote_down_until else None
+        if acquired is not False:
+            # Either we hold the lock or Redis is unavailable; make the request
+            SINGLE_FLIGHT_REQUESTS.labels(result="leader").inc()
+            try:
+                result = await fn()
+                if acquired:
+                    self._publish(key, result, serialize)
+                return result
+            finally:
+                if acquired:
+                    self._release(key, token)
+
+        deadline = time.monotonic() + self.lock_ttl_ms / 1000
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_interval_ms / 1000)
+            payload = self.remote.get(RESULT_NAMESPACE, key)
+            if payload is None and not self._is_locked(key):
+                # The leader may have published and released between the two reads
+                payload = self.remote.get(RESULT_NAMESPACE, key)
+                if payload is None:
+                    break
+            if payload is not None:
+                SINGLE_FLIGHT_REQUESTS.labels(result="remote_shared").inc()
+                return deserialize(payload)
+
+        # The leader failed or timed out without publishing a result
+        SINGLE_FLIGHT_REQUESTS.labels(result="leader").inc()
+        return await fn()
+
+    def _acquire(self, key: str, token: str) -> Optional[bool]:
+        """Try to take the lock; None means Redis is unavailable"""
+        try:
+            redis = self.remote.get_cache()
+            return bool(
+                redis.set(
+                    self.remote.cache_key(LOCK_NAMESPACE, key),
+                    token,
+                    nx=True,
+                    px=self.lock_ttl_ms,
+                )
+            )
+        except Exception as e:
+            logger.warning(f"Single-flight lock unavailable: {str(e)}")
+            self._remote_down_until = time.monotonic() + REMOTE_RETRY_SECONDS
+            return None
+
+    def _is_locked(self, key: str) -> bool:
+        try:
+            return bool(self.remote.get_cache().exists(self.remote.cache_key(LOCK_NAMESPACE, key)))
+        except Exception:
+            return False
+
+    def _publish(self, key: str, result: Any, serialize: Callable[[Any], Any]) -> None:
+        try:
+            self.remote.set(RESULT_NAMESPACE, key, serialize(result), expire=self.result_ttl)
+        except Exception as e:
+            logger.warning(f"Failed to publish single-flight result: {str(e)}")
+
+    def _release(self, key: str, token: str) -> None:
+        try:
+            self.remote.get_cache().eval(
+                _RELEASE_SCRIPT, 1, self.remote.cache_key(LOCK_NAMESPACE, key), token
+            )
+        except Exception as e:
+            logger.warning(f"Failed to release single-flight lock: {str(e)}")
+
+
+single_flight = SingleFlight()
+
+
+async def create_chat_completion(client: Any, **params: Any) -> ChatCompletion:
+    """chat.completions.create, de-duplicated and scheduled within the model's rate budget"""
+    tokens = estimate_chat_tokens(params.get("messages", []), params.get("max_tokens"))
+    return await single_flight.do(
+        SingleFlight.make_key("chat.completions", params),
+        lambda: openai_scheduler.run(
+            params["model"], tokens, lambda: client.chat.completions.create(**params)
+        ),
+        serialize=lambda response: response.model_dump(),
+        deserialize=ChatCompletion.model_validate,
+    )
@@ -0,0 +1,133 @@
+"""
+Structured Output
+Pydantic schemas for the LLM analysis calls and helpers that request them as a
+single forced function call with a strict JSON schema, so every field arrives
+in one round trip and is validated without re-asking the model
+"""
+
+import copy
+from typing import Any, Dict, Iterable, List, Optional, Type
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+
+from backend.models.enums import Priority, StressLevel
+
+# Keywords strict function calling rejects; they are still enforced locally by pydantic
+UNSUPPORTED_SCHEMA_KEYWORDS = {
+    "default", "minimum", "maximum", "exclusiveMinimum", "exclusiveMaximum",
+    "minItems", "maxItems", "minLength", "maxLength",
+}
+
+
+class StructuredOutputError(ValueError):
+    """The model's structured output was missing or did not match the schema"""
+
+
+class ReplyOption(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    tone: str
+    content: str
+
+
+class ContentAnalysis(BaseModel):
+    """Unified analysis returned by openai_service.analyze_content"""
+    model_config = ConfigDict(extra="forbid")
+
+    stress_level: StressLevel
+    priority: Priority
+    summary: str
+    action_items: List[str]
+    sentiment_score: float = Field(ge=-5, le=5)
+    tone_analysis: str
+    suggestions: List[str]
+    # Only requested when the user has cognitive load reduction enabled
+    simplified_version: Optional[str] = None
+    # Only requested when reply tones are asked for
+    reply_options: Optional[List[ReplyOption]] = None
+
+
+class SuggestedAction(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    action: str
+    steps: List[str]
+    deadline: Optional[str]
+    effort_level: StressLevel
+
+
+class EmailSummary(BaseModel):
+    """ASTI summary returned by openai_service.get_email_summary_and_suggestion"""
+    model_config = ConfigDict(extra="forbid")
+
+    summary: str
+    emotional_tone: str
+    stress_level: StressLevel
+    explicit_expectations: List[str]
+    implicit_expectations: List[str]
+    suggested_actions: List[SuggestedAction]
+    suggested_response: str
+    needs_immediate_attention: bool
+    no_action_needed: bool
+
+
+def _strictify(node: Any) -> Any:
+    """Close every object schema and require all its properties"""
+    if isinstance(node, dict):
+        for keyword in UNSUPPORTED_SCHEMA_KEYWORDS & node.keys():
+            del node[keyword]
+        if node.get("type") == "object" and "properties" in node:
+            node["additionalProperties"] = False
+            node["required"] = list(node["properties"])
+        for value in node.values():
+            _strictify(value)
+    elif isinstance(node, list):
+        for item in node:
+            _strictify(item)
+    return node
+
+
+def strict_json_schema(model: Type[BaseModel], exclude: Iterable[str] = ()) -> Dict[str, Any]:
+    """
+    JSON schema for model in the form strict function calling accepts.
+
+    Fields in exclude are dropped, so optional sections are only generated (and
+    paid for) when the caller asks for them.
+    """
+    schema = copy.deepcopy(model.model_json_schema())
+    # Docstrings are for maintainers, not the model
+    schema.pop("description", None)
+    for name in exclude:
+        schema["properties"].pop(name, None)
+    return _strictify(schema)
+
+
+def function_tool_params(
+    name: str, description: str, model: Type[BaseModel], exclude: Iterable[str] = ()
+) -> Dict[str, Any]:
+    """chat.completions.create arguments that force one call to a strict function"""
+    return {
+        "tools": [{
+            "type": "function",
+            "function": {
+                "name": name,
+                "description": description,
+                "parameters": strict_json_schema(model, exclude),
+                "strict": True,
+            },
+        }],
+        "tool_choice": {"type": "function", "function": {"name": name}},
+        "parallel_tool_calls": False,
+    }
+
+
+def parse_function_call(response: Any, name: str, model: Type[BaseModel]) -> BaseModel:
+    """Validate the arguments of the forced function call in a chat completion"""
+    message = response.choices[0].message
+    for tool_call in getattr(message, "tool_calls", None) or []:
+        if tool_call.function.name == name:
+            try:
+                return model.model_validate_json(tool_call.function.arguments)
+            except ValidationError as e:
+                raise StructuredOutputError(f"{name} output failed validation: {str(e)}") from e
+    raise StructuredOutputError(f"Model did not call {name}")
@@ -6,15 +6,34 @@ Handles interaction with ChromaDB for vector storage and retrieval
 from typing import List, Dict, Any, Optional, Union
 from pydantic import BaseModel
 import chromadb
-from chromadb.utils import embedding_functions
+from chromadb.errors import NotFoundError
 import os
 import json
 import logging
 from datetime import datetime
 import asyncio
+import base64
+import hashlib
+import heapq
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
 from enum import Enum
 import uuid
 
+import numpy as np
+
+from backend.config import settings
+from backend.services.embedding_batcher import estimate_tokens
+from backend.services.embedding_provider import LocalEmbeddingProvider, create_embedding_provider
+from backend.services.lexical_index import BM25Index, reciprocal_rank_fusion
+from backend.services.passage_chunker import chunk_text, needs_chunking, parent_of, passage_id
+from backend.services.recall_cache import recall_cache
+from backend.utils.executor import BoundedExecutor
+from backend.utils.metrics import MEMORY_RETRIEVAL_STAGE_LATENCY, PASSAGE_EMBEDDINGS
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -36,6 +55,79 @@ class Memory(BaseModel):
 class MemoryQueryResult(BaseModel):
     memory: Memory
     score: float
+    # Best-matching passage when the memory was matched through one of its passages
+    passage: Optional[str] = None
+
+class MemoryPage(BaseModel):
+    memories: List[Memory]
+    next_cursor: Optional[str] = None
+
+class BulkItemResult(BaseModel):
+    index: int
+    id: str
+    stored: bool
+    error: Optional[str] = None
+
+class BulkStoreResult(BaseModel):
+    stored: int
+    failed: int
+    results: List[BulkItemResult]
+
+# ChromaDB's client is synchronous (HNSW search, SQLite, embedding HTTP calls), so
+# every call runs here rather than on the event loop
+chroma_executor = BoundedExecutor(
+    "chromadb",
+    max_workers=settings.VECTOR_MEMORY_MAX_WORKERS,
+    max_pending=settings.VECTOR_MEMORY_MAX_PENDING,
+)
+
+# Optional parts of a memory a listing can project, and the Chroma field holding each
+MEMORY_PROJECTIONS = {"content": "documents", "embedding": "embeddings"}
+
+def encode_cursor(timestamp: int, memory_id: str) -> str:
+    """Opaque cursor for the position after (timestamp, memory_id) in newest-first order"""
+    raw = json.dumps([timestamp, memory_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        timestamp, memory_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return int(timestamp), str(memory_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+# User ids that can be used verbatim in a collection name
+_SHARD_SAFE_ID = re.compile(r"[A-Za-z0-9._-]{0,63}[A-Za-z0-9]")
+
+def _normalize_where(where: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Chroma needs an explicit $and to filter on more than one field"""
+    if not where:
+        return None
+    if len(where) > 1 and not any(key.startswith("$") for key in where):
+        return {"$and": [{key: value} for key, value in where.items()]}
+    return where
+
+def _and_where(where: Optional[Dict[str, Any]], condition: Dict[str, Any]) -> Dict[str, Any]:
+    return {"$and": [where, condition]} if where else condition
+
+def _owner_where(user_id: Any) -> Dict[str, Any]:
+    """
+    Filter for one user's memories. The memory routes store the integer user id
+    and ASTI its string, so a numeric id matches both forms, as it does in shard
+    names and the lexical index. Chroma's $in needs one type, hence $or.
+    """
+    forms = [user_id]
+    if isinstance(user_id, int) and not isinstance(user_id, bool):
+        forms.append(str(user_id))
+    elif isinstance(user_id, str) and user_id.isdigit():
+        forms.append(int(user_id))
+    if len(forms) == 1:
+        return {"user_id": user_id}
+    return {"$or": [{"user_id": form} for form in forms]}
+
+# Passage records of chunked memories are search-only; listings show their parents.
+# $ne also matches records without a kind, i.e. every whole memory.
+NOT_A_PASSAGE = {"kind": {"$ne": "passage"}}
 
 class VectorMemoryService:
     """Service for handling vector memory operations with ChromaDB"""
@@ -47,23 +139,36 @@ class VectorMemoryService:
         self.collection_name = "asti_memory"
         self.embedding_function = None
         self.initialized = False
-        
-        # Initialize async
-        asyncio.create_task(self.initialize())
+        # Initialization happens lazily on first use, once, on the executor
+        self._init_lock = threading.Lock()
+        # Per-user shard collections, opened on first use and kept in LRU order
+        self._shards: "OrderedDict[str, Any]" = OrderedDict()
+        self._shards_lock = threading.Lock()
+        # BM25 index per collection, built from the collection on first search
+        self._lexical: Dict[str, BM25Index] = {}
+        self._lexical_lock = threading.Lock()
+        # Query embeddings and recall results, invalidated per collection on write
+        self.cache = recall_cache
     
     async def initialize(self):
         """Initialize the ChromaDB client and collection"""
+        await chroma_executor.run("initialize", self._initialize_sync)
+    
+    def _initialize_sync(self):
+        with self._init_lock:
+            if self.initialized:
+                return
+            self._connect()
+    
+    def _connect(self):
         try:
             # Check for environment settings
             persistent_dir = os.environ.get("CHROMADB_PERSISTENT_DIR", "./data/chromadb")
             host = os.environ.get("CHROMADB_HOST")
             port = os.environ.get("CHROMADB_PORT")
             
-            # Use OpenAI embedding function
-            self.embedding_function = embedding_functions.OpenAIEmbeddingFunction(
-                api_key=os.environ.get("OPENAI_API_KEY"),
-                model_name="text-embedding-3-small"
-            )
+            # Configured embedding provider (OpenAI or local), behind the persistent cache
+            self.embedding_function = create_embedding_provider()
             
             # Initialize client (either persistent or in-memory)
             if host and port:
@@ -95,6 +200,9 @@ class VectorMemoryService:
         except Exception as e:
             logger.error(f"Error initializing vector memory service: {e}")
             # Fall back to in-memory client if persistent fails
+            if self.embedding_function is None:
+                logger.info("Falling back to local embeddings")
+                self.embedding_function = LocalEmbeddingProvider()
             if not self.client:
                 logger.info("Falling back to in-memory ChromaDB")
                 self.client = chromadb.EphemeralClient()
@@ -108,69 +216,387 @@ class VectorMemoryService:
         """Ensure the service is initialized before use"""
         if not self.initialized:
             await self.initialize()
-            # Wait for initialization with timeout
-            for _ in range(10):
-                if self.initialized:
-                    break
-                await asyncio.sleep(0.5)
             
             if not self.initialized:
                 raise Exception("Vector memory service failed to initialize")
     
+    def shard_name(self, user_id: Optional[Any]) -> str:
+        """Name of the collection holding a user's memories under the configured sharding mode"""
+        mode = settings.VECTOR_MEMORY_SHARDING
+        if user_id is None or mode == "none":
+            return self.collection_name
+        key = str(user_id)
+        if mode == "bucket":
+            bucket = zlib.crc32(key.encode("utf-8")) % settings.VECTOR_MEMORY_USER_BUCKETS
+            return f"{self.collection_name}-bucket-{bucket:04d}"
+        if not _SHARD_SAFE_ID.fullmatch(key):
+            key = hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]
+        return f"{self.collection_name}-user-{key}"
+    
+    async def _collection(self, user_id: Optional[Any] = None):
+        """Collection serving a user, opening and caching its shard on first use"""
+        name = self.shard_name(user_id)
+        if name == self.collection_name:
+            return self.collection
+        with self._shards_lock:
+            collection = self._shards.get(name)
+            if collection is not None:
+                self._shards.move_to_end(name)
+                return collection
+        return await chroma_executor.run("open_collection", self._open_shard, name)
+    
+    def _open_shard(self, name: str):
+        collection = self.client.get_or_create_collection(
+            name=name,
+            embedding_function=self.embedding_function
+        )
+        with self._shards_lock:
+            self._shards[name] = collection
+            self._shards.move_to_end(name)
+            while len(self._shards) > settings.VECTOR_MEMORY_COLLECTION_CACHE_SIZE:
+                self._shards.popitem(last=False)
+        return collection
+    
+    def _drop_shard(self, name: str) -> None:
+        with self._shards_lock:
+            self._shards.pop(name, None)
+        self._forget_index(name)
+        try:
+            self.client.delete_collection(name=name)
+        except NotFoundError:
+            pass
+    
+    def _lexical_index(self, collection) -> BM25Index:
+        """The collection's BM25 index, (re)built from Chroma when missing or stale"""
+        with self._lexical_lock:
+            index = self._lexical.setdefault(collection.name, BM25Index())
+        # Other processes write to the same collection; a size mismatch means we missed writes
+        if index.loaded and len(index) != collection.count():
+            index.clear()
+        
+        def load(index: BM25Index) -> None:
+            offset = 0
+            while True:
+                chunk = collection.get(
+                    include=["documents", "metadatas"],
+                    limit=settings.VECTOR_MEMORY_SCAN_BATCH,
+                    offset=offset
+                )
+                for i, memory_id in enumerate(chunk["ids"]):
+                    metadata = chunk["metadatas"][i] or {}
+                    index.add(memory_id, chunk["documents"][i] or metadata.get("content", ""), metadata.get("user_id"))
+                if len(chunk["ids"]) < settings.VECTOR_MEMORY_SCAN_BATCH:
+                    break
+                offset += len(chunk["ids"])
+        
+        index.load(load)
+        return index
+    
+    def _index_memories(self, collection, memories: List[Memory]) -> None:
+        """Keep an already-built BM25 index in step with writes to its collection"""
+        self._bump_owners(collection.name, memories)
+        index = self._lexical.get(collection.name)
+        if index is not None:
+            for memory in memories:
+                index.add(memory.id, memory.content, (memory.metadata or {}).get("user_id"))
+    
+    def _bump_owners(self, name: str, memories: List[Memory]) -> None:
+        """Invalidate cached recalls of the users whose memories were written"""
+        for owner in {(memory.metadata or {}).get("user_id") for memory in memories}:
+            self.cache.bump(name, owner)
+    
+    def _forget_index(self, name: str, user_id: Optional[Any] = None) -> None:
+        """
+        Discard a collection's BM25 index after writes we cannot replay, and the
+        cached results of the user they touched (everyone's without a user)
+        """
+        self.cache.bump(name, user_id)
+        with self._lexical_lock:
+            self._lexical.pop(name, None)
+    
+    def _scope(self, where: Optional[Dict[str, Any]], user_id: Optional[Any]):
+        """
+        Resolve the user whose shard serves a request and the filter to run in it.
+        
+        The user comes from the argument or a plain user_id filter. With one
+        collection per user that filter is implied by the shard and dropped; with
+        shared collections it is kept (or added) to preserve tenant isolation,
+        matching a numeric id stored as an int or a string (see _owner_where).
+        """
+        where = dict(where) if where else {}
+        if user_id is None and "user_id" in where and not isinstance(where["user_id"], dict):
+            user_id = where["user_id"]
+        if user_id is not None:
+            owner = where.pop("user_id", user_id)
+            if settings.VECTOR_MEMORY_SHARDING != "user":
+                condition = {"user_id": owner} if isinstance(owner, dict) else _owner_where(owner)
+                return user_id, _and_where(_normalize_where(where), condition)
+        return user_id, _normalize_where(where)
+    
     async def store_memory(self, memory: Memory) -> Memory:
         """Store a memory with its vector embedding"""
         await self._ensure_initialized()
         
         try:
-            # Generate embedding if not provided
-            if not memory.embedding and memory.content:
-                # This will use the embedding function from chromadb
-                # But we don't need to actually generate it manually as ChromaDB will do it
-                pass
-            
-            # Convert metadata to JSON serializable format
-            metadata = {}
-            if memory.metadata:
-                metadata = {k: v for k, v in memory.metadata.items() if v is not None}
-                # Convert non-serializable values to strings
-                for k, v in metadata.items():
-                    if not isinstance(v, (str, int, float, bool, list, dict, type(None))):
-                        metadata[k] = str(v)
-            
-            # Add required fields to metadata
-            metadata["type"] = memory.type
-            metadata["content"] = memory.content
-            metadata["timestamp"] = memory.timestamp
+            metadata = self._prepare_metadata(memory)
+            collection = await self._collection(metadata.get("user_id"))
+            
+            if needs_chunking(memory.content):
+                await chroma_executor.run("store_passages", self._store_chunked_sync, memory, collection)
+                return memory
             
             # Add to collection
-            self.collection.add(
+            await chroma_executor.run(
+                "add",
+                collection.add,
                 ids=[memory.id],
                 embeddings=[memory.embedding] if memory.embedding else None,
+                # Without a precomputed embedding, Chroma embeds the document on the executor thread
+                documents=[memory.content],
                 metadatas=[metadata]
             )
+            self._index_memories(collection, [memory])
             
             return memory
         except Exception as e:
             logger.error(f"Error storing memory: {e}")
             raise
     
+    async def store_memories(self, memories: List[Memory]) -> BulkStoreResult:
+        """
+        Store many memories, embedding and writing them in batches.
+        
+        Each batch is embedded with one call and written with one collection.add.
+        A failed batch is retried item by item so one bad memory does not fail
+        its neighbours; the result reports the outcome of every item.
+        """
+        await self._ensure_initialized()
+        
+        results: List[Optional[BulkItemResult]] = [None] * len(memories)
+        valid = []
+        seen_ids = set()
+        for index, memory in enumerate(memories):
+            if not memory.content and not memory.embedding:
+                results[index] = BulkItemResult(index=index, id=memory.id, stored=False, error="Memory has no content")
+            elif memory.id in seen_ids:
+                results[index] = BulkItemResult(index=index, id=memory.id, stored=False, error="Duplicate id in request")
+            else:
+                seen_ids.add(memory.id)
+                valid.append(index)
+        
+        # Batches never span shards, so each one is a single collection.add
+        shards: Dict[str, List[int]] = {}
+        for index in valid:
+            user_id = (memories[index].metadata or {}).get("user_id")
+            shards.setdefault(self.shard_name(user_id), []).append(index)
+        
+        batches = []
+        for indexes in shards.values():
+            collection = await self._collection((memories[indexes[0]].metadata or {}).get("user_id"))
+            batches.extend((collection, batch) for batch in self._batch(memories, indexes))
+        for batch_results in await asyncio.gather(
+            *(self._store_batch(memories, batch, collection) for collection, batch in batches)
+        ):
+            for result in batch_results:
+                results[result.index] = result
+        
+        stored = sum(1 for result in results if result.stored)
+        logger.info(f"Bulk stored {stored}/{len(memories)} memories in {len(batches)} batches")
+        return BulkStoreResult(stored=stored, failed=len(memories) - stored, results=results)
+    
+    @staticmethod
+    def _batch(memories: List[Memory], indexes: List[int]) -> List[List[int]]:
+        """Split item indexes into batches within the embedding request size and token budget"""
+        batches: List[List[int]] = []
+        batch: List[int] = []
+        batch_tokens = 0
+        for index in indexes:
+            tokens = 0 if memories[index].embedding else estimate_tokens(memories[index].content)
+            if batch and (
+                len(batch) >= settings.EMBEDDING_BATCH_MAX_SIZE
+                or batch_tokens + tokens > settings.EMBEDDING_BATCH_TOKEN_BUDGET
+            ):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(index)
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+    
+    async def _store_batch(self, memories: List[Memory], batch: List[int], collection) -> List[BulkItemResult]:
+        try:
+            await chroma_executor.run("add_batch", self._add_batch_sync, [memories[i] for i in batch], collection)
+            return [BulkItemResult(index=i, id=memories[i].id, stored=True) for i in batch]
+        except Exception as e:
+            if len(batch) == 1:
+                logger.error(f"Error storing memory {memories[batch[0]].id}: {e}")
+                return [BulkItemResult(index=batch[0], id=memories[batch[0]].id, stored=False, error=str(e))]
+            logger.warning(f"Batch of {len(batch)} memories failed, retrying individually: {e}")
+        
+        results = []
+        for i in batch:
+            results.extend(await self._store_batch(memories, [i], collection))
+        return results
+    
+    def _add_batch_sync(self, memories: List[Memory], collection) -> None:
+        """Embed the memories missing an embedding in one call, then add them all in one call"""
+        chunked = [memory for memory in memories if needs_chunking(memory.content)]
+        for memory in chunked:
+            self._store_chunked_sync(memory, collection)
+        memories = [memory for memory in memories if not needs_chunking(memory.content)]
+        if not memories:
+            return
+        
+        embeddings = [memory.embedding for memory in memories]
+        missing = [i for i, embedding in enumerate(embeddings) if not embedding]
+        if missing:
+            computed = self.embedding_function([memories[i].content for i in missing])
+            for i, embedding in zip(missing, computed):
+                embeddings[i] = embedding
+        
+        collection.add(
+            ids=[memory.id for memory in memories],
+            embeddings=embeddings,
+            documents=[memory.content for memory in memories],
+            metadatas=[self._prepare_metadata(memory) for memory in memories]
+        )
+        self._index_memories(collection, memories)
+    
+    def _store_chunked_sync(self, memory: Memory, collection) -> None:
+        """
+        Store a long memory as a parent record plus one record per passage.
+        
+        Passages whose text is unchanged since the memory was last stored keep
+        their embeddings, so re-storing an updated email only embeds the
+        passages that changed. The parent holds the full content with the mean
+        passage embedding (or the memory's own embedding, if given).
+        """
+        passages = chunk_text(memory.content, settings.PASSAGE_MAX_TOKENS, settings.PASSAGE_OVERLAP_TOKENS)
+        ids = [passage_id(memory.id, passage.index) for passage in passages]
+        
+        existing = collection.get(where={"parent_id": memory.id}, include=["metadatas", "embeddings"])
+        previous = {
+            existing_id: (metadata.get("passage_hash"), existing["embeddings"][i])
+            for i, (existing_id, metadata) in enumerate(zip(existing["ids"], existing["metadatas"]))
+        }
+        
+        embeddings: List[Any] = [None] * len(passages)
+        changed = []
+        for i, (record_id, passage) in enumerate(zip(ids, passages)):
+            prior = previous.get(record_id)
+            if prior is not None and prior[0] == passage.digest:
+                embeddings[i] = prior[1]
+            else:
+                changed.append(i)
+        if changed:
+            computed = self.embedding_function([passages[i].text for i in changed])
+            for i, embedding in zip(changed, computed):
+                embeddings[i] = embedding
+        PASSAGE_EMBEDDINGS.labels(result="embedded").inc(len(changed))
+        PASSAGE_EMBEDDINGS.labels(result="reused").inc(len(passages) - len(changed))
+        
+        metadata = self._prepare_metadata(memory)
+        collection.upsert(
+            ids=ids,
+            embeddings=embeddings,
+            documents=[passage.text for passage in passages],
+            metadatas=[
+                {**metadata, "kind": "passage", "parent_id": memory.id, "passage": passage.index,
+                 "passage_hash": passage.digest}
+                for passage in passages
+            ]
+        )
+        stale = [record_id for record_id in previous if record_id not in set(ids)]
+        if stale:
+            collection.delete(ids=stale)
+        
+        if memory.embedding:
+            parent_embedding = memory.embedding
+        else:
+            mean = np.mean(np.asarray(embeddings, dtype=np.float32), axis=0)
+            norm = np.linalg.norm(mean)
+            parent_embedding = (mean / norm if norm else mean).tolist()
+        collection.upsert(
+            ids=[memory.id],
+            embeddings=[parent_embedding],
+            documents=[memory.content],
+            metadatas=[{**metadata, "passages": len(passages)}]
+        )
+        
+        self._index_memories(collection, [memory])
+        index = self._lexical.get(collection.name)
+        if index is not None:
+            owner = metadata.get("user_id")
+            for record_id, passage in zip(ids, passages):
+                index.add(record_id, passage.text, owner)
+            index.remove(stale)
+    
+    @staticmethod
+    def _prepare_metadata(memory: Memory) -> Dict[str, Any]:
+        """Flatten a memory's metadata and core fields into Chroma metadata"""
+        # Convert metadata to JSON serializable format
+        metadata = {}
+        if memory.metadata:
+            metadata = {k: v for k, v in memory.metadata.items() if v is not None}
+            # Convert non-serializable values to strings
+            for k, v in metadata.items():
+                if not isinstance(v, (str, int, float, bool, list, dict, type(None))):
+                    metadata[k] = str(v)
+        
+        # Add required fields to metadata; the content is stored as the document
+        metadata["type"] = memory.type
+        metadata["timestamp"] = memory.timestamp
+        return metadata
+    
+    @staticmethod
+    def _memory_from_record(
+        memory_id: str,
+        metadata: Dict[str, Any],
+        document: Optional[str] = None,
+        embedding: Optional[Any] = None
+    ) -> Memory:
+        """Rebuild a Memory from a Chroma record"""
+        metadata_copy = dict(metadata or {})
+        memory_type = metadata_copy.pop("type", MemoryType.KNOWLEDGE)
+        timestamp = metadata_copy.pop("timestamp", int(datetime.now().timestamp() * 1000))
+        # Memories written before content moved to the document carry it in metadata
+        legacy_content = metadata_copy.pop("content", "")
+        
+        return Memory(
+            id=memory_id,
+            type=memory_type,
+            content=document if document is not None else legacy_content,
+            timestamp=timestamp,
+            metadata=metadata_copy,
+            embedding=[float(x) for x in embedding] if embedding is not None else None
+        )
+    
     async def query_memories(
         self, 
         query: str,
         embedding: Optional[List[float]] = None,
         where: Optional[Dict[str, Any]] = None,
         limit: int = 5,
-        threshold: float = 0.1
+        threshold: float = 0.1,
+        user_id: Optional[Any] = None
     ) -> List[MemoryQueryResult]:
         """Find memories related to a query using vector similarity"""
         await self._ensure_initialized()
         
         try:
+            user_id, where = self._scope(where, user_id)
+            collection = await self._collection(user_id)
+            
+            # Passages compete with whole memories for results, so fetch extra to fill limit
+            oversample = settings.PASSAGE_QUERY_OVERSAMPLE if settings.PASSAGE_CHUNKING_ENABLED else 1
+            
             # Execute query
-            results = self.collection.query(
-                query_texts=[query] if not embedding else None,
-                query_embeddings=[embedding] if embedding else None,
-                n_results=limit,
+            results = await chroma_executor.run(
+                "query",
+                collection.query,
+                query_embeddings=[embedding or await self._query_embedding(query)],
+                n_results=limit * oversample,
                 where=where
             )
             
@@ -180,6 +606,10 @@ class VectorMemoryService:
             if not results["ids"] or not results["ids"][0]:
                 return []
             
+            # Passages collapse into their parent memory, which scores as its best passage
+            hits: Dict[str, Optional[Memory]] = {}
+            parents_to_fetch = []
+            ranked = []
             for i, memory_id in enumerate(results["ids"][0]):
                 metadata = results["metadatas"][0][i]
                 score = 1.0 - (results["distances"][0][i] if "distances" in results else 0.0)
@@ -188,52 +618,184 @@ class VectorMemoryService:
                 if score < threshold:
                     continue
                 
-                # Extract fields from metadata
-                memory_type = metadata.get("type", MemoryType.KNOWLEDGE)
-                content = metadata.get("content", "")
-                timestamp = metadata.get("timestamp", int(datetime.now().timestamp() * 1000))
-                
-                # Remove extracted fields from metadata
-                metadata_copy = metadata.copy()
-                if "type" in metadata_copy:
-                    del metadata_copy["type"]
-                if "content" in metadata_copy:
-                    del metadata_copy["content"]
-                if "timestamp" in metadata_copy:
-                    del metadata_copy["timestamp"]
-                
-                # Get embedding if available
-                embedding = None
-                if "embeddings" in results and results["embeddings"]:
-                    embedding = results["embeddings"][0][i]
-                
-                # Create memory and result
-                memory = Memory(
-                    id=memory_id,
-                    type=memory_type,
-                    content=content,
-                    timestamp=timestamp,
-                    metadata=metadata_copy,
-                    embedding=embedding
-                )
+                document = results["documents"][0][i] if results.get("documents") else None
+                parent_id = metadata.get("parent_id") if metadata.get("kind") == "passage" else None
+                if (parent_id or memory_id) in hits:
+                    continue
+                if parent_id:
+                    parents_to_fetch.append(parent_id)
+                    hits[parent_id] = None
+                    ranked.append((parent_id, score, document))
+                else:
+                    hits[memory_id] = self._memory_from_record(memory_id, metadata, document=document)
+                    ranked.append((memory_id, score, None))
                 
-                memory_results.append(MemoryQueryResult(
-                    memory=memory,
-                    score=score
-                ))
+                if len(ranked) >= limit:
+                    break
+            
+            if parents_to_fetch:
+                parents = await chroma_executor.run("get", collection.get, ids=parents_to_fetch)
+                for i, parent_id in enumerate(parents["ids"]):
+                    hits[parent_id] = self._memory_from_record(
+                        parent_id, parents["metadatas"][i], document=parents["documents"][i]
+                    )
+            
+            # A parent deleted while its passages were matched drops out
+            memory_results = [
+                MemoryQueryResult(memory=hits[memory_id], score=score, passage=passage)
+                for memory_id, score, passage in ranked
+                if hits.get(memory_id) is not None
+            ]
             
             return memory_results
         except Exception as e:
             logger.error(f"Error querying memories: {e}")
             raise
     
-    async def get_memories(self, where: Optional[Dict[str, Any]] = None) -> List[Memory]:
+    async def _query_embedding(self, query: str) -> List[float]:
+        """Embed a query, reusing the embedding of an identical earlier query"""
+        model = getattr(self.embedding_function, "model_name", type(self.embedding_function).__name__)
+        embedding = self.cache.get_embedding(model, query)
+        if embedding is None:
+            embeddings = await chroma_executor.run("embed_query", self.embedding_function, [query])
+            embedding = [float(x) for x in embeddings[0]]
+            self.cache.set_embedding(model, query, embedding)
+        return embedding
+    
+    async def search_memories(
+        self,
+        query: str,
+        where: Optional[Dict[str, Any]] = None,
+        limit: int = 5,
+        threshold: float = 0.1,
+        user_id: Optional[Any] = None
+    ) -> List[MemoryQueryResult]:
+        """
+        Recall memories for a query, serving repeats from the recall cache.
+        
+        Results are cached per collection and user, and invalidated by writes
+        to that user's memories (or, unscoped, by any write to the collection).
+        Retrieval is hybrid unless VECTOR_MEMORY_HYBRID_SEARCH is off.
+        """
+        await self._ensure_initialized()
+        
+        scoped_user, scoped_where = self._scope(where, user_id)
+        collection = await self._collection(scoped_user)
+        key = self.cache.make_key(collection.name, query, scoped_where, limit, threshold, user_id=scoped_user)
+        results = self.cache.get_results(key)
+        if results is not None:
+            return results
+        
+        if settings.VECTOR_MEMORY_HYBRID_SEARCH:
+            results = await self._hybrid_search(query, where, limit, threshold, user_id)
+        else:
+            results = await self.query_memories(query, where=where, limit=limit, threshold=threshold, user_id=user_id)
+        self.cache.set_results(key, results)
+        return results
+    
+    async def _hybrid_search(
+        self,
+        query: str,
+        where: Optional[Dict[str, Any]],
+        limit: int,
+        threshold: float,
+        user_id: Optional[Any]
+    ) -> List[MemoryQueryResult]:
+        """
+        Vector similarity and BM25 fused with reciprocal-rank fusion.
+        
+        Both retrievers return limit * VECTOR_MEMORY_HYBRID_CANDIDATES candidates.
+        Lexical hits the vector search did not return are fetched through the
+        same filter, so they obey it too. Scores are fused RRF scores. Each
+        stage's latency is recorded in memory_retrieval_stage_seconds.
+        """
+        timings: Dict[str, float] = {}
+        
+        async def timed(stage: str, awaitable):
+            started = time.perf_counter()
+            try:
+                return await awaitable
+            finally:
+                timings[stage] = time.perf_counter() - started
+                MEMORY_RETRIEVAL_STAGE_LATENCY.labels(stage=stage).observe(timings[stage])
+        
+        try:
+            depth = limit * settings.VECTOR_MEMORY_HYBRID_CANDIDATES
+            scoped_user, scoped_where = self._scope(where, user_id)
+            collection = await self._collection(scoped_user)
+            # Shared collections hold several users' memories; a shard holds one
+            owner = scoped_user if settings.VECTOR_MEMORY_SHARDING != "user" else None
+            
+            def lexical_search():
+                return self._lexical_index(collection).search(query, depth, owner=owner)
+            
+            vector_results, lexical_results = await asyncio.gather(
+                timed("vector", self.query_memories(
+                    query, where=where, limit=depth, threshold=threshold, user_id=user_id
+                )),
+                timed("lexical", chroma_executor.run("lexical_search", lexical_search)),
+            )
+            
+            by_id = {result.memory.id: result.memory for result in vector_results}
+            passages = {result.memory.id: result.passage for result in vector_results}
+            # Passage hits rank their parent memory, at the rank of its best passage
+            lexical_ids = list(dict.fromkeys(parent_of(doc_id) for doc_id, _ in lexical_results))
+            missing = [doc_id for doc_id in lexical_ids if doc_id not in by_id]
+            if missing:
+                fetched = await timed("fetch", chroma_executor.run(
+                    "get", collection.get, ids=missing, where=scoped_where
+                ))
+                for i, memory_id in enumerate(fetched["ids"]):
+                    by_id[memory_id] = self._memory_from_record(
+                        memory_id,
+                        fetched["metadatas"][i],
+                        document=fetched["documents"][i] if fetched.get("documents") else None
+                    )
+            
+            started = time.perf_counter()
+            scores = reciprocal_rank_fusion(
+                [
+                    [result.memory.id for result in vector_results],
+                    # Lexical hits that failed the filter were not fetched and drop out here
+                    [doc_id for doc_id in lexical_ids if doc_id in by_id],
+                ],
+                k=settings.VECTOR_MEMORY_RRF_K
+            )
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+            results = [
+                MemoryQueryResult(memory=by_id[memory_id], score=score, passage=passages.get(memory_id))
+                for memory_id, score in ranked
+            ]
+            timings["fusion"] = time.perf_counter() - started
+            MEMORY_RETRIEVAL_STAGE_LATENCY.labels(stage="fusion").observe(timings["fusion"])
+            
+            logger.debug(
+                "Hybrid memory search: "
+                + ", ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in timings.items())
+                + f" ({len(vector_results)} vector, {len(lexical_results)} lexical candidates)"
+            )
+            return results
+        except Exception as e:
+            logger.error(f"Error searching memories: {e}")
+            raise
+    
+    async def get_memories(
+        self,
+        where: Optional[Dict[str, Any]] = None,
+        user_id: Optional[Any] = None
+    ) -> List[Memory]:
         """Get memories matching a filter"""
         await self._ensure_initialized()
         
         try:
+            user_id, where = self._scope(where, user_id)
+            where = _and_where(where, NOT_A_PASSAGE)
+            collection = await self._collection(user_id)
+            
             # Get memories from collection
-            results = self.collection.get(
+            results = await chroma_executor.run(
+                "get",
+                collection.get,
                 where=where
             )
             
@@ -246,33 +808,10 @@ class VectorMemoryService:
             for i, memory_id in enumerate(results["ids"]):
                 metadata = results["metadatas"][i]
                 
-                # Extract fields from metadata
-                memory_type = metadata.get("type", MemoryType.KNOWLEDGE)
-                content = metadata.get("content", "")
-                timestamp = metadata.get("timestamp", int(datetime.now().timestamp() * 1000))
-                
-                # Remove extracted fields from metadata
-                metadata_copy = metadata.copy()
-                if "type" in metadata_copy:
-                    del metadata_copy["type"]
-                if "content" in metadata_copy:
-                    del metadata_copy["content"]
-                if "timestamp" in metadata_copy:
-                    del metadata_copy["timestamp"]
-                
-                # Get embedding if available
-                embedding = None
-                if "embeddings" in results and results["embeddings"]:
-                    embedding = results["embeddings"][i]
-                
-                # Create memory
-                memory = Memory(
-                    id=memory_id,
-                    type=memory_type,
-                    content=content,
-                    timestamp=timestamp,
-                    metadata=metadata_copy,
-                    embedding=embedding
+                memory = self._memory_from_record(
+                    memory_id,
+                    metadata,
+                    document=results["documents"][i] if results.get("documents") else None
                 )
                 
                 memories.append(memory)
@@ -285,13 +824,116 @@ class VectorMemoryService:
             logger.error(f"Error getting memories: {e}")
             raise
     
-    async def get_memory_by_id(self, memory_id: str) -> Optional[Memory]:
+    async def list_memories(
+        self,
+        where: Optional[Dict[str, Any]] = None,
+        user_id: Optional[Any] = None,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        include: Optional[List[str]] = None
+    ) -> MemoryPage:
+        """
+        Page through memories newest first.
+        
+        Chroma cannot sort, so the matching metadata is scanned in bounded
+        chunks keeping only the top limit + 1 (timestamp, id) keys; documents and
+        embeddings are then fetched for that page alone, and only when they are
+        in include. Pass the returned next_cursor to continue after the page.
+        """
+        await self._ensure_initialized()
+        
+        include = list(include or [])
+        unknown = set(include) - set(MEMORY_PROJECTIONS)
+        if unknown:
+            raise ValueError(f"Unknown include fields: {sorted(unknown)}")
+        after = decode_cursor(cursor) if cursor else None
+        
+        user_id, where = self._scope(where, user_id)
+        where = _and_where(where, NOT_A_PASSAGE)
+        if after:
+            # Coarse filter in Chroma; ties on the timestamp are resolved by id below
+            before_cursor = {"timestamp": {"$lte": after[0]}}
+            where = _and_where(where, before_cursor)
+        collection = await self._collection(user_id)
+        
+        def scan():
+            top: List[tuple] = []
+            offset = 0
+            while True:
+                chunk = collection.get(
+                    where=where,
+                    include=["metadatas"],
+                    limit=settings.VECTOR_MEMORY_SCAN_BATCH,
+                    offset=offset
+                )
+                for memory_id, metadata in zip(chunk["ids"], chunk["metadatas"]):
+                    key = (metadata.get("timestamp", 0), memory_id)
+                    if after and key >= after:
+                        continue
+                    entry = (key, metadata)
+                    if len(top) <= limit:
+                        heapq.heappush(top, entry)
+                    elif key > top[0][0]:
+                        heapq.heapreplace(top, entry)
+                if len(chunk["ids"]) < settings.VECTOR_MEMORY_SCAN_BATCH:
+                    break
+                offset += len(chunk["ids"])
+            return sorted(top, key=lambda entry: entry[0], reverse=True)
+        
+        try:
+            entries = await chroma_executor.run("list", scan)
+            has_more = len(entries) > limit
+            entries = entries[:limit]
+            
+            details: Dict[str, Dict[str, Any]] = {}
+            fields = [MEMORY_PROJECTIONS[name] for name in include]
+            if fields and entries:
+                results = await chroma_executor.run(
+                    "get",
+                    collection.get,
+                    ids=[key[1] for key, _ in entries],
+                    include=fields
+                )
+                for i, memory_id in enumerate(results["ids"]):
+                    details[memory_id] = {
+                        field: results[field][i] for field in fields if results.get(field) is not None
+                    }
+            
+            memories = []
+            for (_, memory_id), metadata in entries:
+                record = details.get(memory_id, {})
+                memory = self._memory_from_record(
+                    memory_id,
+                    metadata,
+                    document=record.get("documents"),
+                    embedding=record.get("embeddings")
+                )
+                if "content" not in include:
+                    memory.content = ""
+                memories.append(memory)
+            
+            next_cursor = None
+            if has_more:
+                last = memories[-1]
+                next_cursor = encode_cursor(last.timestamp, last.id)
+            return MemoryPage(memories=memories, next_cursor=next_cursor)
+        except Exception as e:
+            logger.error(f"Error listing memories: {e}")
+            raise
+    
+    async def get_memory_by_id(self, memory_id: str, user_id: Optional[Any] = None) -> Optional[Memory]:
         """Get a memory by ID"""
         await self._ensure_initialized()
         
         try:
+            user_id, where = self._scope(None, user_id)
+            collection = await self._collection(user_id)
+            
             # Get memory from collection
-            results = self.collection.get(
+            results = await chroma_executor.run(
+                "get",
+                collection.get,
+                where=where,
                 ids=[memory_id]
             )
             
@@ -301,33 +943,10 @@ class VectorMemoryService:
             # Format result
             metadata = results["metadatas"][0]
             
-            # Extract fields from metadata
-            memory_type = metadata.get("type", MemoryType.KNOWLEDGE)
-            content = metadata.get("content", "")
-            timestamp = metadata.get("timestamp", int(datetime.now().timestamp() * 1000))
-            
-            # Remove extracted fields from metadata
-            metadata_copy = metadata.copy()
-            if "type" in metadata_copy:
-                del metadata_copy["type"]
-            if "content" in metadata_copy:
-                del metadata_copy["content"]
-            if "timestamp" in metadata_copy:
-                del metadata_copy["timestamp"]
-            
-            # Get embedding if available
-            embedding = None
-            if "embeddings" in results and results["embeddings"]:
-                embedding = results["embeddings"][0]
-            
-            # Create memory
-            memory = Memory(
-                id=memory_id,
-                type=memory_type,
-                content=content,
-                timestamp=timestamp,
-                metadata=metadata_copy,
-                embedding=embedding
+            memory = self._memory_from_record(
+                memory_id,
+                metadata,
+                document=results["documents"][0] if results.get("documents") else None
             )
             
             return memory
@@ -335,51 +954,233 @@ class VectorMemoryService:
             logger.error(f"Error getting memory by ID: {e}")
             raise
     
-    async def delete_memory(self, memory_id: str) -> bool:
+    async def delete_memory(self, memory_id: str, user_id: Optional[Any] = None) -> bool:
         """Delete a memory by ID"""
+        return await self.delete_memory_ids([memory_id], user_id=user_id)
+    
+    async def delete_memory_ids(self, memory_ids: List[str], user_id: Optional[Any] = None) -> bool:
+        """Delete memories by ID"""
         await self._ensure_initialized()
+        if not memory_ids:
+            return True
         
         try:
-            # Delete memory from collection
-            self.collection.delete(
-                ids=[memory_id]
-            )
+            user_id, where = self._scope(None, user_id)
+            collection = await self._collection(user_id)
+            
+            def delete():
+                # Passages of chunked memories go with their parent
+                passages = collection.get(
+                    where=_and_where(where, {"parent_id": {"$in": list(memory_ids)}}), include=[]
+                )
+                ids = list(memory_ids) + passages["ids"]
+                collection.delete(ids=ids, where=where)
+                return ids
+            
+            # Delete memories from collection
+            deleted = await chroma_executor.run("delete", delete)
+            self.cache.bump(collection.name, user_id)
+            index = self._lexical.get(collection.name)
+            if index is not None:
+                index.remove(deleted)
             return True
         except Exception as e:
-            logger.error(f"Error deleting memory: {e}")
+            logger.error(f"Error deleting memories: {e}")
             raise
     
-    async def delete_memories(self, where: Optional[Dict[str, Any]] = None) -> bool:
+    async def update_metadata(self, memories: List[Memory], user_id: Optional[Any] = None) -> None:
+        """Rewrite the metadata of existing memories, keeping their content and embeddings"""
+        await self._ensure_initialized()
+        if not memories:
+            return
+        
+        collection = await self._collection(user_id)
+        # Older records keep their content in metadata. With the embedding at hand it moves
+        # to the document without Chroma re-embedding it; otherwise it stays in metadata
+        with_embeddings = all(memory.embedding for memory in memories)
+        metadatas = [self._prepare_metadata(memory) for memory in memories]
+        if not with_embeddings:
+            for metadata, memory in zip(metadatas, memories):
+                metadata["content"] = memory.content
+        await chroma_executor.run(
+            "update",
+            collection.update,
+            ids=[memory.id for memory in memories],
+            embeddings=[memory.embedding for memory in memories] if with_embeddings else None,
+            documents=[memory.content for memory in memories] if with_embeddings else None,
+            metadatas=metadatas
+        )
+        self._bump_owners(collection.name, memories)
+    
+    async def scan_memories(
+        self,
+        user_id: Optional[Any] = None,
+        where: Optional[Dict[str, Any]] = None,
+        include_embeddings: bool = False
+    ) -> List[Memory]:
+        """Every memory matching a filter, read in VECTOR_MEMORY_SCAN_BATCH chunks"""
+        await self._ensure_initialized()
+        
+        user_id, where = self._scope(where, user_id)
+        where = _and_where(where, NOT_A_PASSAGE)
+        collection = await self._collection(user_id)
+        include = ["documents", "metadatas"] + (["embeddings"] if include_embeddings else [])
+        
+        memories = []
+        offset = 0
+        while True:
+            chunk = await chroma_executor.run(
+                "get",
+                collection.get,
+                where=where,
+                include=include,
+                limit=settings.VECTOR_MEMORY_SCAN_BATCH,
+                offset=offset
+            )
+            for i, memory_id in enumerate(chunk["ids"]):
+                memories.append(self._memory_from_record(
+                    memory_id,
+                    chunk["metadatas"][i],
+                    document=chunk["documents"][i],
+                    embedding=chunk["embeddings"][i] if include_embeddings else None
+                ))
+            if len(chunk["ids"]) < settings.VECTOR_MEMORY_SCAN_BATCH:
+                break
+            offset += len(chunk["ids"])
+        return memories
+    
+    async def delete_memories(
+        self,
+        where: Optional[Dict[str, Any]] = None,
+        user_id: Optional[Any] = None
+    ) -> bool:
         """Delete memories matching a filter"""
         await self._ensure_initialized()
         
         try:
-            # Get matching IDs first
-            results = self.collection.get(
-                where=where
-            )
+            user_id, where = self._scope(where, user_id)
             
-            if not results["ids"]:
+            if where is None and user_id is not None and settings.VECTOR_MEMORY_SHARDING == "user":
+                # Everything in the shard belongs to this user: drop the collection
+                await chroma_executor.run("drop_collection", self._drop_shard, self.shard_name(user_id))
                 return True
             
-            # Delete memory from collection
-            self.collection.delete(
-                ids=results["ids"]
-            )
+            collection = await self._collection(user_id)
+            if where is None:
+                # Chroma's delete needs ids or a filter; an unfiltered delete clears the collection
+                def delete_all():
+                    results = collection.get(include=[])
+                    if results["ids"]:
+                        collection.delete(ids=results["ids"])
+                
+                await chroma_executor.run("delete", delete_all)
+            else:
+                # Chroma resolves the filter itself; no need to fetch the matching ids first
+                await chroma_executor.run("delete", collection.delete, where=where)
+            # The deleted ids are unknown here; the index is rebuilt on the next search
+            self._forget_index(collection.name, user_id)
             return True
         except Exception as e:
             logger.error(f"Error deleting memories: {e}")
             raise
+    
+    async def migrate_to_shards(
+        self,
+        batch_size: int = 500,
+        delete_source: bool = False,
+        dry_run: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Move memories from the shared collection into per-user shards.
+        
+        Pages through the shared collection and writes each user's memories to
+        their shard with the stored embeddings, so nothing is re-embedded.
+        Memories without a user_id stay where they are. The upsert makes the
+        migration safe to re-run after an interruption.
+        """
+        await self._ensure_initialized()
+        
+        report = {"scanned": 0, "moved": 0, "skipped": 0, "shards": {}}
+        offset = 0
+        while True:
+            page = await chroma_executor.run(
+                "get",
+                self.collection.get,
+                limit=batch_size,
+                offset=offset,
+                include=["embeddings", "documents", "metadatas"]
+            )
+            if not page["ids"]:
+                break
+            
+            groups: Dict[str, Dict[str, Any]] = {}
+            for i, memory_id in enumerate(page["ids"]):
+                metadata = page["metadatas"][i] or {}
+                name = self.shard_name(metadata.get("user_id"))
+                if name == self.collection_name:
+                    report["skipped"] += 1
+                    continue
+                group = groups.setdefault(name, {
+                    "user_id": metadata["user_id"], "ids": [], "embeddings": [], "documents": [], "metadatas": []
+                })
+                group["ids"].append(memory_id)
+                group["embeddings"].append(page["embeddings"][i])
+                # Memories stored before documents were kept only have their text in metadata
+                group["documents"].append((page["documents"] or [None] * len(page["ids"]))[i] or metadata.get("content", ""))
+                group["metadatas"].append(metadata)
+            
+            moved = 0
+            for name, group in groups.items():
+                count = len(group["ids"])
+                report["shards"][name] = report["shards"].get(name, 0) + count
+                moved += count
+                if dry_run:
+                    continue
+                collection = await self._collection(group["user_id"])
+                await chroma_executor.run(
+                    "upsert",
+                    collection.upsert,
+                    ids=group["ids"],
+                    embeddings=group["embeddings"],
+                    documents=group["documents"],
+                    metadatas=group["metadatas"]
+                )
+                self._forget_index(name)
+                if delete_source:
+                    await chroma_executor.run("delete", self.collection.delete, ids=group["ids"])
+                    self._forget_index(self.collection_name)
+            
+            report["scanned"] += len(page["ids"])
+            report["moved"] += moved
+            # Deleted rows no longer occupy offsets in the shared collection
+            offset += len(page["ids"]) - (moved if delete_source and not dry_run else 0)
+        
+        logger.info(
+            f"Shard migration {'(dry run) ' if dry_run else ''}moved {report['moved']} of "
+            f"{report['scanned']} memories into {len(report['shards'])} collections"
+        )
+        return report
 
 # Create a singleton instance of the vector memory service
 vector_memory = VectorMemoryService()
 
-async def add_memory(content: str, metadata: Dict[str, Any]) -> Memory:
+async def add_memory(
+    content: str,
+    metadata: Dict[str, Any],
+    user_id: Optional[str] = None,
+    memory_type: Optional[str] = None,
+    importance: Optional[float] = None
+) -> Memory:
     """Add a memory to the vector store"""
     memory_id = f"memory-{uuid.uuid4()}"
     timestamp = int(datetime.now().timestamp() * 1000)
     
-    memory_type = metadata.get("type", MemoryType.KNOWLEDGE)
+    metadata = dict(metadata or {})
+    if user_id is not None:
+        metadata["user_id"] = user_id
+    if importance is not None:
+        metadata["importance"] = importance
+    memory_type = memory_type or metadata.get("type", MemoryType.KNOWLEDGE)
     
     memory = Memory(
         id=memory_id,
@@ -391,10 +1192,19 @@ async def add_memory(content: str, metadata: Dict[str, Any]) -> Memory:
     
     return await vector_memory.store_memory(memory)
 
-async def recall_relevant_context(query: str, where: Optional[Dict[str, Any]] = None, limit: int = 5) -> List[MemoryQueryResult]:
+async def recall_relevant_context(
+    query: str,
+    user_id: Optional[str] = None,
+    limit: int = 5,
+    filters: Optional[Dict[str, Any]] = None
+) -> List[MemoryQueryResult]:
     """Recall relevant memories based on a query"""
-    return await vector_memory.query_memories(
+    where = dict(filters or {})
+    if "min_importance" in where:
+        where["importance"] = {"$gte": where.pop("min_importance")}
+    return await vector_memory.search_memories(
         query=query,
         where=where,
-        limit=limit
-    ) 
\ No newline at end of file
+        limit=limit,
+        user_id=user_id
+    )
@@ -5,12 +5,17 @@ from backend.config import settings
 from backend.database import SessionLocal, engine, get_db
 from backend.models.base import Base
 from backend.models.email import Email, StressLevel, Priority
-from backend.models.user import User
+from backend.models.user import User, UserPreferences
 from backend.utils.openai import analyze_content
 from backend.services.notification import NotificationService
+from backend.ai.handlers import AIHandler
+from backend.services.model_router import get_sender_history
+from backend.services.openai_scheduler import PRIORITY_BACKGROUND, run_with_priority
+from backend.services.memory_consolidation import memory_consolidator
 import logging
 from typing import Optional, Dict, Any
 import asyncio
+import concurrent.futures
 import json
 
 # Initialize logging with more detailed format
@@ -50,6 +55,10 @@ celery.conf.beat_schedule = {
         "task": "backend.tasks.worker.update_email_analytics",
         "schedule": timedelta(hours=1),
     },
+    "consolidate-memories": {
+        "task": "backend.tasks.worker.consolidate_memories",
+        "schedule": timedelta(days=1),
+    },
 }
 
 def get_db_session() -> SessionLocal:
@@ -131,6 +140,69 @@ async def process_email(email_id: int, user_id: int,
         if not db_session:
             db.close()
 
+def run_async(coro):
+    """Run a coroutine from synchronous task code"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    # Eager tasks may be called from inside a running loop; use a separate thread
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+@celery.task(bind=True, max_retries=3, default_retry_delay=10)
+def analyze_email_task(self, email_id: int) -> Dict[str, Any]:
+    """Run AI analysis for a stored email and save the results."""
+    db = get_db_session()
+    try:
+        email = db.query(Email).filter(Email.id == email_id).first()
+        if not email:
+            logger.error(f"Email {email_id} not found for analysis")
+            return {"email_id": email_id, "status": "missing"}
+        
+        preferences = (
+            db.query(UserPreferences)
+            .filter(UserPreferences.user_id == email.user_id)
+            .first()
+        )
+        sender_history = get_sender_history(
+            db, email.user_id, email.sender, exclude_email_id=email.id
+        )
+        
+        async def analyze():
+            # Each task runs in its own event loop, so its HTTP pool cannot be
+            # reused by the next task and is closed here instead of leaking
+            handler = AIHandler(testing=settings.TESTING)
+            try:
+                return await handler.analyze_email(
+                    email.content,
+                    sender=email.sender,
+                    sender_history=sender_history,
+                    user_preferences=preferences,
+                    email_id=email.id,
+                )
+            finally:
+                await handler.close()
+        
+        analysis = run_async(run_with_priority(analyze(), PRIORITY_BACKGROUND))
+        
+        email.stress_level = analysis.stress_level
+        email.priority = analysis.priority
+        email.summary = analysis.summary
+        email.action_items = analysis.action_items
+        email.sentiment_score = analysis.sentiment_score
+        email.is_processed = True
+        db.commit()
+        
+        logger.info(f"Analyzed email {email_id}")
+        return {"email_id": email_id, "status": "completed"}
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error analyzing email {email_id}: {str(e)}")
+        raise self.retry(exc=e)
+    finally:
+        db.close()
+
 @celery.task
 def cleanup_old_emails(days: int = 30):
     """Archive emails older than specified days."""
@@ -183,4 +255,26 @@ def update_email_analytics(user_id: int):
     finally:
         db.close()
 
- 
\ No newline at end of file
+@celery.task
+def consolidate_memories(user_id: Optional[int] = None, dry_run: bool = False) -> Dict[str, Any]:
+    """Merge duplicate, roll up old and evict excess vector memories for one user or all users."""
+    if user_id is None:
+        db = next(get_db())
+        try:
+            user_ids = [row.id for row in db.query(User.id).all()]
+        finally:
+            db.close()
+    else:
+        user_ids = [user_id]
+    
+    reports = {}
+    for uid in user_ids:
+        try:
+            # Vector memory matches the id in both its int (routes) and str (ASTI) forms
+            report = run_async(memory_consolidator.consolidate_user(uid, dry_run=dry_run))
+            reports[str(uid)] = report.dict()
+        except Exception as e:
+            # One user's failure should not stop the others
+            logger.error(f"Error consolidating memories for user {uid}: {str(e)}")
+            reports[str(uid)] = {"error": str(e)}
+    return reports
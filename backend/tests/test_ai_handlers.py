@@ -112,3 +112,41 @@ async def test_generate_response(ai_handler):
     )
     assert isinstance(response, str)
     assert response == "Test response suggestion"
+
+
+@pytest.mark.asyncio
+async def test_stream_reply_splits_tokens_and_metadata(ai_handler):
+    """Test streamed reply tokens exclude the metadata, which arrives in the final event"""
+    pieces = ["Thanks for ", "the update.", "\n---ME", "TA---\n", '{"tone": "friendly", ', '"formality_level": 2}']
+
+    async def fake_stream():
+        for piece in pieces:
+            delta = type("Delta", (), {"content": piece})
+            yield type("Chunk", (), {"choices": [type("Choice", (), {"delta": delta})]})
+
+    mock_client = AsyncMock()
+    mock_client.chat.completions.create.return_value = fake_stream()
+    ai_handler.testing = False
+    ai_handler.client = mock_client
+
+    events = [event async for event in ai_handler.stream_reply("Test content", "friendly")]
+
+    tokens = "".join(e["data"]["content"] for e in events if e["event"] == "token")
+    assert "---META---" not in tokens
+    assert tokens.strip() == "Thanks for the update."
+    assert events[-1] == {
+        "event": "done",
+        "data": {"content": "Thanks for the update.", "tone": "friendly", "formality_level": 2},
+    }
+    assert mock_client.chat.completions.create.call_args.kwargs["stream"] is True
+
+
+@pytest.mark.asyncio
+async def test_close_releases_the_connection_pool():
+    """Test that closing a handler closes its OpenAI HTTP client"""
+    handler = AIHandler()
+    assert not handler.client.is_closed()
+
+    await handler.close()
+
+    assert handler.client.is_closed()
@@ -0,0 +1,101 @@
+import pytest
+from unittest.mock import MagicMock
+from backend.services.analysis_cache import AnalysisCache, normalize_content
+from backend.utils.cache import LRUCache
+
+
+@pytest.fixture
+def remote():
+    """In-memory stand-in for the Redis-backed CacheService"""
+    store = {}
+    service = MagicMock()
+    service.get.side_effect = lambda namespace, key: store.get(f"{namespace}:{key}")
+    service.set.side_effect = lambda namespace, key, value, expire=3600: store.__setitem__(
+        f"{namespace}:{key}", value
+    ) or True
+    service.store = store
+    return service
+
+
+@pytest.fixture
+def cache(remote):
+    return AnalysisCache(remote=remote, max_entries=10, ttl=60, enabled=True)
+
+
+def test_lru_evicts_least_recently_used():
+    """Test LRU eviction order"""
+    lru = LRUCache(max_size=2)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    lru.get("a")
+    lru.set("c", 3)
+
+    assert lru.get("a") == 1
+    assert lru.get("b") is None
+    assert lru.get("c") == 3
+
+
+def test_key_ignores_whitespace_differences(cache):
+    """Test that normalized content shares a key"""
+    key1 = cache.make_key("Hello   world\n", "gpt-4", "1")
+    key2 = cache.make_key(" Hello world", "gpt-4", "1")
+    assert normalize_content("Hello   world\n") == "Hello world"
+    assert key1 == key2
+
+
+def test_key_depends_on_model_version_and_context(cache):
+    """Test that model, prompt version and user context change the key"""
+    base = cache.make_key("content", "gpt-4", "1", {"simplify_language": False})
+    assert base != cache.make_key("content", "gpt-3.5-turbo", "1", {"simplify_language": False})
+    assert base != cache.make_key("content", "gpt-4", "2", {"simplify_language": False})
+    assert base != cache.make_key("content", "gpt-4", "1", {"simplify_language": True})
+
+
+def test_memory_and_redis_tiers(cache, remote):
+    """Test lookups fall through the local LRU to Redis"""
+    key = cache.make_key("content", "gpt-4", "1")
+    assert cache.get("analyze_email", key) is None
+
+    cache.set("analyze_email", key, {"summary": "cached"})
+    assert cache.get("analyze_email", key) == {"summary": "cached"}
+
+    # A fresh process only has the Redis tier
+    other = AnalysisCache(remote=remote, max_entries=10, ttl=60, enabled=True)
+    assert other.get("analyze_email", key) == {"summary": "cached"}
+    assert len(other.local) == 1
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_cached_value_is_not_shared(cache):
+    """Test that mutating a returned result does not corrupt the cache"""
+    key = cache.make_key("content", "gpt-4", "1")
+    cache.set("analyze_content", key, {"action_items": ["a"]})
+
+    result = cache.get("analyze_content", key)
+    result["action_items"].append("b")
+
+    assert cache.get("analyze_content", key) == {"action_items": ["a"]}
+
+
+def test_invalidate_prompt(cache, remote):
+    """Test explicit invalidation only drops the given prompt"""
+    email_key = cache.make_key("content", "gpt-4", "1")
+    cache.set("analyze_email", email_key, {"summary": "email"})
+    cache.set("analyze_content", email_key, {"summary": "content"})
+
+    removed = cache.invalidate_prompt("analyze_email")
+
+    assert removed == 1
+    remote.clear_namespace.assert_called_once_with("analysis:analyze_email")
+    assert cache.get("analyze_content", email_key) == {"summary": "content"}
+
+
+def test_disabled_cache_is_bypassed(remote):
+    """Test that a disabled cache never stores or returns results"""
+    cache = AnalysisCache(remote=remote, enabled=False)
+    cache.set("analyze_email", "key", {"summary": "x"})
+    assert cache.get("analyze_email", "key") is None
+    remote.set.assert_not_called()
@@ -55,10 +55,11 @@ def test_create_email(client, test_user):
         headers={"Authorization": f"Bearer {test_user.create_access_token()}"},
     )
 
-    assert response.status_code == 200
+    assert response.status_code == 202
     data = response.json()
     assert data["subject"] == "Test Email"
     assert data["content"] == "Test content"
+    assert "job_id" in data
 
 
 def test_get_emails(client, test_user):
@@ -0,0 +1,93 @@
+import asyncio
+import threading
+import pytest
+from backend.services.embedding_batcher import EmbeddingBatcher
+
+
+class RecordingEmbedder:
+    """Fake embeddings endpoint that records each batch it receives"""
+
+    def __init__(self, fail: bool = False):
+        self.batches = []
+        self.fail = fail
+
+    async def __call__(self, texts):
+        self.batches.append(list(texts))
+        if self.fail:
+            raise RuntimeError("API Error")
+        return [[float(len(text))] for text in texts]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_request():
+    """Test that concurrent embed calls are sent as one batch"""
+    embedder = RecordingEmbedder()
+    batcher = EmbeddingBatcher(embedder, max_wait_ms=10)
+
+    texts = ["a", "bb", "ccc", "dddd"]
+    results = await asyncio.gather(*(batcher.embed(text) for text in texts))
+
+    assert len(embedder.batches) == 1
+    assert results == [[1.0], [2.0], [3.0], [4.0]]
+
+
+@pytest.mark.asyncio
+async def test_batch_size_limit_splits_requests():
+    """Test that a full batch is flushed immediately"""
+    embedder = RecordingEmbedder()
+    batcher = EmbeddingBatcher(embedder, max_wait_ms=1000, max_batch_size=2)
+
+    results = await asyncio.gather(*(batcher.embed(t) for t in ["a", "b", "c", "d"]))
+
+    assert [len(batch) for batch in embedder.batches] == [2, 2]
+    assert len(results) == 4
+
+
+@pytest.mark.asyncio
+async def test_token_budget_splits_requests():
+    """Test that the token budget caps each batch"""
+    embedder = RecordingEmbedder()
+    batcher = EmbeddingBatcher(embedder, max_wait_ms=10, token_budget=10)
+
+    long_text = "x" * 32  # ~8 tokens
+    await asyncio.gather(batcher.embed(long_text), batcher.embed(long_text))
+
+    assert len(embedder.batches) == 2
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_caller():
+    """Test that a failed batch raises in each waiting caller"""
+    batcher = EmbeddingBatcher(RecordingEmbedder(fail=True), max_wait_ms=5)
+
+    results = await asyncio.gather(
+        batcher.embed("a"), batcher.embed("b"), return_exceptions=True
+    )
+
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_batches_never_span_event_loops():
+    """Test that loops in different threads (as Celery tasks run) keep separate batches"""
+    embedder = RecordingEmbedder()
+    batcher = EmbeddingBatcher(embedder, max_wait_ms=50)
+    started = threading.Barrier(2)
+    results = {}
+
+    def run(name, texts):
+        async def main():
+            started.wait()
+            return await asyncio.gather(*(batcher.embed(text) for text in texts))
+        results[name] = asyncio.run(main())
+
+    threads = [
+        threading.Thread(target=run, args=("a", ["a", "aa"]), daemon=True),
+        threading.Thread(target=run, args=("b", ["bbb", "bbbb"]), daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert results == {"a": [[1.0], [2.0]], "b": [[3.0], [4.0]]}
+    assert sorted(embedder.batches) == [["a", "aa"], ["bbb", "bbbb"]]
@@ -0,0 +1,140 @@
+import uuid
+import chromadb
+import numpy as np
+import pytest
+from backend.services.embedding_codec import dequantize, pack_base64, quantize, truncate, unpack_base64
+from backend.services.embedding_provider import (
+    CachedEmbeddingProvider,
+    EmbeddingProvider,
+    LocalEmbeddingProvider,
+    create_embedding_provider,
+)
+from backend.services.vector_memory import Memory, MemoryType, VectorMemoryService
+
+
+class CountingProvider(LocalEmbeddingProvider):
+    def __init__(self):
+        super().__init__(dimensions=64)
+        self.batches = []
+
+    def embed(self, texts):
+        self.batches.append(list(texts))
+        return super().embed(texts)
+
+
+def test_provider_without_embed_cannot_be_created():
+    """Test that a backend missing embed() fails when constructed, not when Chroma first calls it"""
+    class Incomplete(EmbeddingProvider):
+        model_name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_local_provider_is_deterministic_and_normalized():
+    """Test that local embeddings are stable unit vectors that reflect shared words"""
+    provider = LocalEmbeddingProvider(dimensions=256)
+    invoice, overdue, lunch, empty = provider([
+        "Invoice 4471 is overdue",
+        "Reminder: invoice 4471 overdue",
+        "Team lunch on Friday",
+        "",
+    ])
+
+    assert invoice.shape == (256,)
+    assert np.allclose(invoice, provider(["Invoice 4471 is overdue"])[0])
+    assert np.isclose(np.linalg.norm(invoice), 1.0)
+    assert float(invoice @ overdue) > float(invoice @ lunch)
+    assert not empty.any()
+
+
+def test_cached_provider_embeds_each_text_once_across_instances(tmp_path):
+    """Test that the on-disk cache only sends misses to the provider and survives restarts"""
+    path = str(tmp_path / "cache" / "embeddings.sqlite3")
+    inner = CountingProvider()
+    first = CachedEmbeddingProvider(inner, path=path)(["alpha", "beta", "alpha"])
+
+    restarted = CountingProvider()
+    second = CachedEmbeddingProvider(restarted, path=path)(["beta", "gamma", "alpha"])
+
+    assert inner.batches == [["alpha", "beta"]]
+    assert restarted.batches == [["gamma"]]
+    assert np.array_equal(first[1], second[0])
+    assert np.array_equal(first[0], second[2])
+
+
+def test_cache_keys_include_the_model(tmp_path):
+    """Test that vectors from one model are never served for another"""
+    path = str(tmp_path / "embeddings.sqlite3")
+    small = CachedEmbeddingProvider(LocalEmbeddingProvider(dimensions=32), path=path)
+    large = CachedEmbeddingProvider(LocalEmbeddingProvider(dimensions=64), path=path)
+
+    assert small(["same text"])[0].shape == (32,)
+    assert large(["same text"])[0].shape == (64,)
+
+
+def test_quantized_vectors_keep_their_similarities():
+    """Test float16 and int8 round trips, truncation and base64 packing"""
+    vectors = LocalEmbeddingProvider(dimensions=256)(["Invoice 4471 is overdue", "Reminder: invoice 4471 overdue"])
+    exact = float(vectors[0] @ vectors[1])
+
+    for mode, size in [("none", 1025), ("float16", 513), ("int8", 261)]:
+        blobs = [quantize(vector, mode) for vector in vectors]
+        assert len(blobs[0]) == size
+        restored = [dequantize(blob) for blob in blobs]
+        assert abs(float(restored[0] @ restored[1]) - exact) < 0.01
+
+    short = truncate(vectors, 64)
+    assert short.shape == (2, 64)
+    assert np.allclose(np.linalg.norm(short, axis=1), 1.0)
+    assert np.allclose(unpack_base64(pack_base64(vectors[0])), vectors[0])
+    with pytest.raises(ValueError):
+        quantize(vectors[0], "int4")
+
+
+def test_cache_stores_quantized_vectors(tmp_path):
+    """Test that the cache serves the same quantized vector before and after a restart"""
+    path = str(tmp_path / "embeddings.sqlite3")
+    fresh = CachedEmbeddingProvider(LocalEmbeddingProvider(dimensions=64), path=path, quantization="int8")(["text"])
+    cached = CachedEmbeddingProvider(CountingProvider(), path=path, quantization="int8")(["text"])
+
+    assert np.array_equal(fresh[0], cached[0])
+
+
+def test_auto_provider_is_local_without_an_api_key(monkeypatch):
+    """Test that deployments without an OpenAI key get local embeddings"""
+    monkeypatch.setattr("backend.services.embedding_provider.settings.OPENAI_API_KEY", "")
+    monkeypatch.setattr("backend.services.embedding_provider.settings.EMBEDDING_CACHE_ENABLED", False)
+
+    provider = create_embedding_provider("auto", dimensions=48)
+
+    assert isinstance(provider, LocalEmbeddingProvider)
+    assert provider.model_name == "local-hashing-48"
+    with pytest.raises(ValueError):
+        create_embedding_provider("unknown")
+
+
+@pytest.mark.asyncio
+async def test_vector_memory_recalls_with_local_embeddings():
+    """Test that vector memory stores and recalls through the local provider"""
+    service = VectorMemoryService()
+    service.embedding_function = LocalEmbeddingProvider()
+    service.client = chromadb.EphemeralClient()
+    service.collection_name = f"test-{uuid.uuid4().hex}"
+    service.collection = service.client.create_collection(
+        name=service.collection_name, embedding_function=service.embedding_function
+    )
+    service.initialized = True
+
+    for content in ["Dentist appointment moved to Thursday", "Quarterly budget review", "Flight to Lisbon booked"]:
+        await service.store_memory(Memory(
+            id=f"memory-{uuid.uuid4()}",
+            type=MemoryType.KNOWLEDGE,
+            content=content,
+            timestamp=1,
+            metadata={"user_id": "u1"},
+        ))
+
+    results = await service.query_memories("When is the dentist appointment?", limit=1, threshold=-1.0, user_id="u1")
+
+    assert results[0].memory.content == "Dentist appointment moved to Thursday"
@@ -0,0 +1,61 @@
+import json
+import numpy as np
+from fastapi.testclient import TestClient
+from backend.ai.handlers import ANALYZE_EMAIL_PROMPT, EmailAnalysis
+from backend.scripts.fake_openai_server import create_app
+
+
+def chat(client, system, user="Subject: Hello\n\nPlease review the report."):
+    return client.post(
+        "/v1/chat/completions",
+        json={
+            "model": "gpt-4",
+            "messages": [
+                {"role": "system", "content": system},
+                {"role": "user", "content": user},
+            ],
+        },
+    )
+
+
+def test_analysis_response_is_deterministic_and_valid():
+    """Test that identical prompts return identical, schema-valid JSON"""
+    client = TestClient(create_app())
+
+    first = chat(client, ANALYZE_EMAIL_PROMPT).json()
+    second = chat(client, ANALYZE_EMAIL_PROMPT).json()
+
+    content = first["choices"][0]["message"]["content"]
+    assert content == second["choices"][0]["message"]["content"]
+    EmailAnalysis(**json.loads(content))
+    assert first["usage"]["total_tokens"] > 0
+
+
+def test_embeddings_are_deterministic_unit_vectors():
+    """Test embeddings per input, honouring the dimensions parameter"""
+    client = TestClient(create_app())
+
+    response = client.post(
+        "/v1/embeddings",
+        json={"model": "text-embedding-3-small", "input": ["a", "b", "a"], "dimensions": 64},
+    )
+    data = response.json()["data"]
+
+    assert [item["index"] for item in data] == [0, 1, 2]
+    assert data[0]["embedding"] == data[2]["embedding"]
+    assert data[0]["embedding"] != data[1]["embedding"]
+    assert len(data[0]["embedding"]) == 64
+    assert abs(np.linalg.norm(data[0]["embedding"]) - 1) < 1e-6
+
+
+def test_rate_limit_returns_429_with_headers():
+    """Test that exceeding the request budget returns an OpenAI-style 429"""
+    client = TestClient(create_app(rpm=1))
+
+    assert chat(client, ANALYZE_EMAIL_PROMPT).status_code == 200
+    response = chat(client, ANALYZE_EMAIL_PROMPT)
+
+    assert response.status_code == 429
+    assert response.headers["x-ratelimit-remaining-requests"] == "0"
+    assert "retry-after" in response.headers
+    assert response.json()["error"]["code"] == "rate_limit_exceeded"
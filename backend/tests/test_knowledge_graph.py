@@ -0,0 +1,409 @@
+import asyncio
+import threading
+
+import pytest
+from backend.models.knowledge_graph import Edge, EdgeType, EmailNode, NodeType, TaskNode
+from backend.services import asti_brain, graph_reasoning, neo4j_driver
+from backend.services.knowledge_graph import Memory, MemoryType, Neo4jService
+from backend.services.memory_graph import InMemoryGraph
+from backend.services.neo4j_service import Neo4jService as GraphService
+from backend.utils.metrics import NEO4J_SESSIONS_IN_USE
+
+
+class FakeResult:
+    def __init__(self, records):
+        self.records = records
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for record in self.records:
+            yield record
+
+
+    async def consume(self):
+        return None
+
+
+class FakeTransaction:
+    def __init__(self, session):
+        self.session = session
+
+    async def run(self, query, parameters):
+        self.session.queries.append((query, parameters))
+        return FakeResult(self.session.records)
+
+
+class FakeSession:
+    def __init__(self, records):
+        self.records = records
+        self.queries = []
+        self.transactions = 0
+        self.closed = False
+
+    async def run(self, query, parameters):
+        self.queries.append((query, parameters))
+        return FakeResult(self.records)
+
+    async def execute_write(self, work):
+        self.transactions += 1
+        return await work(FakeTransaction(self))
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeDriver:
+    def __init__(self, records=None, reachable=True):
+        self.records = records or []
+        self.reachable = reachable
+        self.sessions = []
+
+    def session(self, database=None):
+        session = FakeSession(self.records)
+        self.sessions.append(session)
+        return session
+
+    async def verify_connectivity(self):
+        if not self.reachable:
+            raise ConnectionError("Neo4j unreachable")
+
+
+@pytest.fixture
+def fake_driver(monkeypatch):
+    def install(**kwargs):
+        driver = FakeDriver(**kwargs)
+        monkeypatch.setattr(neo4j_driver, "_driver", driver)
+        return driver
+    return install
+
+
+@pytest.mark.asyncio
+async def test_run_query_sets_timeout_and_returns_the_session(fake_driver, monkeypatch):
+    """Test that queries carry the configured timeout and release their pooled session"""
+    monkeypatch.setattr("backend.services.neo4j_driver.settings.NEO4J_QUERY_TIMEOUT", 2.5)
+    driver = fake_driver(records=[{"n": 1}, {"n": 2}])
+    in_use = NEO4J_SESSIONS_IN_USE._value.get()
+
+    records = await neo4j_driver.run_query("test", "MATCH (n) RETURN n", id="a")
+
+    assert records == [{"n": 1}, {"n": 2}]
+    query, parameters = driver.sessions[0].queries[0]
+    assert query.timeout == 2.5
+    assert parameters == {"id": "a"}
+    assert driver.sessions[0].closed
+    assert NEO4J_SESSIONS_IN_USE._value.get() == in_use
+
+
+@pytest.mark.asyncio
+async def test_services_share_the_driver_and_fall_back_to_mock_mode(fake_driver):
+    """Test that an unreachable server switches the service to mock mode on first use"""
+    driver = fake_driver(reachable=False)
+    service = Neo4jService()
+
+    node_id = await service.create_node(
+        Memory(id="email-1", type=MemoryType.EMAIL, content="Hello", timestamp=1)
+    )
+
+    assert service.driver is driver
+    assert service.mock_mode
+    assert node_id == "email-1"
+    assert driver.sessions == []
+
+
+CLAUSES = ("UNWIND", "MATCH", "OPTIONAL MATCH", "MERGE", "CREATE", "SET", "ON CREATE", "ON MATCH", "WITH", "RETURN")
+
+
+def assert_merge_actions_follow_merge(query):
+    """ON CREATE / ON MATCH are only valid directly after their MERGE"""
+    previous = None
+    for line in query.splitlines():
+        clause = next((c for c in sorted(CLAUSES, key=len, reverse=True) if line.strip().startswith(c + " ")), None)
+        if clause is None:
+            continue
+        if clause in ("ON CREATE", "ON MATCH"):
+            assert previous in ("MERGE", "ON CREATE", "ON MATCH"), f"{clause} after {previous}:\n{query}"
+        previous = clause
+
+
+@pytest.mark.asyncio
+async def test_write_batch_uses_one_transaction_and_one_statement_per_type(fake_driver):
+    """Test that a batch of nodes and edges is written by one UNWIND statement per label"""
+    driver = fake_driver()
+    email = EmailNode(id="email-1", properties={"subject": "Report", "sender": {"email": "a@example.com"}})
+    tasks = [TaskNode(id=f"task-{i}", properties={"title": f"Task {i}"}) for i in range(3)]
+    edges = [
+        Edge(id=f"edge-{i}", type=EdgeType.PART_OF, source_id=task.id, target_id=email.id)
+        for i, task in enumerate(tasks)
+    ]
+
+    await GraphService().write_batch([email] + tasks, edges, user_id="user-1")
+
+    assert len(driver.sessions) == 1
+    session = driver.sessions[0]
+    assert session.transactions == 1
+    assert len(session.queries) == 3
+    assert all("UNWIND $rows" in query for query, _ in session.queries)
+    for query, _ in session.queries:
+        assert_merge_actions_follow_merge(query)
+    rows = {len(parameters["rows"]) for _, parameters in session.queries}
+    assert rows == {1, 3}
+    email_rows = session.queries[0][1]["rows"]
+    assert email_rows[0]["properties"] == '{"subject": "Report", "sender": {"email": "a@example.com"}}'
+
+
+@pytest.mark.asyncio
+async def test_process_email_writes_its_subgraph_once(monkeypatch):
+    """Test that an email, its sender, tasks and emotion state are stored in one batch"""
+    batches = []
+
+    async def analyze_content(content):
+        return {"action_items": ["Send the report", "Book a room"], "stress_level": "HIGH", "priority": "HIGH"}
+
+    async def get_or_create_relationship(user_id, email):
+        return "rel-1"
+
+    async def get_latest_node(user_id, node_type):
+        return None
+
+    async def write_batch(nodes, edges, user_id=None):
+        batches.append((nodes, edges, user_id))
+
+    async def add_memory(**kwargs):
+        return "memory-1"
+
+    monkeypatch.setattr(asti_brain, "analyze_content", analyze_content)
+    monkeypatch.setattr(asti_brain, "add_memory", add_memory)
+    monkeypatch.setattr(asti_brain.knowledge_graph_service, "get_or_create_relationship", get_or_create_relationship)
+    monkeypatch.setattr(asti_brain.knowledge_graph_service, "get_latest_node", get_latest_node)
+    monkeypatch.setattr(asti_brain.knowledge_graph_service, "write_batch", write_batch)
+
+    await asti_brain.ASTIBrain("user-1").process_email(
+        "Please send the report",
+        {"subject": "Report", "sender": {"email": "a@example.com"}}
+    )
+
+    assert len(batches) == 1
+    nodes, edges, user_id = batches[0]
+    assert user_id == "user-1"
+    assert sorted(node.type.value for node in nodes) == ["email", "emotion_state", "task", "task"]
+    assert sorted(edge.type.value for edge in edges) == ["causes", "part_of", "part_of", "sent_by"]
+    assert [edge.target_id for edge in edges if edge.type == EdgeType.SENT_BY] == ["rel-1"]
+
+
+@pytest.mark.asyncio
+async def test_sender_lookup_is_one_merge_then_cached(fake_driver):
+    """Test that a sender resolves with a single MERGE and repeat senders skip the database"""
+    driver = fake_driver(records=[{"id": "rel-1"}])
+    service = GraphService()
+
+    first = await service.get_or_create_relationship("user-1", "Ana@Example.com ")
+    second = await service.get_or_create_relationship("user-1", "ana@example.com")
+
+    assert first == second == "rel-1"
+    assert len(driver.sessions) == 1
+    query, parameters = driver.sessions[0].queries[0]
+    assert "MERGE (n:RELATIONSHIP {user_id: $user_id, email: $email})" in query.text
+    assert_merge_actions_follow_merge(query.text)
+    assert parameters["email"] == "ana@example.com"
+
+    driver.records = [{"deleted": 1, "id": "rel-1"}]
+    await service.delete_node("other")
+    await service.get_or_create_relationship("user-1", "ana@example.com")
+    assert len(driver.sessions) == 3
+
+
+@pytest.fixture
+def memory_service(monkeypatch, tmp_path):
+    monkeypatch.setattr("backend.services.knowledge_graph.settings.KNOWLEDGE_GRAPH_BACKEND", "memory")
+    monkeypatch.setattr(
+        "backend.services.knowledge_graph.settings.KNOWLEDGE_GRAPH_SNAPSHOT_PATH", str(tmp_path / "graph.json")
+    )
+    return Neo4jService
+
+
+async def build_graph(service):
+    for node_id, memory_type in [("a", MemoryType.EMAIL), ("b", MemoryType.TASK),
+                                 ("c", MemoryType.TASK), ("d", MemoryType.KNOWLEDGE)]:
+        await service.create_node(Memory(id=node_id, type=memory_type, content=node_id.upper(), timestamp=1))
+    # a -> d directly is short but weak; a -> b -> c -> d is longer but stronger
+    await service.create_edge("a", "d", "MENTIONS", {"strength": 0.3})
+    await service.create_edge("a", "b", "MENTIONS", {"strength": 0.9})
+    await service.create_edge("b", "c", "FOLLOWS", {"strength": 0.9})
+    await service.create_edge("c", "d", "FOLLOWS", {"strength": 0.8})
+    await service.create_edge("a", "missing", "MENTIONS", {"strength": 1.0})
+
+
+@pytest.mark.asyncio
+async def test_memory_backend_answers_graph_queries(memory_service):
+    """Test that mock mode serves paths, reasoning and relevance from the in-memory graph"""
+    service = memory_service()
+    await build_graph(service)
+
+    assert service.mock_mode
+    assert (await service.get_node("b")).content == "B"
+    related = await service.get_related_nodes("a", min_strength=0.5)
+    assert [node.id for node in related] == ["b"]
+
+    assert [node.id for node in await service.get_path("a", "d")] == ["a", "d"]
+    assert [node.id for node in await service.get_path("a", "d", relationship_types=["FOLLOWS"])] == []
+
+    reasoning = await service.perform_reasoning("a", "d")
+    assert [node.id for node in reasoning.path] == ["a", "b", "c", "d"]
+    assert reasoning.score == pytest.approx(0.9 * 0.9 * 0.8)
+    assert [rel.type for rel in reasoning.relationships] == ["MENTIONS", "FOLLOWS", "FOLLOWS"]
+
+    # Paths to task nodes: a->b (length 1) and a->b->c (length 2)
+    score = await service.calculate_relevance_score("a", "task")
+    assert score == pytest.approx(0.9 + 0.9 * 0.9 / 4)
+
+    await service.delete_node("b")
+    assert (await service.perform_reasoning("a", "d")).score == pytest.approx(0.3)
+
+
+@pytest.mark.asyncio
+async def test_memory_backend_restores_its_snapshot(memory_service):
+    """Test that the in-memory graph is saved on close and loaded by the next service"""
+    service = memory_service()
+    await build_graph(service)
+    await service.close()
+
+    restored = memory_service()
+    assert len(restored.graph) == 4
+    reasoning = await restored.perform_reasoning("a", "d")
+    assert reasoning.score == pytest.approx(0.9 * 0.9 * 0.8)
+
+
+@pytest.mark.asyncio
+async def test_memory_backend_snapshots_off_the_event_loop(memory_service, monkeypatch):
+    """Test that writes schedule the snapshot on a worker thread from a copy of the graph"""
+    monkeypatch.setattr("backend.services.knowledge_graph.settings.KNOWLEDGE_GRAPH_SNAPSHOT_INTERVAL", 0)
+    writes = []
+    monkeypatch.setattr(
+        InMemoryGraph, "write_snapshot",
+        staticmethod(lambda path, snapshot: writes.append((threading.get_ident(), snapshot)))
+    )
+    service = memory_service()
+
+    await service.create_node(Memory(id="a", type=MemoryType.EMAIL, content="A", timestamp=1))
+    assert writes == []
+    # Let the scheduled snapshot copy the graph; the next write must not change that copy
+    await asyncio.sleep(0)
+    await service.create_node(Memory(id="a", type=MemoryType.EMAIL, content="changed", timestamp=1))
+    await service.close()
+
+    assert writes and all(thread != threading.get_ident() for thread, _ in writes)
+    assert writes[0][1]["nodes"][0]["properties"]["content"] == "A"
+    assert writes[-1][1]["nodes"][0]["properties"]["content"] == "changed"
+
+
+@pytest.mark.asyncio
+async def test_strongest_path_respects_its_budget():
+    """Test that best-first search finds the strongest path and stops at its expansion budget"""
+    # A chain 0 -> 1 -> ... -> 9 of strong edges, and a weak shortcut 0 -> 9
+    edges = {str(i): [("NEXT", str(i + 1), None, {"strength": 0.95})] for i in range(9)}
+    edges["0"].append(("SHORTCUT", "9", None, {"strength": 0.1}))
+
+    async def expand(node_ids):
+        return {node_id: edges.get(node_id, []) for node_id in node_ids}
+
+    full = await graph_reasoning.strongest_path(expand, "0", "9", max_length=10)
+    assert full.node_ids == [str(i) for i in range(10)]
+    assert full.strength == pytest.approx(0.95 ** 9)
+    assert not full.truncated
+
+    limited = await graph_reasoning.strongest_path(expand, "0", "9", max_length=10, budget=3)
+    assert limited.node_ids == ["0", "9"]
+    assert limited.truncated
+
+    assert await graph_reasoning.strongest_path(expand, "0", "9", max_length=5, min_strength=0.5) is None
+
+
+@pytest.mark.asyncio
+async def test_search_fetches_frontier_nodes_in_batches():
+    """Test that batched expansion fetches several frontier nodes per call with the same result"""
+    # A root with ten children, each with one task child
+    edges = {"root": [("HAS", f"c{i}", None, {"strength": 0.9 - i * 0.01}) for i in range(10)]}
+    edges.update({f"c{i}": [("HAS", f"t{i}", "task", {"strength": 0.5})] for i in range(10)})
+    calls = []
+
+    async def expand(node_ids):
+        calls.append(node_ids)
+        return {node_id: edges.get(node_id, []) for node_id in node_ids}
+
+    one_by_one = await graph_reasoning.relevance(expand, "root", "task", max_depth=3)
+    assert len(calls) == 21
+
+    calls.clear()
+    batched = await graph_reasoning.relevance(expand, "root", "task", max_depth=3, batch_size=5)
+    assert batched.score == pytest.approx(one_by_one.score)
+    assert batched.top == one_by_one.top
+    assert [len(node_ids) for node_ids in calls][:3] == [1, 5, 5]
+    assert len(calls) < 21
+
+
+@pytest.mark.asyncio
+async def test_neo4j_search_expands_labelled_nodes_per_batch(fake_driver, monkeypatch):
+    """Test that the Neo4j expander matches Memory nodes by id for a whole batch in one query"""
+    driver = fake_driver(records=[
+        {"source_id": "a", "type": "MENTIONS", "id": "b", "target_type": "task", "properties": {"strength": 0.9}},
+        {"source_id": "c", "type": "FOLLOWS", "id": "d", "target_type": "knowledge", "properties": {"strength": 0.5}},
+    ])
+    service = Neo4jService()
+
+    async with neo4j_driver.graph_session() as session:
+        neighbors = await service._neo4j_expander(session, None, 0.2)(["a", "c", "e"])
+
+    assert neighbors == {
+        "a": [("MENTIONS", "b", "task", {"strength": 0.9})],
+        "c": [("FOLLOWS", "d", "knowledge", {"strength": 0.5})],
+        "e": [],
+    }
+    query, parameters = driver.sessions[0].queries[0]
+    assert "UNWIND $node_ids" in query.text and "MATCH (source:Memory {id: node_id})" in query.text
+    assert parameters["node_ids"] == ["a", "c", "e"]
+
+
+@pytest.mark.asyncio
+async def test_relevance_is_cached_until_the_graph_changes(memory_service, monkeypatch):
+    """Test that relevance results are served from cache and invalidated by writes"""
+    service = memory_service()
+    await build_graph(service)
+    searches = []
+    original = graph_reasoning.relevance
+
+    async def counting_relevance(*args, **kwargs):
+        searches.append(args[1:])
+        return await original(*args, **kwargs)
+
+    monkeypatch.setattr("backend.services.knowledge_graph.relevance", counting_relevance)
+
+    first = await service.get_relevance("a", "task")
+    second = await service.get_relevance("a", "task")
+    assert second is first
+    assert [target_id for target_id, _ in first.top] == ["b", "c"]
+    assert len(searches) == 1
+
+    await service.create_edge("a", "c", "MENTIONS", {"strength": 0.5})
+    assert await service.calculate_relevance_score("a", "task") == pytest.approx(first.score + 0.5)
+    assert len(searches) == 2
+
+
+@pytest.mark.asyncio
+async def test_schema_bootstrap_leaves_existing_nodes_to_the_migration(fake_driver):
+    """Test that startup only creates the schema and relabelling touches the node type labels alone"""
+    driver = fake_driver(records=[{"labelled": 0}])
+    service = GraphService()
+
+    await service.ensure_schema()
+    assert all("SET n:" not in session.queries[0][0].text for session in driver.sessions)
+
+    driver.sessions.clear()
+    labelled = await service.label_existing_nodes(batch_size=100)
+
+    queries = [session.queries[0][0].text for session in driver.sessions]
+    assert len(queries) == len(NodeType) and sum(labelled.values()) == 0
+    assert all("MATCH (n)" not in query for query in queries)
+    assert "MATCH (n:USER_PROFILE)" in queries[0] and "LIMIT $batch_size" in queries[0]
+    assert driver.sessions[0].queries[0][1] == {"batch_size": 100}
@@ -0,0 +1,137 @@
+import time
+import uuid
+import chromadb
+import pytest
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+from backend.services.memory_consolidation import MemoryConsolidator, retention_score
+from backend.services.vector_memory import Memory, MemoryType, VectorMemoryService
+from backend.tasks import worker
+
+DAY_MS = 24 * 60 * 60 * 1000
+NOW_MS = int(time.time() * 1000)
+
+
+class LengthEmbedding(EmbeddingFunction):
+    """Offline embedding for summaries stored by the job"""
+
+    def __call__(self, input: Documents) -> Embeddings:
+        return [[float(len(text)), 1.0, 0.0] for text in input]
+
+
+@pytest.fixture
+def service():
+    service = VectorMemoryService()
+    service.embedding_function = LengthEmbedding()
+    service.client = chromadb.EphemeralClient()
+    service.collection_name = f"test-{uuid.uuid4().hex}"
+    service.collection = service.client.create_collection(
+        name=service.collection_name, embedding_function=service.embedding_function
+    )
+    service.initialized = True
+    return service
+
+
+def memory(content, embedding, age_days=0, importance=0.5, memory_type=MemoryType.EMAIL):
+    return Memory(
+        id=f"memory-{uuid.uuid4()}",
+        type=memory_type,
+        content=content,
+        timestamp=NOW_MS - int(age_days * DAY_MS),
+        metadata={"user_id": "u1", "importance": importance},
+        embedding=embedding,
+    )
+
+
+@pytest.mark.asyncio
+async def test_dry_run_reports_without_writing(service):
+    """Test that a dry run makes the same decisions but leaves the store untouched"""
+    original = memory("Weekly newsletter", [1.0, 0.0, 0.0], importance=0.2)
+    resend = memory("Weekly newsletter!", [0.999, 0.01, 0.0], age_days=1, importance=0.2)
+    await service.store_memories([original, resend])
+
+    report = await MemoryConsolidator(service).consolidate_user("u1", dry_run=True)
+
+    assert report.merged[0].kept == original.id
+    assert report.merged[0].removed == [resend.id]
+    assert report.remaining == 1
+    assert len(await service.get_memories(user_id="u1")) == 2
+
+
+@pytest.mark.asyncio
+async def test_merges_near_duplicates_keeping_the_most_important(service):
+    """Test near-duplicate merging within a type"""
+    keeper = memory("Invoice 17 is overdue", [1.0, 0.0, 0.0], importance=0.9)
+    duplicate = memory("Invoice 17 is overdue (re-analyzed)", [0.99, 0.05, 0.0], importance=0.4)
+    other_type = memory("Invoice 17 task", [1.0, 0.0, 0.0], memory_type=MemoryType.TASK)
+    unrelated = memory("Team lunch", [0.0, 1.0, 0.0])
+    await service.store_memories([keeper, duplicate, other_type, unrelated])
+
+    report = await MemoryConsolidator(service).consolidate_user("u1")
+
+    assert [(g.kept, g.removed) for g in report.merged] == [(keeper.id, [duplicate.id])]
+    stored = {m.id: m for m in await service.get_memories(user_id="u1")}
+    assert set(stored) == {keeper.id, other_type.id, unrelated.id}
+    assert stored[keeper.id].metadata["merged_count"] == 2
+    assert stored[keeper.id].content == "Invoice 17 is overdue"
+
+
+@pytest.mark.asyncio
+async def test_rolls_up_old_low_importance_memories(service, monkeypatch):
+    """Test that old unimportant memories are replaced by one summary per period"""
+    monkeypatch.setattr("backend.services.memory_consolidation.settings.MEMORY_ROLLUP_PERIOD", "month")
+    # Orthogonal embeddings so the old memories are not merged as duplicates first
+    old = [
+        memory(f"Promo email {i}. Details follow.", [float(i == j) for j in range(3)], age_days=120, importance=0.1)
+        for i in range(3)
+    ]
+    recent = memory("Contract signed", [1.0, 1.0, 0.0], importance=0.1)
+    important = memory("Passport renewal", [1.0, 0.0, 1.0], age_days=120, importance=0.9)
+    await service.store_memories(old + [recent, important])
+
+    report = await MemoryConsolidator(service).consolidate_user("u1")
+
+    assert len(report.summaries) == 1
+    assert set(report.summaries[0].source_ids) == {m.id for m in old}
+    stored = {m.id: m for m in await service.get_memories(user_id="u1")}
+    assert set(stored) == {recent.id, important.id, report.summaries[0].id}
+    summary = stored[report.summaries[0].id]
+    assert summary.metadata["rollup"] is True
+    assert "Promo email 0." in summary.content
+
+
+@pytest.mark.asyncio
+async def test_evicts_lowest_retention_over_budget(service, monkeypatch):
+    """Test eviction by importance and age under the per-user budget"""
+    monkeypatch.setattr("backend.services.memory_consolidation.settings.MEMORY_USER_BUDGET", 2)
+    monkeypatch.setattr("backend.services.memory_consolidation.settings.MEMORY_ROLLUP_MAX_IMPORTANCE", 0.0)
+    fresh = memory("Fresh", [1.0, 0.0, 0.0], importance=0.5)
+    stale = memory("Stale", [0.0, 1.0, 0.0], age_days=365, importance=0.5)
+    vital = memory("Vital", [0.0, 0.0, 1.0], age_days=365, importance=1.0)
+    await service.store_memories([fresh, stale, vital])
+
+    report = await MemoryConsolidator(service).consolidate_user("u1")
+
+    assert retention_score(stale, NOW_MS) < retention_score(vital, NOW_MS)
+    assert report.evicted == [stale.id]
+    assert {m.id for m in await service.get_memories(user_id="u1")} == {fresh.id, vital.id}
+
+
+def test_scheduled_job_matches_both_user_id_forms(service, monkeypatch):
+    """Test that the beat task consolidates memories stored under the integer id and under its string"""
+    monkeypatch.setattr("backend.services.vector_memory.settings.VECTOR_MEMORY_SHARDING", "none")
+    monkeypatch.setattr(worker, "memory_consolidator", MemoryConsolidator(service))
+    # The memory routes store the user's integer id, ASTI its string
+    from_routes = memory("Weekly newsletter", [1.0, 0.0, 0.0], importance=0.2)
+    from_routes.metadata["user_id"] = 5
+    from_asti = memory("Weekly newsletter!", [0.999, 0.01, 0.0], age_days=1, importance=0.2)
+    from_asti.metadata["user_id"] = "5"
+    other = memory("Weekly newsletter", [1.0, 0.0, 0.0])
+    other.metadata["user_id"] = 6
+    worker.run_async(service.store_memories([from_routes, from_asti, other]))
+
+    reports = worker.consolidate_memories(user_id=5)
+
+    assert reports["5"]["scanned"] == 2
+    assert reports["5"]["merged"][0]["removed"] == [from_asti.id]
+    assert {m.id for m in worker.run_async(service.get_memories(user_id="5"))} == {from_routes.id}
+    assert {m.id for m in worker.run_async(service.get_memories(user_id=6))} == {other.id}
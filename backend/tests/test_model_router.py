@@ -0,0 +1,114 @@
+import pytest
+from unittest.mock import patch
+from backend.services.model_router import (
+    ModelRouter,
+    TIER_PREMIUM,
+    TIER_SKIP,
+    TIER_STANDARD,
+    heuristic_summary,
+)
+
+
+@pytest.fixture
+def router():
+    return ModelRouter(
+        enabled=True,
+        standard_model="gpt-3.5-turbo",
+        premium_model="gpt-4-turbo",
+        skip_automated=True,
+        long_email_chars=500,
+        urgent_word_threshold=1,
+        sender_stress_ratio=0.5,
+        sender_min_history=3,
+    )
+
+
+@pytest.fixture(autouse=True)
+def audit_log():
+    with patch("backend.services.model_router.log_routing_decision") as log:
+        yield log
+
+
+def test_routine_email_uses_standard_model(router):
+    """Test that calm, short mail goes to the standard model"""
+    decision = router.route("analyze_email", "Hi, thanks for the notes from today.")
+
+    assert decision.tier == TIER_STANDARD
+    assert decision.model == "gpt-3.5-turbo"
+
+
+def test_urgent_email_escalates(router):
+    """Test that urgent wording escalates to the premium model"""
+    decision = router.route("analyze_email", "Please fix this ASAP, the client is waiting.")
+
+    assert decision.tier == TIER_PREMIUM
+    assert "urgent_words" in decision.reasons
+
+
+def test_long_email_escalates(router):
+    """Test that long mail escalates to the premium model"""
+    decision = router.route("analyze_email", "word " * 200)
+
+    assert decision.tier == TIER_PREMIUM
+    assert "long_email" in decision.reasons
+
+
+def test_stressful_sender_history_escalates(router):
+    """Test that a sender with mostly high-stress history escalates"""
+    decision = router.route(
+        "analyze_email",
+        "Can we talk tomorrow?",
+        sender={"email": "boss@example.com"},
+        sender_history={"email_count": 4, "high_stress_count": 3},
+    )
+
+    assert decision.tier == TIER_PREMIUM
+    assert "stressful_sender" in decision.reasons
+
+
+def test_newsletter_skips_llm(router):
+    """Test that automated mail without triggers skips the LLM"""
+    decision = router.route(
+        "analyze_email",
+        "This week's product news.\nClick here to unsubscribe.",
+        sender={"email": "newsletter@shop.example"},
+    )
+
+    assert decision.tier == TIER_SKIP
+    assert decision.model is None
+
+
+def test_automated_mail_with_triggers_is_not_skipped(router):
+    """Test that automated mail mentioning a deadline still reaches a model"""
+    decision = router.route(
+        "analyze_email",
+        "Your invoice deadline is Friday. Do not reply to this email.",
+        sender={"email": "no-reply@billing.example"},
+    )
+
+    assert decision.tier != TIER_SKIP
+
+
+def test_disabled_router_uses_premium_model(router):
+    """Test that a disabled router always uses the configured premium model"""
+    router.enabled = False
+    decision = router.route("analyze_email", "Hello")
+
+    assert decision.tier == TIER_PREMIUM
+    assert decision.model == "gpt-4-turbo"
+
+
+def test_every_decision_is_audited(router, audit_log):
+    """Test that decisions are written to the audit log without email text"""
+    router.route("analyze_email", "Secret plans for Friday", email_id=7)
+
+    record = audit_log.call_args.args[0]
+    assert record["call_site"] == "analyze_email"
+    assert record["email_id"] == 7
+    assert "content_sha256" in record
+    assert "Secret plans" not in str(record)
+
+
+def test_heuristic_summary_uses_first_line():
+    """Test the local summary used when the LLM is skipped"""
+    assert heuristic_summary("\n  Weekly digest  \nMore text") == "Weekly digest"
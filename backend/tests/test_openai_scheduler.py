@@ -0,0 +1,155 @@
+import asyncio
+import time
+import httpx
+import openai
+import pytest
+from openai import AsyncOpenAI
+from backend.scripts.fake_openai_server import create_app
+from backend.services.openai_scheduler import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    ModelBudget,
+    OpenAIScheduler,
+    parse_reset_duration,
+    run_with_priority,
+)
+
+
+def make_scheduler(limits, max_retries=3):
+    scheduler = OpenAIScheduler(limits=limits, enabled=True, max_retries=max_retries, poll_interval=0.005)
+    scheduler._backoff = lambda attempt: 0.01
+    return scheduler
+
+
+def rate_limit_error(model="gpt-4"):
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions", json={"model": model})
+    response = httpx.Response(429, request=request, json={"error": {"message": "slow down"}})
+    return openai.RateLimitError("slow down", response=response, body=None)
+
+
+def test_parse_reset_duration():
+    """Test OpenAI's reset duration formats"""
+    assert parse_reset_duration("20ms") == pytest.approx(0.02)
+    assert parse_reset_duration("1.5s") == pytest.approx(1.5)
+    assert parse_reset_duration("6m0s") == pytest.approx(360)
+    assert parse_reset_duration("7") == pytest.approx(7)
+    assert parse_reset_duration(None) is None
+
+
+def test_budget_waits_for_request_and_token_windows():
+    """Test that RPM and TPM windows delay requests until the oldest entry expires"""
+    budget = ModelBudget(rpm=2, tpm=1000)
+    budget.record(100, now=0)
+    budget.record(100, now=10)
+
+    assert budget.wait_time(100, now=20) == pytest.approx(40)
+
+    budget = ModelBudget(rpm=100, tpm=1000)
+    budget.record(600, now=0)
+    budget.record(300, now=30)
+
+    assert budget.wait_time(200, now=40) == pytest.approx(20)
+    assert budget.wait_time(100, now=40) == 0
+    # Larger than the whole budget: runs once the window is empty
+    assert budget.wait_time(5000, now=95) == 0
+
+
+def test_budget_adopts_rate_limit_headers():
+    """Test that server-reported limits and exhausted quotas are applied"""
+    budget = ModelBudget(rpm=500, tpm=30000)
+    headers = httpx.Headers({
+        "x-ratelimit-limit-requests": "3",
+        "x-ratelimit-remaining-requests": "0",
+        "x-ratelimit-reset-requests": "2s",
+    })
+
+    budget.update_from_headers(headers, 200, now=100)
+
+    assert budget.rpm == 3
+    assert budget.wait_time(1, now=101) == pytest.approx(1)
+
+
+@pytest.mark.asyncio
+async def test_interactive_requests_jump_the_background_queue():
+    """Test that queued interactive work is admitted before queued background work"""
+    scheduler = make_scheduler({"default": {"rpm": 1000, "tpm": 1000000}})
+    scheduler.budget("gpt-4").block(0.05, now=time.monotonic())
+    order = []
+
+    async def call(name):
+        order.append(name)
+        return name
+
+    background = [
+        asyncio.create_task(run_with_priority(scheduler.run("gpt-4", 10, lambda n=n: call(n)), PRIORITY_BACKGROUND))
+        for n in ("bg1", "bg2")
+    ]
+    await asyncio.sleep(0.01)
+    interactive = asyncio.create_task(
+        scheduler.run("gpt-4", 10, lambda: call("ui"), priority=PRIORITY_INTERACTIVE)
+    )
+    await asyncio.gather(*background, interactive)
+
+    assert order == ["ui", "bg1", "bg2"]
+    assert scheduler.queue_depth("gpt-4") == 0
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_request_is_requeued_and_usage_reconciled():
+    """Test that a 429 is retried through the queue and usage replaces the estimate"""
+    scheduler = make_scheduler({"default": {"rpm": 1000, "tpm": 1000000}})
+    attempts = 0
+
+    class Usage:
+        total_tokens = 42
+
+    class Result:
+        usage = Usage()
+
+    async def request():
+        nonlocal attempts
+        attempts += 1
+        if attempts == 1:
+            raise rate_limit_error()
+        return Result()
+
+    result = await scheduler.run("gpt-4", 500, request)
+
+    assert isinstance(result, Result)
+    assert attempts == 2
+    assert [event[1] for event in scheduler.budget("gpt-4").events] == [500, 42]
+
+
+@pytest.mark.asyncio
+async def test_gives_up_after_max_retries():
+    """Test that persistent rate limiting surfaces the error"""
+    scheduler = make_scheduler({"default": {"rpm": 1000, "tpm": 1000000}}, max_retries=1)
+
+    async def request():
+        raise rate_limit_error()
+
+    with pytest.raises(openai.RateLimitError):
+        await scheduler.run("gpt-4", 10, request)
+
+
+@pytest.mark.asyncio
+async def test_learns_limits_from_live_responses():
+    """Test that the httpx hook reads rate-limit headers from real responses"""
+    scheduler = make_scheduler({"default": {"rpm": 1000, "tpm": 1000000}})
+    http_client = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=create_app(rpm=5)),
+        event_hooks={"response": [scheduler._on_response]},
+    )
+    client = AsyncOpenAI(api_key="test", base_url="http://fake/v1", max_retries=0, http_client=http_client)
+
+    response = await scheduler.run(
+        "gpt-3.5-turbo",
+        50,
+        lambda: client.chat.completions.create(
+            model="gpt-3.5-turbo", messages=[{"role": "user", "content": "hello"}]
+        ),
+    )
+    await http_client.aclose()
+
+    assert response.choices[0].message.content
+    assert scheduler.budget("gpt-3.5-turbo").rpm == 5
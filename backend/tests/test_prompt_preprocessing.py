@@ -0,0 +1,79 @@
+from backend.services.prompt_preprocessing import (
+    clean_email_text,
+    count_tokens,
+    preprocess_text,
+)
+
+REPLY_CHAIN = """Hi Sam,
+
+Friday works for me. Details: https://tracker.example.com/c/abc123?utm_source=mail&utm_campaign=x
+
+Thanks,
+Alex
+--
+Alex Smith | Product Lead
++1 555 0100
+
+This email and any attachments are confidential and intended solely for the
+addressee. If you have received this email in error please notify the sender.
+
+On Tue, 3 Jan 2024 at 10:00, Sam Jones <sam@example.com> wrote:
+> Can we meet on Friday?
+> Let me know.
+"""
+
+
+def test_strips_quotes_signature_and_disclaimer():
+    """Test that quoted history, signature and disclaimer are removed"""
+    cleaned = clean_email_text(REPLY_CHAIN)
+
+    assert "Friday works for me" in cleaned
+    assert "Can we meet" not in cleaned
+    assert "Product Lead" not in cleaned
+    assert "confidential" not in cleaned
+    assert "[link: tracker.example.com]" in cleaned
+    assert "utm_source" not in cleaned
+
+
+def test_outlook_reply_header_and_inline_quotes():
+    """Test Outlook-style headers and stray quoted lines"""
+    text = "Sounds good.\n> earlier line\n\nFrom: Sam\nSent: Monday\nSubject: Plan\n\nOld text"
+
+    assert clean_email_text(text) == "Sounds good."
+
+
+def test_html_is_reduced_to_text():
+    """Test that HTML boilerplate is stripped to visible text"""
+    text = "<html><head><style>p{color:red}</style></head><body><p>Hello&nbsp;there</p><br>Bye</body></html>"
+
+    cleaned = clean_email_text(text)
+
+    assert "color" not in cleaned
+    assert "Hello" in cleaned and "there" in cleaned and "Bye" in cleaned
+    assert "<" not in cleaned
+
+
+def test_quote_only_email_keeps_content():
+    """Test that an email consisting only of quoted text is not emptied"""
+    assert clean_email_text("> only a quote") != ""
+
+
+def test_truncates_to_budget_and_reports_savings():
+    """Test token budget truncation and savings accounting"""
+    text = "word " * 2000
+
+    result = preprocess_text(text, "test", max_tokens=100)
+
+    assert result.truncated
+    assert result.tokens <= 100
+    assert result.tokens_saved == result.original_tokens - result.tokens
+    assert count_tokens(result.text) <= 100
+
+
+def test_short_clean_text_is_unchanged():
+    """Test that already-clean text passes through"""
+    result = preprocess_text("Please review the report.", "test")
+
+    assert result.text == "Please review the report."
+    assert not result.truncated
+    assert result.tokens_saved == 0
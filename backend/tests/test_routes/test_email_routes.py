@@ -25,10 +25,11 @@ def test_create_email(client, test_user):
         headers={"Authorization": f"Bearer {test_user.create_access_token()}"},
     )
 
-    assert response.status_code == 200
+    assert response.status_code == 202
     data = response.json()
     assert "id" in data
     assert data["subject"] == "Test Email"
+    assert "job_id" in data
 
 
 def test_analyze_email(client, test_user, test_email):
@@ -58,3 +59,18 @@ def test_generate_reply(client, test_user, test_email):
     assert "content" in data
     assert "tone" in data
     assert "formality_level" in data
+
+
+def test_stream_reply(client, test_user, test_email):
+    """Test streamed reply generation over Server-Sent Events"""
+    response = client.post(
+        f"/api/emails/{test_email.id}/reply/stream",
+        params={"tone": "professional"},
+        headers={"Authorization": f"Bearer {test_user.create_access_token()}"},
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert "event: token" in response.text
+    assert "event: done" in response.text
+    assert '"formality_level"' in response.text
@@ -0,0 +1,194 @@
+import asyncio
+import pytest
+from unittest.mock import MagicMock
+from backend.services.single_flight import SingleFlight
+
+
+class FakeRedis:
+    """Minimal Redis stand-in supporting the calls SingleFlight makes"""
+
+    def __init__(self):
+        self.store = {}
+
+    def set(self, key, value, nx=False, px=None):
+        if nx and key in self.store:
+            return None
+        self.store[key] = value
+        return True
+
+    def exists(self, key):
+        return int(key in self.store)
+
+    def eval(self, script, numkeys, key, token):
+        if self.store.get(key) == token:
+            del self.store[key]
+            return 1
+        return 0
+
+
+@pytest.fixture
+def remote():
+    """CacheService stand-in shared by several SingleFlight instances (workers)"""
+    redis = FakeRedis()
+    service = MagicMock()
+    service.get_cache.return_value = redis
+    service.cache_key.side_effect = lambda namespace, key: f"{namespace}:{key}"
+    service.get.side_effect = lambda namespace, key: redis.store.get(f"{namespace}:{key}")
+    service.set.side_effect = lambda namespace, key, value, expire=3600: redis.set(
+        f"{namespace}:{key}", value
+    )
+    return service
+
+
+def make_flight(remote, distributed=True):
+    return SingleFlight(
+        remote=remote,
+        enabled=True,
+        distributed=distributed,
+        lock_ttl_ms=2000,
+        poll_interval_ms=5,
+        result_ttl=30,
+    )
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_calls_share_one_request(remote):
+    """Test that concurrent callers with the same key make one request"""
+    flight = make_flight(remote, distributed=False)
+    calls = 0
+
+    async def request():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"answer": 42}
+
+    results = await asyncio.gather(*(flight.do("key", request) for _ in range(5)))
+
+    assert calls == 1
+    assert all(r == {"answer": 42} for r in results)
+
+
+@pytest.mark.asyncio
+async def test_different_keys_are_not_shared(remote):
+    """Test that distinct requests run independently"""
+    flight = make_flight(remote, distributed=False)
+    calls = []
+
+    async def request(name):
+        calls.append(name)
+        return name
+
+    results = await asyncio.gather(
+        flight.do("a", lambda: request("a")), flight.do("b", lambda: request("b"))
+    )
+
+    assert sorted(calls) == ["a", "b"]
+    assert results == ["a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_waiting_callers(remote):
+    """Test that a failed request raises in every caller sharing it"""
+    flight = make_flight(remote, distributed=False)
+
+    async def request():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("API Error")
+
+    results = await asyncio.gather(
+        flight.do("key", request), flight.do("key", request), return_exceptions=True
+    )
+
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+@pytest.mark.asyncio
+async def test_followers_retry_when_the_leader_is_cancelled(remote):
+    """Test that cancelling the leader does not cancel the callers sharing its request"""
+    flight = make_flight(remote, distributed=False)
+    calls = 0
+
+    async def request():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return calls
+
+    leader = asyncio.ensure_future(flight.do("key", request))
+    await asyncio.sleep(0)
+    followers = [asyncio.ensure_future(flight.do("key", request)) for _ in range(3)]
+    await asyncio.sleep(0.01)
+    leader.cancel()
+
+    results = await asyncio.gather(*followers)
+
+    assert leader.cancelled()
+    assert results == [2, 2, 2]
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+async def test_workers_share_result_through_redis(remote):
+    """Test that a second worker reads the leader's published result"""
+    leader, follower = make_flight(remote), make_flight(remote)
+    calls = 0
+
+    async def request():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return {"answer": 42}
+
+    results = await asyncio.gather(
+        leader.do("key", request, serialize=dict, deserialize=dict),
+        follower.do("key", request, serialize=dict, deserialize=dict),
+    )
+
+    assert calls == 1
+    assert results == [{"answer": 42}, {"answer": 42}]
+    assert not any(k.startswith("singleflight:lock") for k in remote.get_cache().store)
+
+
+@pytest.mark.asyncio
+async def test_follower_retries_when_leader_fails(remote):
+    """Test that a waiting worker makes the request itself if the leader fails"""
+    leader, follower = make_flight(remote), make_flight(remote)
+
+    async def failing():
+        await asyncio.sleep(0.02)
+        raise RuntimeError("API Error")
+
+    async def succeeding():
+        return {"answer": 42}
+
+    results = await asyncio.gather(
+        leader.do("key", failing, serialize=dict, deserialize=dict),
+        follower.do("key", succeeding, serialize=dict, deserialize=dict),
+        return_exceptions=True,
+    )
+
+    assert isinstance(results[0], RuntimeError)
+    assert results[1] == {"answer": 42}
+
+
+@pytest.mark.asyncio
+async def test_follower_rereads_result_after_lock_is_released(remote):
+    """Test that a result published between the follower's two reads is still used"""
+    follower = make_flight(remote)
+    redis = remote.get_cache()
+    redis.store["singleflight:lock:key"] = "leader-token"
+
+    def get_then_finish(namespace, key):
+        value = redis.store.get(f"{namespace}:{key}")
+        # The leader publishes and releases right after the follower's first read
+        redis.store[f"{namespace}:{key}"] = {"answer": 42}
+        redis.store.pop("singleflight:lock:key", None)
+        return value
+
+    remote.get.side_effect = get_then_finish
+
+    async def request():
+        raise AssertionError("follower must not repeat the request")
+
+    assert await follower.do("key", request, serialize=dict, deserialize=dict) == {"answer": 42}
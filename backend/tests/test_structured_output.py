@@ -0,0 +1,127 @@
+import httpx
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+from openai import AsyncOpenAI
+from backend.ai.handlers import AIHandler, EmailAnalysis
+from backend.models.email import StressLevel
+from backend.scripts.fake_openai_server import create_app
+from backend.services import openai_service
+from backend.services.single_flight import single_flight
+from backend.services.structured_output import (
+    ContentAnalysis,
+    EmailSummary,
+    StructuredOutputError,
+    parse_function_call,
+    strict_json_schema,
+)
+
+
+def tool_response(name, arguments):
+    tool_call = SimpleNamespace(function=SimpleNamespace(name=name, arguments=arguments))
+    message = SimpleNamespace(content=None, tool_calls=[tool_call])
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+@pytest.fixture
+def no_cache(monkeypatch):
+    """Keep analyses out of the shared cache and requests out of Redis"""
+    monkeypatch.setattr(single_flight, "distributed", False)
+    monkeypatch.setattr(openai_service.analysis_cache, "get", lambda *args: None)
+    monkeypatch.setattr(openai_service.analysis_cache, "set", lambda *args, **kwargs: None)
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    """OpenAI client wired to the in-process fake server, recording requests"""
+    requests = []
+
+    async def record(request):
+        requests.append(request)
+
+    http_client = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=create_app()),
+        event_hooks={"request": [record]},
+    )
+    client = AsyncOpenAI(api_key="test", base_url="http://fake/v1", max_retries=0, http_client=http_client)
+    # Replace get_client itself: the autouse conftest fixture patches it with a mock
+    monkeypatch.setattr(openai_service, "get_client", lambda: client)
+    return requests
+
+
+def test_strict_schema_closes_objects_and_drops_excluded_fields():
+    """Test the schema shape strict function calling requires"""
+    schema = strict_json_schema(ContentAnalysis, exclude=["reply_options"])
+
+    assert schema["additionalProperties"] is False
+    assert set(schema["required"]) == set(schema["properties"])
+    assert "reply_options" not in schema["properties"]
+    assert "maximum" not in schema["properties"]["sentiment_score"]
+
+    action = strict_json_schema(EmailSummary)["$defs"]["SuggestedAction"]
+    assert action["additionalProperties"] is False
+    assert "deadline" in action["required"]
+
+
+def test_invalid_function_arguments_raise():
+    """Test that malformed or missing function calls are reported, not retried"""
+    with pytest.raises(StructuredOutputError):
+        parse_function_call(tool_response("record_analysis", "{not json"), "record_analysis", ContentAnalysis)
+
+    message = SimpleNamespace(content="plain text", tool_calls=None)
+    response = SimpleNamespace(choices=[SimpleNamespace(message=message)])
+    with pytest.raises(StructuredOutputError):
+        parse_function_call(response, "record_analysis", ContentAnalysis)
+
+
+@pytest.mark.asyncio
+async def test_simplified_version_and_reply_options_in_one_request(fake_client, no_cache):
+    """Test that cognitive-load reduction and reply drafting need a single completion"""
+    analysis = await openai_service.analyze_content(
+        "Subject: Report\n\nPlease review the report by Friday.",
+        context={"simplify_language": True, "tone_options": ["professional", "friendly"]},
+    )
+
+    assert len(fake_client) == 1
+    assert analysis["stress_level"] in {"LOW", "MEDIUM", "HIGH"}
+    assert analysis["simplified_version"]
+    assert analysis["reply_options"][0]["content"]
+
+
+@pytest.mark.asyncio
+async def test_optional_sections_are_not_requested_by_default(fake_client, no_cache):
+    """Test that the schema only asks for the sections the caller needs"""
+    analysis = await openai_service.analyze_content("Please review the report.")
+
+    assert len(fake_client) == 1
+    assert "simplified_version" not in analysis
+    assert "reply_options" not in analysis
+
+
+@pytest.mark.asyncio
+async def test_email_summary_uses_one_request(fake_client, no_cache):
+    """Test that the ASTI summary is parsed from the function call without a fallback request"""
+    summary = await openai_service.get_email_summary_and_suggestion(
+        "Hi, can you send the budget numbers by Thursday? Thanks, Sam", {}
+    )
+
+    assert len(fake_client) == 1
+    assert summary["suggested_actions"][0]["steps"]
+    assert "error" not in summary
+
+
+@pytest.mark.asyncio
+async def test_analyze_email_invalid_output_degrades_instead_of_500(no_cache):
+    """Test that invalid model output returns a local analysis rather than raising"""
+    handler = AIHandler(testing=True)
+    handler.testing = False
+    handler.client = AsyncMock()
+    handler.client.chat.completions.create.return_value = tool_response(
+        "record_email_analysis", '{"summary": "cut off'
+    )
+
+    result = await handler.analyze_email("Can we move the review to Thursday afternoon?")
+
+    assert isinstance(result, EmailAnalysis)
+    assert result.stress_level == StressLevel.MEDIUM
+    assert result.summary
@@ -1,10 +1,11 @@
 import pytest
 from datetime import datetime, timedelta
 from sqlalchemy import func
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 from backend.models.email import Email, StressLevel, Priority
 from backend.models.user import User, UserPreferences
-from backend.tasks.worker import process_email, cleanup_old_emails, update_email_analytics
+from backend.tasks.worker import process_email, cleanup_old_emails, update_email_analytics, analyze_email_task
+from backend.ai.handlers import EmailAnalysis
 from backend.database import SessionLocal
 import uuid
 
@@ -82,6 +83,33 @@ def test_process_email(mock_analyze, db, test_user, test_emails, mock_analysis):
     assert email.action_items == mock_analysis["action_items"]
     assert email.sentiment_score == mock_analysis["sentiment_score"]
 
+@patch("backend.tasks.worker.get_db_session")
+@patch("backend.tasks.worker.AIHandler")
+def test_analyze_email_task(mock_handler, mock_session, db, test_user, test_emails):
+    """Test the queued analysis job stores results on the email"""
+    # The task closes its session when done, so it gets its own rather than the test's
+    mock_session.side_effect = SessionLocal
+    mock_handler.return_value.analyze_email = AsyncMock(return_value=EmailAnalysis(
+        summary="Test summary",
+        stress_level=StressLevel.HIGH,
+        priority=Priority.HIGH,
+        action_items=["Test action"],
+        sentiment_score=-0.5
+    ))
+    mock_handler.return_value.close = AsyncMock()
+    email = test_emails[0]
+    email.is_processed = False
+    db.commit()
+    
+    result = analyze_email_task.apply(args=[email.id]).get()
+    
+    db.refresh(email)
+    assert result == {"email_id": email.id, "status": "completed"}
+    assert email.is_processed is True
+    assert email.summary == "Test summary"
+    assert email.action_items == ["Test action"]
+    mock_handler.return_value.close.assert_awaited_once()
+
 def test_process_email_not_found(db):
     """Test processing non-existent email"""
     with pytest.raises(ValueError, match="Email not found"):
@@ -0,0 +1,493 @@
+import asyncio
+import hashlib
+import time
+import uuid
+import chromadb
+import numpy as np
+import pytest
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from types import SimpleNamespace
+from backend.routes import vector_memory_routes
+from backend.services.auth_service import get_current_user
+from backend.services.embedding_codec import unpack_base64
+from backend.services.lexical_index import BM25Index, reciprocal_rank_fusion, tokenize
+from backend.services.passage_chunker import chunk_text, parent_of, passage_id
+from backend.services.vector_memory import Memory, MemoryType, VectorMemoryService
+from backend.utils.executor import BoundedExecutor
+
+
+class HashEmbedding(EmbeddingFunction):
+    """Deterministic offline embedding, optionally slow like a remote API"""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+
+    def __call__(self, input: Documents) -> Embeddings:
+        time.sleep(self.delay)
+        return [
+            np.frombuffer(hashlib.sha256(text.encode()).digest(), dtype=np.uint8).astype(np.float32)
+            for text in input
+        ]
+
+
+def make_service(delay: float = 0.0) -> VectorMemoryService:
+    service = VectorMemoryService()
+    service.embedding_function = HashEmbedding(delay)
+    service.client = chromadb.EphemeralClient()
+    # Ephemeral clients share one in-process store, so shard names must be unique per test
+    service.collection_name = f"test-{uuid.uuid4().hex}"
+    service.collection = service.client.create_collection(
+        name=service.collection_name, embedding_function=service.embedding_function
+    )
+    service.initialized = True
+    return service
+
+
+def memory(content: str, timestamp: int = 1, user_id: str = "u1") -> Memory:
+    return Memory(
+        id=f"memory-{uuid.uuid4()}",
+        type=MemoryType.KNOWLEDGE,
+        content=content,
+        timestamp=timestamp,
+        metadata={"user_id": user_id},
+    )
+
+
+@pytest.mark.asyncio
+async def test_store_query_get_delete_roundtrip():
+    """Test that memory operations work through the executor"""
+    service = make_service()
+    stored = await service.store_memory(memory("Quarterly report is due Friday"))
+    await service.store_memory(memory("Lunch with Sam", timestamp=2))
+
+    results = await service.query_memories("Quarterly report is due Friday", threshold=-1, user_id="u1")
+    assert results[0].memory.id == stored.id
+
+    memories = await service.get_memories(where={"user_id": "u1"})
+    assert [m.content for m in memories] == ["Lunch with Sam", "Quarterly report is due Friday"]
+
+    await service.delete_memories(where={"user_id": "u1"})
+    assert await service.get_memories(user_id="u1") == []
+
+
+@pytest.mark.asyncio
+async def test_slow_chroma_calls_do_not_block_the_event_loop():
+    """Test that the event loop keeps running while an embedding call is in flight"""
+    service = make_service(delay=0.3)
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    task = asyncio.create_task(ticker())
+    await service.store_memory(memory("Slow to embed"))
+    task.cancel()
+
+    assert ticks >= 10
+
+
+@pytest.mark.asyncio
+async def test_bounded_executor_limits_concurrency():
+    """Test that no more than max_workers calls run at once"""
+    executor = BoundedExecutor("test", max_workers=2, max_pending=2)
+    running = 0
+    peak = 0
+
+    def work():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        time.sleep(0.05)
+        running -= 1
+        return True
+
+    results = await asyncio.gather(*(executor.run("work", work) for _ in range(6)))
+    executor.shutdown()
+
+    assert all(results)
+    assert peak <= 2
+
+
+class CountingEmbedding(HashEmbedding):
+    """Counts embedding calls and fails on texts containing "poison" """
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def __call__(self, input: Documents) -> Embeddings:
+        self.calls.append(len(input))
+        if any("poison" in text for text in input):
+            raise ValueError("cannot embed")
+        return super().__call__(input)
+
+
+@pytest.mark.asyncio
+async def test_store_memories_batches_and_reports_partial_failures(monkeypatch):
+    """Test batched embedding and per-item results when some items fail"""
+    monkeypatch.setattr("backend.services.vector_memory.settings.EMBEDDING_BATCH_MAX_SIZE", 3)
+    service = make_service()
+    service.embedding_function = CountingEmbedding()
+    items = [memory(f"Email number {i}", timestamp=i) for i in range(5)]
+    items.append(memory("poison pill"))
+    items.append(Memory(**{**items[0].dict(), "content": "Same id again"}))
+    items.append(memory(""))
+
+    result = await service.store_memories(items)
+
+    assert result.stored == 5
+    assert result.failed == 3
+    assert [r.stored for r in result.results] == [True] * 5 + [False] * 3
+    assert result.results[5].error == "cannot embed"
+    assert result.results[6].error == "Duplicate id in request"
+    # Two batches of three, then the failed batch retried one item at a time
+    assert service.embedding_function.calls[:2] == [3, 3]
+    assert len(await service.get_memories(user_id="u1")) == 5
+
+
+def test_bulk_route_tags_memories_with_the_user(monkeypatch):
+    """Test POST /memories/bulk stores for the current user and returns item results"""
+    service = make_service()
+    monkeypatch.setattr(vector_memory_routes, "vector_service", service)
+    app = FastAPI()
+    app.include_router(vector_memory_routes.router)
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id="user-1")
+    client = TestClient(app)
+
+    response = client.post(
+        "/api/vector/memories/bulk",
+        json={"memories": [
+            {"id": f"m{i}", "type": "email", "content": f"Email {i}", "timestamp": i} for i in range(3)
+        ]},
+    )
+
+    assert response.status_code == 200
+    assert response.json()["stored"] == 3
+    stored = asyncio.run(service.get_memories(where={"user_id": "user-1"}))
+    assert {m.id for m in stored} == {"m0", "m1", "m2"}
+
+
+@pytest.mark.asyncio
+async def test_user_shards_isolate_and_clear_without_scanning(monkeypatch):
+    """Test that each user gets a collection and clearing one drops only that collection"""
+    monkeypatch.setattr("backend.services.vector_memory.settings.VECTOR_MEMORY_SHARDING", "user")
+    service = make_service()
+    await service.store_memory(memory("Alice's dentist appointment", user_id="alice"))
+    await service.store_memories([memory(f"Bob email {i}", user_id="bob") for i in range(3)])
+
+    names = {c.name for c in service.client.list_collections()}
+    assert service.shard_name("alice") in names
+    assert service.shard_name("bob") in names
+    assert await service.get_memories() == []
+    assert len(await service.query_memories("email", threshold=float("-inf"), user_id="alice")) == 1
+
+    await service.delete_memories(where={"user_id": "bob"})
+
+    assert service.shard_name("bob") not in {c.name for c in service.client.list_collections()}
+    assert len(await service.get_memories(user_id="alice")) == 1
+    assert await service.get_memories(user_id="bob") == []
+
+
+@pytest.mark.asyncio
+async def test_bucket_sharding_keeps_user_filter(monkeypatch):
+    """Test that users sharing a bucket collection only see their own memories"""
+    monkeypatch.setattr("backend.services.vector_memory.settings.VECTOR_MEMORY_SHARDING", "bucket")
+    monkeypatch.setattr("backend.services.vector_memory.settings.VECTOR_MEMORY_USER_BUCKETS", 1)
+    service = make_service()
+    await service.store_memory(memory("Alice note", user_id="alice"))
+    await service.store_memory(memory("Bob note", user_id="bob"))
+
+    assert service.shard_name("alice") == service.shard_name("bob")
+    assert [m.content for m in await service.get_memories(user_id="alice")] == ["Alice note"]
+
+    await service.delete_memories(user_id="alice")
+    assert [m.content for m in await service.get_memories(user_id="bob")] == ["Bob note"]
+
+
+@pytest.mark.asyncio
+async def test_migrate_to_shards_reuses_embeddings(monkeypatch):
+    """Test that migration copies memories into shards without re-embedding them"""
+    monkeypatch.setattr("backend.services.vector_memory.settings.VECTOR_MEMORY_SHARDING", "user")
+    service = make_service()
+    service.embedding_function = CountingEmbedding()
+    service.collection.add(
+        ids=["a1", "b1", "orphan"],
+        embeddings=[[1.0, 0.0], [0.0, 1.0], [1.0, 1.0]],
+        metadatas=[
+            {"user_id": "alice", "type": "email", "content": "Alice email", "timestamp": 1},
+            {"user_id": "bob", "type": "email", "content": "Bob email", "timestamp": 2},
+            {"type": "email", "content": "No owner", "timestamp": 3},
+        ],
+    )
+
+    dry_run = await service.migrate_to_shards(batch_size=2, dry_run=True)
+    assert dry_run["moved"] == 2
+    assert service.shard_name("alice") not in {c.name for c in service.client.list_collections()}
+
+    report = await service.migrate_to_shards(batch_size=2, delete_source=True)
+
+    assert report == {
+        "scanned": 3,
+        "moved": 2,
+        "skipped": 1,
+        "shards": {service.shard_name("alice"): 1, service.shard_name("bob"): 1},
+    }
+    assert service.embedding_function.calls == []
+    assert [m.content for m in await service.get_memories(user_id="alice")] == ["Alice email"]
+    assert [m.id for m in await service.get_memories()] == ["orphan"]
+
+
+@pytest.mark.asyncio
+async def test_list_memories_pages_newest_first_with_projection(monkeypatch):
+    """Test cursor pagination across scan chunks and timestamp ties"""
+    monkeypatch.setattr("backend.services.vector_memory.settings.VECTOR_MEMORY_SCAN_BATCH", 3)
+    service = make_service()
+    items = [memory(f"Note {i}", timestamp=i // 2) for i in range(7)]
+    await service.store_memories(items)
+    expected = sorted(items, key=lambda m: (m.timestamp, m.id), reverse=True)
+
+    seen = []
+    cursor = None
+    while True:
+        page = await service.list_memories(user_id="u1", limit=3, cursor=cursor)
+        seen.extend(page.memories)
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+
+    assert [m.id for m in seen] == [m.id for m in expected]
+    assert all(m.content == "" and m.embedding is None for m in seen)
+
+    page = await service.list_memories(user_id="u1", limit=1, include=["content", "embedding"])
+    assert page.memories[0].content == expected[0].content
+    assert len(page.memories[0].embedding) == 32
+
+    with pytest.raises(ValueError):
+        await service.list_memories(user_id="u1", include=["documents"])
+
+
+def test_get_memories_route_streams_a_page(monkeypatch):
+    """Test GET /memories/{type} returns one projected page and the next cursor"""
+    service = make_service()
+    asyncio.run(service.store_memories([
+        Memory(id=f"m{i}", type=MemoryType.EMAIL, content=f"Email {i}", timestamp=i, metadata={"user_id": "user-1"})
+        for i in range(3)
+    ]))
+    monkeypatch.setattr(vector_memory_routes, "vector_service", service)
+    app = FastAPI()
+    app.include_router(vector_memory_routes.router)
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id="user-1")
+    client = TestClient(app)
+
+    first = client.get("/api/vector/memories/email", params={"limit": 2})
+    assert [m["id"] for m in first.json()] == ["m2", "m1"]
+    assert "content" not in first.json()[0]
+
+    second = client.get(
+        "/api/vector/memories/email",
+        params={"limit": 2, "cursor": first.headers["x-next-cursor"], "include": "content"},
+    )
+    assert second.json() == [{"id": "m0", "type": "email", "content": "Email 0", "timestamp": 0, "metadata": {"user_id": "user-1"}}]
+    assert "x-next-cursor" not in second.headers
+
+    assert client.get("/api/vector/memories/email", params={"cursor": "nope"}).status_code == 400
+
+
+def test_routes_omit_embeddings_unless_packed_as_base64(monkeypatch):
+    """Test that embeddings are left out of responses by default and base64-packed on request"""
+    service = make_service()
+    monkeypatch.setattr(vector_memory_routes, "vector_service", service)
+    app = FastAPI()
+    app.include_router(vector_memory_routes.router)
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id="user-1")
+    client = TestClient(app)
+    body = {"id": "m1", "type": "email", "content": "Email", "timestamp": 1, "embedding": [0.5] * 32}
+
+    assert client.post("/api/vector/memory", json=body).json()["embedding"] is None
+    packed = client.post("/api/vector/memory", json=body, params={"embedding_format": "base64"}).json()["embedding"]
+    assert unpack_base64(packed) == [0.5] * 32
+
+    listed = client.get("/api/vector/memories/email", params={"include": "embedding"}).json()
+    assert unpack_base64(listed[0]["embedding"]) == [0.5] * 32
+    queried = client.post("/api/vector/query", json={"query": "Email", "embedding": [0.5] * 32}).json()
+    assert queried[0]["memory"]["embedding"] is None
+
+
+def test_bm25_ranks_exact_terms_and_fuses_rankings():
+    """Test ticket-number tokenization, BM25 ranking, removal and RRF"""
+    assert tokenize("See OPS-1234 now") == ["see", "ops-1234", "ops", "1234", "now"]
+
+    index = BM25Index()
+    index.add("a", "Deploy notes for OPS-1234 and OPS-1234 rollback", owner="u1")
+    index.add("b", "Lunch plans for Friday", owner="u1")
+    index.add("c", "OPS-1234 mentioned once in a much longer unrelated message body", owner="u2")
+
+    assert [doc_id for doc_id, _ in index.search("ops-1234", 5)] == ["a", "c"]
+    assert [doc_id for doc_id, _ in index.search("ops-1234", 5, owner="u2")] == ["c"]
+    index.remove(["a"])
+    assert [doc_id for doc_id, _ in index.search("ops-1234", 5)] == ["c"]
+
+    scores = reciprocal_rank_fusion([["x", "y"], ["y", "z"]], k=60)
+    assert max(scores, key=scores.get) == "y"
+
+
+@pytest.mark.asyncio
+async def test_hybrid_search_finds_exact_identifiers():
+    """Test that keyword matches surface at small k and the index follows writes and deletes"""
+    service = make_service()
+    await service.store_memories([memory(f"Routine status update number {i}") for i in range(20)])
+    ticket = await service.store_memory(memory("Customer escalation on ticket INC-48213"))
+
+    # The hash embedding ranks documents arbitrarily, so only the lexical side can find the ticket
+    results = await service.search_memories("INC-48213", limit=2, threshold=float("-inf"), user_id="u1")
+    found = {result.memory.id: result.memory for result in results}
+    assert found[ticket.id].content == "Customer escalation on ticket INC-48213"
+
+    # Writes and deletes after the index was built keep it current
+    index = service._lexical_index(await service._collection("u1"))
+    later = await service.store_memory(memory("Follow-up on INC-99001"))
+    assert index.search("INC-99001", 1)[0][0] == later.id
+
+    await service.delete_memory(later.id, user_id="u1")
+    results = await service.search_memories("INC-99001", limit=3, threshold=float("-inf"), user_id="u1")
+    assert later.id not in {result.memory.id for result in results}
+    assert later.id not in dict(index.search("INC-99001", 5))
+
+
+@pytest.mark.asyncio
+async def test_hybrid_search_applies_filters_to_lexical_hits():
+    """Test that keyword hits outside the filter are not returned"""
+    service = make_service()
+    task = memory("Renew the ACME-7 contract")
+    task.type = MemoryType.TASK
+    await service.store_memories([task, memory("ACME-7 invoice attached")])
+
+    results = await service.search_memories(
+        "ACME-7", where={"type": "task"}, limit=5, threshold=float("-inf"), user_id="u1"
+    )
+    assert [result.memory.id for result in results] == [task.id]
+
+
+@pytest.mark.asyncio
+async def test_recall_cache_serves_repeats_until_a_write():
+    """Test that repeated recalls skip embedding and search, and writes invalidate results"""
+    service = make_service()
+    await service.store_memory(memory("Budget review on Monday"))
+    service.embedding_function = CountingEmbedding()
+
+    first = await service.search_memories("budget review", threshold=float("-inf"), user_id="u1")
+    first[0].memory.content = "mutated by caller"
+    repeat = await service.search_memories("  Budget   REVIEW ", threshold=float("-inf"), user_id="u1")
+
+    assert service.embedding_function.calls == [1]
+    assert repeat[0].memory.content == "Budget review on Monday"
+
+    added = await service.store_memory(memory("Budget review moved to Tuesday"))
+    after_write = await service.search_memories("budget review", threshold=float("-inf"), user_id="u1")
+
+    assert added.id in {result.memory.id for result in after_write}
+    # Results were recomputed but the query embedding was reused
+    assert service.embedding_function.calls == [1]
+
+
+@pytest.mark.asyncio
+async def test_recall_cache_is_invalidated_per_user(monkeypatch):
+    """Test that a write to the shared collection only invalidates its user's cached recalls"""
+    monkeypatch.setattr("backend.services.vector_memory.settings.VECTOR_MEMORY_SHARDING", "none")
+    service = make_service()
+    await service.store_memories([memory("Budget review on Monday"), memory("Budget call", user_id="u2")])
+    searches = []
+    original = service.query_memories
+
+    async def counting_query(*args, **kwargs):
+        searches.append(kwargs.get("user_id"))
+        return await original(*args, **kwargs)
+
+    monkeypatch.setattr(service, "query_memories", counting_query)
+
+    async def recall(user_id):
+        return await service.search_memories("budget review", threshold=float("-inf"), user_id=user_id)
+
+    await recall("u1")
+    await recall("u2")
+    await service.store_memory(memory("Budget moved", user_id="u2"))
+    await recall("u1")
+    assert searches == ["u1", "u2"]
+
+    await recall("u2")
+    await service.delete_memories(where={"type": "knowledge"})
+    await recall("u1")
+    assert searches == ["u1", "u2", "u2", "u1"]
+
+
+def long_text(topic: str = "topic", sentences: int = 40) -> str:
+    return " ".join(f"Sentence number {i} talks about {topic} {i}." for i in range(sentences))
+
+
+@pytest.fixture
+def small_passages(monkeypatch):
+    monkeypatch.setattr("backend.services.vector_memory.settings.PASSAGE_MIN_DOCUMENT_TOKENS", 30)
+    monkeypatch.setattr("backend.services.vector_memory.settings.PASSAGE_MAX_TOKENS", 40)
+    monkeypatch.setattr("backend.services.vector_memory.settings.PASSAGE_OVERLAP_TOKENS", 12)
+
+
+def test_chunk_text_overlaps_sentence_passages():
+    """Test that passages respect the token budget and repeat trailing sentences"""
+    passages = chunk_text(long_text(), max_tokens=40, overlap_tokens=12)
+
+    assert len(passages) > 1
+    assert all(passage.tokens <= 40 for passage in passages)
+    for previous, current in zip(passages, passages[1:]):
+        last_sentence = previous.text.rsplit(". ", 1)[-1]
+        assert current.text.startswith(last_sentence.rstrip("."))
+    assert parent_of(passage_id("memory-1", 3)) == "memory-1"
+    assert parent_of("memory-1") == "memory-1"
+
+
+@pytest.mark.asyncio
+async def test_long_memories_are_searched_by_passage(small_passages):
+    """Test that passages are stored and searched but listed and returned as their parent"""
+    service = make_service()
+    document = memory(long_text())
+    await service.store_memory(document)
+    await service.store_memory(memory("Short note"))
+
+    listed = await service.get_memories(user_id="u1")
+    assert sorted(m.content for m in listed) == sorted([document.content, "Short note"])
+    assert len((await service.list_memories(user_id="u1")).memories) == 2
+
+    target = chunk_text(document.content, 40, 12)[5].text
+    results = await service.query_memories(target, threshold=float("-inf"), user_id="u1")
+    assert results[0].memory.id == document.id
+    assert results[0].memory.content == document.content
+    assert results[0].passage == target
+    assert len({result.memory.id for result in results}) == len(results)
+
+    hybrid = await service.search_memories("Sentence number 21", limit=1, threshold=float("-inf"), user_id="u1")
+    assert hybrid[0].memory.id == document.id
+
+    await service.delete_memory(document.id, user_id="u1")
+    collection = await service._collection("u1")
+    assert collection.get(where={"parent_id": document.id})["ids"] == []
+
+
+@pytest.mark.asyncio
+async def test_restoring_a_long_memory_only_embeds_changed_passages(small_passages):
+    """Test that unchanged passages keep their embeddings when a memory is stored again"""
+    service = make_service()
+    document = memory(long_text())
+    service.embedding_function = CountingEmbedding()
+    await service.store_memory(document)
+    total = service.embedding_function.calls[0]
+
+    document.content = document.content.replace("topic 38.", "an edited topic 38.")
+    await service.store_memory(document)
+
+    assert 0 < service.embedding_function.calls[1] < total
+    collection = await service._collection("u1")
+    assert len(collection.get(where={"parent_id": document.id})["ids"]) == len(chunk_text(document.content, 40, 12))
@@ -1,9 +1,60 @@
 import json
+import threading
+from collections import OrderedDict
 from typing import Any, Optional
 from functools import wraps
 from redis import Redis
 from backend.config import settings
 
+
+class LRUCache:
+    """Thread-safe in-process LRU cache used in front of Redis"""
+
+    def __init__(self, max_size: int = 1000):
+        self.max_size = max_size
+        self._data: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Get a value and mark it as most recently used"""
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key: str, value: Any) -> None:
+        """Set a value, evicting the least recently used entry when full"""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        """Delete a value if present"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear_prefix(self, prefix: str) -> int:
+        """Delete all keys starting with prefix and return how many were removed"""
+        with self._lock:
+            keys = [k for k in self._data if k.startswith(prefix)]
+            for k in keys:
+                del self._data[k]
+            return len(keys)
+
+    def clear(self) -> None:
+        """Remove all entries"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
 class CacheService:
     def __init__(self):
         self.redis: Optional[Redis] = None
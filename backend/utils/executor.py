@@ -0,0 +1,69 @@
+"""
+Bounded executor
+Runs blocking library calls (vector stores, sync SDKs) on a dedicated thread pool
+so they never stall the event loop, with a cap on queued work and metrics for
+how long calls wait before a worker picks them up
+"""
+
+import asyncio
+import functools
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+from backend.utils.metrics import EXECUTOR_PENDING, EXECUTOR_QUEUE_WAIT, EXECUTOR_TASK_DURATION
+
+T = TypeVar("T")
+
+
+class BoundedExecutor:
+    """
+    Thread pool with an async interface and bounded admission.
+
+    At most max_workers calls run at once and at most max_pending are admitted
+    (running or queued); further callers wait on the event loop, applying
+    backpressure instead of growing the pool's queue without bound.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_pending: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max(max_pending, max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        # Semaphores belong to an event loop, and Celery tasks each run their own loop
+        self._slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def _slot(self, loop: asyncio.AbstractEventLoop) -> asyncio.Semaphore:
+        slot = self._slots.get(loop)
+        if slot is None:
+            slot = self._slots[loop] = asyncio.Semaphore(self.max_pending)
+        return slot
+
+    async def run(self, operation: str, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run fn(*args, **kwargs) on the pool and await its result"""
+        loop = asyncio.get_running_loop()
+        submitted = time.monotonic()
+        pending = EXECUTOR_PENDING.labels(executor=self.name)
+
+        def call() -> T:
+            started = time.monotonic()
+            EXECUTOR_QUEUE_WAIT.labels(executor=self.name, operation=operation).observe(started - submitted)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                EXECUTOR_TASK_DURATION.labels(executor=self.name, operation=operation).observe(
+                    time.monotonic() - started
+                )
+
+        async with self._slot(loop):
+            pending.inc()
+            try:
+                return await loop.run_in_executor(self._executor, functools.partial(call))
+            finally:
+                pending.dec()
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
@@ -74,8 +74,23 @@ def setup_logger(name: str = "email_ai", level: str = "INFO") -> logging.Logger:
     
     return logger
 
+def setup_routing_logger(name: str = "email_ai.routing") -> logging.Logger:
+    """Set up the audit logger that records model routing decisions."""
+    routing_logger = logging.getLogger(name)
+    routing_logger.setLevel(logging.INFO)
+    routing_logger.handlers = []
+    # Keep audit records out of the application and accessibility logs
+    routing_logger.propagate = False
+
+    routing_handler = logging.FileHandler("logs/routing.log")
+    routing_handler.setFormatter(CustomFormatter())
+    routing_logger.addHandler(routing_handler)
+
+    return routing_logger
+
 # Create and configure the logger
 logger = setup_logger()
+routing_logger = setup_routing_logger()
 
 # Create a formatter instance for serialization
 _formatter = CustomFormatter()
@@ -108,3 +123,10 @@ def log_accessibility_event(event_type: str, data: Optional[Dict[str, Any]] = No
         f"Accessibility event: {event_type}",
         extra=event_data
     )
+
+def log_routing_decision(decision: Dict[str, Any]) -> None:
+    """Record a model routing decision in the routing audit log."""
+    routing_logger.info(
+        f"Model routing: {decision.get('call_site')} -> {decision.get('tier')}",
+        extra={"extra": _formatter._serialize_extra(decision)}
+    )
@@ -0,0 +1,152 @@
+"""
+Application metrics
+Prometheus collectors shared across services, exposed through /metrics
+"""
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# Analysis cache
+ANALYSIS_CACHE_REQUESTS = Counter(
+    "analysis_cache_requests_total",
+    "LLM analysis cache lookups by prompt and outcome",
+    ["prompt", "result"],
+)
+ANALYSIS_CACHE_INVALIDATIONS = Counter(
+    "analysis_cache_invalidations_total",
+    "Explicit analysis cache invalidations by prompt",
+    ["prompt"],
+)
+
+# Embedding batching
+EMBEDDING_BATCH_SIZE = Histogram(
+    "embedding_batch_size",
+    "Number of texts sent per embeddings request",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512),
+)
+
+# Model routing
+MODEL_ROUTING_DECISIONS = Counter(
+    "model_routing_decisions_total",
+    "LLM routing decisions by call site and tier",
+    ["call_site", "tier"],
+)
+
+# Single-flight de-duplication
+SINGLE_FLIGHT_REQUESTS = Counter(
+    "single_flight_requests_total",
+    "LLM requests by single-flight outcome (leader, shared, remote_shared)",
+    ["result"],
+)
+
+# Prompt preprocessing
+PROMPT_TOKENS_SENT = Counter(
+    "prompt_tokens_sent_total",
+    "Input tokens of email text sent to the model after preprocessing, by call site",
+    ["call_site"],
+)
+PROMPT_TOKENS_SAVED = Counter(
+    "prompt_tokens_saved_total",
+    "Input tokens removed by preprocessing, by call site",
+    ["call_site"],
+)
+
+# OpenAI scheduler
+OPENAI_QUEUE_DEPTH = Gauge(
+    "openai_queue_depth",
+    "OpenAI requests waiting for rate-limit budget, by model and priority",
+    ["model", "priority"],
+)
+OPENAI_QUEUE_WAIT = Histogram(
+    "openai_queue_wait_seconds",
+    "Time OpenAI requests spent queued before being sent, by model",
+    ["model"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+OPENAI_RATE_LIMITED = Counter(
+    "openai_rate_limited_total",
+    "OpenAI responses rejected with 429, by model",
+    ["model"],
+)
+
+# Blocking-call executors
+EXECUTOR_PENDING = Gauge(
+    "executor_pending_tasks",
+    "Blocking calls admitted to an executor (running or queued), by executor",
+    ["executor"],
+)
+EXECUTOR_QUEUE_WAIT = Histogram(
+    "executor_queue_wait_seconds",
+    "Time blocking calls waited before a worker thread started them",
+    ["executor", "operation"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+EXECUTOR_TASK_DURATION = Histogram(
+    "executor_task_duration_seconds",
+    "Time blocking calls spent running on a worker thread",
+    ["executor", "operation"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+# Memory retrieval
+MEMORY_RETRIEVAL_STAGE_LATENCY = Histogram(
+    "memory_retrieval_stage_seconds",
+    "Time spent in each stage of hybrid memory retrieval (vector, lexical, fetch, fusion)",
+    ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+MEMORY_CONSOLIDATION_ACTIONS = Counter(
+    "memory_consolidation_actions_total",
+    "Memories removed by consolidation, by action (merged, rolled_up, evicted)",
+    ["action"],
+)
+RECALL_CACHE_REQUESTS = Counter(
+    "recall_cache_requests_total",
+    "Recall cache lookups, by cache (embeddings, results) and result (hit, miss)",
+    ["cache", "result"],
+)
+PASSAGE_EMBEDDINGS = Counter(
+    "passage_embeddings_total",
+    "Passages of chunked memories stored, by result (embedded, reused)",
+    ["result"],
+)
+EMBEDDING_CACHE_LOOKUPS = Counter(
+    "embedding_cache_lookups_total",
+    "Persistent embedding cache lookups, by result (hit, miss)",
+    ["result"],
+)
+EMBEDDING_PROVIDER_LATENCY = Histogram(
+    "embedding_provider_seconds",
+    "Time to embed one batch of texts, by provider",
+    ["provider"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+NEO4J_POOL_MAX_SIZE = Gauge(
+    "neo4j_pool_max_size",
+    "Configured size of the shared Neo4j connection pool",
+)
+NEO4J_SESSIONS_IN_USE = Gauge(
+    "neo4j_sessions_in_use",
+    "Neo4j sessions currently holding a pooled connection",
+)
+NEO4J_QUERY_DURATION = Histogram(
+    "neo4j_query_seconds",
+    "Time to run a Cypher query and fetch its records, by operation and outcome",
+    ["operation", "outcome"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+GRAPH_SEARCH_EXPANSIONS = Histogram(
+    "graph_search_expansions",
+    "Nodes or paths expanded by one knowledge graph search, by operation",
+    ["operation"],
+    buckets=(1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000),
+)
+GRAPH_SEARCH_TRUNCATED = Counter(
+    "graph_search_truncated_total",
+    "Knowledge graph searches stopped by their expansion budget, by operation",
+    ["operation"],
+)
+GRAPH_RELEVANCE_CACHE_REQUESTS = Counter(
+    "graph_relevance_cache_requests_total",
+    "Relevance score cache lookups, by result (hit, miss)",
+    ["result"],
+)
@@ -5,7 +5,7 @@ from backend.config import settings
 from backend.models.email import StressLevel, Priority
 
 # Initialize OpenAI client
-client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL)
 
 async def analyze_content(content: str) -> Dict[str, Any]:
     """Analyze email content using OpenAI"""
@@ -0,0 +1,31 @@
+import json
+from typing import Any, AsyncIterator, Dict
+from fastapi.responses import StreamingResponse
+from backend.utils.logger import logger
+
+
+def format_sse(event: str, data: Any) -> str:
+    """Format a single Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def sse_response(events: AsyncIterator[Dict[str, Any]]) -> StreamingResponse:
+    """Stream {"event", "data"} dicts to the client as Server-Sent Events.
+
+    Errors raised after the stream has started cannot change the status code,
+    so they are reported to the client as a final "error" event.
+    """
+
+    async def body():
+        try:
+            async for item in events:
+                yield format_sse(item["event"], item["data"])
+        except Exception as e:
+            logger.error(f"SSE stream failed: {str(e)}")
+            yield format_sse("error", {"detail": "Stream interrupted"})
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )